@@ -107,10 +107,13 @@ class Model(object):
                 name='sample_features')
             # [B, # of box, dim]
             V_ft.set_shape([None, self.max_box_num, self.vfeat_dim])
-            num_V_ft = tf.gather(self.num_boxes, self.batch['image_idx'],
+            num_boxes = modules.DataVariable(self.num_boxes, name='num_boxes')
+            num_V_ft = tf.gather(num_boxes, self.batch['image_idx'],
                                  name='gather_num_V_ft', axis=0)
             self.mid_result['num_V_ft'] = num_V_ft
-            normal_boxes = tf.gather(self.normal_boxes, self.batch['image_idx'],
+            normal_boxes = modules.DataVariable(self.normal_boxes,
+                                                name='normal_boxes')
+            normal_boxes = tf.gather(normal_boxes, self.batch['image_idx'],
                                      name='gather_normal_boxes', axis=0)
             self.mid_result['normal_boxes'] = normal_boxes
 
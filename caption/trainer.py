@@ -8,6 +8,10 @@ import tensorflow as tf
 from tqdm import tqdm
 
 from util import log
+from util.profiler import StepProfiler
+from util.session_config import add_session_arguments, get_session_config
+from util.streaming_report import StreamingReport
+from vlmap import modules
 from vqa import importer
 from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
 
@@ -130,16 +134,9 @@ class Trainer(object):
             name='optimizer')
 
         self.avg_report = {
-            'train': {},
-            'val': {},
-            'testval': {},
-        }
-        for split in ['train', 'val', 'testval']:
-            for key in self.model.report.keys():
-                self.avg_report[split][key] = tf.placeholder(tf.float32)
-                tf.summary.scalar('average_{}/{}'.format(split, key),
-                                  self.avg_report[split][key],
-                                  collections=['average_{}'.format(split)])
+            split: StreamingReport(self.model.report, split,
+                                   summary_collection='average_{}'.format(split))
+            for split in ['train', 'val', 'testval']}
 
         self.summary_ops = {
             'train': tf.summary.merge_all(key='train'),
@@ -153,6 +150,8 @@ class Trainer(object):
             'average_testval': tf.summary.merge_all(key='average_testval'),
             'no_op': tf.no_op(),
         }
+        self.profiler = StepProfiler(self.train_dir, config.profile_steps,
+                                     config.trace_every)
 
         all_vars = tf.global_variables()
         transfer_vars = self.model.filter_transfer_vars(all_vars)
@@ -176,15 +175,14 @@ class Trainer(object):
             save_summaries_secs=300,
             save_model_secs=None,
             global_step=self.global_step,
+            init_feed_dict=modules.get_init_feed_dict(),
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
+        modules.initialize_data_variables(self.session)
 
         self.ckpt_path = config.checkpoint
         if self.ckpt_path is not None:
@@ -204,22 +202,22 @@ class Trainer(object):
     def train(self):
         log.infov('Training starts')
 
-        # initialize average report (put 0 to escape average over empty list)
+        # initialize average step time (put 0 to escape average over empty list)
         avg_step_time = [0]
-        avg_train_report = {key: [0] for key in self.avg_report['train']}
 
         for s in range(self.max_train_iter):
             """
             write average summary and print log
             """
             if s % self.train_average_iter == 0:
-                step, avg_train_summary = self.write_average_summary(
-                    avg_train_report, split='train')
+                step, avg_train_summary, avg_train_report = \
+                    self.write_average_summary(split='train')
                 self.summary_writer.add_summary(
                     avg_train_summary, global_step=step)
                 self.log_message(step, avg_train_report, avg_step_time,
                                  split='train', is_train=True)
-                for key in avg_train_report: avg_train_report[key] = []
+                self.profiler.write_summary(
+                    self.session, self.summary_writer, step)
                 avg_step_time = []
 
             """
@@ -227,33 +225,27 @@ class Trainer(object):
             """
             if s % self.validation_step == 0:
                 # val
-                avg_val_report = {key: [] for key in self.avg_report['val']}
                 avg_val_step_time = []
                 for i in tqdm(range(self.val_average_iter), desc='eval val'):
-                    step, summary, loss, report, step_time = self.run_val_step(
+                    step, summary, step_time = self.run_val_step(
                         i == (self.val_average_iter - 1), split='val')
-                    for key in avg_val_report:
-                        avg_val_report[key].append(report[key])
                     avg_val_step_time.append(step_time)
                 self.summary_writer.add_summary(summary, global_step=step)
-                step, avg_val_summary = self.write_average_summary(
-                    avg_val_report, split='val')
+                step, avg_val_summary, avg_val_report = \
+                    self.write_average_summary(split='val')
                 self.summary_writer.add_summary(avg_val_summary, global_step=step)
                 self.log_message(step, avg_val_report, avg_val_step_time,
                                  split='val', is_train=False)
 
                 # testval
-                avg_val_report = {key: [] for key in self.avg_report['testval']}
                 avg_val_step_time = []
                 for i in tqdm(range(self.val_average_iter), desc='eval testval'):
-                    step, summary, loss, report, step_time = self.run_val_step(
+                    step, summary, step_time = self.run_val_step(
                         i == (self.val_average_iter - 1), split='testval')
-                    for key in avg_val_report:
-                        avg_val_report[key].append(report[key])
                     avg_val_step_time.append(step_time)
                 self.summary_writer.add_summary(summary, global_step=step)
-                step, avg_val_summary = self.write_average_summary(
-                    avg_val_report, split='testval')
+                step, avg_val_summary, avg_val_report = \
+                    self.write_average_summary(split='testval')
                 self.summary_writer.add_summary(avg_val_summary, global_step=step)
                 self.log_message(step, avg_val_report, avg_val_step_time,
                                  split='testval', is_train=False)
@@ -261,13 +253,16 @@ class Trainer(object):
             """
             Run TRAINING step
             """
-            step, train_summary, loss, train_report, step_time = \
-                self.run_train_step(s % self.heavy_summary_step == 0)
-            for key in avg_train_report:
-                avg_train_report[key].append(train_report[key])
+            run_kwargs = self.profiler.run_kwargs(s)
+            step, train_summary, step_time = \
+                self.run_train_step(s % self.heavy_summary_step == 0,
+                                    run_kwargs=run_kwargs)
+            self.profiler.after_run(s, step, run_kwargs, step_time)
             avg_step_time.append(step_time)
             if s % self.heavy_summary_step == 0:
+                _start_time = time.time()
                 self.summary_writer.add_summary(train_summary, global_step=step)
+                self.profiler.add_time('summary_write', time.time() - _start_time)
 
             """
             Save Checkpoint
@@ -278,29 +273,31 @@ class Trainer(object):
                     self.session, os.path.join(self.train_dir, 'model'),
                     global_step=step)
 
-    def write_average_summary(self, avg_report, split='train'):
-        feed_dict = {
-            self.avg_report[split][key]:
-            np.array(avg_report[key], dtype=np.float32).mean()
-            for key in self.avg_report[split]}
+    def write_average_summary(self, split='train'):
+        """
+        Read (and reset) the running averages of the split.
+        """
         summary_op = self.summary_ops['average_{}'.format(split)]
-        step, avg_summary = self.session.run([self.global_step, summary_op],
-                                             feed_dict=feed_dict)
-        return step, avg_summary
+        step, avg_summary, avg_report = self.session.run(
+            [self.global_step, summary_op, self.avg_report[split].average])
+        self.session.run(self.avg_report[split].reset_op)
+        return step, avg_summary, avg_report
 
-    def run_train_step(self, use_heavy_summary):
+    def run_train_step(self, use_heavy_summary, run_kwargs=None):
+        if run_kwargs is None: run_kwargs = {}
         if use_heavy_summary:
             summary_op = self.summary_ops['heavy_train']
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
         fetch = [self.global_step, summary_op,
-                 self.model.loss, self.model.report, self.optimizer]
+                 self.avg_report['train'].update_op, self.optimizer]
         fetch_values = self.session.run(fetch,
-                                        feed_dict={self.target_split: 'train'})
-        [step, summary, loss, report] = fetch_values[:4]
+                                        feed_dict={self.target_split: 'train'},
+                                        **run_kwargs)
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def run_val_step(self, use_heavy_summary, split):
         if use_heavy_summary:
@@ -308,12 +305,13 @@ class Trainer(object):
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
-        fetch = [self.global_step, summary_op, self.model.loss, self.model.report]
+        fetch = [self.global_step, summary_op,
+                 self.avg_report[split].update_op]
         fetch_values = self.session.run(
             fetch, feed_dict={self.target_split: split})
-        [step, summary, loss, report] = fetch_values[:4]
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def log_message(self, step, avg_report, avg_step_time, split='train', is_train=True):
         step_time = np.array(avg_step_time, dtype=np.float32).mean()
@@ -323,8 +321,7 @@ class Trainer(object):
         log_str += '({:.3f} sec/batch, {:.3f} instances/sec)]\n'.format(
             step_time, self.batch_size / step_time)
         for key in sorted(avg_report.keys()):
-            report = np.array(avg_report[key], dtype=np.float32).mean()
-            log_str += '  * {}: {:.5f}\n'.format(key, report)
+            log_str += '  * {}: {:.5f}\n'.format(key, avg_report[key])
         log_fn = (log.info if is_train else log.infov)
         log_fn(log_str)
 
@@ -355,6 +352,12 @@ def main():
     parser.add_argument('--heavy_summary_step', type=int, default=800)  # 867 for 1 epoch
     parser.add_argument('--validation_step', type=int, default=800)
     parser.add_argument('--checkpoint_step', type=int, default=800)
+    parser.add_argument('--profile_steps', type=str, default='',
+                        help='steps to export Chrome trace timelines for,'
+                        ' e.g. "100,200-202"')
+    parser.add_argument('--trace_every', type=int, default=100,
+                        help='trace a step every N steps for the'
+                        ' average_train/time/* summaries (0: off)')
     # hyper parameters
     parser.add_argument('--prefix', type=str, default='default', help=' ')
     parser.add_argument('--checkpoint', type=str, default=None)
@@ -369,6 +372,7 @@ def main():
     parser.add_argument('--vlmap_word_weight_dir', type=str, default=None,
                         help=' ')
     parser.add_argument('--ft_vlmap', action='store_true', default=False)
+    add_session_arguments(parser)
     config = parser.parse_args()
     config.vocab_path = os.path.join(config.tf_record_dir, config.vocab_name)
     config.vfeat_path = os.path.join(config.tf_record_dir, config.vfeat_name)
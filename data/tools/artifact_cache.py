@@ -0,0 +1,220 @@
+"""
+Content-addressed cache for the preprocessing scripts.
+
+Every stage declares its inputs (files, directories and arguments, plus the
+source of the script itself) and is keyed by a hash of them:
+
+    - DirStage: the output directory (e.g. a qa_split_dir) is built in
+      <parent>/.artifacts/<name>/<key> and the usual output path becomes a
+      symlink to it. A stage whose key was already built is skipped at once
+      (switching the arguments back only moves the symlink), and a changed
+      stage is built next to the previous outputs instead of refusing to
+      overwrite them.
+    - FileStage: for scripts that add files to an existing directory (e.g.
+      find_word_group.py, enwiki/*.py). The key is recorded in a manifest
+      next to the outputs (manifest_path) and the stage is skipped while it
+      matches.
+
+Input fingerprints: the key of the producing stage for cached directories,
+the sha1 of the content for files (memoized by path, size and mtime in
+HASH_CACHE_PATH) and the listing (names, sizes, mtimes) for other
+directories. A stage downstream of a rebuilt stage therefore sees a new
+key and is rebuilt as well, and run.py only rebuilds what changed.
+
+Usage in a script:
+    stage = artifact_cache.DirStage('qa_split', config.save_split_dir,
+                                    args=vars(config), inputs=[...])
+    if stage.up_to_date(): sys.exit(0)
+    config.save_split_dir = stage.begin()
+    ...
+    stage.commit()
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+from util import log
+
+ARTIFACT_DIR = '.artifacts'
+MANIFEST_NAME = '.artifact.json'
+HASH_CACHE_PATH = 'data/preprocessed/.artifact_hashes.json'
+
+
+def _atomic_write_json(path, obj):
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=2, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+def _load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+_hash_cache = None
+
+
+def file_digest(path):
+    """ sha1 of the content, memoized by (path, size, mtime). """
+    global _hash_cache
+    if _hash_cache is None:
+        _hash_cache = _load_json(HASH_CACHE_PATH) or {}
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    signature = '{}:{}'.format(stat.st_size, stat.st_mtime)
+    cached = _hash_cache.get(path, None)
+    if cached is not None and cached['signature'] == signature:
+        return cached['sha1']
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 24), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+    _hash_cache[path] = {'signature': signature, 'sha1': digest}
+    if os.path.isdir(os.path.dirname(HASH_CACHE_PATH)):
+        # merge entries written by stages running concurrently
+        merged = _load_json(HASH_CACHE_PATH) or {}
+        merged.update(_hash_cache)
+        _atomic_write_json(HASH_CACHE_PATH, merged)
+    return digest
+
+
+def dir_digest(path):
+    manifest = _load_json(os.path.join(path, MANIFEST_NAME))
+    if manifest is not None:
+        return 'artifact:' + manifest['key']
+    listing = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d != ARTIFACT_DIR)
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            listing.append([os.path.relpath(file_path, path),
+                            stat.st_size, stat.st_mtime])
+    return 'listing:' + hashlib.sha1(
+        json.dumps(listing).encode('utf-8')).hexdigest()
+
+
+def input_digest(path):
+    if os.path.isdir(path): return dir_digest(path)
+    if os.path.exists(path): return file_digest(path)
+    raise ValueError('Input of the stage does not exist: {}'.format(path))
+
+
+def stage_key(name, args=None, inputs=(), script=None):
+    """
+    Args:
+        - args: {name: value} of the arguments (json serializable)
+        - inputs: paths of the input files / directories
+        - script: path of the script (default: the running script)
+    """
+    if script is None: script = sys.argv[0]
+    description = {
+        'name': name,
+        'args': {key: val for key, val in (args or {}).items()},
+        'inputs': {path: input_digest(path) for path in inputs},
+        'script': file_digest(script) if os.path.exists(script) else script,
+    }
+    return hashlib.sha1(json.dumps(
+        description, sort_keys=True, default=str).encode('utf-8')).hexdigest(), \
+        description
+
+
+class DirStage(object):
+
+    def __init__(self, name, output_dir, args=None, inputs=(), script=None):
+        self.name = name
+        self.output_dir = output_dir.rstrip('/')
+        self.key, self.description = stage_key(name, args, inputs, script)
+        self.store_dir = os.path.join(
+            os.path.dirname(self.output_dir) or '.', ARTIFACT_DIR,
+            os.path.basename(self.output_dir))
+        self.key_dir = os.path.join(self.store_dir, self.key)
+        self.partial_dir = self.key_dir + '.partial'
+
+    def up_to_date(self):
+        """
+        True if the outputs of this key are built; the output path is made
+        to point to them.
+        """
+        if _load_json(os.path.join(self.key_dir, MANIFEST_NAME)) is None:
+            return False
+        self._link()
+        log.warn('{} is up to date ({}: {})'.format(
+            self.output_dir, self.name, self.key[:12]))
+        return True
+
+    def begin(self):
+        """
+        Returns:
+            - the directory to write the outputs to
+        """
+        if os.path.exists(self.output_dir) and \
+                not os.path.islink(self.output_dir):
+            raise ValueError(
+                'Do not overwrite {}: it is not managed by the artifact cache,'
+                ' move it away to rebuild it'.format(self.output_dir))
+        if os.path.exists(self.partial_dir):
+            log.warn('Remove incomplete outputs: {}'.format(self.partial_dir))
+            shutil.rmtree(self.partial_dir)
+        os.makedirs(self.partial_dir)
+        log.warn('Build {} ({}: {})'.format(
+            self.output_dir, self.name, self.key[:12]))
+        return self.partial_dir
+
+    def commit(self):
+        _atomic_write_json(os.path.join(self.partial_dir, MANIFEST_NAME),
+                           dict(self.description, key=self.key))
+        os.rename(self.partial_dir, self.key_dir)
+        self._link()
+        log.infov('{} is built in {}'.format(self.output_dir, self.key_dir))
+
+    def _link(self):
+        target = os.path.relpath(self.key_dir, os.path.dirname(self.output_dir) or '.')
+        if os.path.islink(self.output_dir) and \
+                os.readlink(self.output_dir) == target:
+            return
+        tmp_link = '{}.link{}'.format(self.output_dir, os.getpid())
+        os.symlink(target, tmp_link)
+        os.rename(tmp_link, self.output_dir)
+
+
+def manifest_path(output, name):
+    """
+    Manifest of the FileStage `name` writing `output`.
+    """
+    return os.path.join(os.path.dirname(output) or '.', '.{}.{}{}'.format(
+        os.path.basename(output), name, MANIFEST_NAME))
+
+
+class FileStage(object):
+
+    def __init__(self, name, outputs, args=None, inputs=(), script=None):
+        self.name = name
+        self.outputs = list(outputs)
+        self.key, self.description = stage_key(name, args, inputs, script)
+        self.manifest_path = manifest_path(self.outputs[0], name)
+
+    def up_to_date(self):
+        manifest = _load_json(self.manifest_path)
+        if manifest is None or manifest['key'] != self.key: return False
+        if not all(os.path.exists(path) for path in self.outputs): return False
+        log.warn('{} is up to date ({}: {})'.format(
+            ', '.join(self.outputs), self.name, self.key[:12]))
+        return True
+
+    def begin(self):
+        # the outputs are rewritten, invalidate the manifest first
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+    def commit(self):
+        _atomic_write_json(self.manifest_path, dict(
+            self.description, key=self.key, outputs=self.outputs))
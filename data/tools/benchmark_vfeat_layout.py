@@ -0,0 +1,91 @@
+"""
+Random per-batch reads of image_features through h5py for several vfeat
+files (e.g. the current contiguous layout and the outputs of
+data/tools/relayout_vfeat.py).
+
+    python data/tools/benchmark_vfeat_layout.py \\
+        --vfeat_paths .../vfeat_bottomup_36.hdf5 \\
+            .../vfeat_bottomup_36_chunk1_none.hdf5 \\
+            .../vfeat_bottomup_36_chunk1_lzf.hdf5 --batch_size 512
+
+Every file reads the same batches. The first file pays for a cold page
+cache; run with --repeat 2 to see the warm numbers as well.
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from util import log
+from util.vfeat_layout import describe_layout, open_vfeat_file
+
+
+def read_batches(vfeat_path, batches, cache_mb):
+    latencies = []
+    with open_vfeat_file(vfeat_path, cache_mb=cache_mb) as f:
+        features = f['image_features']
+        layout = describe_layout(features)
+        for batch in batches:
+            start = time.time()
+            # h5py point selections need increasing indices
+            features[np.unique(batch)]
+            latencies.append(time.time() - start)
+    return layout, np.array(latencies) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--vfeat_paths', nargs='+', type=str, required=True)
+    parser.add_argument('--batch_size', type=int, default=512, help=' ')
+    parser.add_argument('--num_batches', type=int, default=50, help=' ')
+    parser.add_argument('--cache_mb', type=int, default=64,
+                        help='h5py chunk cache')
+    parser.add_argument('--repeat', type=int, default=1, help=' ')
+    parser.add_argument('--seed', type=int, default=123, help=' ')
+    parser.add_argument('--output', type=str, default=None,
+                        help='save the results as json')
+    config = parser.parse_args()
+
+    with open_vfeat_file(config.vfeat_paths[0]) as f:
+        num_images, num_boxes, vfeat_dim = f['image_features'].shape
+        image_mb = np.dtype(f['image_features'].dtype).itemsize * \
+            num_boxes * vfeat_dim / 1e6
+    rng = np.random.RandomState(config.seed)
+    batches = [rng.randint(num_images, size=config.batch_size)
+               for _ in range(config.num_batches)]
+
+    results = []
+    for r in range(config.repeat):
+        for vfeat_path in config.vfeat_paths:
+            layout, latencies_ms = read_batches(vfeat_path, batches,
+                                                config.cache_mb)
+            images = sum(len(np.unique(b)) for b in batches)
+            results.append({
+                'vfeat_path': vfeat_path,
+                'repeat': r,
+                'layout': layout,
+                'file_mb': os.path.getsize(vfeat_path) / 1e6,
+                'p50_ms': float(np.percentile(latencies_ms, 50)),
+                'p99_ms': float(np.percentile(latencies_ms, 99)),
+                'mb_per_sec': images * image_mb / (latencies_ms.sum() / 1000.0),
+            })
+            log.info('{}: {}'.format(vfeat_path, results[-1]))
+
+    log.warn('batch size {}, {} batches'.format(config.batch_size,
+                                                config.num_batches))
+    log.warn('{:<48} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(
+        'file', 'repeat', 'size (MB)', 'p50 (ms)', 'p99 (ms)', 'MB/s'))
+    for r in results:
+        log.infov('{:<48} {:>6} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.1f}'.format(
+            os.path.basename(r['vfeat_path'])[-48:], r['repeat'], r['file_mb'],
+            r['p50_ms'], r['p99_ms'], r['mb_per_sec']))
+    if config.output is not None:
+        with open(config.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        log.warn('results are saved in: {}'.format(config.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Decode and resize the images of a dataset once into an image cache
+(util/image_cache.py) used with --image_cache_dir of the trainers.
+
+    python data/tools/build_image_cache.py --dataset vlmap \\
+        --dataset_path data/preprocessed/visualgenome/merged_by_image_new_vocab50_min_region20 \\
+        --image_dir data/VisualGenome/VG_100K
+
+Datasets:
+    - vlmap: whole images of id.txt of --dataset_path (540x540)
+    - objects, region_descriptions: crops of every entry of id.txt of
+      --dataset_path (224x224, one per (image, box))
+    - vfeat: whole images of --used_image_path (540x540)
+
+Size: 875KB per 540x540 image, 150KB per 224x224 crop.
+"""
+import argparse
+import h5py
+import multiprocessing
+import os
+import sys
+
+from tqdm import tqdm
+
+from util import log
+from util.image_cache import build_image_cache, crop_key
+from data.tools import artifact_cache
+
+IMAGE_SIZES = {
+    'vlmap': (540, 540),
+    'objects': (224, 224),
+    'region_descriptions': (224, 224),
+    'vfeat': (540, 540),
+}
+
+
+def read_ids(dataset_path):
+    with open(os.path.join(dataset_path, 'id.txt'), 'r') as fp:
+        return fp.read().splitlines()
+
+
+def list_items(config):
+    """ [(key, image path, box or None)] of the dataset. """
+    if config.dataset == 'vlmap':
+        return [(id, os.path.join(config.image_dir, '{}.jpg'.format(id)),
+                 None) for id in read_ids(config.dataset_path)]
+    if config.dataset == 'vfeat':
+        with open(config.used_image_path, 'r') as f:
+            image_paths = f.read().splitlines()
+        return [(image_path, os.path.join(config.image_dir, image_path), None)
+                for image_path in image_paths]
+
+    items = []
+    with h5py.File(os.path.join(config.dataset_path, 'data.hdf5'), 'r') as f:
+        for id in tqdm(read_ids(config.dataset_path), desc='read boxes'):
+            image_id, entry_id = id.split()
+            entry = f[image_id][entry_id]
+            box = (entry['x'].value, entry['y'].value,
+                   entry['w'].value, entry['h'].value)
+            items.append((crop_key(image_id, *box), os.path.join(
+                config.image_dir, '{}.jpg'.format(image_id)), box))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--dataset', type=str, required=True,
+                        choices=sorted(IMAGE_SIZES.keys()), help=' ')
+    parser.add_argument('--dataset_path', type=str, default=None,
+                        help='vlmap, objects and region_descriptions')
+    parser.add_argument('--used_image_path', type=str, default=None,
+                        help='vfeat: used_image_path.txt of a qa_split_dir')
+    parser.add_argument('--image_dir', type=str, required=True, help=' ')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='default: <dataset_path>/image_cache or '
+                        '<used_image_path dir>/image_cache')
+    parser.add_argument('--num_workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='processes decoding the images')
+    config = parser.parse_args()
+
+    if config.dataset == 'vfeat':
+        if config.used_image_path is None:
+            raise ValueError('--used_image_path is required for vfeat')
+        inputs = [config.used_image_path]
+        default_dir = os.path.dirname(config.used_image_path)
+    else:
+        if config.dataset_path is None:
+            raise ValueError('--dataset_path is required for {}'.format(
+                config.dataset))
+        inputs = [os.path.join(config.dataset_path, 'id.txt'),
+                  os.path.join(config.dataset_path, 'data.hdf5')]
+        default_dir = config.dataset_path
+    if config.cache_dir is None:
+        config.cache_dir = os.path.join(default_dir, 'image_cache')
+
+    stage = artifact_cache.DirStage(
+        'image_cache', config.cache_dir,
+        # the images do not depend on the number of workers
+        args={k: v for k, v in vars(config).items() if k != 'num_workers'},
+        inputs=inputs + [config.image_dir])
+    if stage.up_to_date(): sys.exit(0)
+    cache_dir = stage.begin()
+
+    width, height = IMAGE_SIZES[config.dataset]
+    num_images = build_image_cache(cache_dir, list_items(config), width,
+                                   height, config.num_workers)
+    log.infov('{} images of {}x{} are cached'.format(num_images, width,
+                                                     height))
+    stage.commit()
+
+
+if __name__ == '__main__':
+    main()
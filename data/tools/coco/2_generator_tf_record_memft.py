@@ -1,13 +1,14 @@
 import argparse
 import h5py
 import json
+import multiprocessing
 import os
 import numpy as np
 import tensorflow as tf
 
-from tqdm import tqdm
 from coco_utils import *
 from util import log, tf_util
+from data.tools import tf_record_shards
 
 parser = argparse.ArgumentParser(
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -22,6 +23,9 @@ parser.add_argument('--reference_vcaption_dir', type=str,
                     'caption_split_objattr_answer_genome_memft_check_all_answer_thres1_50000_thres2_-1')
 parser.add_argument('--use_train_reserve', action='store_true', default=False)
 parser.add_argument('--num_record_per_shard', type=int, default=1024, help=' ')
+parser.add_argument('--num_workers', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help='processes writing the shards')
 config = parser.parse_args()
 
 config.data_dir = os.path.join(config.caption_split_dir, 'tf_record_memft')
@@ -165,111 +169,62 @@ def get_score(occurences):
     else:
         return 1
 
-max_num_answer = 0
-max_q_len = 0
-for split in ['train']:
-    num_shards = len(caption_split[split]) / config.num_record_per_shard + 1
-    for i, qid in enumerate(tqdm(caption_split[split],
-                                 desc='process {} qids'.format(split))):
-        if i % config.num_record_per_shard == 0:
-            shard_id = int(i / config.num_record_per_shard)
-            shard_name = '{}-{:05d}-of-{:05d}'.format(
-                split, shard_id, num_shards)
-            shard_path = os.path.join(config.data_dir, split, shard_name)
-            if os.path.exists(shard_path):
-                raise ValueError('Existing shard path: {}'.format(shard_path))
-            tf_record_writer = tf.python_io.TFRecordWriter(shard_path)
-
-        caption = qid2caption[str(qid)]
-
-        answer_count = {}
-        for answer in caption['processed_answers']:
-            answer_count[answer] = answer_count.get(answer, 0) + 1
-
-        # use tf.sparse_to_dense to make these values to score vector
-        answer_ids = []
-        answer_scores = []
-        for answer, count in answer_count.items():
-            if answer not in freq_ans_set:
-                continue
-            ans_id = ans_dict[answer]
-            answer_ids.append(ans_id)
-            answer_scores.append(get_score(count))
-        if len(answer_ids) == 0:
+
+def make_example(qid, skip_no_answer):
+    caption = qid2caption[str(qid)]
+
+    answer_count = {}
+    for answer in caption['processed_answers']:
+        answer_count[answer] = answer_count.get(answer, 0) + 1
+
+    # use tf.sparse_to_dense to make these values to score vector
+    answer_ids = []
+    answer_scores = []
+    for answer, count in answer_count.items():
+        if answer not in freq_ans_set:
             continue
+        ans_id = ans_dict[answer]
+        answer_ids.append(ans_id)
+        answer_scores.append(get_score(count))
+    if skip_no_answer and len(answer_ids) == 0:
+        return None
+
+    unk_id = vocab['dict']['<unk>']
+    q_intseq = [vocab['dict'].get(t, unk_id) for t in caption['q_tokens']]
+    q_intseq = np.array(q_intseq, dtype=np.int32)
+
+    image_id = caption['image_path'].replace('/', '-')
+    image_idx = image_id2idx[image_id]
+    tf_example = tf.train.Example(features=tf.train.Features(feature={
+        'qid': tf_util.int64_feature(int(qid)),
+        'image_id': tf_util.bytes_feature(str(image_id)),
+        'image_idx': tf_util.int64_feature(int(image_idx)),
+        'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
+        'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
+        'answers/ids': tf_util.int64_feature(answer_ids),
+        'answers/scores': tf_util.float_feature(answer_scores),
+    }))
+    return qid, tf_example, {'max_q_len': len(q_intseq),
+                             'max_num_answer': len(answer_ids)}
 
-        max_num_answer = max(max_num_answer, len(answer_ids))
-
-        unk_id = vocab['dict']['<unk>']
-        q_intseq = [vocab['dict'].get(t, unk_id) for t in caption['q_tokens']]
-        q_intseq = np.array(q_intseq, dtype=np.int32)
-        used_qid[split].append(qid)
-        max_q_len = max(max_q_len, len(q_intseq))
-
-        image_id = caption['image_path'].replace('/', '-')
-        image_idx = image_id2idx[image_id]
-        tf_example = tf.train.Example(features=tf.train.Features(feature={
-            'qid': tf_util.int64_feature(int(qid)),
-            'image_id': tf_util.bytes_feature(str(image_id)),
-            'image_idx': tf_util.int64_feature(int(image_idx)),
-            'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
-            'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
-            'answers/ids': tf_util.int64_feature(answer_ids),
-            'answers/scores': tf_util.float_feature(answer_scores),
-        }))
-        tf_record_writer.write(tf_example.SerializeToString())
-
-for split in ['val', 'testval', 'test']:
-    num_shards = len(caption_split[split]) / config.num_record_per_shard + 1
-    for i, qid in enumerate(tqdm(caption_split[split],
-                                 desc='process {} qids'.format(split))):
-        if i % config.num_record_per_shard == 0:
-            shard_id = int(i / config.num_record_per_shard)
-            shard_name = '{}-{:05d}-of-{:05d}'.format(
-                split, shard_id, num_shards)
-            shard_path = os.path.join(config.data_dir, split, shard_name)
-            if os.path.exists(shard_path):
-                raise ValueError('Existing shard path: {}'.format(shard_path))
-            tf_record_writer = tf.python_io.TFRecordWriter(shard_path)
-
-        caption = qid2caption[str(qid)]
-
-        answer_count = {}
-        for answer in caption['processed_answers']:
-            answer_count[answer] = answer_count.get(answer, 0) + 1
-
-        # use tf.sparse_to_dense to make these values to score vector
-        answer_ids = []
-        answer_scores = []
-        for answer, count in answer_count.items():
-            if answer not in freq_ans_set:
-                continue
-            ans_id = ans_dict[answer]
-            answer_ids.append(ans_id)
-            answer_scores.append(get_score(count))
-
-        max_num_answer = max(max_num_answer, len(answer_ids))
-
-        unk_id = vocab['dict']['<unk>']
-        q_intseq = [vocab['dict'].get(t, unk_id) for t in caption['q_tokens']]
-        q_intseq = np.array(q_intseq, dtype=np.int32)
-        used_qid[split].append(qid)
-        max_q_len = max(max_q_len, len(q_intseq))
-
-        image_id = caption['image_path'].replace('/', '-')
-        image_idx = image_id2idx[image_id]
-
-        tf_example = tf.train.Example(features=tf.train.Features(feature={
-            'qid': tf_util.int64_feature(int(qid)),
-            'image_id': tf_util.bytes_feature(str(image_id)),
-            'image_idx': tf_util.int64_feature(int(image_idx)),
-            'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
-            'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
-            'answers/ids': tf_util.int64_feature(answer_ids),
-            'answers/scores': tf_util.float_feature(answer_scores),
-        }))
-        tf_record_writer.write(tf_example.SerializeToString())
 
+def make_train_example(qid):
+    return make_example(qid, skip_no_answer=True)
+
+
+def make_eval_example(qid):
+    return make_example(qid, skip_no_answer=False)
+
+
+max_num_answer = 0
+max_q_len = 0
+for split in ['train', 'val', 'testval', 'test']:
+    used_qid[split], stats = tf_record_shards.write_shards(
+        split, caption_split[split],
+        make_train_example if split == 'train' else make_eval_example,
+        config.data_dir, config.num_record_per_shard, config.num_workers)
+    max_q_len = max(max_q_len, stats.get('max_q_len', 0))
+    max_num_answer = max(max_num_answer, stats.get('max_num_answer', 0))
 
 log.warn('write to data_info')
 data_info['num_train'] = len(used_qid['train'])
@@ -2,11 +2,13 @@ import argparse
 import cPickle
 import glob
 import os
+import sys
 
 from collections import Counter
 from tqdm import tqdm
 
 from util import log
+from data.tools import artifact_cache
 
 parser = argparse.ArgumentParser(
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -22,6 +24,15 @@ config = parser.parse_args()
 config.enwiki_paths = glob.glob(os.path.join(config.enwiki_dir, 'wiki_*'))
 
 config.answer_dict_path = os.path.join(config.dir_name, 'answer_dict.pkl')
+
+save_path = os.path.join(config.enwiki_dir, 'merge_and_count.pkl')
+save_text_path = os.path.join(config.enwiki_dir, 'merged_used_sents.txt')
+stage = artifact_cache.FileStage(
+    'merge_and_count', [save_path, save_text_path], args=vars(config),
+    inputs=sorted(config.enwiki_paths) + [config.answer_dict_path])
+if stage.up_to_date(): sys.exit(0)
+stage.begin()
+
 answer_dict = cPickle.load(open(config.answer_dict_path, 'rb'))
 
 vocab_1st_token_set = set([v.split()[0] for v in answer_dict['vocab']])
@@ -51,15 +62,15 @@ word_cnt = Counter(word_list)
 log.info('done')
 most_common = word_cnt.most_common()
 
-save_path = os.path.join(config.enwiki_dir, 'merge_and_count.pkl')
 log.warn('saving results to : {}'.format(save_path))
 cPickle.dump({
     'vocab_1st2sent_idx_list': vocab_1st2sent_idx_list,
     'most_common': most_common,
 }, open(save_path, 'wb'))
-save_text_path = os.path.join(config.enwiki_dir, 'merged_used_sents.txt')
 log.warn('saving results to : {}'.format(save_text_path))
 f = open(save_text_path, 'w')
 for sent in tqdm(used_sents, desc='saving texts'):
     f.write(sent + '\n')
+f.close()
+stage.commit()
 log.warn('done')
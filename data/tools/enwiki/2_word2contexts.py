@@ -2,6 +2,7 @@ import argparse
 import cPickle
 import copy
 import os
+import sys
 
 from collections import Counter
 from itertools import groupby
@@ -9,6 +10,7 @@ from nltk.corpus import stopwords  # remove stopwords and too frequent words (in
 from tqdm import tqdm
 
 from util import log
+from data.tools import artifact_cache
 
 
 parser = argparse.ArgumentParser(
@@ -27,6 +29,19 @@ parser.add_argument('--preprocessing', type=int, default=0,
 config = parser.parse_args()
 
 config.answer_dict_path = os.path.join(config.dir_name, 'answer_dict.pkl')
+
+save_path = os.path.join(
+    config.enwiki_dir, 'word2contexts_w{}_p{}.pkl'.format(
+    config.context_window_size,
+    int(config.preprocessing)))
+stage = artifact_cache.FileStage(
+    'word2contexts', [save_path], args=vars(config),
+    inputs=[config.answer_dict_path,
+            os.path.join(config.enwiki_dir, 'merge_and_count.pkl'),
+            os.path.join(config.enwiki_dir, 'merged_used_sents.txt')])
+if stage.up_to_date(): sys.exit(0)
+stage.begin()
+
 answer_dict = cPickle.load(open(config.answer_dict_path, 'rb'))
 
 vocab_1st_token_set = set([v.split()[0] for v in answer_dict['vocab']])
@@ -105,11 +120,7 @@ for i, v in enumerate(answer_dict['vocab']):
     else:
         word2contexts[v] = dict(Counter([" ".join(c) for c in v_contexts]))
 
-save_path = os.path.join(
-    config.enwiki_dir, 'word2contexts_w{}_p{}.pkl'.format(
-    config.context_window_size,
-    int(config.preprocessing)))
-
 log.warn('saving results to to : {}'.format(save_path))
 cPickle.dump(word2contexts, open(save_path, 'wb'))
+stage.commit()
 log.warn('done')
@@ -2,6 +2,7 @@ import argparse
 import cPickle
 import h5py
 import os
+import sys
 import numpy as np
 
 import math
@@ -14,6 +15,7 @@ from nltk.corpus import stopwords  # remove stopwords and too frequent words (in
 from collections import defaultdict, Counter
 
 from util import log
+from data.tools import artifact_cache
 
 
 cpu_count = multiprocessing.cpu_count()
@@ -45,6 +47,20 @@ parser.add_argument('--min_num_word', type=int, default=5, help='min num word in
 config = parser.parse_args()
 
 config.answer_dict_path = os.path.join(config.dir_name, 'answer_dict.pkl')
+
+save_name = 'enwiki_context_dict_w{}_p{}_n{}'.format(
+    config.context_window_size, config.preprocessing, config.min_num_word)
+save_pkl_path = os.path.join(config.dir_name, '{}.pkl'.format(save_name))
+save_h5_path = os.path.join(config.dir_name, '{}.hdf5'.format(save_name))
+stage = artifact_cache.FileStage(
+    'make_wordset', [save_pkl_path, save_h5_path], args=vars(config),
+    inputs=[config.answer_dict_path] + [
+        os.path.join(enwiki_dir, 'word2contexts_w{}_p{}.pkl'.format(
+            config.context_window_size, int(config.preprocessing)))
+        for enwiki_dir in config.enwiki_dirs])
+if stage.up_to_date(): sys.exit(0)
+stage.begin()
+
 answer_dict = cPickle.load(open(config.answer_dict_path, 'rb'))
 
 word2contexts = None
@@ -425,15 +441,12 @@ enwiki_context_dict = {
     'ans2context_idx': ans2context_idx,
     'ans2context_prob': ans2context_prob,
 }
-save_name = 'enwiki_context_dict_w{}_p{}_n{}'.format(
-    config.context_window_size, config.preprocessing, config.min_num_word)
-save_pkl_path = os.path.join(config.dir_name, '{}.pkl'.format(save_name))
 log.info('saving: {} ..'.format(save_pkl_path))
 cPickle.dump(enwiki_context_dict, open(save_pkl_path, 'wb'))
 
-save_h5_path = os.path.join(config.dir_name, '{}.hdf5'.format(save_name))
 log.info('saving: {} ..'.format(save_h5_path))
 with h5py.File(save_h5_path, 'w') as f:
     f['np_context'] = np_context
     f['np_context_len'] = np_context_len
+stage.commit()
 log.warn('done')
@@ -3,6 +3,7 @@ import argparse
 import cPickle
 import h5py
 import os
+import sys
 import numpy as np
 
 import math
@@ -15,6 +16,7 @@ from nltk.corpus import stopwords  # remove stopwords and too frequent words (in
 from collections import defaultdict, Counter
 
 from util import log
+from data.tools import artifact_cache
 
 
 cpu_count = multiprocessing.cpu_count()
@@ -43,6 +45,7 @@ parser.add_argument('--context_window_size', type=int, default=3,
 parser.add_argument('--preprocessing', type=int, default=0,
                     help='whether to do preprocessing (1) or not (0)')
 parser.add_argument('--min_num_word', type=int, default=5, help='min num word in set')
+parser.add_argument('--seed', type=int, default=123, help='seed of the shuffle')
 config = parser.parse_args()
 
 #config.answer_dict_path = os.path.join(config.dir_name, 'answer_dict.pkl')
@@ -50,20 +53,27 @@ config = parser.parse_args()
 
 save_name = 'enwiki_context_dict_w{}_p{}_n{}'.format(
     config.context_window_size, config.preprocessing, config.min_num_word)
-save_pkl_path = os.path.join(config.dir_name, '{}.pkl'.format(save_name))
+enwiki_pkl_path = os.path.join(config.dir_name, '{}.pkl'.format(save_name))
+# the output of 3_make_wordset is read only, the shuffled context indices
+# are a separate artifact merged by vlmap_memft/datasets/dataset_vlmap.py
+save_pkl_path = os.path.join(config.dir_name, '{}_shuffled.pkl'.format(save_name))
 
+stage = artifact_cache.FileStage(
+    'post_processing', [save_pkl_path], args=vars(config),
+    inputs=[enwiki_pkl_path])
+if stage.up_to_date(): sys.exit(0)
+stage.begin()
 
-log.info('Reading: {} ..'.format(save_pkl_path))
-enwiki_context_dict = cPickle.load(open(save_pkl_path, 'rb'))
+log.info('Reading: {} ..'.format(enwiki_pkl_path))
+enwiki_context_dict = cPickle.load(open(enwiki_pkl_path, 'rb'))
 
-if 'ans2shuffled_context_idx' not in enwiki_context_dict:
-    log.info("Generating `enwiki_context_dict`...")
+log.info("Generating `ans2shuffled_context_idx`...")
+rng = np.random.RandomState(config.seed)
+ans2shuffled_context_idx = copy.deepcopy(enwiki_context_dict['ans2context_idx'])
+for ans in sorted(ans2shuffled_context_idx):
+    rng.shuffle(ans2shuffled_context_idx[ans])
 
-    ans2shuffled_context_idx = copy.deepcopy(enwiki_context_dict['ans2context_idx'])
-    for ans in ans2shuffled_context_idx:
-        np.random.shuffle(ans2shuffled_context_idx[ans])
-    enwiki_context_dict['ans2shuffled_context_idx'] = ans2shuffled_context_idx
-
-    cPickle.dump(enwiki_context_dict, open(save_pkl_path, 'wb'))
-else:
-    log.info("`enwiki_context_dict` already exists. Skip")
+log.info('saving: {} ..'.format(save_pkl_path))
+cPickle.dump({'ans2shuffled_context_idx': ans2shuffled_context_idx},
+             open(save_pkl_path, 'wb'))
+stage.commit()
@@ -0,0 +1,113 @@
+"""
+Convert the image_features of a vfeat hdf5 file to float16 or int8
+(see util/feature_quantization.py) and report the reconstruction error.
+
+    python data/tools/quantize_vfeat.py \\
+        --vfeat_path data/preprocessed/vqa_v2/.../vfeat_bottomup_36.hdf5 \\
+        --dtypes float16 int8
+
+writes vfeat_bottomup_36_float16.hdf5 and vfeat_bottomup_36_int8.hdf5 next
+to the input. Every other dataset and data_info is copied as is. A view
+(util/vfeat_view.py, e.g. the vlmap_memft {split}_vfeat.hdf5) becomes a
+view of the converted base file, which has to be converted first.
+"""
+import argparse
+import h5py
+import json
+import os
+
+from util import log
+from util.feature_quantization import (
+    FEATURE_DTYPES, dequantize, get_feature_dtype, quantize,
+    quantized_vfeat_path, reconstruction_error, summarize_error)
+from util.vfeat_layout import create_image_dataset
+from util.vfeat_view import VFeatView, is_view, write_view
+
+
+def convert(vfeat_path, save_path, dtype, chunk_size):
+    with h5py.File(vfeat_path, 'r') as f_in, h5py.File(save_path, 'w') as f_out:
+        if get_feature_dtype(f_in) != 'float32':
+            raise ValueError('{} is already quantized'.format(vfeat_path))
+        for key in f_in:
+            if key != 'image_features': f_in.copy(key, f_out)
+        f_out['data_info']['feature_dtype'] = dtype
+
+        features = f_in['image_features']
+        # same layout as the input features (contiguous: 0)
+        values = create_image_dataset(
+            f_out, 'image_features', features.shape, dtype,
+            features.chunks[0] if features.chunks else 0)
+        if dtype == 'int8':
+            scales = create_image_dataset(
+                f_out, 'image_feature_scales', features.shape[:-1] + (1,), 'f')
+
+        errors = []
+        for start in range(0, features.shape[0], chunk_size):
+            end = min(start + chunk_size, features.shape[0])
+            chunk = features[start:end]
+            chunk_values, chunk_scales = quantize(chunk, dtype)
+            values[start:end] = chunk_values
+            if chunk_scales is not None: scales[start:end] = chunk_scales
+            errors.append(reconstruction_error(
+                chunk, dequantize(chunk_values, chunk_scales)))
+            log.info('[{}/{}] {}'.format(end, features.shape[0], dtype))
+    error = summarize_error(errors)
+    error['input_mb'] = os.path.getsize(vfeat_path) / 1e6
+    error['output_mb'] = os.path.getsize(save_path) / 1e6
+    return error
+
+
+def convert_view(view_path, save_path, dtype):
+    with VFeatView(view_path) as view:
+        base_path = quantized_vfeat_path(view.base_path, dtype)
+        if not os.path.exists(base_path):
+            raise ValueError('Convert the base file first: {}'.format(
+                view.base_path))
+        index = view.index
+        pretrained_param_path = view['data_info']['pretrained_param_path'].value
+    write_view(save_path, base_path, index,
+               pretrained_param_path=pretrained_param_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--vfeat_path', type=str, required=True, help=' ')
+    parser.add_argument('--dtypes', nargs='+', type=str,
+                        default=['float16', 'int8'],
+                        choices=FEATURE_DTYPES[1:], help=' ')
+    parser.add_argument('--chunk_size', type=int, default=1024,
+                        help='images converted at a time')
+    config = parser.parse_args()
+
+    report = {}
+    for dtype in config.dtypes:
+        save_path = quantized_vfeat_path(config.vfeat_path, dtype)
+        if os.path.exists(save_path):
+            raise ValueError('Do not overwrite: {}'.format(save_path))
+        log.warn('{} -> {}'.format(config.vfeat_path, save_path))
+        if is_view(config.vfeat_path):
+            convert_view(config.vfeat_path, save_path, dtype)
+            continue
+        report[dtype] = convert(config.vfeat_path, save_path, dtype,
+                                config.chunk_size)
+        log.infov('{}: {}'.format(dtype, report[dtype]))
+    if not report:
+        log.warn('views are written, see the report of the base file')
+        return
+
+    report_path = config.vfeat_path.replace('.hdf5', '_quantization.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    log.warn('{:<8} {:>12} {:>12} {:>14} {:>10}'.format(
+        'dtype', 'size (MB)', 'rel. l2', 'mean cosine', 'max abs'))
+    for dtype in config.dtypes:
+        r = report[dtype]
+        log.infov('{:<8} {:>12.1f} {:>12.5f} {:>14.6f} {:>10.4f}'.format(
+            dtype, r['output_mb'], r['relative_l2'], r['mean_cosine'],
+            r['max_abs_error']))
+    log.warn('report is saved in: {}'.format(report_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Rewrite a vfeat hdf5 file with image_features in the per-image chunked
+layout of util/vfeat_layout.py (optionally compressed). Other datasets and
+data_info are copied as is.
+
+    python data/tools/relayout_vfeat.py \\
+        --vfeat_path .../vfeat_bottomup_36.hdf5 --images_per_chunk 1 \\
+        --compression lzf --save_path .../vfeat_bottomup_36_chunked.hdf5
+
+Compare the layouts with data/tools/benchmark_vfeat_layout.py.
+"""
+import argparse
+import h5py
+import os
+
+from util import log
+from util.vfeat_layout import COMPRESSIONS, copy_with_layout, describe_layout
+from util.vfeat_view import VIEW_INDEX
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--vfeat_path', type=str, required=True, help=' ')
+    parser.add_argument('--save_path', type=str, default=None,
+                        help='default: <vfeat_path>_chunk<n>_<compression>.hdf5')
+    parser.add_argument('--images_per_chunk', type=int, default=1, help=' ')
+    parser.add_argument('--compression', type=str, default='none',
+                        choices=COMPRESSIONS, help=' ')
+    parser.add_argument('--images_per_copy', type=int, default=1024,
+                        help='images read at a time')
+    config = parser.parse_args()
+
+    if config.save_path is None:
+        config.save_path = config.vfeat_path.replace(
+            '.hdf5', '_chunk{}_{}.hdf5'.format(config.images_per_chunk,
+                                               config.compression))
+    if os.path.exists(config.save_path):
+        raise ValueError('Do not overwrite: {}'.format(config.save_path))
+
+    with h5py.File(config.vfeat_path, 'r') as f_in:
+        if VIEW_INDEX in f_in:
+            raise ValueError('{} is a view, re-layout its base file'.format(
+                config.vfeat_path))
+        log.infov('input layout: {}'.format(
+            describe_layout(f_in['image_features'])))
+        with h5py.File(config.save_path, 'w') as f_out:
+            copy_with_layout(f_in, f_out, config.images_per_chunk,
+                             config.compression, config.images_per_copy,
+                             log_fn=log.info)
+            log.infov('output layout: {}'.format(
+                describe_layout(f_out['image_features'])))
+    log.warn('{:.1f}MB -> {:.1f}MB: {}'.format(
+        os.path.getsize(config.vfeat_path) / 1e6,
+        os.path.getsize(config.save_path) / 1e6, config.save_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Process pool writer of the {split}-{shard:05d}-of-{num_shards:05d} tfrecord
+shards of the generator_*tf_record* scripts.
+
+Shard k holds items[k * num_record_per_shard:(k + 1) * num_record_per_shard]
+(skipped items included in the count) as in the sequential loops, and each
+worker writes whole shards. The ids and stats of the shards are merged in
+shard order afterwards, so the shards, the id lists and the data_info
+stats are the same for any number of workers.
+
+Usage in a script (make_example is called in the workers):
+
+    def make_example(qid):
+        ...
+        if skip: return None
+        return qid, tf_example, {'max_q_len': len(q_intseq)}
+
+    used_qid[split], stats = tf_record_shards.write_shards(
+        split, qa_split[split], make_example, config.data_dir,
+        config.num_record_per_shard, config.num_workers)
+
+The workers are forked: make_example can read the module globals of the
+script (annotations, vocab) without pickling them.
+"""
+import multiprocessing
+import os
+
+from tqdm import tqdm
+
+from util import log
+
+_make_example = None
+_job = None
+
+
+def shard_path(save_dir, split, shard_id, num_shards):
+    return os.path.join(save_dir, split, '{}-{:05d}-of-{:05d}'.format(
+        split, shard_id, num_shards))
+
+
+def merge_stats(stats, new_stats):
+    """ The stats are maxima (max_q_len, max_num_answer, ...). """
+    for key, value in new_stats.items():
+        stats[key] = max(stats.get(key, value), value)
+    return stats
+
+
+def _write_shard(shard_id):
+    import tensorflow as tf
+    split, items, save_dir, num_record_per_shard, num_shards = _job
+    path = shard_path(save_dir, split, shard_id, num_shards)
+    if os.path.exists(path):
+        raise ValueError('Existing shard path: {}'.format(path))
+    ids = []
+    stats = {}
+    writer = tf.python_io.TFRecordWriter(path)
+    start = shard_id * num_record_per_shard
+    for item in items[start:start + num_record_per_shard]:
+        result = _make_example(item)
+        if result is None: continue
+        record_id, tf_example, example_stats = result
+        writer.write(tf_example.SerializeToString())
+        ids.append(record_id)
+        merge_stats(stats, example_stats)
+    writer.close()
+    return shard_id, ids, stats
+
+
+def write_shards(split, items, make_example, save_dir, num_record_per_shard,
+                 num_workers=1):
+    """
+    Args:
+        - make_example: item -> None (skipped) or
+            (record id, tf.train.Example, {stat: value})
+    Returns:
+        - ids: record ids in the order of the shards
+        - stats: maxima of the stats
+    """
+    global _make_example, _job
+    num_shards = len(items) // num_record_per_shard + 1
+    num_used_shards = (len(items) + num_record_per_shard - 1) // \
+        num_record_per_shard
+    _make_example = make_example
+    _job = (split, items, save_dir, num_record_per_shard, num_shards)
+
+    results = {}
+    desc = 'write {} shards'.format(split)
+    if num_workers > 1 and num_used_shards > 1:
+        pool = multiprocessing.Pool(min(num_workers, num_used_shards))
+        for shard_id, ids, stats in tqdm(pool.imap_unordered(
+                _write_shard, range(num_used_shards)),
+                total=num_used_shards, desc=desc):
+            results[shard_id] = (ids, stats)
+        pool.close()
+        pool.join()
+    else:
+        for shard_id in tqdm(range(num_used_shards), desc=desc):
+            results[shard_id] = _write_shard(shard_id)[1:]
+    _make_example = _job = None
+
+    all_ids = []
+    all_stats = {}
+    for shard_id in range(num_used_shards):
+        ids, stats = results[shard_id]
+        all_ids.extend(ids)
+        merge_stats(all_stats, stats)
+    log.info('{}: {} records in {} shards'.format(
+        split, len(all_ids), num_used_shards))
+    return all_ids, all_stats
@@ -2,12 +2,15 @@ import argparse
 import cPickle
 import json
 import os
+import sys
 
 from collections import defaultdict
 from nltk.corpus import wordnet as wn
 from textblob import Word
 from tqdm import tqdm
 
+from data.tools import artifact_cache
+
 
 def str2bool(v):
     return v.lower() in ('true', '1')
@@ -32,6 +35,13 @@ config.answer_dict_path = os.path.join(
 config.save_wordset_path = os.path.join(
     config.dir_name, 'wordset_dict{}_depth{}.pkl'.format(config.min_num_word, int(config.expand_depth)))
 
+stage = artifact_cache.FileStage(
+    'find_word_group', [config.save_wordset_path], args=vars(config),
+    inputs=[config.object_synset_path, config.attribute_synset_path,
+            config.answer_dict_path])
+if stage.up_to_date(): sys.exit(0)
+stage.begin()
+
 object_synsets = json.load(open(config.object_synset_path, 'r'))
 attribute_synsets = json.load(open(config.attribute_synset_path, 'r'))
 
@@ -123,4 +133,5 @@ for k, v_list in hypernym_wordset.items():
         wordset_dict['wordset2ans'][k_idx].add(v_idx)
 
 cPickle.dump(wordset_dict, open(config.save_wordset_path, 'wb'))
+stage.commit()
 print('wordset is saved in : {}'.format(config.save_wordset_path))
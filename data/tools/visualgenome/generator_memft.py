@@ -18,12 +18,13 @@ import cPickle
 import h5py
 import json
 import os
+import sys
 import numpy as np
 
 from collections import Counter
 from tqdm import tqdm
 
-from data.tools import tools
+from data.tools import artifact_cache, tools
 from util import box_utils
 
 RANDOM_STATE = np.random.RandomState(123)
@@ -55,8 +56,12 @@ config.dir_name += '_attr{}'.format(config.num_attribute)
 if config.max_description_length > 0:
     config.dir_name += '_maxlen{}'.format(config.max_description_length)
 
-if not os.path.exists(config.dir_name): os.makedirs(config.dir_name)
-else: raise ValueError('Do not overwrite {}'.format(config.dir_name))
+stage = artifact_cache.DirStage(
+    'generator_memft', config.dir_name, args=vars(config),
+    inputs=[config.vocab_path, config.bottomup_data_dir, IMAGE_DATA_PATH] +
+    sorted(ANNO_FILES.values()))
+if stage.up_to_date(): sys.exit(0)
+config.dir_name = stage.begin()
 
 config.save_vocab_path = os.path.join(config.dir_name, 'vocab.pkl')
 config.save_answer_dict = os.path.join(config.dir_name, 'answer_dict.pkl')
@@ -593,4 +598,5 @@ for split in ['train', 'val']:
         os.path.join(config.dir_name, '{}_image_info.pkl'.format(split)), 'wb'))
 cPickle.dump(image_split, open(config.save_image_split, 'wb'))
 
+stage.commit()
 print('done')
@@ -9,6 +9,7 @@ import numpy as np
 
 from tqdm import tqdm
 from util import box_utils, log
+from util.vfeat_layout import COMPRESSIONS, create_image_dataset
 
 BOTTOM_UP_FILE_NAMES = [
     'genome_all_resnet101_faster_rcnn_genome.tsv.0',
@@ -24,6 +25,12 @@ parser = argparse.ArgumentParser(
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 parser.add_argument('--bottomup_data_dir', type=str,
                     default='data/VisualGenome/bottomup_feature_36', help=' ')
+parser.add_argument('--images_per_chunk', type=int, default=0,
+                    help='hdf5 chunk size in images of image_features '
+                    '(0: contiguous)')
+parser.add_argument('--compression', type=str, default='none',
+                    choices=COMPRESSIONS,
+                    help='image_features (needs images_per_chunk)')
 config = parser.parse_args()
 
 image_data = json.load(open(IMAGE_DATA_PATH, 'r'))
@@ -47,13 +54,14 @@ np_field = ['boxes', 'features']
 
 f = h5py.File(config.vfeat_path, 'w')
 
-image_features = f.create_dataset(
-    'image_features', (len(image_id2idx), NUM_BOXES, FEATURE_DIM), 'f')
-normal_boxes = f.create_dataset(
-    'normal_boxes', (len(image_id2idx), NUM_BOXES, 4), 'f')
+image_features = create_image_dataset(
+    f, 'image_features', (len(image_id2idx), NUM_BOXES, FEATURE_DIM), 'f',
+    config.images_per_chunk, config.compression)
+normal_boxes = create_image_dataset(
+    f, 'normal_boxes', (len(image_id2idx), NUM_BOXES, 4), 'f')
 num_boxes = np.zeros([len(image_id2idx)], dtype=np.int32)
-spatial_features = f.create_dataset(
-    'spatial_features', (len(image_id2idx), NUM_BOXES, 6), 'f')
+spatial_features = create_image_dataset(
+    f, 'spatial_features', (len(image_id2idx), NUM_BOXES, 6), 'f')
 
 for file_name in BOTTOM_UP_FILE_NAMES:
     log.warn('process: {}'.format(file_name))
@@ -2,12 +2,14 @@ import argparse
 import cPickle
 import h5py
 import json
+import multiprocessing
 import os
 import numpy as np
 import tensorflow as tf
 
 from tqdm import tqdm
 from util import log, tf_util
+from data.tools import tf_record_shards
 
 NUM_BOXES = 36
 FEATURE_DIM = 2048
@@ -21,6 +23,9 @@ parser.add_argument('--save_dir', type=str,
                     '/bottomup_vqa_tf_record_memft', help=' ')
 parser.add_argument('--use_train_reserve', action='store_true', default=False)
 parser.add_argument('--num_record_per_shard', type=int, default=1024, help=' ')
+parser.add_argument('--num_workers', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help='processes writing the shards')
 config = parser.parse_args()
 
 config.data_info_path = os.path.join(config.save_dir, 'data_info.hdf5')
@@ -182,6 +187,22 @@ def _load_dataset(dataroot, name, img_id2val):
 
     return entries
 
+
+def make_example(entry):
+    tf_example = tf.train.Example(features=tf.train.Features(feature={
+        'qid': tf_util.int64_feature(int(entry['question_id'])),
+        'image_id': tf_util.bytes_feature(str(entry['image_id'])),
+        'image_idx': tf_util.int64_feature(int(entry['image'])),
+        'q_intseq/list': tf_util.int64_feature(entry['q_token']),
+        'q_intseq/len': tf_util.int64_feature(len(entry['q_token'])),
+        'answers/ids': tf_util.int64_feature(entry['answer']['labels']),
+        'answers/scores': tf_util.float_feature(entry['answer']['scores']),
+    }))
+    return entry['question_id'], tf_example, {
+        'max_q_len': len(entry['q_token']),
+        'max_num_answer': len(entry['answer']['labels'])}
+
+
 max_q_len = 0
 max_num_answer = 0
 num_data = {}
@@ -199,30 +220,11 @@ for split in ['train', 'val']:
         os.makedirs(tf_record_dir)
 
     num_data[split] = len(entries)
-    num_shards = len(entries) / config.num_record_per_shard + 1
-    for i, entry in enumerate(tqdm(entries,
-                                   desc='write tfrecord {}'.format(split))):
-        if i % config.num_record_per_shard == 0:
-            shard_id = int(i / config.num_record_per_shard)
-            shard_name = '{}-{:05d}-of-{:05d}'.format(
-                split, shard_id, num_shards)
-            shard_path = os.path.join(config.save_dir, split, shard_name)
-            if os.path.exists(shard_path):
-                raise ValueError('Existing shard path: {}'.format(shard_path))
-            tf_record_writer = tf.python_io.TFRecordWriter(shard_path)
-
-        max_q_len = max(max_q_len, len(entry['q_token']))
-        max_num_answer = max(max_num_answer, len(entry['answer']['labels']))
-        tf_example = tf.train.Example(features=tf.train.Features(feature={
-            'qid': tf_util.int64_feature(int(entry['question_id'])),
-            'image_id': tf_util.bytes_feature(str(entry['image_id'])),
-            'image_idx': tf_util.int64_feature(int(entry['image'])),
-            'q_intseq/list': tf_util.int64_feature(entry['q_token']),
-            'q_intseq/len': tf_util.int64_feature(len(entry['q_token'])),
-            'answers/ids': tf_util.int64_feature(entry['answer']['labels']),
-            'answers/scores': tf_util.float_feature(entry['answer']['scores']),
-        }))
-        tf_record_writer.write(tf_example.SerializeToString())
+    _, stats = tf_record_shards.write_shards(
+        split, entries, make_example, config.save_dir,
+        config.num_record_per_shard, config.num_workers)
+    max_q_len = max(max_q_len, stats.get('max_q_len', 0))
+    max_num_answer = max(max_num_answer, stats.get('max_num_answer', 0))
 
 # Construct image_info
 used_image_paths = set()
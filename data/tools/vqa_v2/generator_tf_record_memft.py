@@ -1,12 +1,14 @@
 import argparse
 import h5py
 import json
+import multiprocessing
 import os
+import sys
 import numpy as np
 import tensorflow as tf
 
-from tqdm import tqdm
 from util import log, tf_util
+from data.tools import artifact_cache, tf_record_shards
 
 parser = argparse.ArgumentParser(
     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -15,18 +17,23 @@ parser.add_argument('--qa_split_dir', type=str,
                     '/new_qa_split_thres1_500_thres2_50', help=' ')
 parser.add_argument('--use_train_reserve', action='store_true', default=False)
 parser.add_argument('--num_record_per_shard', type=int, default=1024, help=' ')
+parser.add_argument('--num_workers', type=int,
+                    default=multiprocessing.cpu_count(),
+                    help='processes writing the shards')
 config = parser.parse_args()
 
 config.data_dir = os.path.join(config.qa_split_dir, 'tf_record_memft')
+stage = artifact_cache.DirStage(
+    'generator_tf_record_memft', config.data_dir,
+    # the shards do not depend on the number of workers
+    args={k: v for k, v in vars(config).items() if k != 'num_workers'},
+    inputs=[os.path.join(config.qa_split_dir, name) for name in [
+        'vocab.json', 'frequent_answers.json', 'merged_annotations.json',
+        'qa_split.json', 'used_image_path.txt']])
+if stage.up_to_date(): sys.exit(0)
+config.data_dir = stage.begin()
 config.data_path = os.path.join(config.data_dir, 'data_info.hdf5')
 config.id_path = os.path.join(config.data_dir, 'id.txt')
-if not os.path.exists(config.data_dir):
-    log.warn('create directory: {}'.format(config.data_dir))
-    os.makedirs(config.data_dir)
-else:
-    raise ValueError(
-        'The directory {} already exists. Do not overwrite.'.format(
-            config.data_dir))
 
 log.info('loading vocab')
 vocab = json.load(open(
@@ -137,111 +144,62 @@ def get_score(occurences):
     else:
         return 1
 
-max_num_answer = 0
-max_q_len = 0
-for split in ['train']:
-    num_shards = len(qa_split[split]) / config.num_record_per_shard + 1
-    for i, qid in enumerate(tqdm(qa_split[split],
-                                 desc='process {} qids'.format(split))):
-        if i % config.num_record_per_shard == 0:
-            shard_id = int(i / config.num_record_per_shard)
-            shard_name = '{}-{:05d}-of-{:05d}'.format(
-                split, shard_id, num_shards)
-            shard_path = os.path.join(config.data_dir, split, shard_name)
-            if os.path.exists(shard_path):
-                raise ValueError('Existing shard path: {}'.format(shard_path))
-            tf_record_writer = tf.python_io.TFRecordWriter(shard_path)
 
-        anno = qid2anno[str(qid)]
+def make_example(qid, skip_no_answer):
+    anno = qid2anno[str(qid)]
 
-        answer_count = {}
-        for answer in anno['processed_answers']:
-            answer_count[answer] = answer_count.get(answer, 0) + 1
+    answer_count = {}
+    for answer in anno['processed_answers']:
+        answer_count[answer] = answer_count.get(answer, 0) + 1
 
-        # use tf.sparse_to_dense to make these values to score vector
-        answer_ids = []
-        answer_scores = []
-        for answer, count in answer_count.items():
-            if answer not in freq_ans_set:
-                continue
-            ans_id = ans_dict[answer]
-            answer_ids.append(ans_id)
-            answer_scores.append(get_score(count))
-        if len(answer_ids) == 0:
+    # use tf.sparse_to_dense to make these values to score vector
+    answer_ids = []
+    answer_scores = []
+    for answer, count in answer_count.items():
+        if answer not in freq_ans_set:
             continue
+        ans_id = ans_dict[answer]
+        answer_ids.append(ans_id)
+        answer_scores.append(get_score(count))
+    if skip_no_answer and len(answer_ids) == 0:
+        return None
 
-        max_num_answer = max(max_num_answer, len(answer_ids))
-
-        unk_id = vocab['dict']['<unk>']
-        q_intseq = [vocab['dict'].get(t, unk_id) for t in anno['q_tokens']]
-        q_intseq = np.array(q_intseq, dtype=np.int32)
-        used_qid[split].append(qid)
-        max_q_len = max(max_q_len, len(q_intseq))
-
-        image_id = anno['image_path'].replace('/', '-')
-        image_idx = image_id2idx[image_id]
-        tf_example = tf.train.Example(features=tf.train.Features(feature={
-            'qid': tf_util.int64_feature(int(qid)),
-            'image_id': tf_util.bytes_feature(str(image_id)),
-            'image_idx': tf_util.int64_feature(int(image_idx)),
-            'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
-            'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
-            'answers/ids': tf_util.int64_feature(answer_ids),
-            'answers/scores': tf_util.float_feature(answer_scores),
-        }))
-        tf_record_writer.write(tf_example.SerializeToString())
+    unk_id = vocab['dict']['<unk>']
+    q_intseq = [vocab['dict'].get(t, unk_id) for t in anno['q_tokens']]
+    q_intseq = np.array(q_intseq, dtype=np.int32)
 
-for split in ['val', 'testval', 'test']:
-    num_shards = len(qa_split[split]) / config.num_record_per_shard + 1
-    for i, qid in enumerate(tqdm(qa_split[split],
-                                 desc='process {} qids'.format(split))):
-        if i % config.num_record_per_shard == 0:
-            shard_id = int(i / config.num_record_per_shard)
-            shard_name = '{}-{:05d}-of-{:05d}'.format(
-                split, shard_id, num_shards)
-            shard_path = os.path.join(config.data_dir, split, shard_name)
-            if os.path.exists(shard_path):
-                raise ValueError('Existing shard path: {}'.format(shard_path))
-            tf_record_writer = tf.python_io.TFRecordWriter(shard_path)
+    image_id = anno['image_path'].replace('/', '-')
+    image_idx = image_id2idx[image_id]
+    tf_example = tf.train.Example(features=tf.train.Features(feature={
+        'qid': tf_util.int64_feature(int(qid)),
+        'image_id': tf_util.bytes_feature(str(image_id)),
+        'image_idx': tf_util.int64_feature(int(image_idx)),
+        'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
+        'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
+        'answers/ids': tf_util.int64_feature(answer_ids),
+        'answers/scores': tf_util.float_feature(answer_scores),
+    }))
+    return qid, tf_example, {'max_q_len': len(q_intseq),
+                             'max_num_answer': len(answer_ids)}
 
-        anno = qid2anno[str(qid)]
 
-        answer_count = {}
-        for answer in anno['processed_answers']:
-            answer_count[answer] = answer_count.get(answer, 0) + 1
+def make_train_example(qid):
+    return make_example(qid, skip_no_answer=True)
 
-        # use tf.sparse_to_dense to make these values to score vector
-        answer_ids = []
-        answer_scores = []
-        for answer, count in answer_count.items():
-            if answer not in freq_ans_set:
-                continue
-            ans_id = ans_dict[answer]
-            answer_ids.append(ans_id)
-            answer_scores.append(get_score(count))
 
-        max_num_answer = max(max_num_answer, len(answer_ids))
+def make_eval_example(qid):
+    return make_example(qid, skip_no_answer=False)
 
-        unk_id = vocab['dict']['<unk>']
-        q_intseq = [vocab['dict'].get(t, unk_id) for t in anno['q_tokens']]
-        q_intseq = np.array(q_intseq, dtype=np.int32)
-        used_qid[split].append(qid)
-        max_q_len = max(max_q_len, len(q_intseq))
-
-        image_id = anno['image_path'].replace('/', '-')
-        image_idx = image_id2idx[image_id]
-
-        tf_example = tf.train.Example(features=tf.train.Features(feature={
-            'qid': tf_util.int64_feature(int(qid)),
-            'image_id': tf_util.bytes_feature(str(image_id)),
-            'image_idx': tf_util.int64_feature(int(image_idx)),
-            'q_intseq/list': tf_util.int64_feature(list(q_intseq)),
-            'q_intseq/len': tf_util.int64_feature(len(q_intseq)),
-            'answers/ids': tf_util.int64_feature(answer_ids),
-            'answers/scores': tf_util.float_feature(answer_scores),
-        }))
-        tf_record_writer.write(tf_example.SerializeToString())
 
+max_num_answer = 0
+max_q_len = 0
+for split in ['train', 'val', 'testval', 'test']:
+    used_qid[split], stats = tf_record_shards.write_shards(
+        split, qa_split[split],
+        make_train_example if split == 'train' else make_eval_example,
+        config.data_dir, config.num_record_per_shard, config.num_workers)
+    max_q_len = max(max_q_len, stats.get('max_q_len', 0))
+    max_num_answer = max(max_num_answer, stats.get('max_num_answer', 0))
 
 log.warn('write to data_info')
 data_info['num_train'] = len(used_qid['train'])
@@ -272,3 +230,4 @@ answer_dict = {
 }
 json.dump(answer_dict, open(answer_dict_path, 'w'))
 log.infov('answer_dict is saved to: {}'.format(answer_dict_path))
+stage.commit()
@@ -0,0 +1,345 @@
+"""
+Ingest the bottom-up attention features (TSV) into hdf5.
+
+Replaces process_bottom_up_attention_{36, 36_memft_genome,
+36_my_memft_genome, 10_100}.py, which are the presets below:
+
+    python data/tools/vqa_v2/process_bottom_up_attention.py --preset 36_my_memft_genome
+
+The TSV files are split into byte ranges (aligned to lines) that worker
+processes decode in parallel (base64 -> features, normalized boxes and
+spatial features); the speedup over the sequential scripts comes from this
+parallel decoding. The TSV order is not the image_idx order, so the dense
+writer still writes about one row per hdf5 call: it sorts a buffer of rows
+by image_idx so the writes move forward through the file, and only merges
+the rare runs of consecutive indices. rows/sec and the number of writes
+are logged.
+
+Layouts:
+    - dense: image_features / normal_boxes / spatial_features of shape
+        [num_images, NUM_BOXES, ...] indexed by image_idx of image_info
+    - group: one group per image (variable number of boxes)
+"""
+import argparse
+import base64
+import cPickle
+import h5py
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+
+from util import box_utils, log
+from util.vfeat_layout import COMPRESSIONS, create_image_dataset
+
+NUM_BOXES = 36
+FEATURE_DIM = 2048
+GROUP_BOX_SIZE = 540.0
+
+PRESETS = {
+    '36': {
+        'layout': 'dense',
+        'file_names': ['trainval/trainval_resnet101_faster_rcnn_genome_36.tsv'],
+        'bottom_up_dir': 'data/VQA_v2/bottom_up_attention_36',
+        'save_dir': 'data/preprocessed/vqa_v2'
+                    '/new_qa_split_thres1_500_thres2_50/tf_record_memft',
+        'image_info_name': 'image_info.json',
+        'vfeat_name': 'vfeat_bottomup_36.hdf5',
+        'pretrained_param_path': 'bottom_up_attention_36',
+    },
+    '36_memft_genome': {
+        'layout': 'dense',
+        'file_names': ['trainval/trainval_resnet101_faster_rcnn_genome_36.tsv'],
+        'bottom_up_dir': 'data/VQA_v2/bottom_up_attention_36',
+        'save_dir': 'data/preprocessed/vqa_v2'
+                    '/qa_split_genome_memft_thres1_500_thres2_50/tf_record_memft',
+        'image_info_name': 'image_info.pkl',
+        'vfeat_name': 'vfeat_bottomup_36.hdf5',
+        'pretrained_param_path': 'bottom_up_attention_36',
+    },
+    '36_my_memft_genome': {
+        'layout': 'dense',
+        'file_names': ['vqa_trainval_resnet101_faster_rcnn_genome.tsv.0',
+                       'vqa_trainval_resnet101_faster_rcnn_genome.tsv.1',
+                       'vqa_trainval_resnet101_faster_rcnn_genome.tsv.2'],
+        'bottom_up_dir': 'data/VQA_v2/bottomup_feature_36_my',
+        'save_dir': 'data/preprocessed/vqa_v2'
+                    '/qa_split_genome_memft_thres1_500_thres2_50/tf_record_memft',
+        'image_info_name': 'image_info.pkl',
+        'vfeat_name': 'vfeat_bottomup_36_my.hdf5',
+        'pretrained_param_path': 'bottom_up_attention_36',
+    },
+    '10_100': {
+        'layout': 'group',
+        'file_names': [
+            'trainval/karpathy_test_resnet101_faster_rcnn_genome.tsv',
+            'trainval/karpathy_train_resnet101_faster_rcnn_genome.tsv.0',
+            'trainval/karpathy_train_resnet101_faster_rcnn_genome.tsv.1',
+            'trainval/karpathy_val_resnet101_faster_rcnn_genome.tsv'],
+        'bottom_up_dir': 'data/VQA_v2/bottom_up_attention_10_100',
+        'save_dir': 'data/preprocessed/vqa_v2/qa_split_thres1_500_thres2_50',
+        'vfeat_name': 'used_vfeat_bottom_up_10_100.hdf5',
+        'pretrained_param_path': 'bottom_up_attention_10_100',
+    },
+}
+
+
+def split_byte_ranges(path, chunk_bytes):
+    """
+    Returns:
+        - [(path, start, end)]: every line belongs to the range its first
+            byte is in
+    """
+    size = os.path.getsize(path)
+    return [(path, start, min(start + chunk_bytes, size))
+            for start in range(0, size, chunk_bytes)]
+
+
+def read_lines(path, start, end):
+    with open(path, 'rb') as f:
+        if start > 0:
+            # skip the line started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line: break
+            yield line
+
+
+def decode_row(line, layout):
+    image_id, image_w, image_h, num_boxes, boxes, features = \
+        line.rstrip('\r\n').split('\t')
+    num_boxes = int(num_boxes)
+    row = {
+        'image_id': int(image_id),
+        'image_w': int(image_w),
+        'image_h': int(image_h),
+        'num_boxes': num_boxes,
+        'features': np.frombuffer(base64.b64decode(features),
+                                  dtype=np.float32).reshape((num_boxes, -1)),
+    }
+    box = np.frombuffer(base64.b64decode(boxes),
+                        dtype=np.float32).reshape((num_boxes, -1))
+    if layout == 'dense':
+        normal_box = box_utils.normalize_boxes_x1y1x2y2(
+            box, float(row['image_w']), float(row['image_h']))
+        row['normal_boxes'] = normal_box
+        row['spatial_features'] = np.concatenate(
+            [normal_box, normal_box[:, 2:4] - normal_box[:, 0:2]], axis=1)
+    else:
+        frac_x = GROUP_BOX_SIZE / float(row['image_w'])
+        frac_y = GROUP_BOX_SIZE / float(row['image_h'])
+        row['box'] = box_utils.scale_boxes_x1y1x2y2(box, [frac_x, frac_y])
+        row['normal_box'] = box_utils.normalize_boxes_x1y1x2y2(
+            row['box'], GROUP_BOX_SIZE, GROUP_BOX_SIZE)
+    return row
+
+
+def decode_range(args):
+    """ Worker: decode all rows of a byte range. """
+    path, start, end, layout = args
+    return [decode_row(line, layout) for line in read_lines(path, start, end)]
+
+
+def load_image_num2idx(save_dir, image_info_name):
+    image_info_path = os.path.join(save_dir, image_info_name)
+    log.infov('loading image_info: {}'.format(image_info_path))
+    if image_info_name.endswith('.json'):
+        image_info = json.load(open(image_info_path, 'r'))
+    else: image_info = cPickle.load(open(image_info_path, 'rb'))
+    image_path2idx = image_info['image_path2idx']
+    # json has string keys, pkl has int keys
+    image_num2idx = {int(num): image_path2idx[path]
+                     for num, path in image_info['image_num2path'].items()}
+    return image_num2idx, len(image_info['image_id2idx'])
+
+
+def load_image_id2path(save_dir):
+    anno_path = os.path.join(save_dir, 'merged_annotations.json')
+    log.infov('processing anno: {}'.format(anno_path))
+    qid2anno = json.load(open(anno_path, 'r'))
+    return {anno['image_id']: anno['image_path'] for anno in qid2anno.values()}
+
+
+class DenseWriter(object):
+    """
+    Writes the buffered rows in image_idx order, one hdf5 call per run of
+    consecutive indices (mostly single rows: the TSV order is not
+    correlated with image_idx).
+    """
+
+    KEYS = ['features', 'normal_boxes', 'spatial_features']
+
+    def __init__(self, f, image_num2idx, num_images, buffer_rows=2048,
+                 images_per_chunk=0, compression=None):
+        self.image_num2idx = image_num2idx
+        self.buffer_rows = buffer_rows
+        shapes = {
+            'features': ('image_features', [NUM_BOXES, FEATURE_DIM]),
+            'normal_boxes': ('normal_boxes', [NUM_BOXES, 4]),
+            'spatial_features': ('spatial_features', [NUM_BOXES, 6]),
+        }
+        self.datasets = {
+            key: create_image_dataset(f, name, tuple([num_images] + shape), 'f')
+            for key, (name, shape) in shapes.items() if key != 'features'}
+        # only the features are chunked (see util/vfeat_layout.py)
+        name, shape = shapes['features']
+        self.datasets['features'] = create_image_dataset(
+            f, name, tuple([num_images] + shape), 'f', images_per_chunk,
+            compression)
+        self.num_boxes = np.zeros([num_images], dtype=np.int32)
+        self.buffer = []
+        self.num_writes = 0
+        self.unknown_image_nums = []
+
+    def add(self, row):
+        image_idx = self.image_num2idx.get(row['image_id'], None)
+        if image_idx is None:
+            self.unknown_image_nums.append(row['image_id'])
+            return
+        if row['num_boxes'] != NUM_BOXES:
+            raise ValueError('image {} has {} boxes, expected {}'.format(
+                row['image_id'], row['num_boxes'], NUM_BOXES))
+        self.buffer.append((image_idx, row))
+        if len(self.buffer) >= self.buffer_rows: self.flush()
+
+    def flush(self):
+        self.buffer.sort(key=lambda x: x[0])
+        run_start = 0
+        for i in range(1, len(self.buffer) + 1):
+            if i < len(self.buffer) and \
+                    self.buffer[i][0] == self.buffer[i - 1][0] + 1:
+                continue
+            run = self.buffer[run_start:i]
+            start, end = run[0][0], run[-1][0] + 1
+            for key in self.KEYS:
+                self.datasets[key][start:end] = np.stack(
+                    [row[key] for _, row in run], axis=0)
+            for image_idx, row in run:
+                self.num_boxes[image_idx] = row['num_boxes']
+            self.num_writes += 1
+            run_start = i
+        self.buffer = []
+
+    def close(self, f, pretrained_param_path):
+        self.flush()
+        if self.unknown_image_nums:
+            log.error('{} rows of images missing in image_info are skipped: '
+                      '{} ...'.format(len(self.unknown_image_nums),
+                                      self.unknown_image_nums[:10]))
+        f['num_boxes'] = self.num_boxes
+        data_info = f.create_group('data_info')
+        data_info['vfeat_dim'] = FEATURE_DIM
+        data_info['max_box_num'] = NUM_BOXES
+        data_info['pretrained_param_path'] = pretrained_param_path
+
+
+class GroupWriter(object):
+
+    def __init__(self, f, image_id2path):
+        self.f = f
+        self.image_id2path = image_id2path
+        self.vfeat_dim = 0
+        self.max_box_num = 0
+        self.num_writes = 0
+
+    def add(self, row):
+        image_path_id = self.image_id2path[row['image_id']].replace('/', '-')
+        grp = self.f.create_group(image_path_id)
+        grp['image_num_id'] = row['image_id']
+        grp['original_image_w'] = row['image_w']
+        grp['original_image_h'] = row['image_h']
+        grp['box_image_w'] = int(GROUP_BOX_SIZE)
+        grp['box_image_h'] = int(GROUP_BOX_SIZE)
+        grp['num_box'] = row['num_boxes']
+        grp['vfeat'] = row['features']
+        grp['box'] = row['box']
+        grp['normal_box'] = row['normal_box']
+        self.vfeat_dim = row['features'].shape[1]
+        self.max_box_num = max(self.max_box_num, row['num_boxes'])
+        self.num_writes += 1
+
+    def close(self, f, pretrained_param_path):
+        data_info = f.create_group('data_info')
+        data_info['vfeat_dim'] = self.vfeat_dim
+        data_info['max_box_num'] = self.max_box_num
+        data_info['pretrained_param_path'] = pretrained_param_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--preset', type=str, required=True,
+                        choices=sorted(PRESETS.keys()))
+    parser.add_argument('--save_dir', type=str, default=None,
+                        help='tf_record_memft_dir (dense) or qa_split_dir '
+                        '(group), default: see PRESETS')
+    parser.add_argument('--bottom_up_dir', type=str, default=None,
+                        help='default: see PRESETS')
+    parser.add_argument('--vfeat_name', type=str, default=None,
+                        help='default: see PRESETS')
+    parser.add_argument('--num_workers', type=int,
+                        default=max(multiprocessing.cpu_count() - 1, 1),
+                        help='decoding processes')
+    parser.add_argument('--chunk_mb', type=int, default=64,
+                        help='size of the byte ranges read by a worker')
+    parser.add_argument('--buffer_rows', type=int, default=2048,
+                        help='rows written in image_idx order at a time (dense)')
+    parser.add_argument('--images_per_chunk', type=int, default=0,
+                        help='hdf5 chunk size in images of image_features '
+                        '(dense, 0: contiguous)')
+    parser.add_argument('--compression', type=str, default='none',
+                        choices=COMPRESSIONS,
+                        help='image_features (dense, needs images_per_chunk)')
+    config = parser.parse_args()
+
+    preset = PRESETS[config.preset]
+    layout = preset['layout']
+    save_dir = config.save_dir or preset['save_dir']
+    bottom_up_dir = config.bottom_up_dir or preset['bottom_up_dir']
+    vfeat_path = os.path.join(save_dir, config.vfeat_name or preset['vfeat_name'])
+    if layout == 'group' and os.path.exists(vfeat_path):
+        raise ValueError('The file exists. Do not overwrite: {}'.format(
+            vfeat_path))
+
+    # fork the workers before opening the hdf5 file
+    pool = multiprocessing.Pool(config.num_workers)
+    f = h5py.File(vfeat_path, 'w')
+    if layout == 'dense':
+        image_num2idx, num_images = load_image_num2idx(
+            save_dir, preset['image_info_name'])
+        writer = DenseWriter(f, image_num2idx, num_images, config.buffer_rows,
+                             config.images_per_chunk, config.compression)
+    else:
+        writer = GroupWriter(f, load_image_id2path(save_dir))
+
+    ranges = []
+    for file_name in preset['file_names']:
+        path = os.path.join(bottom_up_dir, file_name)
+        ranges.extend(split_byte_ranges(path, config.chunk_mb * (1 << 20)))
+    log.warn('{} byte ranges of {} file(s), {} workers'.format(
+        len(ranges), len(preset['file_names']), config.num_workers))
+
+    start_time = time.time()
+    num_rows = 0
+    for i, rows in enumerate(pool.imap_unordered(
+            decode_range, [r + (layout,) for r in ranges])):
+        for row in rows: writer.add(row)
+        num_rows += len(rows)
+        log.info('[{}/{}] {} rows, {:.1f} rows/sec'.format(
+            i + 1, len(ranges), num_rows, num_rows / (time.time() - start_time)))
+    pool.close()
+    pool.join()
+
+    writer.close(f, preset['pretrained_param_path'])
+    f.close()
+    elapsed = time.time() - start_time
+    log.warn('{} rows in {:.1f}s ({:.1f} rows/sec, {} writes): {}'.format(
+        num_rows, elapsed, num_rows / max(elapsed, 1e-6), writer.num_writes,
+        vfeat_path))
+
+
+if __name__ == '__main__':
+    main()
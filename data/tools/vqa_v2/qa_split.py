@@ -1,15 +1,39 @@
+"""
+Split VQA questions by the objects (or attributes / answers) they mention.
+
+Replaces qa_split.py, qa_split_memft_genome.py,
+qa_split_objattr_memft_genome.py and qa_split_objattr_answer_memft_genome.py,
+which are the variants below:
+
+    python data/tools/vqa_v2/qa_split.py --variant objattr_answer_memft_genome
+
+The VQA questions and annotations are merged and tokenized once into
+--token_cache_path (shared by the variants): the tokens of the questions and
+answers are stored as int sequences over the vocabulary of the cache. The
+phrases of a variant are indexed in a trie over these ids, and every
+question is matched with one walk per start token instead of building the
+strings of all its ngrams. The matched phrases are exactly the ngrams of the
+legacy scripts (same ngram lengths) that are phrases, so the occurrences,
+the splits (same RandomState call order) and the outputs are the same.
+
+Phrase grouping (occurrence counted once per question):
+    1. occurrence >= occ_thres_1: always 'train'
+    2. occ_thres_1 > occurrence >= occ_thres_2: random split of 'train' and
+       'test'
+    3. occ_thres_2 > occurrence: random split of 'train-reserve' and 'test'
+"""
 import argparse
+import cPickle
 import h5py
 import json
 import os
+import sys
 import re
 import numpy as np
 
 from tqdm import tqdm
 from util import log
-
-
-RANDOM_STATE = np.random.RandomState(123)
+from data.tools import artifact_cache
 
 
 QUESTION_PATHS = {
@@ -25,80 +49,92 @@ ANNOTATION_PATHS = {
     '/v2_mscoco_val2014_annotations.json',
 }
 
-parser = argparse.ArgumentParser(
-    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-parser.add_argument('--vocab_path', type=str,
-                    default='data/preprocessed/new_vocab50.json', help=' ')
-parser.add_argument('--vlmap_traindata_dir', type=str,
-                    default='data/preprocessed/visualgenome'
-                    '/merged_by_image_new_vocab50_min_region20', help=' ')
-parser.add_argument('--occ_thres_1', type=int, default=500,
-                    help='object classes with occurrence greater or equal to '
-                    'this threshold are splited into train')
-parser.add_argument('--occ_thres_2', type=int, default=50,
-                    help='object classes with occurrence greater or equal to '
-                    'this threshold are splited into train and test. If '
-                    'occurrence is smaller, they are splited into train-reserve '
-                    'and test.')
-parser.add_argument('--save_split_dir', type=str,
-                    default='data/preprocessed/vqa_v2/new_qa_split')
-config = parser.parse_args()
-
-vocab = json.load(open(config.vocab_path, 'r'))
-
-config.save_split_dir += '_thres1_{}'.format(config.occ_thres_1)
-config.save_split_dir += '_thres2_{}'.format(config.occ_thres_2)
-
-if not os.path.exists(config.save_split_dir):
-    log.warn('Create directory: {}'.format(config.save_split_dir))
-    os.makedirs(config.save_split_dir)
-else:
-    raise ValueError(
-        'The directory {} already exists. Do not overwrite.'.format(
-            config.save_split_dir))
-
-
-def intseq2str(intseq):
-    return ' '.join([vocab['vocab'][i] for i in intseq])
-
-with h5py.File(os.path.join(config.vlmap_traindata_dir, 'data.hdf5'), 'r') as f:
-    objects_intseq = f['data_info']['objects_intseq'].value
-    objects_intseq_len = f['data_info']['objects_intseq_len'].value
-
-objects = []
-for intseq, intseq_len in zip(objects_intseq, objects_intseq_len):
-    objects.append(intseq2str(intseq[:intseq_len]))
+GENOME_MEMFT_DIR = 'data/preprocessed/visualgenome' \
+    '/memft_all_new_vocab50_obj3000_attr1000_maxlen10'
+
+"""
+Variants:
+    - phrases: 'vlmap_objects' (objects_intseq of the vlmap train data),
+        'genome_objects' (object_list.pkl) or 'genome_objattrs'
+        (object_list.pkl + attribute_list.pkl)
+    - question_ngrams: ngram lengths 1 .. min(len, max_name_len) - 1
+        ('exclusive'), 1 .. min(len, max_name_len) ('inclusive') or None
+    - answer_match: ngrams of the multiple choice answer ('ngrams', lengths
+        as 'exclusive'), the whole processed answers ('answers') or the whole
+        processed answers which are not digits ('answers_no_digit')
+    - min_occurrence: phrases occurring less are in none of the splits
+    - split_fraction: (num, den) of groups 2 and 3 going to train /
+        train-reserve
+"""
+VARIANTS = {
+    'qa_split': {
+        'stage_name': 'qa_split',
+        'phrases': 'vlmap_objects',
+        'question_ngrams': 'exclusive',
+        'answer_match': 'ngrams',
+        'occ_thres_1': 500,
+        'occ_thres_2': 50,
+        'min_occurrence': 0,
+        'split_fraction': (1, 2),
+        'save_split_dir': 'data/preprocessed/vqa_v2/new_qa_split',
+        'output_format': 'json',
+        'phrase_split_name': 'object_split',
+        'save_phrase_lists': False,
+    },
+    'memft_genome': {
+        'stage_name': 'qa_split_memft_genome',
+        'phrases': 'genome_objects',
+        'question_ngrams': 'exclusive',
+        'answer_match': 'ngrams',
+        'occ_thres_1': 500,
+        'occ_thres_2': 50,
+        'min_occurrence': 0,
+        'split_fraction': (1, 2),
+        'save_split_dir': 'data/preprocessed/vqa_v2/qa_split_genome_memft',
+        'output_format': 'pkl',
+        'phrase_split_name': 'object_split',
+        'save_phrase_lists': False,
+    },
+    'objattr_memft_genome': {
+        'stage_name': 'qa_split_objattr_memft_genome',
+        'phrases': 'genome_objattrs',
+        'question_ngrams': 'inclusive',
+        'answer_match': 'answers',
+        'occ_thres_1': 3000,
+        'occ_thres_2': 50,
+        'min_occurrence': 0,
+        'split_fraction': (1, 2),
+        'save_split_dir': 'data/preprocessed/vqa_v2'
+                          '/qa_split_objattr_genome_memft_check_all_answer',
+        'output_format': 'pkl',
+        'phrase_split_name': 'obj_attrs_split',
+        'save_phrase_lists': True,
+    },
+    'objattr_answer_memft_genome': {
+        'stage_name': 'qa_split_objattr_answer_memft_genome',
+        'phrases': 'genome_objattrs',
+        'question_ngrams': None,
+        'answer_match': 'answers_no_digit',
+        'occ_thres_1': 50000,
+        'occ_thres_2': -1,
+        'min_occurrence': 1,
+        'split_fraction': (3, 4),
+        'save_split_dir': 'data/preprocessed/vqa_v2'
+                          '/qa_split_objattr_answer_3div4_genome_memft'
+                          '_check_all_answer',
+        'output_format': 'pkl',
+        'phrase_split_name': 'obj_attrs_split',
+        'save_phrase_lists': True,
+    },
+}
 
 """
 When we split objects, we consider every object classes independent. Therefore,
 splits such as "right leg" and "left leg" could happen. This is because making
 disjoint set based on the vocabulary is difficult as most vocabulary is
 connected to each other and more than 900 vocabulary end up belongs to the same
-clusters. For splits including subsets such as "leg" and "right leg", we allocate
-questions to longest object name split.
+clusters.
 """
-questions = {}
-for key, path in tqdm(QUESTION_PATHS.items(), desc='Loading questions'):
-    questions[key] = json.load(open(path, 'r'))
-merge_questions = []
-for key, entry in questions.items():
-    merge_questions.extend(entry['questions'])
-
-annotations = {}
-for key, path in tqdm(ANNOTATION_PATHS.items(), desc='Loading annotations'):
-    annotations[key] = json.load(open(path, 'r'))
-merge_annotations = []
-for key, entry in annotations.items():
-    data_subtype = entry['data_subtype']
-    for anno in tqdm(entry['annotations'], desc='Annotation {}'.format(key)):
-        anno['image_path'] = '{}/COCO_{}_{:012d}.jpg'.format(
-            data_subtype, data_subtype, anno['image_id'])
-        anno['split'] = data_subtype
-        merge_annotations.append(anno)
-
-qid2anno = {a['question_id']: a for a in merge_annotations}
-for q in tqdm(merge_questions, desc='merge question and annotations'):
-    qid2anno[q['question_id']]['question'] = q['question']
 
 contractions = {
     "aint": "ain't", "arent": "aren't", "cant": "can't", "couldve":
@@ -199,178 +235,388 @@ def preprocess_answer(answer):
     answer = answer.replace(',', '')
     return answer
 
-for qid in tqdm(qid2anno.keys(), desc='tokenize QA'):
-    anno = qid2anno[qid]
-    qid2anno[qid]['q_tokens'] = split_with_punctuation(
-        anno['question'].lower())
-    qid2anno[qid]['a_tokens'] = split_with_punctuation(
-        preprocess_answer(anno['multiple_choice_answer'].lower()))
-    processed_answers = []
-    for answer in anno['answers']:
-        a_tokens = split_with_punctuation(
-            preprocess_answer(answer['answer'].lower()))
-        processed_answers.append(' '.join(a_tokens))
-    qid2anno[qid]['processed_answers'] = processed_answers
-
-"""
-Test question or answer could have training object words, but it should contain
-at least one test object words, which is unseen during training.
-"""
 
-
-def get_ngrams(tokens, n):
-    ngrams = []
-    for i in range(0, len(tokens) - n + 1):
-        ngrams.append(' '.join(tokens[i: i+n]))
-    return ngrams
-
-occurrence = {name: 0 for name in objects}
-max_name_len = objects_intseq_len.max()
-qid2ngrams = {}
-for qid, anno in tqdm(qid2anno.items(), desc='count object occurrence'):
-    q_tokens = anno['q_tokens']
-    a_tokens = anno['a_tokens']
-    ngrams = []
-    for n in range(1, min(len(q_tokens), max_name_len)):
-        ngrams.extend(get_ngrams(q_tokens, n))
-    for n in range(1, min(len(a_tokens), max_name_len)):
-        ngrams.extend(get_ngrams(a_tokens, n))
-    ngrams = list(set(ngrams))
-    for ngram in ngrams:
-        if ngram in occurrence: occurrence[ngram] += 1
-    qid2ngrams[qid] = ngrams
-
-"""
-How we could split object classes based on occurrence in questions and answers?
-1. Generalization to rare words: have rare objects in the test set.
-This way of spliting classes well matches with the motivation:
-    Collecting VQA training data for all rare object classes are difficult, but
-    there are rich set of object annotations.
-    So transfer to rare words make sense.
-Why should we keep very frequent words:
-    This is to run reasoning well. VQA training data with very rare words only
-    teaches the biases. But rich words appears with various forms of questions
-    and this help to learn real reasoning, not a bias.
-* How we will split data:
-    1. occurence >= threshold_1: always training set
-    2. threshold_1 > occurrence >= threshold_2: random split
-    3. threshold_2 > occurrence: always testing set
-
-c.f)
-Among 4810 classes
-top 500 occurrence object classes have more than 500 occurrences
-if we pick top 1650-th occurrece object, its occurrene is around 50.
-Therefore, with threshold_1 == 500, threshold_2 == 50,
-around 487 classes are always 'train'
-around 1167 classes are randomly splited into 'train' and 'test'
-around 3156 classes are randomly splited into 'train-reserve' and 'test'
-(train-reserve could be used for training or not, based on the experiment result)
-"""
-log.warn('Split objects')
-obj_grp1 = [name for name, occ in occurrence.items()
-            if occ >= config.occ_thres_1]
-obj_grp2 = [name for name, occ in occurrence.items()
-            if config.occ_thres_1 > occ >= config.occ_thres_2]
-obj_grp3 = [name for name, occ in occurrence.items()
-            if config.occ_thres_2 > occ]
-RANDOM_STATE.shuffle(obj_grp1)
-RANDOM_STATE.shuffle(obj_grp2)
-half2 = len(obj_grp2) / 2
-RANDOM_STATE.shuffle(obj_grp3)
-half3 = len(obj_grp3) / 2
-objects_split = {
-    'train': obj_grp1 + obj_grp2[:half2],
-    'train-reserve': obj_grp3[:half3],
-    'test': obj_grp2[half2:] + obj_grp3[half3:],
-}
-objects_split_set = {key: set(val) for key, val in objects_split.items()}
-log.infov('train object: {}'.format(len(objects_split['train'])))
-log.info('ex)')
-for obj in objects_split['train'][:5]: log.info(obj)
-
-log.infov('train-reserve object: {}'.format(len(objects_split['train-reserve'])))
-log.info('ex)')
-for obj in objects_split['train-reserve'][:5]: log.info(obj)
-
-log.infov('test object: {}'.format(len(objects_split['test'])))
-log.info('ex)')
-for obj in objects_split['test'][:5]: log.info(obj)
-
-
-def filter_qids_by_object_split(qids, split):
-    filtered_qids = []
-    for qid in tqdm(qids, desc='mark {} QA'.format(split)):
-        ngrams = qid2ngrams[qid]
-        is_target_split = False
-        for ngram in ngrams:
-            if ngram in objects_split_set[split]:
-                is_target_split = True
-                break
-        if is_target_split: filtered_qids.append(qid)
-    return filtered_qids
-
-qids = qid2anno.keys()
-
-log.warn('Mark test QA')
-test_qids = filter_qids_by_object_split(qids, 'test')
-left_qids = list(set(qids) - set(test_qids))
-log.infov('{} question ids are marked for test objects'.format(len(test_qids)))
-
-log.warn('Mark train-reserve QA')
-train_reserve_qids = filter_qids_by_object_split(left_qids, 'train-reserve')
-train_qids = list(set(left_qids) - set(train_reserve_qids))
-log.infov('{} question ids are marked for train-reserve objects'.format(
-    len(train_reserve_qids)))
-log.infov('{} question ids are marked for train objects'.format(
-    len(train_qids)))
-
-log.warn('Shuffle qids')
-RANDOM_STATE.shuffle(train_qids)
-RANDOM_STATE.shuffle(train_reserve_qids)
-RANDOM_STATE.shuffle(test_qids)
-
-train_90p = len(train_qids) * 90 / 100
-train_reserve_90p = len(train_reserve_qids) * 90 / 100
-test_80p = len(test_qids) * 80 / 100
-
-qid_splits = {}
-log.warn('Split testval / test')
-qid_splits['testval'] = test_qids[test_80p:]
-qid_splits['test'] = test_qids[:test_80p]
-log.infov('test: {}, testval: {}'.format(
-    len(qid_splits['test']), len(qid_splits['testval'])))
-
-log.warn('Split train / val')
-qid_splits['val'] = train_qids[train_90p:]
-qid_splits['train'] = train_qids[:train_90p]
-log.infov('train: {}, val: {}'.format(
-    len(qid_splits['train']), len(qid_splits['val'])))
-qid_splits['val-reserve'] = train_reserve_qids[train_reserve_90p:]
-qid_splits['train-reserve'] = train_reserve_qids[:train_reserve_90p]
-log.infov('train-reserve: {}, val-reserve: {}'.format(
-    len(qid_splits['train-reserve']), len(qid_splits['val-reserve'])))
-
-# used image ids
-used_image_paths = []
-for anno in tqdm(qid2anno.values(), desc='construct used_image_ids'):
-    used_image_paths.append(anno['image_path'])
-used_image_paths = list(set(used_image_paths))
-log.infov('used_image_paths: {}'.format(len(used_image_paths)))
-
-"""
-What to save:
-    - used image ids (for efficient feature extraction)
-    - object splits (train , train-reserve, test)
-    - qa splits qids (train, val, train-reserve, val-reserve, testval, test)
-    - annotations: merged annotations is saved for evaluation / future usage
-"""
-with open(os.path.join(config.save_split_dir, 'used_image_path.txt'), 'w') as f:
-    for image_path in used_image_paths:
-        f.write(image_path + '\n')
-json.dump(objects_split, open(os.path.join(
-    config.save_split_dir, 'object_split.json'), 'w'))
-json.dump(qid_splits, open(os.path.join(
-    config.save_split_dir, 'qa_split.json'), 'w'))
-json.dump(qid2anno, open(os.path.join(
-    config.save_split_dir, 'merged_annotations.json'), 'w'))
-log.warn('output saving is done.')
+def load_merged_annotations():
+    """
+    Returns:
+        - qids: question ids in the order of qid2anno.keys() of the legacy
+            scripts (the order the splits are drawn in)
+        - qid2anno: annotations with question, image_path, split, q_tokens,
+            a_tokens and processed_answers
+    """
+    questions = {}
+    for key, path in tqdm(QUESTION_PATHS.items(), desc='Loading questions'):
+        questions[key] = json.load(open(path, 'r'))
+    merge_questions = []
+    for key, entry in questions.items():
+        merge_questions.extend(entry['questions'])
+
+    annotations = {}
+    for key, path in tqdm(ANNOTATION_PATHS.items(),
+                          desc='Loading annotations'):
+        annotations[key] = json.load(open(path, 'r'))
+    merge_annotations = []
+    for key, entry in annotations.items():
+        data_subtype = entry['data_subtype']
+        for anno in tqdm(entry['annotations'],
+                         desc='Annotation {}'.format(key)):
+            anno['image_path'] = '{}/COCO_{}_{:012d}.jpg'.format(
+                data_subtype, data_subtype, anno['image_id'])
+            anno['split'] = data_subtype
+            merge_annotations.append(anno)
+
+    qid2anno = {a['question_id']: a for a in merge_annotations}
+    for q in tqdm(merge_questions, desc='merge question and annotations'):
+        qid2anno[q['question_id']]['question'] = q['question']
+
+    for qid in tqdm(qid2anno.keys(), desc='tokenize QA'):
+        anno = qid2anno[qid]
+        anno['q_tokens'] = split_with_punctuation(anno['question'].lower())
+        anno['a_tokens'] = split_with_punctuation(
+            preprocess_answer(anno['multiple_choice_answer'].lower()))
+        processed_answers = []
+        for answer in anno['answers']:
+            a_tokens = split_with_punctuation(
+                preprocess_answer(answer['answer'].lower()))
+            processed_answers.append(' '.join(a_tokens))
+        anno['processed_answers'] = processed_answers
+    return qid2anno.keys(), qid2anno
+
+
+def build_token_cache():
+    qids, qid2anno = load_merged_annotations()
+    vocab = []
+    token2id = {}
+
+    def to_intseq(tokens):
+        intseq = []
+        for t in tokens:
+            if t not in token2id:
+                token2id[t] = len(vocab)
+                vocab.append(t)
+            intseq.append(token2id[t])
+        return intseq
+
+    q_intseq = []
+    a_intseq = []
+    for qid in tqdm(qids, desc='tokens to intseq'):
+        q_intseq.append(to_intseq(qid2anno[qid]['q_tokens']))
+        a_intseq.append(to_intseq(qid2anno[qid]['a_tokens']))
+    return {
+        'qids': qids,
+        'qid2anno': qid2anno,
+        'vocab': vocab,
+        'q_intseq': q_intseq,
+        'a_intseq': a_intseq,
+    }
+
+
+def load_token_cache(token_cache_path):
+    stage = artifact_cache.FileStage(
+        'qa_split_tokens', [token_cache_path],
+        inputs=sorted(QUESTION_PATHS.values()) +
+        sorted(ANNOTATION_PATHS.values()))
+    if stage.up_to_date():
+        log.info('loading tokenized QA: {}'.format(token_cache_path))
+        return cPickle.load(open(token_cache_path, 'rb'))
+    stage.begin()
+    cache = build_token_cache()
+    cPickle.dump(cache, open(token_cache_path, 'wb'),
+                 protocol=cPickle.HIGHEST_PROTOCOL)
+    stage.commit()
+    log.infov('tokenized QA is saved in: {}'.format(token_cache_path))
+    return cache
+
+
+def load_phrases(config, variant):
+    """
+    Returns:
+        - phrases: names of the phrases to split
+        - max_name_len: maximum number of words of a phrase
+        - phrase_lists: {name: list} saved with the outputs
+    """
+    if variant['phrases'] == 'vlmap_objects':
+        vocab = json.load(open(config.vocab_path, 'r'))
+        with h5py.File(os.path.join(
+                config.vlmap_traindata_dir, 'data.hdf5'), 'r') as f:
+            objects_intseq = f['data_info']['objects_intseq'].value
+            objects_intseq_len = f['data_info']['objects_intseq_len'].value
+        objects = []
+        for intseq, intseq_len in zip(objects_intseq, objects_intseq_len):
+            objects.append(' '.join(
+                [vocab['vocab'][i] for i in intseq[:intseq_len]]))
+        return objects, objects_intseq_len.max(), {}
+
+    objects = cPickle.load(open(os.path.join(
+        config.genome_memft_dir, 'object_list.pkl'), 'rb'))
+    if variant['phrases'] == 'genome_objects':
+        phrases = objects
+        phrase_lists = {}
+    elif variant['phrases'] == 'genome_objattrs':
+        attrs = cPickle.load(open(os.path.join(
+            config.genome_memft_dir, 'attribute_list.pkl'), 'rb'))
+        phrases = objects + attrs
+        phrase_lists = {'object_list': objects, 'attribute_list': attrs}
+    else:
+        raise ValueError('Unknown phrases: {}'.format(variant['phrases']))
+    return phrases, max([len(name.split()) for name in phrases]), phrase_lists
+
+
+PHRASE = -1  # key of the phrase ending at a trie node (token ids are >= 0)
+
+
+def build_phrase_trie(phrases, token2id):
+    """
+    Trie of the phrases over the token ids. A phrase with a word which is
+    not a token of any question or answer can not be matched and is left
+    out.
+    """
+    trie = {}
+    for name in phrases:
+        intseq = [token2id.get(t, None) for t in name.split(' ')]
+        if None in intseq: continue
+        node = trie
+        for i in intseq:
+            node = node.setdefault(i, {})
+        node[PHRASE] = name
+    return trie
+
+
+def match_ngrams(intseq, max_n, trie, matched):
+    """ Adds the phrases among the ngrams of intseq of length 1 .. max_n. """
+    seq_len = len(intseq)
+    for start in range(seq_len):
+        node = trie
+        for i in range(start, min(start + max_n, seq_len)):
+            node = node.get(intseq[i], None)
+            if node is None: break
+            if PHRASE in node: matched.add(node[PHRASE])
+
+
+def count_occurrence(cache, phrases, max_name_len, variant):
+    """
+    Returns:
+        - occurrence: {phrase: number of questions mentioning it}
+        - qid2phrases: {qid: set of phrases mentioned}
+    """
+    token2id = {t: i for i, t in enumerate(cache['vocab'])}
+    trie = build_phrase_trie(phrases, token2id)
+    occurrence = {name: 0 for name in phrases}
+
+    # the legacy ngram lengths: range(1, min(len, max_name_len) [+ 1])
+    q_offset = {'exclusive': 1, 'inclusive': 0, None: None}[
+        variant['question_ngrams']]
+    answer_match = variant['answer_match']
+    if answer_match not in ('ngrams', 'answers', 'answers_no_digit'):
+        raise ValueError('Unknown answer_match: {}'.format(answer_match))
+
+    qid2phrases = {}
+    for k, qid in enumerate(tqdm(cache['qids'],
+                                 desc='count phrase occurrence')):
+        matched = set()
+        if q_offset is not None:
+            q_intseq = cache['q_intseq'][k]
+            match_ngrams(q_intseq, min(len(q_intseq), max_name_len) - q_offset,
+                         trie, matched)
+        if answer_match == 'ngrams':
+            a_intseq = cache['a_intseq'][k]
+            match_ngrams(a_intseq, min(len(a_intseq), max_name_len) - 1,
+                         trie, matched)
+        else:
+            for answer in cache['qid2anno'][qid]['processed_answers']:
+                if answer_match == 'answers_no_digit' and \
+                        str.isdigit(str(answer)):
+                    continue
+                if answer in occurrence: matched.add(answer)
+        for name in matched:
+            occurrence[name] += 1
+        qid2phrases[qid] = matched
+    return occurrence, qid2phrases
+
+
+def split_phrases(occurrence, config, variant, random_state):
+    min_occ = variant['min_occurrence']
+    num, den = variant['split_fraction']
+    grp1 = [name for name, occ in occurrence.items()
+            if occ >= max(config.occ_thres_1, min_occ)]
+    grp2 = [name for name, occ in occurrence.items()
+            if config.occ_thres_1 > occ >= max(config.occ_thres_2, min_occ)]
+    grp3 = [name for name, occ in occurrence.items()
+            if config.occ_thres_2 > occ >= min_occ]
+    random_state.shuffle(grp1)
+    log.warn('# grp1: {}'.format(len(grp1)))
+    random_state.shuffle(grp2)
+    cut2 = len(grp2) * num // den
+    log.warn('# grp2: {}'.format(len(grp2)))
+    random_state.shuffle(grp3)
+    cut3 = len(grp3) * num // den
+    log.warn('# grp3: {}'.format(len(grp3)))
+    phrase_split = {
+        'train': grp1 + grp2[:cut2],
+        'train-reserve': grp3[:cut3],
+        'test': grp2[cut2:] + grp3[cut3:],
+    }
+    for split in ['train', 'train-reserve', 'test']:
+        log.infov('{} phrases: {}'.format(split, len(phrase_split[split])))
+        log.info('ex)')
+        for name in phrase_split[split][:5]: log.info(name)
+    return phrase_split
+
+
+def filter_qids_by_phrase_split(qids, qid2phrases, split_set, split):
+    """
+    Test question or answer could have training object words, but it should
+    contain at least one test object words, which is unseen during training.
+    """
+    return [qid for qid in tqdm(qids, desc='mark {} QA'.format(split))
+            if not qid2phrases[qid].isdisjoint(split_set)]
+
+
+def split_qids(qids, qid2phrases, phrase_split, random_state):
+    log.warn('Mark test QA')
+    test_qids = filter_qids_by_phrase_split(
+        qids, qid2phrases, set(phrase_split['test']), 'test')
+    left_qids = list(set(qids) - set(test_qids))
+    log.infov('{} question ids are marked for test phrases'.format(
+        len(test_qids)))
+
+    log.warn('Mark train-reserve QA')
+    train_reserve_qids = filter_qids_by_phrase_split(
+        left_qids, qid2phrases, set(phrase_split['train-reserve']),
+        'train-reserve')
+    train_qids = list(set(left_qids) - set(train_reserve_qids))
+    log.infov('{} question ids are marked for train-reserve phrases'.format(
+        len(train_reserve_qids)))
+    log.infov('{} question ids are marked for train phrases'.format(
+        len(train_qids)))
+
+    log.warn('Shuffle qids')
+    random_state.shuffle(train_qids)
+    random_state.shuffle(train_reserve_qids)
+    random_state.shuffle(test_qids)
+
+    train_90p = len(train_qids) * 90 // 100
+    train_reserve_90p = len(train_reserve_qids) * 90 // 100
+    test_80p = len(test_qids) * 80 // 100
+
+    qid_splits = {}
+    qid_splits['testval'] = test_qids[test_80p:]
+    qid_splits['test'] = test_qids[:test_80p]
+    qid_splits['val'] = train_qids[train_90p:]
+    qid_splits['train'] = train_qids[:train_90p]
+    qid_splits['val-reserve'] = train_reserve_qids[train_reserve_90p:]
+    qid_splits['train-reserve'] = train_reserve_qids[:train_reserve_90p]
+    for split in ['train', 'val', 'train-reserve', 'val-reserve',
+                  'test', 'testval']:
+        log.infov('{}: {}'.format(split, len(qid_splits[split])))
+    return qid_splits
+
+
+def save_outputs(save_dir, variant, used_image_paths, phrase_split,
+                 qid_splits, qid2anno, phrase_lists):
+    """
+    What to save:
+        - used image ids (for efficient feature extraction)
+        - phrase splits (train , train-reserve, test)
+        - qa splits qids (train, val, train-reserve, val-reserve, testval,
+          test)
+        - annotations: merged annotations is saved for evaluation / future
+          usage
+    """
+    with open(os.path.join(save_dir, 'used_image_path.txt'), 'w') as f:
+        for image_path in used_image_paths:
+            f.write(image_path + '\n')
+    outputs = [(variant['phrase_split_name'], phrase_split),
+               ('qa_split', qid_splits),
+               ('merged_annotations', qid2anno)]
+    if variant['save_phrase_lists']:
+        outputs.extend([('object_list', phrase_lists['object_list']),
+                        ('attribute_list', phrase_lists['attribute_list'])])
+    for name, obj in outputs:
+        if variant['output_format'] == 'json':
+            json.dump(obj, open(os.path.join(
+                save_dir, name + '.json'), 'w'))
+        else:
+            cPickle.dump(obj, open(os.path.join(
+                save_dir, name + '.pkl'), 'wb'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--variant', type=str, default='qa_split',
+                        choices=sorted(VARIANTS.keys()), help=' ')
+    parser.add_argument('--vocab_path', type=str,
+                        default='data/preprocessed/new_vocab50.json',
+                        help='qa_split variant')
+    parser.add_argument('--vlmap_traindata_dir', type=str,
+                        default='data/preprocessed/visualgenome'
+                        '/merged_by_image_new_vocab50_min_region20',
+                        help='qa_split variant')
+    parser.add_argument('--genome_memft_dir', type=str,
+                        default=GENOME_MEMFT_DIR,
+                        help='*_memft_genome variants')
+    parser.add_argument('--occ_thres_1', type=int, default=None,
+                        help='phrases with occurrence greater or equal to '
+                        'this threshold are splited into train '
+                        '(default: per variant)')
+    parser.add_argument('--occ_thres_2', type=int, default=None,
+                        help='phrases with occurrence greater or equal to '
+                        'this threshold are splited into train and test. If '
+                        'occurrence is smaller, they are splited into '
+                        'train-reserve and test (default: per variant)')
+    parser.add_argument('--save_split_dir', type=str, default=None,
+                        help='default: per variant')
+    parser.add_argument('--token_cache_path', type=str,
+                        default='data/preprocessed/vqa_v2/qa_tokens.pkl',
+                        help='tokenized QA shared by the variants')
+    config = parser.parse_args()
+
+    variant = VARIANTS[config.variant]
+    for key in ['occ_thres_1', 'occ_thres_2', 'save_split_dir']:
+        if getattr(config, key) is None: setattr(config, key, variant[key])
+    config.save_split_dir += '_thres1_{}'.format(config.occ_thres_1)
+    config.save_split_dir += '_thres2_{}'.format(config.occ_thres_2)
+
+    if variant['phrases'] == 'vlmap_objects':
+        phrase_inputs = [config.vocab_path, os.path.join(
+            config.vlmap_traindata_dir, 'data.hdf5')]
+    else:
+        phrase_inputs = [os.path.join(config.genome_memft_dir,
+                                      'object_list.pkl')]
+        if variant['phrases'] == 'genome_objattrs':
+            phrase_inputs.append(os.path.join(config.genome_memft_dir,
+                                              'attribute_list.pkl'))
+    stage = artifact_cache.DirStage(
+        variant['stage_name'], config.save_split_dir,
+        # the splits do not depend on where the tokens are cached
+        args={k: v for k, v in vars(config).items()
+              if k != 'token_cache_path'},
+        inputs=phrase_inputs + sorted(QUESTION_PATHS.values()) +
+        sorted(ANNOTATION_PATHS.values()))
+    if stage.up_to_date(): sys.exit(0)
+    config.save_split_dir = stage.begin()
+
+    random_state = np.random.RandomState(123)
+    phrases, max_name_len, phrase_lists = load_phrases(config, variant)
+    cache = load_token_cache(config.token_cache_path)
+    qids = cache['qids']
+    qid2anno = cache['qid2anno']
+
+    occurrence, qid2phrases = count_occurrence(
+        cache, phrases, max_name_len, variant)
+    log.warn('Split phrases')
+    phrase_split = split_phrases(occurrence, config, variant, random_state)
+    qid_splits = split_qids(qids, qid2phrases, phrase_split, random_state)
+
+    used_image_paths = list(set([qid2anno[qid]['image_path'] for qid in qids]))
+    log.infov('used_image_paths: {}'.format(len(used_image_paths)))
+
+    save_outputs(config.save_split_dir, variant, used_image_paths,
+                 phrase_split, qid_splits, qid2anno, phrase_lists)
+    log.warn('output saving is done.')
+    stage.commit()
+
+
+if __name__ == '__main__':
+    main()
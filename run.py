@@ -1,46 +1,19 @@
 import os
-import time
-import shlex
-import itertools
-import subprocess
 from glob import glob
 from datetime import datetime
-from collections import defaultdict
 
 from util import log
+from util import scheduler
+from util.scheduler import Job
 
 def list_dir(directory, prefix="", postfix=""):
     lists = glob(directory + "/{}*{}".format(prefix, postfix))
     lists.sort()
     return lists
 
-def grouper(iterable, n):
-    it = iter(iterable)
-    while True:
-       chunk = tuple(itertools.islice(it, n))
-       if not chunk:
-           return
-       yield chunk
-
 def parallel_run(commands, config):
-    groups = list(grouper(commands, config.num_thread))
-
-    for idx, cmds in enumerate(groups):
-        procs = []
-
-        for num, cmd in enumerate(cmds):
-            if num > 0:
-                time.sleep(60*3)
-
-            print(" [*] Group {}/{}, Thread {}/{}". \
-                format(idx, len(groups), num, len(cmds)))
-
-            cmd = 'CUDA_VISIBLE_DEVICES={} '.format(num % config.num_gpu) + cmd
-            proc = run(cmd, config)
-            procs.append(proc)
-
-        for proc in procs:
-            proc.wait()
+    """ Run independent commands as soon as a slot frees up. """
+    return scheduler.run_commands(commands, config)
 
 def makedirs(path):
     if not os.path.exists(path):
@@ -58,12 +31,21 @@ def symlink(src_path, dst_path):
         log.info("Sym link: {}->{}".format(src_path, dst_path))
         os.symlink(src_path, dst_path)
 
-def run(cmd, config):
-    print(" [*] {}".format(cmd))
-    if not config.debug:
-        proc = subprocess.Popen(cmd, shell=True)
-        time.sleep(1)
-    return proc
+def find_arg(path, arg):
+    for item in path.split('_')[::-1]:
+        if item.startswith(arg):
+            value = item[len(arg):]
+            return value
+
+def find_checkpoint_step(directory, steps=(4800, 4801)):
+    for step in steps:
+        check_path = os.path.join(directory, "model-{}.data-00000-of-00001".format(step))
+        if os.path.exists(check_path):
+            return step
+    log.error("="*40)
+    log.error(" {} not found".format(check_path))
+    log.error("="*40)
+    return None
 
 
 if __name__ == '__main__':
@@ -75,13 +57,17 @@ if __name__ == '__main__':
     parser.add_argument('num_gpu', type=int)
     parser.add_argument('vlmap_prefix', type=str)
     parser.add_argument('--debug', type=int, default=0, help='0: normal, 1: debug')
-    parser.add_argument('--time_str', type=str, default=None)
+    parser.add_argument('--time_str', type=str, default=None,
+                        help='set to the time_str of a previous sweep to resume it')
     parser.add_argument('--enwiki_sep_num', type=int, default=4)
     parser.add_argument('--process_enwiki', type=int, default=0)
     parser.add_argument('--process_depth', type=int, default=0)
     parser.add_argument('--skip_vqa', type=int, default=0)
     parser.add_argument('--skip_vlmap', type=int, default=0)
     parser.add_argument('--result_dir', type=str, default='experiments/important')
+    parser.add_argument('--train_memory_gb', type=float, default=0,
+                        help='memory reserved for each vlmap / vqa training job')
+    scheduler.add_scheduler_arguments(parser)
 
     config = parser.parse_args()
 
@@ -106,198 +92,201 @@ if __name__ == '__main__':
     # standard_word2vec: 3, vlmap_answer: 6
     MODEL_TYPES = ['vlmap_answer']
     #MODEL_TYPES = ['standard_word2vec', 'vlmap_answer']
-    
+
+    important_dir = "{}/{}".format(config.result_dir, TAG)
+    makedirs(important_dir)
+
+    # the stages form a DAG: find_word_group -> enwiki -> vlmap pretrain ->
+    # export_word_weights -> vqa train -> eval. Jobs start as soon as their
+    # own dependencies are done; the state is kept in the important_dir so
+    # running again with the same --time_str resumes the sweep.
+    sweep = scheduler.Scheduler.from_config(
+        config, state_path=os.path.join(important_dir, 'sweep_state.json'))
+
     #########################
     # 1. find_word_group.py
     #########################
 
+    depth_jobs = []
     if config.process_depth:
-        cmds = []
         for depth in DEPTHS:
             cmd = 'python data/tools/visualgenome/find_word_group.py --expand_depth={}'.format(depth)
-            cmds.append(cmd)
-            #run(cmd, config)
-
-        parallel_run(cmds, config)
+            depth_jobs.append(sweep.add(Job(
+                'find_word_group_dp{}'.format(depth), cmd, gpu=False)).name)
 
+    enwiki_jobs = []
     if config.process_enwiki:
-        cmds = []
-        base_cmd = 'python data/tools/enwiki/{} --enwiki_dir=data/preprocessed/enwiki/enwiki_processed_{}_{}'
-
-        def loop(filename, args):
-            for arg, values in args.items():
-                for value in values:
-                    for idx in range(1, config.enwiki_sep_num+1):
-                        cmd = base_cmd.format(filename, idx, config.enwiki_sep_num)
-                        cmd += " --{}={}".format(arg, value)
-                        cmds.append(cmd)
-
-        loop('2_word2contexts.py', {'preprocessing': [0, 1]})
-
-        #cmds.append(base_cmd.format('3_make_wordset.py', idx, config.enwiki_sep_num))
-        parallel_run(cmds, config)
-    
+        # every stage is cached by data/tools/artifact_cache, so the whole
+        # chain is scheduled and only the stages whose inputs changed rebuild
+        enwiki_dirs = ['data/preprocessed/enwiki/enwiki_processed_{}_{}'.format(
+            idx, config.enwiki_sep_num) for idx in range(1, config.enwiki_sep_num+1)]
+        merge_jobs = {}
+        for enwiki_dir in enwiki_dirs:
+            cmd = 'python data/tools/enwiki/1_merge_and_count.py --enwiki_dir={}'.format(enwiki_dir)
+            merge_jobs[enwiki_dir] = sweep.add(Job(
+                'enwiki_1_merge_and_count_{}'.format(os.path.basename(enwiki_dir)),
+                cmd, deps=depth_jobs, gpu=False)).name
+
+        for preprocessing in [0, 1]:
+            context_jobs = []
+            for enwiki_dir in enwiki_dirs:
+                cmd = 'python data/tools/enwiki/2_word2contexts.py --enwiki_dir={}' \
+                    ' --preprocessing={}'.format(enwiki_dir, preprocessing)
+                context_jobs.append(sweep.add(Job(
+                    'enwiki_2_word2contexts_preprocessing{}_{}'.format(
+                        preprocessing, os.path.basename(enwiki_dir)),
+                    cmd, deps=[merge_jobs[enwiki_dir]], gpu=False)).name)
+
+            cmd = 'python data/tools/enwiki/3_make_wordset.py --enwiki_dirs={}' \
+                ' --preprocessing={}'.format(','.join(enwiki_dirs), preprocessing)
+            wordset_job = sweep.add(Job(
+                'enwiki_3_make_wordset_preprocessing{}'.format(preprocessing),
+                cmd, deps=context_jobs, gpu=False)).name
+            cmd = 'python data/tools/enwiki/4_post_processing.py --enwiki_dirs={}' \
+                ' --preprocessing={}'.format(','.join(enwiki_dirs), preprocessing)
+            enwiki_jobs.append(sweep.add(Job(
+                'enwiki_4_post_processing_preprocessing{}'.format(preprocessing),
+                cmd, deps=[wordset_job], gpu=False)).name)
+
     ###############################
     # 2. vlmap_memft/trainer.py
     ###############################
 
+    vlmap_runs = []
+    for depth in DEPTHS:
+        for vlmap_model in VLMAP_MODELS:
+            for vlmap_seed in VLMAP_SEEDS:
+                if vlmap_model == 'vlmap_enwiki_withatt_sp':
+                    runs = [(vlmap_prefix + "wikipro0", 0),
+                            (vlmap_prefix + "wikipro1", 1)]
+                else: runs = [(vlmap_prefix, ENWIKI_PREPROCESSING)]
+                for prefix, enwiki_preprocessing in runs:
+                    vlmap_runs.append({
+                        'name': '{}_{}_dp{}_seed{}'.format(
+                            vlmap_model, prefix, depth, vlmap_seed),
+                        'model': vlmap_model, 'prefix': prefix,
+                        'seed': vlmap_seed, 'depth': depth,
+                        'enwiki_preprocessing': enwiki_preprocessing,
+                    })
+
+    vlmap_jobs = {}
     if not config.skip_vlmap:
-        cmds = []
-        for depth in DEPTHS:
-            for vlmap_model in VLMAP_MODELS:
-                for vlmap_seed in VLMAP_SEEDS:
-                    if vlmap_model == 'vlmap_enwiki_withatt_sp':
-                        cmd = 'python vlmap_memft/trainer.py' \
-                            ' --model_type={vlmap_model}' \
-                            ' --prefix={vlmap_prefix}' \
-                            ' --max_train_iter=4810 --seed={vlmap_seed} --expand_depth={depth}' \
-                            .format(vlmap_prefix=vlmap_prefix+"wikipro0",
-                                    vlmap_model=vlmap_model,
-                                    vlmap_seed=vlmap_seed,
-                                    depth=depth)
-                        tmp_cmd = cmd + ' --enwiki_preprocessing=0'
-                        cmds.append(tmp_cmd)
-
-                        cmd = 'python vlmap_memft/trainer.py' \
-                            ' --model_type={vlmap_model}' \
-                            ' --prefix={vlmap_prefix}' \
-                            ' --max_train_iter=4810 --seed={vlmap_seed} --expand_depth={depth}' \
-                            .format(vlmap_prefix=vlmap_prefix+"wikipro1",
-                                    vlmap_model=vlmap_model,
-                                    vlmap_seed=vlmap_seed,
-                                    depth=depth)
-                        tmp_cmd = cmd + ' --enwiki_preprocessing=1'
-                        cmds.append(tmp_cmd)
-                    else:
-                        cmd = 'python vlmap_memft/trainer.py' \
-                            ' --model_type={vlmap_model}' \
-                            ' --prefix={vlmap_prefix}' \
-                            ' --max_train_iter=4810 --seed={vlmap_seed} --expand_depth={depth}' \
-                            .format(vlmap_prefix=vlmap_prefix,
-                                    vlmap_model=vlmap_model,
-                                    vlmap_seed=vlmap_seed,
-                                    depth=depth)
-                        cmd += ' --enwiki_preprocessing={}'.format(ENWIKI_PREPROCESSING)
-                        cmds.append(cmd)
-
-        parallel_run(cmds, config)
-    
+        for vlmap_run in vlmap_runs:
+            cmd = 'python vlmap_memft/trainer.py' \
+                ' --model_type={vlmap_model}' \
+                ' --prefix={vlmap_prefix}' \
+                ' --max_train_iter=4810 --seed={vlmap_seed} --expand_depth={depth}' \
+                .format(vlmap_prefix=vlmap_run['prefix'],
+                        vlmap_model=vlmap_run['model'],
+                        vlmap_seed=vlmap_run['seed'],
+                        depth=vlmap_run['depth'])
+            cmd += ' --enwiki_preprocessing={}'.format(vlmap_run['enwiki_preprocessing'])
+            vlmap_jobs[vlmap_run['name']] = sweep.add(Job(
+                'vlmap_' + vlmap_run['name'], cmd,
+                deps=depth_jobs + enwiki_jobs,
+                memory_gb=config.train_memory_gb)).name
+
     #########################################
     # 3. symlink to experiments/important/*
     #########################################
 
-    important_dir = "{}/{}".format(config.result_dir, TAG)
-    makedirs(important_dir)
-
-    important_sub_dirs = []
-    dirs = list_dir("train_dir", prefix=VLMAP_BASE.format(
-        vlmap_prefix="*",
-        vlmap_model="*",
-        depth="*",
-        seed="*"))
+    def important_sub_dir(vlmap_run):
+        """ Link the latest train_dir of the run (resolved once it is trained). """
+        dirs = list_dir("train_dir", prefix=VLMAP_BASE.format(
+            vlmap_prefix=vlmap_run['prefix'],
+            vlmap_model=vlmap_run['model'],
+            depth=vlmap_run['depth'],
+            seed=vlmap_run['seed']))
+        dirs = [directory for directory in dirs
+                if time_str <= directory.rsplit('_', 1)[1]]
+        if len(dirs) == 0:
+            raise ValueError('No train_dir of {} since {}'.format(
+                vlmap_run['name'], time_str))
+        src_path = dirs[-1]
+        dst_path = os.path.join(important_dir, src_path.rsplit('/')[-1].rsplit('_', 1)[0])
+        symlink(src_path, dst_path)
+        return dst_path
 
-    base_path = "{}/{}".format(config.result_dir, TAG)
-    for directory in dirs:
-        dir_time_str = directory.rsplit('_', 1)[1]
-
-        if time_str <= dir_time_str:
-            src_path = directory
-            dst_path = os.path.join(base_path, directory.rsplit('/')[-1].rsplit('_', 1)[0])
-
-            symlink(src_path, dst_path)
-            important_sub_dirs.append(dst_path)
-    
     #########################################
     # 4. vlmap_memft/export_word_weights.py
     #########################################
 
-    cmds = []
-    steps = {}
-
-    for directory in important_sub_dirs:
-        checkpoint_found = False
-        for tmp_step in [4800, 4801]:
-            check_path = os.path.join(directory, "model-{}.data-00000-of-00001".format(tmp_step))
-            if os.path.exists(check_path):
-                steps[directory] = tmp_step
-                checkpoint_found = True
-                break
-
-        if not checkpoint_found:
-            log.error("="*40)
-            log.error(" {} not found".format(check_path))
-            log.error("="*40)
+    def export_cmd(vlmap_run):
+        directory = important_sub_dir(vlmap_run)
+        step = find_checkpoint_step(directory)
+        if step is None:
+            raise ValueError('No checkpoint in {}'.format(directory))
 
-        check_dir = os.path.join(directory, "word_weights_model-{}".format(steps[directory]))
+        check_dir = os.path.join(directory, "word_weights_model-{}".format(step))
         if os.path.exists(check_dir):
-            continue
-        checkpoint = os.path.join(directory, "model-{}".format(steps[directory]))
+            return None
+        checkpoint = os.path.join(directory, "model-{}".format(step))
+        return "python vlmap_memft/export_word_weights.py --checkpoint={}".format(checkpoint)
 
-        cmd = "python vlmap_memft/export_word_weights.py --checkpoint={}".format(checkpoint)
-        cmds.append(cmd)
-
-    cmds = list(reversed(cmds))
-    parallel_run(cmds, config)
+    export_jobs = {}
+    for vlmap_run in vlmap_runs:
+        deps = [vlmap_jobs[vlmap_run['name']]] if vlmap_run['name'] in vlmap_jobs else []
+        export_jobs[vlmap_run['name']] = sweep.add(Job(
+            'export_' + vlmap_run['name'],
+            lambda vlmap_run=vlmap_run: export_cmd(vlmap_run), deps=deps)).name
 
     #########################################
     # 5. vqa/trainer.py
     #########################################
 
-    def find_arg(path, arg):
-        for item in path.split('_')[::-1]:
-            if item.startswith(arg):
-                value = item[len(arg):]
-                return value
-
+    def vqa_cmd(vlmap_run, vqa_seed, model_type):
+        directory = important_sub_dir(vlmap_run)
+        step = find_checkpoint_step(directory)
+
+        cmd = "python vqa/trainer.py" \
+            " --vlmap_word_weight_dir {directory}/word_weights_model-{step}" \
+            " --seed {vqa_seed}" \
+            .format(directory=directory, step=step, vqa_seed=vqa_seed)
+        if model_type == 'vlmap_answer':
+            cmd += " --pretrained_param_path {directory}/model-{step}". \
+                format(directory=directory, step=step)
+
+        vqa_prefix = "{}_{}".format(
+            config.vlmap_prefix, directory.split(config.vlmap_prefix)[1])
+        cmd += " --prefix {vqa_prefix}_md{model_type}_vqasd{vqa_seed}". \
+            format(vqa_prefix=vqa_prefix, vqa_seed=vqa_seed, model_type=model_type)
+        cmd += " --model_type={}".format(model_type)
+        return cmd
+
+    vqa_jobs = []
     if not config.skip_vqa:
-        cmds = []
-        for directory in important_sub_dirs:
+        for vlmap_run in vlmap_runs:
             for vqa_seed in VQA_SEEDS:
-                dp = find_arg(directory, "dp")
-                vlmap_seed = find_arg(directory, "seed")
-
-                base_cmd = "python vqa/trainer.py" \
-                    " --vlmap_word_weight_dir {directory}/word_weights_model-{step}" \
-                    " --seed {vqa_seed}" \
-                    .format(directory=directory, dp=dp, step=steps[directory],
-                            vlmap_seed=vlmap_seed, vqa_seed=vqa_seed)
-
                 for model_type in MODEL_TYPES:
                     if model_type.startswith('standard'):
-                        if 'vlmap_bf_or_wordset_withatt_sp' not in directory:
+                        if 'vlmap_bf_or_wordset_withatt_sp' not in vlmap_run['model']:
                             continue
-                        cmd = base_cmd
                     elif model_type == 'vlmap_answer':
-                        if 'vlmap_bf_or_wordset_withatt_sp' in directory:
+                        if 'vlmap_bf_or_wordset_withatt_sp' in vlmap_run['model']:
                             continue
-                        cmd = base_cmd + " --pretrained_param_path {directory}/model-{step}". \
-                            format(directory=directory, step=steps[directory])
                     else:
                         raise Exception()
 
-                    vlmap_prefix = "{}_{}".format(
-                        config.vlmap_prefix, directory.split(config.vlmap_prefix)[1])
-
-                    cmd += " --prefix {vlmap_prefix}_md{model_type}_vqasd{vqa_seed}". \
-                        format(directory=directory, vlmap_prefix=vlmap_prefix,
-                               vqa_seed=vqa_seed, model_type=model_type)
-
-                    cmd += " --model_type={}".format(model_type)
-                    cmds.append(cmd)
-
-        import ipdb; ipdb.set_trace() 
-        parallel_run(cmds, config)
+                    vqa_jobs.append(sweep.add(Job(
+                        'vqa_{}_md{}_vqasd{}'.format(vlmap_run['name'], model_type, vqa_seed),
+                        lambda vlmap_run=vlmap_run, vqa_seed=vqa_seed, model_type=model_type:
+                            vqa_cmd(vlmap_run, vqa_seed, model_type),
+                        deps=[export_jobs[vlmap_run['name']]],
+                        memory_gb=config.train_memory_gb)).name)
 
     #########################################
     # -2. vqa/eval_multiple_model.py
     #########################################
 
     cmd = "python vqa/eval_multiple_model.py --root_train_dir=train_dir"
-    parallel_run([cmd], config)
+    sweep.add(Job('eval_multiple_model', cmd,
+                  deps=vqa_jobs or list(export_jobs.values())))
 
     #########################################
     # -1. vqa/eval_collection.py
     #########################################
 
     cmd = "python vqa/eval_collection.py --root_train_dir=train_dir"
-    parallel_run([cmd], config)
+    sweep.add(Job('eval_collection', cmd, deps=['eval_multiple_model']))
+
+    sweep.run()
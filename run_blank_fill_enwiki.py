@@ -211,10 +211,10 @@ if __name__ == '__main__':
             important_sub_dirs.append(dst_path)
     
     #########################################
-    # 4. vlmap_memft/export_noc_word_weights.py
+    # 4. vlmap_memft/export_weights.py --export noc_word_weights
     #########################################
 
-    cmds = []
+    checkpoints = []
     steps = {}
 
     for directory in important_sub_dirs:
@@ -236,10 +236,14 @@ if __name__ == '__main__':
             continue
         checkpoint = os.path.join(directory, "model-{}".format(steps[directory]))
 
-        cmd = "python vlmap_memft/export_noc_word_weights.py --checkpoint={}".format(checkpoint)
-        cmds.append(cmd)
+        checkpoints.append(checkpoint)
 
-    parallel_run(cmds, config)
+    # one process for every checkpoint: the dictionaries are loaded once
+    if checkpoints:
+        cmd = "python vlmap_memft/export_weights.py --export noc_word_weights" \
+            " --num_workers {} --checkpoints {}".format(
+                config.num_thread, ' '.join(checkpoints))
+        parallel_run([cmd], config)
 
     #########################################
     # 5. vqa/trainer.py
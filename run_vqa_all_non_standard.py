@@ -1,43 +1,18 @@
 import os
-import time
-import shlex
-import itertools
-import subprocess
 from glob import glob
 from datetime import datetime
-from collections import defaultdict
 
 from util import log
+from util import scheduler
 
 def list_dir(directory, prefix="", postfix=""):
     lists = glob(directory + "/{}*{}".format(prefix, postfix))
     lists.sort()
     return lists
 
-def grouper(iterable, n):
-    it = iter(iterable)
-    while True:
-       chunk = tuple(itertools.islice(it, n))
-       if not chunk:
-           return
-       yield chunk
-
 def parallel_run(commands, config):
-    groups = list(grouper(commands, config.num_thread))
-
-    for idx, cmds in enumerate(groups):
-        procs = []
-
-        for num, cmd in enumerate(cmds):
-            print(" [*] Group {}/{}, Thread {}/{}". \
-                format(idx, len(groups), num, len(cmds)))
-
-            cmd = 'CUDA_VISIBLE_DEVICES={} '.format(num % config.num_gpu) + cmd
-            proc = run(cmd, config)
-            procs.append(proc)
-
-        for proc in procs:
-            proc.wait()
+    """ Run independent commands as soon as a slot frees up. """
+    return scheduler.run_commands(commands, config)
 
 def makedirs(path):
     if not os.path.exists(path):
@@ -55,13 +30,6 @@ def symlink(src_path, dst_path):
         log.info("Sym link: {}->{}".format(src_path, dst_path))
         os.symlink(src_path, dst_path)
 
-def run(cmd, config):
-    print(" [*] {}".format(cmd))
-    if not config.debug:
-        proc = subprocess.Popen(cmd, shell=True)
-        time.sleep(1)
-    return proc
-
 
 if __name__ == '__main__':
     import argparse
@@ -80,6 +48,7 @@ if __name__ == '__main__':
     parser.add_argument('--skip_vlmap', type=int, default=0)
     parser.add_argument('--result_dir', type=str, default='experiments/important')
 
+    scheduler.add_scheduler_arguments(parser)
     config = parser.parse_args()
 
     time_str = config.time_str or datetime.now().strftime("%Y%m%d-%H%M%S")
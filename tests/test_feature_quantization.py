@@ -0,0 +1,56 @@
+import numpy as np
+
+from util import feature_quantization as fq
+
+
+def random_features(shape=(4, 6, 32), seed=0):
+    rng = np.random.RandomState(seed)
+    features = rng.randn(*shape).astype(np.float32) * 3.0
+    features[0, -1] = 0.0  # padded box
+    return features
+
+
+def test_float32_is_lossless():
+    features = random_features()
+    values, scales = fq.quantize(features, 'float32')
+    assert scales is None
+    np.testing.assert_array_equal(fq.dequantize(values, scales), features)
+
+
+def test_float16_round_trip():
+    features = random_features()
+    values, scales = fq.quantize(features, 'float16')
+    assert values.dtype == np.float16 and scales is None
+    reconstructed = fq.dequantize(values, scales)
+    # float16 keeps 11 significant bits
+    assert np.all(np.abs(reconstructed - features) <=
+                  np.abs(features) * 2 ** -11 + 1e-7)
+
+
+def test_int8_round_trip_error_is_half_a_step():
+    features = random_features()
+    values, scales = fq.quantize(features, 'int8')
+    assert values.dtype == np.int8
+    assert scales.shape == features.shape[:-1] + (1,)
+    reconstructed = fq.dequantize(values, scales)
+    assert np.all(np.abs(reconstructed - features) <= scales / 2 + 1e-6)
+    # the largest value of every box is exact, padded boxes stay zero
+    np.testing.assert_allclose(np.abs(reconstructed).max(axis=-1),
+                               np.abs(features).max(axis=-1), rtol=1e-6)
+    np.testing.assert_array_equal(reconstructed[0, -1], 0.0)
+
+    summary = fq.summarize_error([fq.reconstruction_error(features,
+                                                          reconstructed)])
+    assert summary['relative_l2'] < 0.01
+    assert summary['mean_cosine'] > 0.999
+
+
+def test_quantized_features_take():
+    features = random_features()
+    values, scales = fq.quantize(features, 'int8')
+    quantized = fq.QuantizedFeatures(values, scales)
+    idx = np.array([3, 0, 3])
+    np.testing.assert_array_equal(np.take(quantized, idx, axis=0),
+                                  fq.dequantize(values[idx], scales[idx]))
+    np.testing.assert_array_equal(quantized[1:3],
+                                  fq.dequantize(values[1:3], scales[1:3]))
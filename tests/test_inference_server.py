@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from vqa.inference_server import dropout_bypass_feeds, find_dropouts
+
+
+def test_dropout_bypass_is_identity():
+    with tf.Graph().as_default() as graph:
+        x = tf.placeholder(tf.float32, [None, 16])
+        y = tf.nn.dropout(tf.nn.dropout(x, 0.5), 0.5)
+        feeds = dropout_bypass_feeds(graph)
+        assert len(find_dropouts(graph)) == 2
+        assert len(feeds) == 2
+
+        value = np.random.RandomState(0).rand(8, 16).astype(np.float32)
+        with tf.Session() as session:
+            outputs = []
+            for _ in range(2):
+                feed_dict = {x: value}
+                feed_dict.update(feeds)
+                outputs.append(session.run(y, feed_dict=feed_dict))
+            dropped = session.run(y, feed_dict={x: value})
+
+    # two identical requests return identical scores
+    np.testing.assert_array_equal(outputs[0], outputs[1])
+    np.testing.assert_array_equal(outputs[0], value)
+    assert not np.array_equal(dropped, value)
@@ -0,0 +1,40 @@
+from util import input_tuner
+
+# parallelism -> producer secs/batch
+MEASUREMENTS = {
+    1: {'mean': 0.40, 'p90': 0.50},
+    2: {'mean': 0.20, 'p90': 0.25},
+    4: {'mean': 0.10, 'p90': 0.15},
+    8: {'mean': 0.098, 'p90': 0.14},
+}
+
+
+def test_consumer_unknown_keeps_the_smallest_near_best():
+    config = input_tuner.choose_config(MEASUREMENTS)
+    assert config['num_parallel_calls'] == 4
+    assert config['cycle_length'] == 4
+    assert config['prefetch'] == 3  # ceil(0.15 / 0.10) + 1
+
+
+def test_slow_consumer_needs_less_parallelism():
+    config = input_tuner.choose_config(MEASUREMENTS,
+                                       consumer_secs_per_batch=0.3)
+    assert config['num_parallel_calls'] == 2
+    assert config['prefetch'] == 2
+    assert input_tuner.check_rates(MEASUREMENTS, config, 0.3)
+
+
+def test_fast_consumer_gets_deep_prefetch_and_a_warning():
+    config = input_tuner.choose_config(MEASUREMENTS,
+                                       consumer_secs_per_batch=0.01,
+                                       max_cycle_length=2)
+    assert config['num_parallel_calls'] == 4
+    assert config['cycle_length'] == 2
+    assert config['prefetch'] == 16  # ceil(0.15 / 0.01) + 1
+    assert not input_tuner.check_rates(MEASUREMENTS, config, 0.01)
+
+
+def test_prefetch_is_bounded():
+    config = input_tuner.choose_config(MEASUREMENTS,
+                                       consumer_secs_per_batch=1e-4)
+    assert config['prefetch'] == input_tuner.MAX_PREFETCH
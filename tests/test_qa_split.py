@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cPickle')  # python 2 preprocessing script
+
+from data.tools.vqa_v2 import qa_split
+
+VOCAB = ['red', 'car', 'tennis', 'racket', 'man', 'is', 'the', 'what',
+         'hot', 'dog', 'stop', 'sign']
+PHRASES = ['car', 'red car', 'tennis racket', 'hot dog', 'stop sign', 'man',
+           'hot dog stand', 'fire hydrant', 'dog']
+
+
+def legacy_ngrams(tokens, max_name_len, offset):
+    """ n-gram strings of the legacy qa_split scripts """
+    ngrams = set()
+    for n in range(1, min(len(tokens), max_name_len) + 1 - offset):
+        for i in range(0, len(tokens) - n + 1):
+            ngrams.add(' '.join(tokens[i: i + n]))
+    return ngrams
+
+
+def random_questions(num, seed=0):
+    rng = np.random.RandomState(seed)
+    return [list(rng.randint(len(VOCAB), size=rng.randint(1, 9)))
+            for _ in range(num)]
+
+
+@pytest.mark.parametrize('offset', [0, 1])  # inclusive, exclusive
+def test_trie_matches_the_legacy_ngrams(offset):
+    token2id = {t: i for i, t in enumerate(VOCAB)}
+    trie = qa_split.build_phrase_trie(PHRASES, token2id)
+    max_name_len = max(len(p.split(' ')) for p in PHRASES)
+    for intseq in random_questions(500):
+        tokens = [VOCAB[i] for i in intseq]
+        matched = set()
+        qa_split.match_ngrams(
+            intseq, min(len(intseq), max_name_len) - offset, trie, matched)
+        expected = legacy_ngrams(tokens, max_name_len, offset) & set(PHRASES)
+        assert matched == expected, tokens
+
+
+@pytest.mark.parametrize('question_ngrams', ['exclusive', 'inclusive'])
+def test_count_occurrence_matches_the_legacy_counts(question_ngrams):
+    questions = random_questions(200, seed=1)
+    answers = random_questions(200, seed=2)
+    qids = list(range(len(questions)))
+    cache = {'vocab': VOCAB, 'qids': qids,
+             'q_intseq': questions, 'a_intseq': answers}
+    variant = {'question_ngrams': question_ngrams, 'answer_match': 'ngrams'}
+    max_name_len = 3
+    occurrence, qid2phrases = qa_split.count_occurrence(
+        cache, PHRASES, max_name_len, variant)
+
+    offset = {'exclusive': 1, 'inclusive': 0}[question_ngrams]
+    expected_occurrence = {name: 0 for name in PHRASES}
+    for qid, q_intseq, a_intseq in zip(qids, questions, answers):
+        ngrams = legacy_ngrams([VOCAB[i] for i in q_intseq], max_name_len,
+                               offset)
+        ngrams |= legacy_ngrams([VOCAB[i] for i in a_intseq], max_name_len, 1)
+        expected = ngrams & set(PHRASES)
+        assert qid2phrases[qid] == expected
+        for name in expected:
+            expected_occurrence[name] += 1
+    assert occurrence == expected_occurrence
@@ -0,0 +1,63 @@
+import collections
+
+import numpy as np
+import pytest
+
+from vqa.question_cache import CachedQuestionEncoder, QuestionEncodingCache
+
+FakeModel = collections.namedtuple('FakeModel',
+                                   ['output', 'heavy_output', 'mid_result'])
+
+
+def test_lru_eviction():
+    cache = QuestionEncodingCache(max_size=2)
+    cache.put((1,), 'a')
+    cache.put((2,), 'b')
+    assert cache.get((1,)) == 'a'  # (2,) is now the least recently used
+    cache.put((3,), 'c')
+    assert cache.get((2,)) is None
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def build(tf, logit_reads_encoder_output):
+    """ encode -> condition -> logit (+ a second read of the encoder) """
+    batch = {'q_intseq': tf.placeholder(tf.int32, [None, None]),
+             'q_intseq_len': tf.placeholder(tf.int32, [None])}
+    q_L_ft = tf.cast(tf.reduce_sum(batch['q_intseq'], axis=1, keepdims=True),
+                     tf.float32) + tf.zeros([1, 3])
+    condition = tf.tanh(q_L_ft)
+    logit = condition * 2.0
+    mid_result = {}
+    if logit_reads_encoder_output:
+        logit += q_L_ft
+        mid_result['q_L_ft'] = q_L_ft
+    model = FakeModel({'logit': logit}, {'condition': condition}, mid_result)
+    return model, batch
+
+
+def test_encoder_output_is_cached():
+    tf = pytest.importorskip('tensorflow')
+    for reads_encoder_output in [False, True]:
+        with tf.Graph().as_default():
+            model, batch = build(tf, reads_encoder_output)
+            assert CachedQuestionEncoder.supports(model, batch)
+            encoder = CachedQuestionEncoder(model, batch)
+            with tf.Session() as session:
+                q_intseq = np.array([[1, 2, 0], [1, 2, 0], [4, 0, 0]])
+                q_len = np.array([2, 2, 1])
+                feed_dict = encoder.feed_dict(session, q_intseq, q_len)
+                # the logits are computed from the cache alone
+                session.run(model.output['logit'], feed_dict=feed_dict)
+                assert encoder.stats()['misses'] == 3
+                assert encoder.stats()['size'] == 2
+
+
+def test_question_bypassing_the_encoding_is_rejected():
+    tf = pytest.importorskip('tensorflow')
+    with tf.Graph().as_default():
+        model, batch = build(tf, True)
+        del model.mid_result['q_L_ft']  # caching condition skips nothing
+        assert not CachedQuestionEncoder.supports(model, batch)
+        with pytest.raises(ValueError):
+            CachedQuestionEncoder(model, batch)
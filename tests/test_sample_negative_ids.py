@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from vlmap_crop_and_run.datasets.dataset_objects import sample_negative_ids
+
+
+def check_negatives(negative_ids, num_objects, positive_ids, num_neg):
+    assert negative_ids.shape == (len(positive_ids), num_neg)
+    assert negative_ids.dtype == np.int32
+    for row, ids in zip(negative_ids, positive_ids):
+        assert len(set(row)) == num_neg
+        assert not set(row) & set(ids)
+        assert row.min() >= 0 and row.max() < num_objects
+
+
+@pytest.mark.parametrize('num_objects', [1000, 12])  # rejection, shuffle
+def test_negatives_are_distinct_and_not_positive(num_objects):
+    positive_ids = [[0, 1, 2], [], [5], [3, 3, 4]]
+    negative_ids = sample_negative_ids(
+        num_objects, positive_ids, 4, random_state=np.random.RandomState(0))
+    check_negatives(negative_ids, num_objects, positive_ids, 4)
+
+
+def test_every_non_positive_object_is_used():
+    positive_ids = [[0, 1], [4]]
+    negative_ids = sample_negative_ids(
+        6, positive_ids, 4, random_state=np.random.RandomState(0))
+    check_negatives(negative_ids, 6, positive_ids, 4)
+    assert sorted(negative_ids[0]) == [2, 3, 4, 5]
+
+
+def test_too_few_negatives_raises():
+    with pytest.raises(ValueError, match='4 negatives requested'):
+        sample_negative_ids(5, [[0], [0, 1, 2]], 4,
+                            random_state=np.random.RandomState(0))
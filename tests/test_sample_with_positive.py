@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from vlmap.datasets.dataset_vlmap import sample_with_positive
+
+
+@pytest.mark.parametrize('num_candidates', [10, 11, 50])
+def test_positive_first_and_distinct_negatives(num_candidates):
+    # the last two rows are padding: their positive is not a candidate
+    pos_idx = np.array([0, 9, 3, num_candidates, num_candidates + 5],
+                       dtype=np.int32)
+    sampled = sample_with_positive(pos_idx, num_candidates, 10)
+    assert sampled.shape == (len(pos_idx), 10)
+    assert sampled.dtype == np.int32
+    np.testing.assert_array_equal(sampled[:, 0], pos_idx)
+    for pos, neg in zip(pos_idx, sampled[:, 1:]):
+        assert len(set(neg)) == 9
+        assert pos not in neg
+        assert neg.min() >= 0 and neg.max() < num_candidates
+
+
+def test_too_few_candidates_raises():
+    with pytest.raises(ValueError, match='9 candidates for 10 samples'):
+        sample_with_positive(np.array([0, 1], dtype=np.int32), 9, 10)
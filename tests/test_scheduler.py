@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+
+from util import scheduler
+
+
+def make_config(state_path, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num_thread', type=int, default=2)
+    parser.add_argument('--num_gpu', type=int, default=0)
+    parser.add_argument('--debug', type=int, default=0)
+    scheduler.add_scheduler_arguments(parser)
+    config = parser.parse_args(['--state_path', state_path, '--pin_cores', '0'])
+    for key, value in kwargs.items():
+        setattr(config, key, value)
+    return config
+
+
+def append_cmd(path, line):
+    return 'echo {} >> {}'.format(line, path)
+
+
+def test_run_commands_share_the_state_file(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    out_path = str(tmpdir.join('out.txt'))
+    config = make_config(state_path)
+
+    stage_1 = [append_cmd(out_path, 'a'), append_cmd(out_path, 'b')]
+    stage_2 = [append_cmd(out_path, 'c')]
+    statuses = scheduler.run_commands(stage_1, config)
+    assert set(statuses.values()) == {scheduler.DONE}
+    scheduler.run_commands(stage_2, config)
+
+    # the second stage keeps the jobs of the first one
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    assert len(state) == 3
+    assert all(job['status'] == scheduler.DONE for job in state.values())
+
+    # resuming runs none of the done jobs again
+    scheduler.run_commands(stage_1, config)
+    scheduler.run_commands(stage_2 + [append_cmd(out_path, 'd')], config)
+    with open(out_path, 'r') as f:
+        assert sorted(f.read().split()) == ['a', 'b', 'c', 'd']
+
+
+def test_failed_job_skips_its_dependents(tmpdir):
+    state_path = str(tmpdir.join('state.json'))
+    sweep = scheduler.Scheduler(2, state_path=state_path, pin_cores=False,
+                                max_retries=0, poll_secs=0.01)
+    sweep.add(scheduler.Job('fail', 'exit 1', gpu=False))
+    sweep.add(scheduler.Job('after', 'true', deps=['fail'], gpu=False))
+    sweep.add(scheduler.Job('other', 'true', gpu=False))
+    statuses = sweep.run()
+    assert statuses == {'fail': scheduler.FAILED, 'after': scheduler.SKIPPED,
+                        'other': scheduler.DONE}
+
+    # the failed job is run again when resuming, the done one is not
+    resumed = scheduler.Scheduler(2, state_path=state_path, pin_cores=False)
+    assert resumed.add(scheduler.Job('fail', 'true')).status == scheduler.PENDING
+    assert resumed.add(scheduler.Job('other', 'true')).status == scheduler.DONE
+
+
+def test_pinned_job_sees_its_gpu(tmpdir):
+    out_path = str(tmpdir.join('gpu.txt'))
+    sweep = scheduler.Scheduler(1, num_gpu=1, pin_cores=True, max_retries=0,
+                                poll_secs=0.01)
+    sweep.add(scheduler.Job('gpu', 'echo $CUDA_VISIBLE_DEVICES > {}'.format(
+        out_path)))
+    assert sweep.run() == {'gpu': scheduler.DONE}
+    with open(out_path, 'r') as f:
+        assert f.read().strip() == '0'
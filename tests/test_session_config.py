@@ -0,0 +1,11 @@
+from util import session_config
+
+
+def test_thread_counts_grow_with_the_budget():
+    counts = [session_config.thread_counts(n) for n in [1, 4, 8, 16, 64]]
+    assert [intra for intra, _ in counts] == [1, 4, 8, 16, 64]
+    inter = [inter for _, inter in counts]
+    assert inter[0] == 1
+    assert inter == sorted(inter)
+    assert inter[-1] > 2
+    assert all(i <= n for (n, i) in zip([1, 4, 8, 16, 64], inter))
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from data.tools import tf_record_shards
+
+ITEMS = list(range(23))
+
+
+def make_example(item):
+    if item % 5 == 3: return None  # skipped, still counted in its shard
+    example = tf.train.Example(features=tf.train.Features(feature={
+        'id': tf.train.Feature(int64_list=tf.train.Int64List(value=[item]))}))
+    return 'id{}'.format(item), example, {'max_len': item % 7}
+
+
+def write(save_dir, num_workers):
+    os.makedirs(os.path.join(save_dir, 'train'))
+    ids, stats = tf_record_shards.write_shards(
+        'train', ITEMS, make_example, save_dir, 4, num_workers=num_workers)
+    records = {}
+    for name in sorted(os.listdir(os.path.join(save_dir, 'train'))):
+        records[name] = list(tf.python_io.tf_record_iterator(
+            os.path.join(save_dir, 'train', name)))
+    return ids, stats, records
+
+
+def test_shards_match_the_sequential_order(tmpdir):
+    sequential = write(str(tmpdir.join('sequential')), 1)
+    parallel = write(str(tmpdir.join('parallel')), 3)
+    assert parallel == sequential
+
+    ids, stats, records = sequential
+    kept = [item for item in ITEMS if make_example(item) is not None]
+    assert ids == ['id{}'.format(item) for item in kept]
+    assert stats == {'max_len': 6}
+    # shard k holds items[4k:4k + 4], the skipped items included
+    assert sorted(records) == ['train-{:05d}-of-00006'.format(k)
+                               for k in range(6)]
+    assert len(records['train-00000-of-00006']) == 3
+    assert sum(len(r) for r in records.values()) == len(kept)
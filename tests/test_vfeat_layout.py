@@ -0,0 +1,34 @@
+import h5py
+import numpy as np
+import pytest
+
+from util.vfeat_layout import copy_with_layout, create_image_dataset
+
+
+def test_contiguous_by_default(tmpdir):
+    with h5py.File(str(tmpdir.join('vfeat.hdf5')), 'w') as f:
+        assert create_image_dataset(f, 'normal_boxes', (10, 36, 4),
+                                    'f').chunks is None
+        chunked = create_image_dataset(f, 'image_features', (10, 36, 8), 'f',
+                                       images_per_chunk=2, compression='lzf')
+        assert chunked.chunks == (2, 36, 8)
+        with pytest.raises(ValueError):
+            create_image_dataset(f, 'other', (10, 36, 8), 'f',
+                                 compression='gzip')
+
+
+def test_relayout_chunks_only_the_features(tmpdir):
+    rng = np.random.RandomState(0)
+    data = {'image_features': rng.rand(5, 3, 8).astype(np.float32),
+            'normal_boxes': rng.rand(5, 3, 4).astype(np.float32),
+            'num_boxes': np.full([5], 3, dtype=np.int32)}
+    in_path, out_path = str(tmpdir.join('in.hdf5')), str(tmpdir.join('out.hdf5'))
+    with h5py.File(in_path, 'w') as f:
+        for key, value in data.items(): f[key] = value
+    with h5py.File(in_path, 'r') as f_in, h5py.File(out_path, 'w') as f_out:
+        copy_with_layout(f_in, f_out, images_per_chunk=1, images_per_copy=2)
+    with h5py.File(out_path, 'r') as f:
+        assert f['image_features'].chunks == (1, 3, 8)
+        assert f['normal_boxes'].chunks is None
+        for key, value in data.items():
+            np.testing.assert_array_equal(f[key][()], value)
@@ -0,0 +1,38 @@
+import h5py
+import numpy as np
+import pytest
+
+from util.vfeat_view import read_rows
+
+INDEXES = {
+    'sorted': [0, 1, 2, 7, 8, 40],
+    'unsorted': [40, 3, 17, 0, 39, 2],
+    'repeated': [5, 5, 0, 49, 5, 0, 49],
+    'all_reversed': list(range(49, -1, -1)),
+    'empty': [],
+}
+
+
+def make_data():
+    return np.arange(50 * 3 * 2, dtype=np.float32).reshape([50, 3, 2])
+
+
+@pytest.mark.parametrize('name', sorted(INDEXES))
+@pytest.mark.parametrize('chunk_size', [1, 4, 1024])
+def test_read_rows_of_array(name, chunk_size):
+    data = make_data()
+    index = INDEXES[name]
+    rows = read_rows(data, index, chunk_size=chunk_size)
+    assert rows.dtype == data.dtype
+    np.testing.assert_array_equal(rows, data[np.array(index, dtype=np.int64)])
+
+
+@pytest.mark.parametrize('name', ['unsorted', 'repeated'])
+def test_read_rows_of_hdf5_dataset(tmpdir, name):
+    data = make_data()
+    path = str(tmpdir.join('vfeat.hdf5'))
+    with h5py.File(path, 'w') as f:
+        f['image_features'] = data
+    with h5py.File(path, 'r') as f:
+        rows = read_rows(f['image_features'], INDEXES[name], chunk_size=4)
+    np.testing.assert_array_equal(rows, data[INDEXES[name]])
@@ -0,0 +1,124 @@
+"""
+Checkpoint saver that writes in a background thread.
+
+tf.train.Saver.save blocks the training loop while every variable is
+serialized and the meta graph is rewritten. AsyncSaver only blocks for
+copying the variables to host memory; a background thread then writes the
+copy through a shadow graph that holds one variable per saved variable.
+Checkpoints keep the variable names of the training graph, so they can be
+restored with a regular tf.train.Saver.
+"""
+import threading
+import time
+import tensorflow as tf
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from util import log
+
+
+class AsyncSaver(object):
+
+    def __init__(self, var_list=None, max_to_keep=100, meta_graph_path=None):
+        """
+        Args:
+            - var_list: variables to save (default: all global variables)
+            - max_to_keep: number of recent checkpoints to keep
+            - meta_graph_path: if given, the meta graph of the training graph
+                is written once to this path
+        """
+        if var_list is None:
+            var_list = tf.global_variables()
+        self.var_list = list(var_list)
+
+        if meta_graph_path is not None:
+            tf.train.export_meta_graph(filename=meta_graph_path)
+            log.info('Meta graph is saved in: {}'.format(meta_graph_path))
+
+        self.shadow_graph = tf.Graph()
+        self.placeholders = []
+        with self.shadow_graph.as_default():
+            shadow_vars = {}
+            initializers = []
+            for i, var in enumerate(self.var_list):
+                placeholder = tf.placeholder(
+                    var.dtype.base_dtype, shape=var.get_shape(),
+                    name='value_{}'.format(i))
+                shadow_var = tf.Variable(placeholder, trainable=False,
+                                         name='var_{}'.format(i))
+                shadow_vars[var.op.name] = shadow_var
+                self.placeholders.append(placeholder)
+                initializers.append(shadow_var.initializer)
+            self.load_op = tf.group(*initializers)
+            self.shadow_saver = tf.train.Saver(
+                var_list=shadow_vars, max_to_keep=max_to_keep)
+        self.shadow_session = tf.Session(
+            graph=self.shadow_graph,
+            config=tf.ConfigProto(device_count={'GPU': 0}))
+
+        # at most one pending snapshot: a new save waits for the previous
+        # write instead of piling copies up in memory
+        self.queue = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._write_loop,
+                                       name='async_saver')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def save(self, session, save_path, global_step):
+        """
+        Snapshot variables to host memory and schedule the write.
+        Returns:
+            - snapshot_time: seconds the caller was blocked
+        """
+        if self.error is not None:
+            raise self.error
+        _start_time = time.time()
+        values = session.run(self.var_list)
+        self.queue.put((values, save_path, int(global_step)))
+        return time.time() - _start_time
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                break
+            values, save_path, global_step = item
+            _start_time = time.time()
+            try:
+                self.shadow_session.run(
+                    self.load_op,
+                    feed_dict=dict(zip(self.placeholders, values)))
+                path = self.shadow_saver.save(
+                    self.shadow_session, save_path, global_step=global_step,
+                    write_meta_graph=False)
+                log.info('Checkpoint written: {} ({:.3f} sec)'.format(
+                    path, time.time() - _start_time))
+            except Exception as e:  # re-raised by the next save call
+                log.error('Fail to write checkpoint at {}: {}'.format(
+                    global_step, e))
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """ Block until every scheduled checkpoint is written. """
+        self.queue.join()
+
+    def close(self, raise_error=True):
+        """
+        Args:
+            - raise_error: re-raise the last write error; False when another
+                exception is propagating, which it must not replace
+        """
+        self.wait()
+        self.queue.put(None)
+        self.thread.join()
+        self.shadow_session.close()
+        if self.error is not None:
+            if raise_error: raise self.error
+            log.error('A checkpoint write also failed: {}'.format(self.error))
@@ -0,0 +1,83 @@
+"""
+CPU core sets for running several processes on one host.
+
+util/scheduler gives every job a disjoint set of cores (inside one NUMA node
+when asked), pins the job to it and passes it in the CPU_CORES_ENV
+environment variable. util/session_config sizes the TensorFlow thread pools
+from it. This module does not import TensorFlow.
+"""
+import multiprocessing
+import os
+from glob import glob
+
+CPU_CORES_ENV = 'VLMAP_CPU_CORES'
+NUMA_NODE_ENV = 'VLMAP_NUMA_NODE'
+
+
+def parse_cores(cores_str):
+    """
+    '0-3,8' -> [0, 1, 2, 3, 8]
+    """
+    cores = set()
+    for token in cores_str.split(','):
+        token = token.strip()
+        if not token: continue
+        if '-' in token:
+            start, end = token.split('-')
+            cores.update(range(int(start), int(end) + 1))
+        else: cores.add(int(token))
+    return sorted(cores)
+
+
+def format_cores(cores):
+    """
+    [0, 1, 2, 3, 8] -> '0-3,8'
+    """
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else: ranges.append([core, core])
+    return ','.join('{}'.format(s) if s == e else '{}-{}'.format(s, e)
+                    for s, e in ranges)
+
+
+def available_cores():
+    """ Cores this process may run on. """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def assigned_cores():
+    """ Cores handed out by util/scheduler (None when not set). """
+    cores_str = os.environ.get(CPU_CORES_ENV, '')
+    if not cores_str: return None
+    return parse_cores(cores_str)
+
+
+def numa_nodes():
+    """
+    Returns:
+        - {node id: [cores]} from sysfs ({0: available cores} without NUMA
+            information)
+    """
+    nodes = {}
+    for path in glob('/sys/devices/system/node/node[0-9]*/cpulist'):
+        node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+        with open(path, 'r') as f:
+            cores = parse_cores(f.read().strip())
+        if cores: nodes[node] = cores
+    if not nodes:
+        nodes = {0: available_cores()}
+    return nodes
+
+
+def pin_process(cores):
+    """
+    Pin the current process. Returns False where the platform does not
+    support it (Python 2 has no os.sched_setaffinity; use taskset).
+    """
+    if not hasattr(os, 'sched_setaffinity'): return False
+    os.sched_setaffinity(0, cores)
+    return True
@@ -0,0 +1,139 @@
+"""
+Reduced precision storage of the visual features.
+
+vfeat hdf5 files store image_features [N, max_box_num, vfeat_dim] as
+float32. data/tools/quantize_vfeat.py converts them to
+    - float16
+    - int8: symmetric quantization with one float32 scale per box
+        (image_feature_scales [N, max_box_num, 1])
+and records the format in data_info/feature_dtype.
+
+load_image_features() keeps the compact values in memory and returns an
+array-like object. Its take() / __getitem__ dequantize only the selected
+images to float32, so np.take(features, image_idx, axis=0) in the
+feature loading py_funcs works unchanged.
+"""
+import numpy as np
+
+FEATURE_DTYPES = ['float32', 'float16', 'int8']
+INT8_MAX = 127.0
+
+
+def quantize(features, dtype):
+    """
+    Args:
+        - features: float32 [..., vfeat_dim]
+    Returns:
+        - values: features in dtype
+        - scales: float32 [..., 1] for int8, None otherwise
+    """
+    if dtype == 'float32':
+        return features.astype(np.float32), None
+    if dtype == 'float16':
+        return features.astype(np.float16), None
+    if dtype == 'int8':
+        scales = np.abs(features).max(axis=-1, keepdims=True) / INT8_MAX
+        scales = scales.astype(np.float32)
+        safe_scales = np.where(scales > 0, scales, 1.0)
+        values = np.clip(np.round(features / safe_scales), -INT8_MAX, INT8_MAX)
+        return values.astype(np.int8), scales
+    raise ValueError('Unknown feature dtype: {}'.format(dtype))
+
+
+def dequantize(values, scales=None):
+    values = values.astype(np.float32)
+    if scales is not None: values *= scales
+    return values
+
+
+def reconstruction_error(features, reconstructed):
+    """
+    Returns:
+        - sums over the boxes: squared error, squared norm, cosine similarity
+            and max absolute error, see summarize_error()
+    """
+    diff = reconstructed - features
+    norm = np.linalg.norm(features, axis=-1)
+    rec_norm = np.linalg.norm(reconstructed, axis=-1)
+    valid = norm > 0
+    cosine = (features * reconstructed).sum(axis=-1)[valid] / \
+        np.maximum(norm * rec_norm, 1e-12)[valid]
+    return {
+        'squared_error': float(np.square(diff).sum()),
+        'squared_norm': float(np.square(features).sum()),
+        'cosine_sum': float(cosine.sum()),
+        'num_boxes': int(valid.sum()),
+        'max_abs_error': float(np.abs(diff).max()) if diff.size else 0.0,
+    }
+
+
+def summarize_error(errors):
+    """ Merge reconstruction_error() of the chunks. """
+    squared_norm = sum(e['squared_norm'] for e in errors)
+    num_boxes = sum(e['num_boxes'] for e in errors)
+    return {
+        'relative_l2': float(np.sqrt(
+            sum(e['squared_error'] for e in errors) / max(squared_norm, 1e-12))),
+        'mean_cosine': sum(e['cosine_sum'] for e in errors) / max(num_boxes, 1),
+        'max_abs_error': max([e['max_abs_error'] for e in errors] + [0.0]),
+    }
+
+
+class QuantizedFeatures(object):
+    """ Array-like [N, ...] dequantizing the selected rows to float32. """
+
+    def __init__(self, values, scales=None):
+        self.values = values
+        self.scales = scales
+        self.shape = values.shape
+        self.dtype = np.dtype(np.float32)
+        self.ndim = values.ndim
+
+    @property
+    def nbytes(self):
+        nbytes = self.values.nbytes
+        if self.scales is not None: nbytes += self.scales.nbytes
+        return nbytes
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx):
+        scales = None if self.scales is None else self.scales[idx]
+        return dequantize(self.values[idx], scales)
+
+    def take(self, indices, axis=0, out=None, mode='raise'):
+        if axis != 0 or out is not None:
+            raise ValueError('QuantizedFeatures only supports take along axis 0')
+        scales = None if self.scales is None else \
+            np.take(self.scales, indices, axis=0, mode=mode)
+        return dequantize(np.take(self.values, indices, axis=0, mode=mode),
+                          scales)
+
+
+def get_feature_dtype(f):
+    data_info = f['data_info']
+    if 'feature_dtype' not in data_info: return 'float32'
+    return str(data_info['feature_dtype'].value)
+
+
+def load_image_features(f):
+    """
+    Args:
+        - f: opened vfeat hdf5 file
+    Returns:
+        - np.ndarray for float32 files, QuantizedFeatures otherwise
+    """
+    feature_dtype = get_feature_dtype(f)
+    values = np.array(f.get('image_features'))
+    if feature_dtype == 'float32': return values
+    scales = None
+    if feature_dtype == 'int8':
+        scales = np.array(f.get('image_feature_scales'))
+    return QuantizedFeatures(values, scales)
+
+
+def quantized_vfeat_path(vfeat_path, dtype):
+    """ vfeat_bottomup_36.hdf5 -> vfeat_bottomup_36_int8.hdf5 """
+    if dtype == 'float32': return vfeat_path
+    return vfeat_path.replace('.hdf5', '_{}.hdf5'.format(dtype))
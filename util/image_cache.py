@@ -0,0 +1,134 @@
+"""
+Decoded and resized images in a memory-mapped uint8 array, so that the
+datasets do not decode JPEGs every epoch.
+
+A cache directory (data/tools/build_image_cache.py) holds:
+    - images.npy: uint8 [num_images, height, width, 3]
+    - index.json: keys (image id / image path, or crop_key() for crops),
+      height, width and the original (width, height) of every image
+
+The images are returned as uint8 and converted to float in the input graph
+(tf.to_float), which gives the same values as the previous
+np.array(..., dtype=np.float32) of the PIL image.
+"""
+import json
+import multiprocessing
+import os
+import numpy as np
+
+from PIL import Image
+from tqdm import tqdm
+
+IMAGES_NAME = 'images.npy'
+INDEX_NAME = 'index.json'
+
+
+def crop_key(image_id, x, y, w, h):
+    """ Key of the crop x, y, w, h (image coordinates) of an image. """
+    return '{} {} {} {} {}'.format(image_id, int(x), int(y), int(w), int(h))
+
+
+def decode_image(image_path, width, height, box=None):
+    """
+    Returns:
+        - image: uint8 [height, width, 3] rgb image resized after cropping
+          it to box (x, y, w, h) if given
+        - size: (width, height) of the original image
+    """
+    image = Image.open(image_path)
+    size = image.size
+    if box is not None:
+        x, y, w, h = box
+        image = image.crop([x, y, x + w, y + h])
+    return np.array(image.resize([width, height]).convert('RGB'),
+                    dtype=np.uint8), size
+
+
+class ImageCache(object):
+
+    def __init__(self, cache_dir):
+        with open(os.path.join(cache_dir, INDEX_NAME), 'r') as f:
+            index = json.load(f)
+        self.cache_dir = cache_dir
+        self.width = index['width']
+        self.height = index['height']
+        self.key2idx = {key: i for i, key in enumerate(index['keys'])}
+        self.sizes = np.array(index['sizes'], dtype=np.int32)
+        self.images = np.load(os.path.join(cache_dir, IMAGES_NAME),
+                              mmap_mode='r')
+
+    def check_size(self, width, height):
+        if (self.width, self.height) != (width, height):
+            raise ValueError('Images of {} are {}x{}, not {}x{}'.format(
+                self.cache_dir, self.width, self.height, width, height))
+
+    def get(self, key):
+        """
+        Returns:
+            - image: uint8 [height, width, 3]
+            - size: (width, height) of the original image
+        """
+        idx = self.key2idx.get(key, None)
+        if idx is None:
+            raise KeyError('{} is not in the image cache {}, rebuild it with '
+                           'data/tools/build_image_cache.py'.format(
+                               key, self.cache_dir))
+        return np.array(self.images[idx]), tuple(self.sizes[idx])
+
+    def __contains__(self, key):
+        return key in self.key2idx
+
+    def __len__(self):
+        return len(self.key2idx)
+
+
+_job = None
+
+
+def _decode(i):
+    key, image_path, box = _job[0][i]
+    image, size = decode_image(image_path, _job[1], _job[2], box)
+    return i, image, size
+
+
+def build_image_cache(cache_dir, items, width, height, num_workers=1):
+    """
+    Args:
+        - items: [(key, image path, box (x, y, w, h) or None)], duplicated
+          keys are decoded once
+    """
+    global _job
+    unique_items = []
+    used_keys = set()
+    for item in items:
+        if item[0] in used_keys: continue
+        used_keys.add(item[0])
+        unique_items.append(item)
+
+    images = np.lib.format.open_memmap(
+        os.path.join(cache_dir, IMAGES_NAME), mode='w+', dtype=np.uint8,
+        shape=(len(unique_items), height, width, 3))
+    sizes = [None] * len(unique_items)
+    _job = (unique_items, width, height)  # read by the forked workers
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        decoded = pool.imap_unordered(_decode, range(len(unique_items)),
+                                      chunksize=64)
+    else:
+        pool = None
+        decoded = (_decode(i) for i in range(len(unique_items)))
+    for i, image, size in tqdm(decoded, total=len(unique_items),
+                               desc='decode images'):
+        images[i] = image
+        sizes[i] = [int(size[0]), int(size[1])]
+    if pool is not None:
+        pool.close()
+        pool.join()
+    _job = None
+    images.flush()
+    del images
+
+    with open(os.path.join(cache_dir, INDEX_NAME), 'w') as f:
+        json.dump({'keys': [item[0] for item in unique_items],
+                   'width': width, 'height': height, 'sizes': sizes}, f)
+    return len(unique_items)
@@ -0,0 +1,147 @@
+"""
+Startup time of the entry points.
+
+Every entry point is run with --help in a fresh interpreter, which covers
+its imports and argument parsing. The time, and whether TensorFlow was
+imported, is compared to a budget and appended to a history file so a
+regression shows up against the previous run:
+
+    python -m util.import_benchmark
+    python -m util.import_benchmark --entry_points vqa/trainer.py --repeat 5
+
+Exits with 1 if an entry point fails to start or is over its budget, or if
+a TF-free entry point imports TensorFlow.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from util import log
+
+# entry point -> (budget in seconds, imports TensorFlow)
+ENTRY_POINTS = [
+    ('run.py', 2.0, False),
+    ('util/scheduler.py', 2.0, False),
+    ('vqa/eval_collection.py', 2.0, False),
+    ('vqa/eval_collection_vqa_all.py', 2.0, False),
+    ('vqa/eval_multiple_model.py', 2.0, False),
+    ('vqa/trainer.py', 15.0, True),
+    ('vqa/evaler.py', 15.0, True),
+    ('vlmap_memft/trainer.py', 15.0, True),
+    ('vlmap_memft/export_word_weights.py', 15.0, True),
+    ('vlmap_memft/export_weights.py', 15.0, True),
+]
+
+# runs one entry point with --help and prints the measurement as json
+_RUNNER = """
+import json, os, runpy, sys, time
+path = sys.argv[1]
+sys.path.insert(0, os.getcwd())
+sys.argv = [path, '--help']
+stdout = sys.stdout
+sys.stdout = open(os.devnull, 'w')
+start = time.time()
+try:
+    runpy.run_path(path, run_name='__main__')
+except SystemExit:
+    pass
+seconds = time.time() - start
+sys.stdout = stdout
+print(json.dumps({
+    'seconds': seconds,
+    'tensorflow': 'tensorflow' in sys.modules,
+    'tf_contrib': 'tensorflow.contrib.slim' in sys.modules,
+}))
+"""
+
+
+def measure(path, repeat=3, python=sys.executable):
+    """
+    Returns:
+        - {'seconds': fastest of `repeat` runs, 'tensorflow': bool,
+            'tf_contrib': bool}
+    """
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output([python, '-c', _RUNNER, path])
+        results.append(json.loads(output.decode('utf-8').strip().split('\n')[-1]))
+    return min(results, key=lambda r: r['seconds'])
+
+
+def load_last_record(history_path):
+    if not os.path.exists(history_path): return None
+    last = None
+    with open(history_path, 'r') as f:
+        for line in f:
+            if line.strip(): last = json.loads(line)
+    return last
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--entry_points', nargs='+', type=str, default=[],
+                        help='subset of the entry points (default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per entry point, the fastest is kept')
+    parser.add_argument('--budget_scale', type=float, default=1.0,
+                        help='scale the budgets (e.g. for a slow file system)')
+    parser.add_argument('--history_path', type=str,
+                        default='experiments/import_benchmark.jsonl',
+                        help='results are appended here (empty: do not save)')
+    config = parser.parse_args()
+
+    entry_points = [e for e in ENTRY_POINTS
+                    if not config.entry_points or e[0] in config.entry_points]
+    unknown = set(config.entry_points) - set(e[0] for e in ENTRY_POINTS)
+    entry_points += [(path, None, None) for path in sorted(unknown)]
+
+    last = load_last_record(config.history_path) if config.history_path else None
+    last_results = last['results'] if last is not None else {}
+
+    results = {}
+    failed = []
+    log.warn('{:<40} {:>8} {:>8} {:>8}  {}'.format(
+        'entry point', 'secs', 'budget', 'last', 'tensorflow'))
+    for path, budget, uses_tf in entry_points:
+        try:
+            result = measure(path, repeat=config.repeat)
+        except subprocess.CalledProcessError:
+            failed.append(path)
+            log.error('{:<40} failed to start'.format(path))
+            continue
+        results[path] = result
+        over_budget = budget is not None and \
+            result['seconds'] > budget * config.budget_scale
+        tf_leak = uses_tf is False and result['tensorflow']
+        last_secs = last_results.get(path, {}).get('seconds', None)
+        msg = '{:<40} {:>8.2f} {:>8} {:>8}  {}'.format(
+            path, result['seconds'],
+            '-' if budget is None else '{:.1f}'.format(budget * config.budget_scale),
+            '-' if last_secs is None else '{:.2f}'.format(last_secs),
+            'contrib' if result['tf_contrib'] else
+            'yes' if result['tensorflow'] else 'no')
+        if over_budget or tf_leak:
+            failed.append(path)
+            log.error(msg + ('  (imports tensorflow)' if tf_leak else
+                             '  (over budget)'))
+        else: log.info(msg)
+
+    if config.history_path:
+        history_dir = os.path.dirname(config.history_path)
+        if history_dir and not os.path.exists(history_dir):
+            os.makedirs(history_dir)
+        with open(config.history_path, 'a') as f:
+            f.write(json.dumps({'time': time.strftime('%Y%m%d-%H%M%S'),
+                                'results': results}, sort_keys=True) + '\n')
+
+    if failed:
+        log.error('{} entry point(s) failed the budget'.format(len(failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
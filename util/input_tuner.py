@@ -0,0 +1,247 @@
+"""
+Input pipeline tuner for the tf.data pipelines.
+
+The pipelines take a pipeline_config dict overriding their defaults:
+    - num_parallel_calls: parallelism of the per-example map
+    - cycle_length: interleave width over TFRecord files
+    - prefetch: number of prefetched batches
+    - shuffle_buffer: shuffle buffer size (not tuned)
+
+measure() measures the producer rate (secs/batch of the pipeline alone, in
+a separate graph) for increasing parallelism. choose_config() picks the
+smallest parallelism producing batches faster than the consumer (the train
+step) and a prefetch depth covering the slow batches. The consumer rate is
+only known once the model runs: the trainers build their pipelines with a
+TunablePipeline, start them from the producer rates alone, time the first
+train steps with util/profiler and retune() the pipelines for both rates.
+The chosen configuration and the measurements are saved to
+train_dir/input_pipeline.json.
+"""
+import json
+import math
+import multiprocessing
+import os
+import time
+import numpy as np
+
+from util import log
+from util.registry import LazyModule
+from util.session_config import core_budget
+
+tf = LazyModule('tensorflow')
+
+CPU_COUNT = multiprocessing.cpu_count()
+CONFIG_NAME = 'input_pipeline.json'
+ITERATOR_INITIALIZERS = 'input_tuner_iterator_initializers'
+MAX_PREFETCH = 64
+# train steps traced for the consumer rate, after warming up the model
+CONSUMER_WARMUP_STEPS = 5
+CONSUMER_STEPS = 20
+
+
+def merge_config(default, pipeline_config=None):
+    config = dict(default)
+    if pipeline_config is not None:
+        config.update({key: val for key, val in pipeline_config.items()
+                       if key in default})
+    return config
+
+
+def measure_producer(build_fn, pipeline_config, num_batches=20, warmup=3):
+    """
+    Pull batches from a pipeline built in a separate graph.
+    Args:
+        - build_fn: pipeline_config -> batch ops (e.g. input_ops.create)
+    Returns:
+        - batch_times: [num_batches] secs per batch after warmup
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        batch_ops = build_fn(pipeline_config)
+        session = tf.Session(config=tf.ConfigProto(device_count={'GPU': 0}))
+        try:
+            for _ in range(warmup):
+                session.run(batch_ops)
+            batch_times = []
+            for _ in range(num_batches):
+                _start_time = time.time()
+                session.run(batch_ops)
+                batch_times.append(time.time() - _start_time)
+        finally:
+            session.close()
+    return np.array(batch_times, dtype=np.float64)
+
+
+def parallelism_candidates(cpu_budget=None):
+    if cpu_budget is None: cpu_budget = core_budget()
+    candidates, p = [], 1
+    while p < cpu_budget:
+        candidates.append(p)
+        p *= 2
+    candidates.append(max(cpu_budget, 1))
+    return sorted(set(candidates))
+
+
+def measure(build_fn, cpu_budget=None, num_batches=20, max_cycle_length=None):
+    """
+    Returns:
+        - measurements: {parallelism: {'mean': secs/batch, 'p90': secs/batch}}
+    """
+    measurements = {}
+    for p in parallelism_candidates(cpu_budget):
+        cycle_length = p if max_cycle_length is None \
+            else min(p, max_cycle_length)
+        times = measure_producer(build_fn, {
+            'num_parallel_calls': p, 'cycle_length': cycle_length,
+            'prefetch': 2}, num_batches=num_batches)
+        measurements[p] = {'mean': float(times.mean()),
+                           'p90': float(np.percentile(times, 90))}
+        log.info('input pipeline parallelism {}: {:.4f} sec/batch'.format(
+            p, measurements[p]['mean']))
+    return measurements
+
+
+def choose_config(measurements, consumer_secs_per_batch=None, tolerance=0.05,
+                  max_cycle_length=None):
+    """
+    Parallelism: the smallest one producing batches faster than the consumer
+    (train step) by `tolerance`, else (consumer unknown or faster than every
+    setting) the smallest one within `tolerance` of the best rate.
+    Prefetch: batches consumed while a slow (p90) batch is produced, or the
+    p90 / mean ratio of the producer alone when the consumer is unknown.
+    """
+    best = min(m['mean'] for m in measurements.values())
+    candidates = [p for p in measurements
+                  if measurements[p]['mean'] <= best * (1 + tolerance)]
+    if consumer_secs_per_batch:
+        fast_enough = [p for p in measurements if measurements[p]['mean'] *
+                       (1 + tolerance) <= consumer_secs_per_batch]
+        if fast_enough: candidates = fast_enough
+    parallelism = min(candidates)
+
+    p90 = measurements[parallelism]['p90']
+    if consumer_secs_per_batch:
+        prefetch = int(math.ceil(p90 / consumer_secs_per_batch)) + 1
+    else:
+        prefetch = int(math.ceil(
+            p90 / max(measurements[parallelism]['mean'], 1e-6))) + 1
+    prefetch = min(max(prefetch, 2), MAX_PREFETCH)
+
+    return {
+        'num_parallel_calls': parallelism,
+        'cycle_length': parallelism if max_cycle_length is None
+        else min(parallelism, max_cycle_length),
+        'prefetch': prefetch,
+    }
+
+
+def check_rates(measurements, pipeline_config, consumer_secs_per_batch,
+                tolerance=0.05):
+    """ Warn when the chosen pipeline cannot keep up with the train step. """
+    producer = measurements[pipeline_config['num_parallel_calls']]['mean']
+    if producer > consumer_secs_per_batch * (1 + tolerance):
+        log.warn('Input pipeline ({:.4f} sec/batch with parallelism {}) is '
+                 'slower than the train step ({:.4f} sec/batch): training '
+                 'will wait on input'.format(
+                     producer, pipeline_config['num_parallel_calls'],
+                     consumer_secs_per_batch))
+        return False
+    return True
+
+
+def tune(build_fn, consumer_secs_per_batch=None, cpu_budget=None,
+         num_batches=20, tolerance=0.05, max_cycle_length=None):
+    """
+    Returns:
+        - pipeline_config: chosen configuration
+        - measurements: see measure()
+    """
+    measurements = measure(build_fn, cpu_budget, num_batches,
+                           max_cycle_length)
+    pipeline_config = choose_config(measurements, consumer_secs_per_batch,
+                                    tolerance, max_cycle_length)
+    if consumer_secs_per_batch:
+        check_rates(measurements, pipeline_config, consumer_secs_per_batch,
+                    tolerance)
+    log.infov('Tuned input pipeline: {}'.format(pipeline_config))
+    return pipeline_config, measurements
+
+
+class TunablePipeline(object):
+    """
+    The tuned values as placeholders. The pipelines built with
+    pipeline_config() use initializable iterators, and initialize() (re)starts
+    every one of them with a configuration: first with the producer rates
+    alone, then again once the train step time is measured (retune()).
+    """
+
+    def __init__(self, measurements, max_cycle_length=None, tolerance=0.05):
+        self.measurements = measurements
+        self.max_cycle_length = max_cycle_length
+        self.tolerance = tolerance
+        with tf.name_scope('input_tuner'):
+            self.placeholders = {
+                'num_parallel_calls': tf.placeholder(
+                    tf.int32, [], name='num_parallel_calls'),
+                'cycle_length': tf.placeholder(
+                    tf.int64, [], name='cycle_length'),
+                'prefetch': tf.placeholder(tf.int64, [], name='prefetch'),
+            }
+        self.config = choose_config(measurements, None, tolerance,
+                                    max_cycle_length)
+        log.infov('Input pipeline before measuring the train step: {}'.format(
+            self.config))
+
+    def pipeline_config(self):
+        return dict(self.placeholders)
+
+    def initialize(self, session, pipeline_config=None):
+        if pipeline_config is not None: self.config = pipeline_config
+        session.run(tf.get_collection(ITERATOR_INITIALIZERS), feed_dict={
+            self.placeholders[key]: self.config[key]
+            for key in self.placeholders})
+
+    def retune(self, session, consumer_secs_per_batch):
+        """
+        Choose the configuration for the producer and consumer rates and
+        restart the pipelines if it changed.
+        """
+        pipeline_config = choose_config(
+            self.measurements, consumer_secs_per_batch, self.tolerance,
+            self.max_cycle_length)
+        check_rates(self.measurements, pipeline_config,
+                    consumer_secs_per_batch, self.tolerance)
+        log.infov('Tuned input pipeline for {:.4f} sec/batch train steps: '
+                  '{}'.format(consumer_secs_per_batch, pipeline_config))
+        if pipeline_config != self.config:
+            self.initialize(session, pipeline_config)
+        return pipeline_config
+
+
+def make_iterator(dataset, pipeline_config):
+    """ Initializable iterator for the pipelines of a TunablePipeline. """
+    if any(isinstance(val, tf.Tensor) for val in pipeline_config.values()):
+        iterator = dataset.make_initializable_iterator()
+        tf.add_to_collection(ITERATOR_INITIALIZERS, iterator.initializer)
+        return iterator
+    return dataset.make_one_shot_iterator()
+
+
+def save_config(train_dir, pipeline_config, measurements=None,
+                consumer_secs_per_batch=None):
+    path = os.path.join(train_dir, CONFIG_NAME)
+    with open(path, 'w') as f:
+        json.dump({
+            'cpu_count': CPU_COUNT,
+            'pipeline_config': pipeline_config,
+            'producer_secs_per_batch': {
+                str(key): val for key, val in (measurements or {}).items()},
+            'consumer_secs_per_batch': consumer_secs_per_batch,
+        }, f, indent=2, sort_keys=True)
+    log.info('Input pipeline config is saved in: {}'.format(path))
+
+
+def load_config(path):
+    """ Reuse a configuration saved by a previous run. """
+    with open(path, 'r') as f:
+        return json.load(f)['pipeline_config']
@@ -0,0 +1,180 @@
+"""
+Per-stage step-time profiler for the trainers.
+
+- Steps listed in --profile_steps are run with full tracing and exported as
+  Chrome trace timelines (train_dir/timeline_step{step}.json, open them in
+  chrome://tracing).
+- Every --trace_every steps a lightweight software trace is captured and
+  split into input wait (dataset iterator), visual feature gathering
+  (py_func), summary ops and the remaining forward/backward compute. The
+  averages are written as average_train/time/* scalars next to the
+  average_train summaries, and a warning is logged when the input wait
+  exceeds input_wait_warn of the traced step time.
+- measure_consumer(start, num_steps) traces the given steps to measure the
+  train step time without the input wait (the consumer rate of
+  util/input_tuner).
+"""
+import os
+import numpy as np
+import tensorflow as tf
+
+from tensorflow.python.client import timeline
+
+from util import log
+
+STAGES = ['input_wait', 'feature', 'summary', 'compute']
+PYTHON_STAGES = ['step', 'summary_write']
+
+INPUT_SCOPES = ('datasets/',)
+FEATURE_OPS = ('sample_features',)
+
+
+def parse_steps(steps_str):
+    """
+    '100,200,300-302' -> set([100, 200, 300, 301, 302])
+    """
+    steps = set()
+    if not steps_str: return steps
+    for token in steps_str.split(','):
+        token = token.strip()
+        if not token: continue
+        if '-' in token:
+            start, end = token.split('-')
+            steps.update(range(int(start), int(end) + 1))
+        else: steps.add(int(token))
+    return steps
+
+
+def classify_node(node_stats):
+    name = node_stats.node_name
+    if name.startswith(INPUT_SCOPES) or 'IteratorGetNext' in name:
+        return 'input_wait'
+    if any(op in name for op in FEATURE_OPS):
+        return 'feature'
+    if 'Summary' in node_stats.timeline_label:
+        return 'summary'
+    return 'compute'
+
+
+def stage_times(step_stats):
+    """
+    Wall time (sec) spent in each stage of one traced step. A stage spans
+    from the start of the step to the end of its last op for input_wait
+    (the time until the batch is ready), and from its first to its last op
+    otherwise. compute is the rest of the step after the input is ready.
+    """
+    span = {}
+    step_start, step_end = None, None
+    for dev_stats in step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+            start = node_stats.all_start_micros
+            end = start + node_stats.all_end_rel_micros
+            if start <= 0: continue
+            step_start = start if step_start is None else min(step_start, start)
+            step_end = end if step_end is None else max(step_end, end)
+            stage = classify_node(node_stats)
+            if stage == 'compute': continue
+            s, e = span.get(stage, (start, end))
+            span[stage] = (min(s, start), max(e, end))
+    times = {stage: 0.0 for stage in STAGES}
+    if step_start is None: return times
+    if 'input_wait' in span:
+        times['input_wait'] = (span['input_wait'][1] - step_start) * 1e-6
+    for stage in ['feature', 'summary']:
+        if stage in span:
+            times[stage] = (span[stage][1] - span[stage][0]) * 1e-6
+    times['compute'] = max(
+        (step_end - step_start) * 1e-6 - times['input_wait'], 0.0)
+    return times
+
+
+class StepProfiler(object):
+
+    def __init__(self, train_dir, profile_steps='', trace_every=0,
+                 input_wait_warn=0.2, summary_prefix='average_train'):
+        """
+        Build the summary ops in the constructor (before the graph is
+        finalized by tf.train.Supervisor).
+        """
+        self.train_dir = train_dir
+        self.profile_steps = parse_steps(profile_steps)
+        self.trace_every = trace_every
+        self.input_wait_warn = input_wait_warn
+        self.avg_times = {key: [] for key in STAGES + PYTHON_STAGES}
+        self.consumer_steps = set()
+        self.consumer_times = []
+
+        self.placeholders = {}
+        for key in self.avg_times:
+            self.placeholders[key] = tf.placeholder(tf.float32)
+            tf.summary.scalar('{}/time/{}'.format(summary_prefix, key),
+                              self.placeholders[key],
+                              collections=['average_profile'])
+        self.summary_op = tf.summary.merge_all(key='average_profile')
+        if len(self.profile_steps) > 0:
+            log.infov('Timelines are exported for steps: {}'.format(
+                sorted(self.profile_steps)))
+
+    def measure_consumer(self, start, num_steps):
+        """ Trace iterations [start, start + num_steps) for the consumer rate. """
+        self.consumer_steps = set(range(start, start + num_steps))
+        self.consumer_times = []
+
+    def consumer_secs_per_batch(self):
+        """ Median step time without input wait of the measured iterations. """
+        if len(self.consumer_times) == 0: return None
+        return float(np.median(self.consumer_times))
+
+    def run_kwargs(self, s):
+        """
+        Extra keyword arguments of session.run for iteration s.
+        """
+        if s in self.profile_steps:
+            trace_level = tf.RunOptions.FULL_TRACE
+        elif s in self.consumer_steps or \
+                (self.trace_every > 0 and s % self.trace_every == 0):
+            trace_level = tf.RunOptions.SOFTWARE_TRACE
+        else: return {}
+        return {'options': tf.RunOptions(trace_level=trace_level),
+                'run_metadata': tf.RunMetadata()}
+
+    def after_run(self, s, step, run_kwargs, step_time):
+        self.avg_times['step'].append(step_time)
+        run_metadata = run_kwargs.get('run_metadata', None)
+        if run_metadata is None: return
+        times = stage_times(run_metadata.step_stats)
+        for key, val in times.items():
+            self.avg_times[key].append(val)
+        if s in self.consumer_steps:
+            self.consumer_times.append(times['compute'])
+        if s in self.profile_steps:
+            path = os.path.join(self.train_dir,
+                                'timeline_step{}.json'.format(step))
+            trace = timeline.Timeline(run_metadata.step_stats)
+            with open(path, 'w') as f:
+                f.write(trace.generate_chrome_trace_format(show_memory=True))
+            log.infov('Timeline is saved in: {}'.format(path))
+
+    def add_time(self, key, secs):
+        self.avg_times[key].append(secs)
+
+    def write_summary(self, session, summary_writer, step):
+        if len(self.avg_times['step']) == 0: return
+        avg = {key: (sum(val) / len(val) if len(val) > 0 else 0.0)
+               for key, val in self.avg_times.items()}
+        summary = session.run(self.summary_op, feed_dict={
+            self.placeholders[key]: avg[key] for key in avg})
+        summary_writer.add_summary(summary, global_step=step)
+        # feature and summary overlap input_wait / compute
+        traced = avg['input_wait'] + avg['compute']
+        if traced > 0:
+            log.info('step time breakdown: ' + ', '.join(
+                '{} {:.3f}s ({:.0f}%)'.format(key, avg[key],
+                                              100.0 * avg[key] / traced)
+                for key in STAGES) +
+                ', summary_write {:.3f}s'.format(avg['summary_write']))
+            if avg['input_wait'] > self.input_wait_warn * traced:
+                log.warn('Input pipeline is starving the model: waiting on'
+                         ' input for {:.0f}% of the step time (step {})'.format(
+                             100.0 * avg['input_wait'] / traced, step))
+        for key in self.avg_times: self.avg_times[key] = []
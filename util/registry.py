@@ -0,0 +1,65 @@
+"""
+Lazy imports for the model zoo.
+
+Every model variant is its own module (vqa/model_*.py, vlmap_memft/model_*.py)
+and builds on TensorFlow and tf.contrib. The entry points only name them in
+a ModelRegistry, so listing the model types (argparse choices, --help) does
+not import any of them, and get() imports the selected one alone.
+LazyModule defers `import tensorflow.contrib.*` the same way: tf.contrib
+loads most of its submodules on first import, which dominated the startup
+time of every script importing vlmap/modules.py.
+
+This module does not import TensorFlow.
+"""
+import importlib
+
+
+class LazyModule(object):
+    """ Module proxy importing `name` on the first attribute access. """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return '<LazyModule {} ({})>'.format(self._name, state)
+
+
+class ModelRegistry(object):
+
+    def __init__(self, package, modules, aliases=None, class_name='Model'):
+        """
+        Args:
+            - package: package of the model modules (e.g. 'vqa')
+            - modules: [(model_type, module name)], in the order listed by
+                types()
+            - aliases: {alias: model_type} accepted by get() but not listed
+            - class_name: attribute of the module returned by get()
+        """
+        self.package = package
+        self.modules = list(modules)
+        self.module_dict = dict(self.modules)
+        self.aliases = aliases or {}
+        self.class_name = class_name
+
+    def types(self):
+        return [model_type for model_type, _ in self.modules]
+
+    def module_path(self, model_type):
+        model_type = self.aliases.get(model_type, model_type)
+        if model_type not in self.module_dict:
+            raise ValueError('Unknown model_type: {}'.format(model_type))
+        return '{}.{}'.format(self.package, self.module_dict[model_type])
+
+    def get(self, model_type):
+        module = importlib.import_module(self.module_path(model_type))
+        return getattr(module, self.class_name)
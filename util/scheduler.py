@@ -0,0 +1,430 @@
+"""
+Work-queue scheduler for experiment sweeps (run.py, run_vqa_all.py).
+
+Jobs are shell commands with dependencies. A job starts as soon as its
+dependencies are done and a slot, enough free cores, memory and a GPU are
+available, instead of running the sweep in fixed groups. Each job gets a
+disjoint core set (pinned with taskset, exported in VLMAP_CPU_CORES for
+util/session_config) and the least loaded GPU. Failed jobs are retried, the
+dependents of a job that keeps failing are skipped, and the job states are
+saved to a json file after every change so an interrupted sweep resumes
+where it stopped (done jobs are not run again).
+
+A command can be a callable returning the command string, called when the
+job is about to start. This is used for stages that depend on the outputs of
+earlier stages (e.g. train directories named with a timestamp). Returning
+None marks the job done without running anything.
+
+Try it locally with CPU-only dummy jobs:
+    python -m util.scheduler --state_path /tmp/sweep_state.json
+"""
+import hashlib
+import json
+import os
+import subprocess
+import time
+from distutils.spawn import find_executable
+
+from util import cpu_affinity, log
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Job(object):
+
+    def __init__(self, name, cmd, deps=(), cores=None, memory_gb=0,
+                 gpu=True, max_retries=None):
+        """
+        Args:
+            - name: unique name, used for dependencies, state and log file
+            - cmd: shell command, or a callable returning it (or None)
+            - deps: names of the jobs that have to be done first
+            - cores: cores of the job (default: the scheduler's share)
+            - memory_gb: memory reserved for the job
+            - gpu: False runs the job with no visible GPU
+            - max_retries: override the scheduler's max_retries
+        """
+        self.name = name
+        self.cmd = cmd
+        self.deps = list(deps)
+        self.cores = cores
+        self.memory_gb = memory_gb
+        self.gpu = gpu
+        self.max_retries = max_retries
+
+        self.status = PENDING
+        self.attempts = 0
+        self.returncode = None
+        self.resolved_cmd = None
+
+
+def total_memory_gb():
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / float(1024 ** 2)
+    except IOError:
+        pass
+    return None
+
+
+class Scheduler(object):
+
+    def __init__(self, num_slots, num_gpu=0, state_path=None, log_dir=None,
+                 cores_per_job=None, pin_cores=True, numa=False,
+                 memory_budget_gb=None, max_retries=1, launch_interval=0,
+                 poll_secs=1.0, debug=False):
+        """
+        Args:
+            - num_slots: maximum number of concurrent jobs
+            - num_gpu: GPUs to share among the jobs (0: CPU only)
+            - state_path: json file to save / resume the job states
+            - log_dir: per-job log files (default: inherit stdout)
+            - cores_per_job: default cores of a job (default: equal share)
+            - pin_cores: pin each job to its cores with taskset
+            - numa: take the cores of a job from a single NUMA node
+            - memory_budget_gb: memory shared by running jobs (default: host)
+            - max_retries: retries of a failed job
+            - launch_interval: seconds between two launches (staggers the
+                start-up of jobs that load large datasets)
+            - debug: print the commands instead of running them
+        """
+        self.num_slots = num_slots
+        self.num_gpu = num_gpu
+        self.state_path = state_path
+        self.log_dir = log_dir
+        self.pin_cores = pin_cores and find_executable('taskset') is not None
+        if pin_cores and not self.pin_cores:
+            log.warn('taskset is not found, jobs are not pinned')
+        self.memory_budget_gb = memory_budget_gb or total_memory_gb()
+        self.max_retries = max_retries
+        self.launch_interval = launch_interval
+        self.poll_secs = poll_secs
+        self.debug = debug
+
+        if numa and find_executable('numactl') is None:
+            log.warn('numactl is not found, NUMA nodes are ignored')
+            numa = False
+        if numa:
+            available = set(cpu_affinity.available_cores())
+            self.free_cores = {
+                node: [core for core in cores if core in available]
+                for node, cores in cpu_affinity.numa_nodes().items()}
+            self.free_cores = {node: cores for node, cores
+                               in self.free_cores.items() if cores}
+        else:
+            self.free_cores = {None: cpu_affinity.available_cores()}
+        num_cores = sum(len(cores) for cores in self.free_cores.values())
+        self.cores_per_job = cores_per_job or max(num_cores // num_slots, 1)
+        self.max_job_cores = max(len(cores) for cores in self.free_cores.values())
+        # fewer cores than slots: jobs share every core instead of waiting
+        self.share_cores = num_cores < num_slots
+        if self.share_cores:
+            log.warn('{} cores for {} slots, jobs are not given their own '
+                     'cores'.format(num_cores, num_slots))
+            self.pin_cores = False
+
+        self.jobs = {}
+        self.order = []
+        self.running = {}
+        self.gpu_load = [0] * num_gpu
+        self.last_launch = 0
+
+        self.saved_state = {}
+        if state_path is not None and os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                self.saved_state = json.load(f)
+            log.infov('Resume from {} ({} jobs done)'.format(
+                state_path, sum(1 for s in self.saved_state.values()
+                                if s['status'] == DONE)))
+        if log_dir is not None and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+    @staticmethod
+    def from_config(config, state_path=None):
+        return Scheduler(
+            config.num_thread, num_gpu=config.num_gpu,
+            state_path=state_path or config.state_path or None,
+            log_dir=config.job_log_dir or None,
+            cores_per_job=config.cores_per_proc or None,
+            pin_cores=bool(config.pin_cores), numa=bool(config.numa),
+            memory_budget_gb=config.memory_budget_gb or None,
+            max_retries=config.max_retries,
+            launch_interval=config.launch_interval,
+            debug=bool(config.debug))
+
+    def add(self, job):
+        if job.name in self.jobs:
+            raise ValueError('Duplicated job name: {}'.format(job.name))
+        for dep in job.deps:
+            if dep not in self.jobs:
+                raise ValueError('Unknown dependency of {}: {}'.format(
+                    job.name, dep))
+        saved = self.saved_state.get(job.name, None)
+        if saved is not None and saved['status'] == DONE:
+            job.status = DONE
+            job.resolved_cmd = saved['cmd']
+        self.jobs[job.name] = job
+        self.order.append(job.name)
+        return job
+
+    def run(self):
+        """
+        Returns:
+            - {job name: status}
+        """
+        try:
+            while True:
+                self._poll()
+                self._skip_blocked()
+                self._launch_ready()
+                if not self.running and not any(
+                        self.jobs[name].status == PENDING for name in self.order):
+                    break
+                time.sleep(self.poll_secs)
+        except KeyboardInterrupt:
+            log.warn('Interrupted, terminating {} jobs'.format(len(self.running)))
+            for name, (proc, _, _, _) in self.running.items():
+                proc.terminate()
+                self.jobs[name].status = PENDING
+            self.running = {}
+            self._save_state()
+            raise
+
+        counts = {}
+        for name in self.order:
+            status = self.jobs[name].status
+            counts[status] = counts.get(status, 0) + 1
+        log_fn = log.infov if counts.get(FAILED, 0) == 0 else log.error
+        log_fn('Sweep finished: {}'.format(', '.join(
+            '{} {}'.format(val, key) for key, val in sorted(counts.items()))))
+        return {name: self.jobs[name].status for name in self.order}
+
+    def _job_cores(self, job):
+        return min(job.cores or self.cores_per_job, self.max_job_cores)
+
+    def _fits(self, job):
+        if len(self.running) >= self.num_slots: return False
+        if self.memory_budget_gb is not None and job.memory_gb > 0:
+            used = sum(self.jobs[name].memory_gb for name in self.running)
+            if used + job.memory_gb > self.memory_budget_gb: return False
+        if self.share_cores: return True
+        num_cores = self._job_cores(job)
+        return any(len(cores) >= num_cores for cores in self.free_cores.values())
+
+    def _acquire_cores(self, job):
+        if self.share_cores:
+            return cpu_affinity.available_cores(), None
+        num_cores = self._job_cores(job)
+        # the node with the most free cores
+        node = max((n for n in self.free_cores
+                    if len(self.free_cores[n]) >= num_cores),
+                   key=lambda n: len(self.free_cores[n]))
+        cores = self.free_cores[node][:num_cores]
+        self.free_cores[node] = self.free_cores[node][num_cores:]
+        return cores, node
+
+    def _release_cores(self, cores, node):
+        if self.share_cores: return
+        self.free_cores[node] = sorted(self.free_cores[node] + cores)
+
+    def _launch_ready(self):
+        for name in self.order:
+            job = self.jobs[name]
+            if job.status != PENDING: continue
+            if any(self.jobs[dep].status != DONE for dep in job.deps): continue
+            if not self._fits(job): continue
+            wait = self.last_launch + self.launch_interval - time.time()
+            if wait > 0: return
+
+            if callable(job.cmd):
+                try:
+                    job.resolved_cmd = job.cmd()
+                except Exception as e:
+                    log.error('Fail to build the command of {}: {}'.format(name, e))
+                    job.status = FAILED
+                    self._save_state()
+                    continue
+            else: job.resolved_cmd = job.cmd
+            if job.resolved_cmd is None:
+                log.info('Nothing to do for {}'.format(name))
+                job.status = DONE
+                self._save_state()
+                continue
+            self._start(job)
+
+    def _start(self, job):
+        cores, node = self._acquire_cores(job)
+        gpu = None
+        if job.gpu and self.num_gpu > 0:
+            gpu = self.gpu_load.index(min(self.gpu_load))
+            self.gpu_load[gpu] += 1
+
+        env = dict(os.environ)
+        env['CUDA_VISIBLE_DEVICES'] = '' if gpu is None else str(gpu)
+        env[cpu_affinity.CPU_CORES_ENV] = cpu_affinity.format_cores(cores)
+        cmd = job.resolved_cmd
+        if self.pin_cores:
+            cmd = 'taskset -c {} {}'.format(cpu_affinity.format_cores(cores), cmd)
+        if node is not None:
+            env[cpu_affinity.NUMA_NODE_ENV] = str(node)
+            cmd = 'numactl --cpunodebind={} --membind={} {}'.format(node, node, cmd)
+
+        job.attempts += 1
+        log.info(' [*] {} (attempt {}, gpu {}, cores {}): {}'.format(
+            job.name, job.attempts, gpu, cpu_affinity.format_cores(cores),
+            job.resolved_cmd))
+        if self.debug:
+            job.status = DONE
+            self._release_cores(cores, node)
+            if gpu is not None: self.gpu_load[gpu] -= 1
+            self._save_state()
+            return
+
+        stdout = None
+        if self.log_dir is not None:
+            stdout = open(os.path.join(
+                self.log_dir, job.name.replace('/', '_') + '.log'), 'a')
+        proc = subprocess.Popen(cmd, shell=True, env=env, stdout=stdout,
+                                stderr=subprocess.STDOUT if stdout else None)
+        if stdout is not None: stdout.close()
+        job.status = RUNNING
+        self.running[job.name] = (proc, cores, node, gpu)
+        self.last_launch = time.time()
+        self._save_state()
+
+    def _poll(self):
+        for name in list(self.running.keys()):
+            proc, cores, node, gpu = self.running[name]
+            returncode = proc.poll()
+            if returncode is None: continue
+            del self.running[name]
+            self._release_cores(cores, node)
+            if gpu is not None: self.gpu_load[gpu] -= 1
+
+            job = self.jobs[name]
+            job.returncode = returncode
+            max_retries = self.max_retries if job.max_retries is None \
+                else job.max_retries
+            if returncode == 0:
+                job.status = DONE
+                log.infov('Job done: {}'.format(name))
+            elif job.attempts <= max_retries:
+                job.status = PENDING
+                log.warn('Job {} failed (exit code {}), retry {}/{}'.format(
+                    name, returncode, job.attempts, max_retries))
+            else:
+                job.status = FAILED
+                log.error('Job {} failed (exit code {})'.format(name, returncode))
+            self._save_state()
+
+    def _skip_blocked(self):
+        # jobs are added after their dependencies, one pass in order is enough
+        skipped = False
+        for name in self.order:
+            job = self.jobs[name]
+            if job.status != PENDING: continue
+            if any(self.jobs[dep].status in [FAILED, SKIPPED]
+                   for dep in job.deps):
+                log.warn('Skip {}: a dependency failed'.format(name))
+                job.status = SKIPPED
+                skipped = True
+        if skipped: self._save_state()
+
+    def _save_state(self):
+        if self.state_path is None: return
+        # keep the jobs of the earlier schedulers sharing the state file
+        state = dict(self.saved_state)
+        state.update({name: {
+            'status': job.status,
+            'attempts': job.attempts,
+            'returncode': job.returncode,
+            'cmd': job.resolved_cmd,
+        } for name, job in self.jobs.items()})
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.state_path)
+
+
+def add_scheduler_arguments(parser):
+    parser.add_argument('--state_path', type=str, default=None,
+                        help='json file to save / resume the sweep')
+    parser.add_argument('--job_log_dir', type=str, default=None,
+                        help='write the output of every job to a log file')
+    parser.add_argument('--max_retries', type=int, default=1)
+    parser.add_argument('--launch_interval', type=int, default=0,
+                        help='seconds between two job launches')
+    parser.add_argument('--memory_budget_gb', type=float, default=0,
+                        help='0: host memory')
+    parser.add_argument('--pin_cores', type=int, default=1,
+                        help='1: pin each job to its own cores')
+    parser.add_argument('--cores_per_proc', type=int, default=0,
+                        help='0: split the cores equally over num_thread')
+    parser.add_argument('--numa', type=int, default=0,
+                        help='1: keep each core set (and its memory) in one NUMA node')
+
+
+def run_commands(commands, config, name_prefix='job'):
+    """
+    Run independent commands (the former parallel_run). Jobs are named after
+    their command, so successive calls can share one state file.
+    """
+    scheduler = Scheduler.from_config(config)
+    for cmd in commands:
+        base_name = '{}_{}'.format(
+            name_prefix, hashlib.sha1(cmd.encode('utf-8')).hexdigest()[:12])
+        name, i = base_name, 1
+        while name in scheduler.jobs:
+            name = '{}_{}'.format(base_name, i)
+            i += 1
+        scheduler.add(Job(name, cmd))
+    return scheduler.run()
+
+
+def main():
+    """ Dummy sweep with the stages of run.py, CPU only. """
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num_thread', type=int, default=3)
+    parser.add_argument('--num_gpu', type=int, default=0)
+    parser.add_argument('--debug', type=int, default=0)
+    parser.add_argument('--fail', type=str, default='vqa_1',
+                        help='job that fails on its first attempt')
+    add_scheduler_arguments(parser)
+    config = parser.parse_args()
+
+    scheduler = Scheduler.from_config(config)
+    fail_marker = '{}.{}.failed_once'.format(
+        config.state_path or '/tmp/scheduler_demo', config.fail)
+
+    def dummy(name, secs):
+        cmd = 'sleep {} && echo {} on cores $VLMAP_CPU_CORES'.format(secs, name)
+        if name == config.fail:
+            cmd = '(test -e {m} || (touch {m} && exit 1)) && {cmd}'.format(
+                m=fail_marker, cmd=cmd)
+        return cmd
+
+    scheduler.add(Job('find_word_group', dummy('find_word_group', 1), gpu=False))
+    scheduler.add(Job('enwiki', dummy('enwiki', 1), deps=['find_word_group'],
+                      gpu=False))
+    for i in range(3):
+        scheduler.add(Job('vlmap_{}'.format(i), dummy('vlmap_{}'.format(i), 2 + i),
+                          deps=['enwiki']))
+        scheduler.add(Job('export_{}'.format(i), dummy('export_{}'.format(i), 1),
+                          deps=['vlmap_{}'.format(i)]))
+        scheduler.add(Job('vqa_{}'.format(i), dummy('vqa_{}'.format(i), 3 - i),
+                          deps=['export_{}'.format(i)]))
+    scheduler.add(Job('eval', dummy('eval', 1),
+                      deps=['vqa_{}'.format(i) for i in range(3)]))
+    scheduler.run()
+
+if __name__ == '__main__':
+    main()
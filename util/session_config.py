@@ -0,0 +1,73 @@
+"""
+Shared tf.ConfigProto factory.
+
+The thread pools are sized from a core budget: num_cores if given, else the
+cores assigned by util/scheduler (util/cpu_affinity.CPU_CORES_ENV),
+else every core the process may run on. Without a budget TensorFlow sizes
+both pools to the whole host, and processes launched side by side
+oversubscribe the cores.
+
+TensorFlow is imported by get_session_config(), so the entry points can add
+the arguments without importing it.
+"""
+import math
+
+from util import cpu_affinity, log
+from util.registry import LazyModule
+
+tf = LazyModule('tensorflow')
+
+
+def core_budget(num_cores=None):
+    if num_cores: return num_cores
+    cores = cpu_affinity.assigned_cores()
+    if cores is None: cores = cpu_affinity.available_cores()
+    return len(cores)
+
+
+def thread_counts(num_cores):
+    """
+    Returns:
+        - intra_op_threads: threads inside one op (matmul, conv, ...)
+        - inter_op_threads: ops run concurrently. Every concurrent op can use
+            the whole intra op pool, so it grows with the square root of the
+            budget: 1 up to 4 cores, 2 for 8, 3 for 16, 4 for 32, 6 for 64
+    """
+    inter_op_threads = max(int(round(math.sqrt(num_cores / 2.0))), 1)
+    return num_cores, inter_op_threads
+
+
+def get_session_config(num_cores=None, intra_op_threads=None,
+                       inter_op_threads=None, use_gpu=True, pin=True):
+    """
+    Args:
+        - num_cores: core budget of this process (0 / None: see above)
+        - intra_op_threads, inter_op_threads: override the derived sizes
+        - use_gpu: False hides the GPUs
+        - pin: pin the process to the cores assigned by the scheduler where
+            the platform allows it (scheduled jobs are pinned by taskset)
+    """
+    assigned = cpu_affinity.assigned_cores()
+    if pin and assigned is not None:
+        cpu_affinity.pin_process(assigned)
+
+    budget = core_budget(num_cores)
+    default_intra, default_inter = thread_counts(budget)
+    intra_op_threads = intra_op_threads or default_intra
+    inter_op_threads = inter_op_threads or default_inter
+    log.info('Session threads: {} intra op, {} inter op ({} cores{})'.format(
+        intra_op_threads, inter_op_threads, budget,
+        '' if assigned is None else ': ' + cpu_affinity.format_cores(assigned)))
+
+    return tf.ConfigProto(
+        allow_soft_placement=True,
+        gpu_options=tf.GPUOptions(allow_growth=True),
+        device_count={'GPU': 1 if use_gpu else 0},
+        intra_op_parallelism_threads=intra_op_threads,
+        inter_op_parallelism_threads=inter_op_threads)
+
+
+def add_session_arguments(parser):
+    parser.add_argument('--num_cores', type=int, default=0,
+                        help='CPU core budget of the process (0: cores '
+                        'assigned by the sweep scheduler, or all cores)')
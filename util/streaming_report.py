@@ -0,0 +1,51 @@
+"""
+In-graph running averages of model.report.
+
+The trainers used to fetch the whole report dict on every step and average
+it in Python. StreamingReport keeps a running sum of every report entry and
+a step counter in local variables (not saved in checkpoints, initialized by
+the Supervisor local init op), so a step only runs update_op and the
+averages are read once per averaging window.
+"""
+import tensorflow as tf
+
+
+class StreamingReport(object):
+
+    def __init__(self, report, split, summary_collection=None):
+        """
+        Args:
+            - report: {key: scalar tensor}
+            - split: name used for the variable scope and summary tags
+            - summary_collection: if given, 'average_{split}/{key}' scalar
+                summaries of the averages are added to this collection
+        """
+        self.split = split
+        with tf.variable_scope('streaming_report/{}'.format(split)):
+            self.count = tf.get_variable(
+                'count', shape=(), dtype=tf.float32, trainable=False,
+                initializer=tf.zeros_initializer(),
+                collections=[tf.GraphKeys.LOCAL_VARIABLES])
+            self.sums = {
+                key: tf.get_variable(
+                    key, shape=(), dtype=tf.float32, trainable=False,
+                    initializer=tf.zeros_initializer(),
+                    collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                for key in report}
+
+            update_ops = [self.sums[key].assign_add(
+                tf.cast(report[key], tf.float32)) for key in report]
+            update_ops.append(self.count.assign_add(1.0))
+            self.update_op = tf.group(*update_ops, name='update')
+
+            # 0 for an empty window
+            self.average = {
+                key: self.sums[key] / tf.maximum(self.count, 1.0)
+                for key in report}
+            self.reset_op = tf.variables_initializer(
+                [self.count] + list(self.sums.values()), name='reset')
+
+        if summary_collection is not None:
+            for key, val in self.average.items():
+                tf.summary.scalar('average_{}/{}'.format(split, key), val,
+                                  collections=[summary_collection])
@@ -0,0 +1,85 @@
+"""
+hdf5 layout of the per-image vfeat datasets for random access.
+
+create_dataset('image_features', (N, 36, 2048), 'f') is contiguous: reading
+a batch of images costs one seek per image but cannot be compressed, and any
+other chunk shape picked by h5py may split an image over several chunks.
+create_image_dataset() keeps that contiguous layout by default and, on
+request, chunks by images_per_chunk whole images (one image: 36 x 2048 x 4
+bytes = 288KB) with an optional fast codec. Only image_features is worth
+chunking: the loaders read the small per-image datasets (normal_boxes,
+spatial_features, ...) whole, and chunks of one image of them would turn
+that sequential read into a read per image. open_vfeat_file() sizes the
+chunk cache for random batches.
+"""
+import h5py
+import numpy as np
+
+CHUNKED_KEYS = ['image_features']
+COMPRESSIONS = ['none', 'lzf', 'gzip']
+
+
+def compression_kwargs(compression, gzip_level=1):
+    if compression in (None, 'none'): return {}
+    if compression == 'lzf': return {'compression': 'lzf', 'shuffle': True}
+    if compression == 'gzip':
+        return {'compression': 'gzip', 'compression_opts': gzip_level,
+                'shuffle': True}
+    raise ValueError('Unknown compression: {}'.format(compression))
+
+
+def create_image_dataset(f, name, shape, dtype, images_per_chunk=0,
+                         compression=None, data=None):
+    """
+    Args:
+        - shape: [num_images, ...]
+        - images_per_chunk: whole images per chunk (0: contiguous)
+    """
+    if images_per_chunk <= 0:
+        if compression not in (None, 'none'):
+            raise ValueError('{} compression needs images_per_chunk > 0'.format(
+                compression))
+        return f.create_dataset(name, shape, dtype, data=data)
+    chunks = (min(images_per_chunk, max(shape[0], 1)),) + tuple(shape[1:])
+    return f.create_dataset(name, shape, dtype, data=data, chunks=chunks,
+                            **compression_kwargs(compression))
+
+
+def open_vfeat_file(path, mode='r', cache_mb=64):
+    """
+    h5py.File with a chunk cache of cache_mb (h5py default: 1MB, less than
+    four images) when the h5py version supports it.
+    """
+    try:
+        return h5py.File(path, mode, rdcc_nbytes=cache_mb * (1 << 20),
+                         rdcc_nslots=10007)
+    except TypeError:  # h5py < 2.9
+        return h5py.File(path, mode)
+
+
+def copy_with_layout(f_in, f_out, images_per_chunk=1, compression=None,
+                     images_per_copy=1024, log_fn=None):
+    """ Copy every dataset of f_in, re-chunking the CHUNKED_KEYS ones. """
+    num_images = f_in['num_boxes'].shape[0]
+    for key in f_in:
+        item = f_in[key]
+        if key not in CHUNKED_KEYS or not isinstance(item, h5py.Dataset) \
+                or item.shape[:1] != (num_images,):
+            f_in.copy(key, f_out)
+            continue
+        dataset = create_image_dataset(
+            f_out, key, item.shape, item.dtype, images_per_chunk, compression)
+        for start in range(0, num_images, images_per_copy):
+            end = min(start + images_per_copy, num_images)
+            dataset[start:end] = item[start:end]
+            if log_fn is not None:
+                log_fn('{} [{}/{}]'.format(key, end, num_images))
+
+
+def describe_layout(dataset):
+    return {
+        'chunks': dataset.chunks,
+        'compression': dataset.compression,
+        'shape': dataset.shape,
+        'dtype': str(np.dtype(dataset.dtype)),
+    }
@@ -0,0 +1,111 @@
+"""
+Index views of a vfeat hdf5 file.
+
+A view stores view_index [N] (rows of a shared base vfeat file) and a copy
+of the base data_info with data_info/view_of, the base path relative to the
+view. open_vfeat() returns the base rows in view order for every dataset,
+so the loaders read a view exactly like a vfeat file:
+
+    with open_vfeat(vfeat_path) as f:
+        max_box_num = int(f['data_info']['max_box_num'].value)
+        normal_boxes = np.array(f.get('normal_boxes'))
+
+The rows are read from the base in contiguous chunks, without loading the
+whole base into memory.
+"""
+import h5py
+import os
+import numpy as np
+
+VIEW_INDEX = 'view_index'
+
+
+def read_rows(dataset, index, chunk_size=1024):
+    """
+    Returns:
+        - dataset[index] for any (unsorted, repeated) index
+    """
+    index = np.asarray(index, dtype=np.int64)
+    rows, inverse = np.unique(index, return_inverse=True)
+    out = np.empty((len(rows),) + dataset.shape[1:], dtype=dataset.dtype)
+    i = 0
+    while i < len(rows):
+        start = rows[i]
+        end = min(start + chunk_size, dataset.shape[0])
+        j = np.searchsorted(rows, end)
+        if j - i == end - start:
+            out[i:j] = dataset[start:end]
+        else:
+            out[i:j] = dataset[start:end][rows[i:j] - start]
+        i = j
+    return out[inverse]
+
+
+class VFeatView(object):
+
+    def __init__(self, view_path):
+        self.view = h5py.File(view_path, 'r')
+        self.index = np.array(self.view[VIEW_INDEX])
+        self.base_path = os.path.join(
+            os.path.dirname(view_path),
+            str(self.view['data_info']['view_of'].value))
+        self.base = h5py.File(self.base_path, 'r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, key):
+        return key == 'data_info' or key in self.base
+
+    def __getitem__(self, key):
+        if key == 'data_info': return self.view['data_info']
+        return self.get(key)
+
+    def get(self, key):
+        if key not in self.base: return None
+        dataset = self.base[key]
+        if dataset.shape[:1] != self.base['num_boxes'].shape[:1]:
+            return np.array(dataset)  # not a per image dataset
+        return read_rows(dataset, self.index)
+
+    def close(self):
+        self.view.close()
+        self.base.close()
+
+
+def is_view(vfeat_path):
+    with h5py.File(vfeat_path, 'r') as f:
+        return VIEW_INDEX in f
+
+
+def open_vfeat(vfeat_path):
+    """ h5py.File, or VFeatView if vfeat_path is a view """
+    if is_view(vfeat_path): return VFeatView(vfeat_path)
+    return h5py.File(vfeat_path, 'r')
+
+
+def write_view(view_path, base_path, index, **data_info):
+    """
+    Args:
+        - index: [N] rows of the base file
+        - data_info: overrides the data_info copied from the base
+    """
+    with h5py.File(base_path, 'r') as base, h5py.File(view_path, 'w') as f:
+        if VIEW_INDEX in base:
+            raise ValueError('Create views of a vfeat file, not of a view: '
+                             '{}'.format(base_path))
+        num_images = base['num_boxes'].shape[0]
+        index = np.asarray(index, dtype=np.int64)
+        if len(index) and (index.min() < 0 or index.max() >= num_images):
+            raise ValueError('view_index out of range [0, {})'.format(
+                num_images))
+        f[VIEW_INDEX] = index
+        base.copy('data_info', f)
+        f['data_info']['view_of'] = os.path.relpath(
+            base_path, os.path.dirname(os.path.abspath(view_path)))
+        for key, value in data_info.items():
+            if key in f['data_info']: del f['data_info'][key]
+            f['data_info'][key] = value
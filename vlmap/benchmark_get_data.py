@@ -0,0 +1,83 @@
+"""
+Compare Dataset.get_data (vectorized sampler) of vlmap/datasets/dataset_vlmap.py
+with the per-box loop implementation it replaced (get_data_loop): time per
+example of the full get_data and of the region sampling alone (image
+decoding excluded), and the shapes of the outputs.
+
+    python vlmap/benchmark_get_data.py --num_examples 200
+
+Both implementations run on the same ids. The first pass checks the outputs
+and warms the page cache of the images and the hdf5 file; it is not
+measured.
+"""
+import argparse
+import time
+import numpy as np
+
+from util import log
+from vlmap.datasets import dataset_vlmap
+
+
+def time_per_example(fn, ids):
+    latencies = []
+    for id in ids:
+        start = time.time()
+        fn(id)
+        latencies.append(time.time() - start)
+    return np.array(latencies) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--vocab_path', type=str,
+                        default='data/preprocessed/new_vocab50.json', help=' ')
+    parser.add_argument('--image_dir', type=str,
+                        default='data/VisualGenome/VG_100K', help=' ')
+    parser.add_argument('--dataset_path', type=str,
+                        default='data/preprocessed/visualgenome'
+                        '/merged_by_image_new_vocab50_min_region20', help=' ')
+    parser.add_argument('--image_cache_dir', type=str, default=None,
+                        help='decoded images of data/tools/build_image_cache.py')
+    parser.add_argument('--num_examples', type=int, default=200, help=' ')
+    config = parser.parse_args()
+
+    dataset = dataset_vlmap.create_default_splits(
+        config.dataset_path, config.image_dir, config.vocab_path,
+        is_train=True, image_cache_dir=config.image_cache_dir)['train']
+    ids = dataset.ids[:config.num_examples]
+
+    # the outputs must have the same keys, shapes and types (also warms up)
+    for id in ids:
+        new, loop = dataset.get_data(id), dataset.get_data_loop(id)
+        if sorted(new.keys()) != sorted(loop.keys()):
+            raise ValueError('Different outputs: {}'.format(
+                set(new.keys()) ^ set(loop.keys())))
+        for key in loop:
+            if np.shape(new[key]) != np.shape(loop[key]) or \
+                    np.asarray(new[key]).dtype.kind != \
+                    np.asarray(loop[key]).dtype.kind:
+                raise ValueError('{} of {}: {} {} vs {} {}'.format(
+                    key, id, np.shape(new[key]), np.asarray(new[key]).dtype,
+                    np.shape(loop[key]), np.asarray(loop[key]).dtype))
+    log.info('outputs of {} examples have the same shapes'.format(len(ids)))
+
+    image_ms = time_per_example(dataset.load_image, ids)
+    results = [
+        ('get_data_loop', time_per_example(dataset.get_data_loop, ids)),
+        ('get_data', time_per_example(dataset.get_data, ids)),
+    ]
+    log.warn('{} examples, load_image: {:.2f}ms'.format(
+        len(ids), np.mean(image_ms)))
+    log.warn('{:<16} {:>10} {:>10} {:>10} {:>14}'.format(
+        'implementation', 'mean (ms)', 'p50 (ms)', 'p99 (ms)',
+        'sampling (ms)'))
+    for name, latencies_ms in results:
+        log.infov('{:<16} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.2f}'.format(
+            name, np.mean(latencies_ms), np.percentile(latencies_ms, 50),
+            np.percentile(latencies_ms, 99),
+            np.mean(latencies_ms) - np.mean(image_ms)))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,8 @@ import json
 import os
 import numpy as np
 
-from PIL import Image
-
 from util import log, box_utils
+from util.image_cache import ImageCache, decode_image
 
 RANDOM_STATE = np.random.RandomState(123)
 IMAGE_WIDTH = 540
@@ -25,10 +24,103 @@ MAX_BOX_PER_ENTRY = {
 }
 
 
+ENTRY_FIELDS = ['box_xywh', 'positive_box_idx', 'negative_box_idx',
+                'region_descriptions', 'region_description_len',
+                'asn_region2pos_idx']
+for _key in ['region', 'object', 'attribute', 'relationship']:
+    ENTRY_FIELDS.extend(['asn_{}_idx'.format(_key),
+                         'no_asn_{}_idx'.format(_key),
+                         '{}_xywh'.format(_key)])
+for _key in ['object', 'attribute', 'relationship']:
+    ENTRY_FIELDS.extend(['{}_name_ids'.format(_key),
+                         '{}_num_names'.format(_key),
+                         'asn_{}2pos_idx'.format(_key)])
+
+
+def read_entry(entry):
+    """
+    Reads every field used by get_data from the group of an image at once.
+    Index fields are int32 (empty ones are stored as float).
+    """
+    fields = {}
+    for name in ENTRY_FIELDS:
+        value = entry[name].value
+        if name.endswith('_idx'): value = value.astype(np.int32)
+        fields[name] = value
+    return fields
+
+
+def random_subset(n, k):
+    """ min(k, n) random indices of range(n) in random order. """
+    return RANDOM_STATE.permutation(n)[:max(k, 0)].astype(np.int32)
+
+
+def blank_fill(desc, desc_len, unk_id):
+    """
+    Replaces 1, 2 or 3 (p: 0.5, 0.3, 0.2) consecutive tokens of each
+    description with one <unk> token.
+    """
+    num_desc, width = desc.shape
+    rows = np.arange(num_desc)
+    drop_count = np.minimum(RANDOM_STATE.choice(
+        [1, 2, 3], size=num_desc, p=[0.5, 0.3, 0.2]), desc_len)
+    drop_s = (RANDOM_STATE.rand(num_desc) *
+              (desc_len - drop_count + 1)).astype(np.int32)
+    # tokens after the blank are shifted left by drop_count - 1
+    cols = np.arange(width)[None, :]
+    src = cols + (cols > drop_s[:, None]) * (drop_count[:, None] - 1)
+    blank_desc = desc[rows[:, None], np.minimum(src, width - 1)]
+    blank_desc[src >= width] = 0
+    blank_desc[rows, drop_s] = unk_id
+    return blank_desc, (desc_len - drop_count + 1).astype(np.int32)
+
+
+def sample_with_positive(pos_idx, num_candidates, k):
+    """
+    [len(pos_idx), k] indices: pos_idx[i] followed by random indices of
+    range(num_candidates) other than pos_idx[i].
+    """
+    if num_candidates < k:
+        # a positive among the candidates would be drawn as a negative and
+        # the rows would be shorter than k
+        raise ValueError('{} candidates for {} samples with a positive'.format(
+            num_candidates, k))
+    rows = np.arange(len(pos_idx))
+    keys = RANDOM_STATE.rand(len(pos_idx), num_candidates)
+    in_range = pos_idx < num_candidates
+    keys[rows[in_range], pos_idx[in_range]] = 2.0  # after every other index
+    neg_idx = np.argsort(keys, axis=1)[:, :k - 1]
+    return np.concatenate([pos_idx[:, None], neg_idx], axis=1).astype(np.int32)
+
+
+def sample_candidates(name_ids, num_names, num_entry, k):
+    """
+    Returns:
+        - [num_rows, k] entry ids: the first num_names[i] of name_ids[i]
+          followed by random ids of range(num_entry) which are not among them
+        - [num_rows, k] mask of the former (ground truths)
+    """
+    rows = np.arange(len(name_ids))[:, None]
+    cols = np.arange(k)[None, :]
+    keys = RANDOM_STATE.rand(len(name_ids), num_entry)
+    pos_rows, pos_cols = np.nonzero(
+        np.arange(name_ids.shape[1])[None, :] < num_names[:, None])
+    keys[pos_rows, name_ids[pos_rows, pos_cols]] = 2.0
+    # k smallest keys in increasing order: k random negatives
+    neg_ids = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    neg_ids = neg_ids[rows, np.argsort(keys[rows, neg_ids], axis=1)]
+
+    is_gt = cols < num_names[:, None]
+    sampled_ids = np.where(
+        is_gt, name_ids[rows, np.minimum(cols, name_ids.shape[1] - 1)],
+        neg_ids[rows, np.maximum(cols - num_names[:, None], 0)])
+    return sampled_ids, is_gt
+
+
 class Dataset(object):
 
     def __init__(self, ids, dataset_path, image_dir, vocab_path, is_train=True,
-                 name='default'):
+                 name='default', image_cache_dir=None):
         self.name = name
 
         self._ids = list(ids)
@@ -38,6 +130,12 @@ class Dataset(object):
         self.width = IMAGE_WIDTH
         self.height = IMAGE_HEIGHT
 
+        # decoded images (data/tools/build_image_cache.py)
+        self.image_cache = None
+        if image_cache_dir is not None:
+            self.image_cache = ImageCache(image_cache_dir)
+            self.image_cache.check_size(self.width, self.height)
+
         self.vocab = json.load(open(vocab_path, 'r'))
 
         file_name = os.path.join(dataset_path, 'data.hdf5')
@@ -96,6 +194,23 @@ class Dataset(object):
         config.max_len = self.max_len
         return config
 
+    def load_image(self, id):
+        """
+        Returns:
+            - image: resized rgb image (uint8, converted to float in the
+              input ops)
+            - frac_x, frac_y: scale from the original image to the resized one
+        """
+        if self.image_cache is not None:
+            image, (o_w, o_h) = self.image_cache.get(id)
+        else:
+            image, (o_w, o_h) = decode_image(
+                os.path.join(self.image_dir, '{}.jpg'.format(id)),
+                self.width, self.height)
+        frac_x = self.width / float(o_w)
+        frac_y = self.height / float(o_h)
+        return image, frac_x, frac_y
+
     def get_data(self, id):
         """
         Returns:
@@ -124,17 +239,177 @@ class Dataset(object):
                 - {}_candidate_name: string of candidate entry (for debugging)
                 - {}_selection_gt: gt for entry selection task
         """
-        entry = self.data[id]
+        image, frac_x, frac_y = self.load_image(id)
+        returns = self.sample_regions(read_entry(self.data[id]), frac_x, frac_y)
+        returns['image'] = image
+        return returns
 
-        # Image
-        image_path = os.path.join(self.image_dir, '{}.jpg'.format(id))
-        o_image = Image.open(image_path)
-        o_w, o_h = o_image.size
-        image = np.array(
-            o_image.resize([self.width, self.height]).convert('RGB'),
-            dtype=np.float32)
-        frac_x = self.width / float(o_w)
-        frac_y = self.height / float(o_h)
+    def sample_regions(self, entry, frac_x, frac_y):
+        """
+        Vectorized sampler of get_data: the boxes, descriptions and entries
+        are written by index into buffers of their fixed (padded) size and
+        the random selections are drawn as arrays.
+
+        Args:
+            - entry: fields of an image group (read_entry)
+        """
+        def preprocess_box(box):
+            return box_utils.xywh_to_x1y1x2y2(box_utils.scale_boxes_xywh(
+                box.astype(np.float32), [frac_x, frac_y]))
+
+        # [1 - 6] positive densecap boxes, no-assigned region / object /
+        # attribute / relationship boxes and negative densecap boxes. The
+        # rest are pad boxes (which covers whole image) to fix num_box
+        used_box = np.empty([MAX_USED_BOX, 4], dtype=np.float32)
+        used_box[:] = [0, 0, self.width, self.height]
+
+        pos_box_idx = entry['positive_box_idx'][:MAX_USED_BOX]
+        num_box = len(pos_box_idx)
+        used_box[:num_box] = preprocess_box(
+            np.take(entry['box_xywh'], pos_box_idx, axis=0))
+
+        box_idx_start = {}
+        asn_idx = {}
+        asn_order_idx = {}
+        used_no_asn_idx = {}
+        for i, key in enumerate(['region', 'object', 'attribute', 'relationship']):
+            box_idx_start[key] = num_box
+
+            asn_idx[key] = entry['asn_{}_idx'.format(key)]
+            asn_order_idx[key] = np.arange(len(asn_idx[key]), dtype=np.int32)
+            num_asn = len(asn_idx[key])
+            if num_asn > MAX_BOX_PER_ENTRY[key]:
+                num_asn = MAX_BOX_PER_ENTRY[key]
+                asn_order_idx[key] = random_subset(len(asn_idx[key]), num_asn)
+                asn_idx[key] = asn_idx[key][asn_order_idx[key]]
+
+            # leave 1 object, 1 attribute, 1 relationship box, fill
+            # MAX_USED_BOX, use all labeled regions
+            no_asn_idx = entry['no_asn_{}_idx'.format(key)]
+            num_used_no_asn = min(MAX_USED_BOX - num_box - (3 - i),
+                                  MAX_BOX_PER_ENTRY[key] - num_asn,
+                                  len(no_asn_idx))
+            used_no_asn_idx[key] = no_asn_idx[
+                random_subset(len(no_asn_idx), num_used_no_asn)]
+            num_used = len(used_no_asn_idx[key])
+            used_box[num_box:num_box + num_used] = preprocess_box(np.take(
+                entry['{}_xywh'.format(key)], used_no_asn_idx[key], axis=0))
+            num_box += num_used
+
+        box_idx_start['neg_box'] = num_box
+        neg_box_idx = entry['negative_box_idx']
+        used_neg_box_idx = neg_box_idx[
+            random_subset(len(neg_box_idx), MAX_USED_BOX - num_box)]
+        num_used = len(used_neg_box_idx)
+        used_box[num_box:num_box + num_used] = preprocess_box(
+            np.take(entry['box_xywh'], used_neg_box_idx, axis=0))
+        num_box += num_used
+        box_idx_start['pad_box'] = num_box
+
+        normal_used_box = box_utils.normalize_boxes_x1y1x2y2(
+            used_box, self.width, self.height)
+
+        # [7] region descriptions of the assigned and the used no-assigned
+        # regions, padded to MAX_BOX_PER_ENTRY['region'] (length 1), with
+        # end token <e>. Use used_desc_len + 1 as the length for the end token
+        all_desc = entry['region_descriptions']
+        all_desc_len = entry['region_description_len']
+        num_asn = len(asn_idx['region'])
+        num_used_desc = num_asn + len(used_no_asn_idx['region'])
+        used_desc_idx = np.concatenate(
+            [asn_idx['region'], used_no_asn_idx['region']])
+        used_desc = np.zeros([MAX_BOX_PER_ENTRY['region'],
+                              all_desc.shape[1] + 1], dtype=np.int32)
+        used_desc[:num_used_desc, :-1] = np.take(
+            all_desc, used_desc_idx, axis=0)
+        used_desc_len = np.ones([MAX_BOX_PER_ENTRY['region']], dtype=np.int32)
+        used_desc_len[:num_used_desc] = np.take(
+            all_desc_len, used_desc_idx, axis=0)
+        used_desc_box_idx = np.zeros([MAX_BOX_PER_ENTRY['region']],
+                                     dtype=np.int32)
+        used_desc_box_idx[:num_asn] = np.take(
+            entry['asn_region2pos_idx'], asn_order_idx['region'], axis=0)
+        used_desc_box_idx[num_asn:num_used_desc] = np.arange(
+            box_idx_start['region'],
+            box_idx_start['region'] + num_used_desc - num_asn)
+        used_desc[np.arange(len(used_desc)), used_desc_len] = \
+            self.vocab['dict']['<e>']
+        num_used_desc = np.array(num_used_desc, dtype=np.int32)
+
+        # blank-fill
+        blank_desc, blank_desc_len = blank_fill(
+            used_desc, used_desc_len, self.vocab['dict']['<unk>'])
+
+        # [8] language retrieval (lr) among the descriptions except for
+        # padding and image retrieval (ir) among the boxes except for padding
+        lr_desc_idx = sample_with_positive(
+            np.arange(len(used_desc), dtype=np.int32), num_used_desc,
+            LANGUAGE_RETRIEVAL_K)
+        ir_box_idx = sample_with_positive(
+            used_desc_box_idx, box_idx_start['pad_box'], IMAGE_RETRIEVAL_K)
+        lr_gt = np.zeros([len(used_desc), LANGUAGE_RETRIEVAL_K],
+                         dtype=np.float32)
+        lr_gt[:, 0] = 1
+        ir_gt = np.zeros([len(used_desc), IMAGE_RETRIEVAL_K], dtype=np.float32)
+        ir_gt[:, 0] = 1
+
+        # [9] Data for classification of object / attribute / relationship
+        returns = {}
+        for key in ['object', 'attribute', 'relationship']:
+            all_name_ids = entry['{}_name_ids'.format(key)]
+            all_num_names = entry['{}_num_names'.format(key)]
+            num_asn = len(asn_idx[key])
+            num_used = num_asn + len(used_no_asn_idx[key])
+            used_idx = np.concatenate([asn_idx[key], used_no_asn_idx[key]])
+
+            used_name_ids = np.zeros([MAX_BOX_PER_ENTRY[key],
+                                      all_name_ids.shape[1]], dtype=np.int32)
+            used_name_ids[:num_used] = np.take(all_name_ids, used_idx, axis=0)
+            used_num_names = np.zeros([MAX_BOX_PER_ENTRY[key]], dtype=np.int32)
+            used_num_names[:num_used] = np.take(all_num_names, used_idx, axis=0)
+            used_entry_box_idx = np.zeros([MAX_BOX_PER_ENTRY[key]],
+                                          dtype=np.int32)
+            used_entry_box_idx[:num_asn] = np.take(
+                entry['asn_{}2pos_idx'.format(key)], asn_order_idx[key],
+                axis=0)
+            used_entry_box_idx[num_asn:num_used] = np.arange(
+                box_idx_start[key], box_idx_start[key] + num_used - num_asn)
+
+            sampled_ids, is_gt = sample_candidates(
+                used_name_ids, used_num_names, self.num_entry[key], NUM_K)
+            returns['{}_box_idx'.format(key)] = used_entry_box_idx
+            returns['{}_num_used_box'.format(key)] = np.array(
+                num_used, dtype=np.int32)
+            returns['{}_candidate'.format(key)] = self.entry[key][sampled_ids]
+            returns['{}_candidate_len'.format(key)] = \
+                self.entry_len[key][sampled_ids]
+            returns['{}_candidate_name'.format(key)] = \
+                self.entry_name[key][sampled_ids]
+            returns['{}_selection_gt'.format(key)] = is_gt.astype(np.float32)
+
+        returns.update({
+            'box': used_box,
+            'normal_box': normal_used_box,
+            'desc': used_desc,
+            'desc_len': used_desc_len,
+            'desc_box_idx': used_desc_box_idx,
+            'num_used_desc': num_used_desc,
+            'blank_desc': blank_desc,
+            'blank_desc_len': blank_desc_len,
+            'lr_desc_idx': lr_desc_idx,
+            'lr_gt': lr_gt,
+            'ir_box_idx': ir_box_idx,
+            'ir_gt': ir_gt})
+        return returns
+
+    def get_data_loop(self, id):
+        """
+        The per-box loop implementation of get_data (same outputs, drawn from
+        RANDOM_STATE in another order). Kept as the reference of
+        vlmap/benchmark_get_data.py.
+        """
+        entry = self.data[id]
+        image, frac_x, frac_y = self.load_image(id)
 
         def preprocess_box(box):
             return box_utils.xywh_to_x1y1x2y2(box_utils.scale_boxes_xywh(
@@ -508,7 +783,7 @@ class Dataset(object):
 
     def get_data_types(self):
         data_types = {
-            'image': np.float32,
+            'image': np.uint8,
             'box': np.float32,
             'normal_box': np.float32,
             'desc': np.int32,
@@ -544,15 +819,19 @@ class Dataset(object):
         return 'Dataset ({}, {} examples)'.format(self.name, len(self))
 
 
-def create_default_splits(dataset_path, image_dir, vocab_path, is_train=True):
+def create_default_splits(dataset_path, image_dir, vocab_path, is_train=True,
+                          image_cache_dir=None):
     ids_train, ids_test, ids_val = all_ids(dataset_path, is_train=is_train)
 
     dataset_train = Dataset(ids_train, dataset_path, image_dir, vocab_path,
-                            is_train=is_train, name='train')
+                            is_train=is_train, name='train',
+                            image_cache_dir=image_cache_dir)
     dataset_test = Dataset(ids_test, dataset_path, image_dir, vocab_path,
-                           is_train=is_train, name='test')
+                           is_train=is_train, name='test',
+                           image_cache_dir=image_cache_dir)
     dataset_val = Dataset(ids_val, dataset_path, image_dir, vocab_path,
-                          is_train=is_train, name='val')
+                          is_train=is_train, name='val',
+                          image_cache_dir=image_cache_dir)
     return {
         'train': dataset_train,
         'test': dataset_test,
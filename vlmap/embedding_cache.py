@@ -0,0 +1,249 @@
+"""
+Process-level cache for pre-trained word embedding subsets.
+
+Building a model used to re-read the whole GloVe matrix (400k x 300) for
+every embedding module (V_GloVe, L_GloVe, answer GloVe, ...). The full matrix
+is now loaded at most once per process, and each vocabulary subset is
+memoized in memory and on disk, keyed by the vocabulary and the GloVe file.
+
+Weights exported by vlmap_memft/export_*word_weights.py (word_weight_dir)
+are cached per directory in the same way, together with the index alignment
+between a model vocabulary and the exported vocabulary.
+
+This module does not depend on tensorflow.
+"""
+import cPickle
+import hashlib
+import json
+import os
+import h5py
+import numpy as np
+
+from util import log
+
+GLOVE_EMBEDDING_PATH = 'data/preprocessed/glove.6B.300d.hdf5'
+GLOVE_VOCAB_PATH = 'data/preprocessed/glove_vocab.json'
+GLOVE_CACHE_DIR = 'data/preprocessed/glove_cache'
+
+SUBSET_MODES = ['word', 'oov_mean', 'phrase_mean', 'strict']
+
+_GLOVE_VOCAB = {}  # glove_vocab_path -> {'vocab': [...], 'dict': {...}}
+_GLOVE_PARAM = {}  # glove_path -> [dim, num_words]
+_SUBSETS = {}  # cache key -> [len(words), dim] weights
+_WORD_WEIGHT_DICTS = {}  # pkl signature -> vocab / answer_dict
+_WORD_WEIGHTS = {}  # (hdf5 signature, weight_name) -> array
+_ALIGNMENTS = {}  # (pkl signature, vocab hash) -> (dst_idx, src_idx)
+
+
+def _to_bytes(s):
+    return s if isinstance(s, bytes) else s.encode('utf-8')
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return '{}:{}:{}'.format(os.path.abspath(path), stat.st_size,
+                             int(stat.st_mtime))
+
+
+def vocab_hash(words):
+    h = hashlib.sha1()
+    for w in words:
+        h.update(_to_bytes(w))
+        h.update(b'\n')
+    return h.hexdigest()
+
+
+def load_glove_vocab(glove_vocab_path=GLOVE_VOCAB_PATH):
+    if glove_vocab_path not in _GLOVE_VOCAB:
+        _GLOVE_VOCAB[glove_vocab_path] = json.load(open(glove_vocab_path, 'r'))
+    return _GLOVE_VOCAB[glove_vocab_path]
+
+
+def load_glove_param(glove_path=GLOVE_EMBEDDING_PATH):
+    """
+    Returns:
+        - param: [dim, num_words] (layout of the hdf5 file, not transposed)
+    """
+    if glove_path not in _GLOVE_PARAM:
+        log.info('loading GloVe: {}'.format(glove_path))
+        with h5py.File(glove_path, 'r') as f:
+            param = np.array(f.get('param'), dtype=np.float32)
+        param.flags.writeable = False
+        _GLOVE_PARAM[glove_path] = param
+    return _GLOVE_PARAM[glove_path]
+
+
+def _lookup(glove_dict, words, num_rows):
+    idx = np.array([glove_dict.get(w, -1) for w in words], dtype=np.int64)
+    found = np.logical_and(idx >= 0, idx < num_rows)
+    return idx, found
+
+
+def _phrase_mean(glove_dict, param, phrases, num_rows, require_all=False):
+    """
+    Average the embeddings of the space separated tokens of each phrase.
+    Tokens that are not in GloVe are skipped (or raise if require_all).
+    """
+    dim = param.shape[0]
+    seg, tok = [], []
+    for i, phrase in enumerate(phrases):
+        tokens = phrase.split()
+        if require_all and not all(t in glove_dict for t in tokens):
+            raise Exception("Unkown words {}".format(tokens))
+        for t in tokens:
+            j = glove_dict.get(t, -1)
+            if 0 <= j < num_rows:
+                seg.append(i)
+                tok.append(j)
+    sums = np.zeros([len(phrases), dim], dtype=np.float32)
+    counts = np.zeros([len(phrases)], dtype=np.float32)
+    if len(tok) > 0:
+        seg = np.array(seg, dtype=np.int64)
+        np.add.at(sums, seg, np.take(param, tok, axis=1).T)
+        np.add.at(counts, seg, 1.0)
+    nonzero = counts > 0
+    sums[nonzero] /= counts[nonzero][:, None]
+    return sums
+
+
+def _build_subset(words, mode, glove_vocab, param):
+    glove_dict = glove_vocab['dict']
+    num_rows = param.shape[1]
+    dim = param.shape[0]
+    if mode == 'strict':
+        idx = [glove_dict[w] for w in words]
+        return np.ascontiguousarray(np.take(param, idx, axis=1).T)
+    if mode == 'phrase_mean':
+        return _phrase_mean(glove_dict, param, words, num_rows)
+
+    weights = np.zeros([len(words), dim], dtype=np.float32)
+    idx, found = _lookup(glove_dict, words, num_rows)
+    weights[found] = np.take(param, idx[found], axis=1).T
+    if mode == 'oov_mean':
+        oov = [i for i in np.where(~found)[0] if words[i] != ""]
+        if len(oov) > 0:
+            weights[oov] = _phrase_mean(
+                glove_dict, param, [words[i] for i in oov], num_rows,
+                require_all=True)
+    return weights
+
+
+def glove_subset(words, mode='word',
+                 glove_path=GLOVE_EMBEDDING_PATH,
+                 glove_vocab_path=GLOVE_VOCAB_PATH,
+                 cache_dir=GLOVE_CACHE_DIR):
+    """
+    GloVe rows for a list of vocabulary entries.
+    Args:
+        - words: list of vocabulary entries
+        - mode: how entries are matched to GloVe
+            'word': exact match, zero vector if missing
+            'oov_mean': exact match, otherwise the mean of its tokens
+                (raises if a token is missing), zero vector for ""
+            'phrase_mean': mean of the tokens found in GloVe, zero if none
+            'strict': exact match, raises KeyError if missing
+    Returns:
+        - weights: [len(words), dim] float32 (read-only, shared between
+            callers)
+    """
+    if mode not in SUBSET_MODES:
+        raise ValueError('Unknown mode: {}'.format(mode))
+    key = hashlib.sha1(_to_bytes('{}|{}|{}|{}'.format(
+        mode, _file_signature(glove_path), _file_signature(glove_vocab_path),
+        vocab_hash(words)))).hexdigest()
+    if key in _SUBSETS:
+        return _SUBSETS[key]
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, '{}.npy'.format(key))
+    if cache_path is not None and os.path.exists(cache_path):
+        weights = np.load(cache_path)
+    else:
+        weights = _build_subset(words, mode,
+                                load_glove_vocab(glove_vocab_path),
+                                load_glove_param(glove_path))
+        if cache_path is not None:
+            _save_atomic(cache_path, weights)
+    weights.flags.writeable = False
+    _SUBSETS[key] = weights
+    return weights
+
+
+def _save_atomic(path, array):
+    # write to a temporary file and rename so that concurrent processes
+    # never read a partially written cache entry
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            try: os.makedirs(os.path.dirname(path))
+            except OSError:  # created by another process
+                if not os.path.isdir(os.path.dirname(path)): raise
+        with open(tmp_path, 'wb') as f:
+            np.save(f, array)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        log.warn('Fail to write embedding cache {}: {}'.format(path, e))
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+def load_word_weight_dict(word_weight_dir, dict_name='vocab.pkl'):
+    """
+    Exported vocabulary ('vocab.pkl') or answer dictionary
+    ('answer_dict.pkl') of a word_weight_dir.
+    """
+    path = os.path.join(word_weight_dir, dict_name)
+    key = _file_signature(path)
+    if key not in _WORD_WEIGHT_DICTS:
+        _WORD_WEIGHT_DICTS[key] = cPickle.load(open(path, 'rb'))
+    return _WORD_WEIGHT_DICTS[key]
+
+
+def load_word_weight(word_weight_dir, weight_name):
+    """
+    Array named weight_name in the weights.hdf5 of a word_weight_dir.
+    """
+    path = os.path.join(word_weight_dir, 'weights.hdf5')
+    key = (_file_signature(path), weight_name)
+    if key not in _WORD_WEIGHTS:
+        with h5py.File(path, 'r') as f:
+            weight = np.array(f.get(weight_name))
+        weight.flags.writeable = False
+        _WORD_WEIGHTS[key] = weight
+    return _WORD_WEIGHTS[key]
+
+
+def vocab_alignment(words, word_weight_dir, dict_name='vocab.pkl',
+                    num_src=None):
+    """
+    Index alignment from a model vocabulary to an exported vocabulary.
+    Args:
+        - words: model vocabulary entries
+        - dict_name: 'vocab.pkl' or 'answer_dict.pkl'
+        - num_src: if given, drop exported indices >= num_src
+    Returns:
+        - dst_idx: int array, indices into words
+        - src_idx: int array, matching indices into the exported vocabulary
+    """
+    path = os.path.join(word_weight_dir, dict_name)
+    key = (_file_signature(path), vocab_hash(words))
+    if key not in _ALIGNMENTS:
+        src_dict = load_word_weight_dict(word_weight_dir, dict_name)['dict']
+        src_idx = np.array([src_dict.get(w, -1) for w in words],
+                           dtype=np.int64)
+        dst_idx = np.where(src_idx >= 0)[0]
+        _ALIGNMENTS[key] = (dst_idx, src_idx[dst_idx])
+    dst_idx, src_idx = _ALIGNMENTS[key]
+    if num_src is not None:
+        valid = src_idx < num_src
+        dst_idx, src_idx = dst_idx[valid], src_idx[valid]
+    return dst_idx, src_idx
+
+
+def clear_memory_cache():
+    _GLOVE_VOCAB.clear()
+    _GLOVE_PARAM.clear()
+    _SUBSETS.clear()
+    _WORD_WEIGHT_DICTS.clear()
+    _WORD_WEIGHTS.clear()
+    _ALIGNMENTS.clear()
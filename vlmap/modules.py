@@ -1,24 +1,93 @@
-import cPickle
-import json
-import h5py
 import math
-import os
+import weakref
 import numpy as np
 import tensorflow as tf
-import tensorflow.contrib.layers as layers
-import tensorflow.contrib.rnn as rnn
-import tensorflow.contrib.seq2seq as seq2seq
-import tensorflow.contrib.slim as slim
-import tensorflow.contrib.slim.nets as nets
 
 from util import log
-
-GLOVE_EMBEDDING_PATH = 'data/preprocessed/glove.6B.300d.hdf5'
-GLOVE_VOCAB_PATH = 'data/preprocessed/glove_vocab.json'
+from util.registry import LazyModule
+from vlmap import embedding_cache
+
+# tf.contrib is loaded on first use, not when the entry points import this
+layers = LazyModule('tensorflow.contrib.layers')
+rnn = LazyModule('tensorflow.contrib.rnn')
+seq2seq = LazyModule('tensorflow.contrib.seq2seq')
+slim = LazyModule('tensorflow.contrib.slim')
+nets = LazyModule('tensorflow.contrib.slim.nets')
+
+GLOVE_EMBEDDING_PATH = embedding_cache.GLOVE_EMBEDDING_PATH
+GLOVE_VOCAB_PATH = embedding_cache.GLOVE_VOCAB_PATH
 ENC_I_R_MEAN = 123.68
 ENC_I_G_MEAN = 116.78
 ENC_I_B_MEAN = 103.94
 
+# Variables holding dataset-sized arrays (box counts, fixed embeddings).
+# They are kept out of the global / local variable collections so that they
+# are neither saved in checkpoints nor touched by the Supervisor init ops.
+DATA_VARIABLES = 'data_variables'
+
+# graph -> [(placeholder, value)] for every feed-initialized variable
+_INIT_FEEDS = weakref.WeakKeyDictionary()
+
+
+def feed_initializer(value, name='init_value'):
+    """
+    Initializer that reads its value from a placeholder fed at initialization
+    time, so that large numpy arrays are not serialized into the GraphDef as
+    constants (as tf.constant_initializer does).
+    Args:
+        - value: numpy array used to initialize the variable
+    Returns:
+        - initializer: callable usable as tf.get_variable initializer
+    """
+    value = np.asarray(value)
+    placeholder = tf.placeholder(tf.as_dtype(value.dtype), shape=value.shape,
+                                 name=name)
+    graph = tf.get_default_graph()
+    _INIT_FEEDS.setdefault(graph, []).append((placeholder, value))
+
+    def _initializer(shape, dtype=None, partition_info=None):
+        if dtype is not None and dtype.base_dtype != placeholder.dtype:
+            return tf.cast(placeholder, dtype.base_dtype)
+        return placeholder
+    return _initializer
+
+
+def get_init_feed_dict(graph=None):
+    """
+    Feed dict for the placeholders created by feed_initializer.
+    Pass it as init_feed_dict to tf.train.Supervisor or to the session.run of
+    an initializer.
+    """
+    if graph is None: graph = tf.get_default_graph()
+    return {placeholder: value
+            for placeholder, value in _INIT_FEEDS.get(graph, [])}
+
+
+def DataVariable(value, name, scope='DataVariable', reuse=tf.AUTO_REUSE):
+    """
+    Non-trainable variable holding a dataset-sized numpy array.
+    The variable is neither saved in checkpoints nor initialized by
+    global_variables_initializer. Call initialize_data_variables after
+    creating (or restoring) a session.
+    """
+    value = np.asarray(value)
+    with tf.variable_scope(scope, reuse=reuse):
+        var = tf.get_variable(
+            name=name, shape=value.shape, dtype=tf.as_dtype(value.dtype),
+            initializer=feed_initializer(value, name='{}_value'.format(name)),
+            trainable=False, collections=[DATA_VARIABLES])
+        return var
+
+
+def initialize_data_variables(session):
+    # run the existing initializers: the graph may already be finalized
+    # (e.g. by tf.train.Supervisor)
+    graph = session.graph
+    data_vars = graph.get_collection(DATA_VARIABLES)
+    if len(data_vars) == 0: return
+    session.run([var.initializer for var in data_vars],
+                feed_dict=get_init_feed_dict(graph))
+
 
 def attention_pooling(memory, score, scope='attention_pooling'):
     """
@@ -370,23 +439,12 @@ def BiasVariable(shape, initializer=None, scope='Bias', reuse=tf.AUTO_REUSE):
 
 def LearnAnswerGloVe(answer_dict, scope='LearnAnswerGloVe', reuse=tf.AUTO_REUSE):
     with tf.variable_scope(scope, reuse=reuse) as scope:
-        glove_vocab = json.load(open(GLOVE_VOCAB_PATH, 'r'))
-        with h5py.File(GLOVE_EMBEDDING_PATH, 'r') as f:
-            glove_param = np.array(f.get('param')).transpose()
-        weights = np.zeros([len(answer_dict['vocab']), 300], dtype=np.float32)
-        for i, answer_word in enumerate(answer_dict['vocab']):
-            ws = []
-            for w in answer_word.split():
-                if w in glove_vocab['dict'] and \
-                        glove_vocab['dict'][w] < glove_param.shape[0]:
-                    ws.append(glove_param[glove_vocab['dict'][w], :])
-            if len(ws) > 0:
-                weights[i, :] = np.stack(ws, axis=0).mean(axis=0)
-            else: pass  # initialize to zero
-        init = tf.constant_initializer(weights)
+        # answers are averaged over their words (zero if none is in GloVe)
+        weights = embedding_cache.glove_subset(
+            answer_dict['vocab'], mode='phrase_mean')
         embed_map = tf.get_variable(
             name='embed_map', shape=[len(answer_dict['vocab']), 300],
-            initializer=init)
+            initializer=feed_initializer(weights))
         return embed_map
 
 
@@ -395,20 +453,15 @@ def WordWeightEmbed(vocab, word_weight_dir=None, weight_name='v_word',
     with tf.variable_scope(scope, reuse=reuse) as scope:
         weights = np.zeros([len(vocab['vocab']), 300], dtype=np.float32)
         if word_weight_dir is not None:
-            word_vocab_path = os.path.join(word_weight_dir, 'vocab.pkl')
-            word_vocab = cPickle.load(open(word_vocab_path, 'rb'))
-            word_weight_path = os.path.join(word_weight_dir, 'weights.hdf5')
-            with h5py.File(word_weight_path, 'r') as f:
-                word_weight = np.array(f.get(weight_name))
-            num_row = word_weight.shape[0]
-            for i, w in enumerate(vocab['vocab']):
-                if w in word_vocab['dict'] and word_vocab['dict'][w] < num_row:
-                    weights[i, :] = word_weight[word_vocab['dict'][w], :]
-                else: pass
-        init = tf.constant_initializer(weights)
+            word_weight = embedding_cache.load_word_weight(
+                word_weight_dir, weight_name)
+            dst_idx, src_idx = embedding_cache.vocab_alignment(
+                vocab['vocab'], word_weight_dir, 'vocab.pkl',
+                num_src=word_weight.shape[0])
+            weights[dst_idx, :] = word_weight[src_idx, :]
         embed_map = tf.get_variable(
             name='embed_map', shape=[len(vocab['vocab']), 300],
-            initializer=init)
+            initializer=feed_initializer(weights))
         return embed_map
 
 
@@ -418,47 +471,27 @@ def LearnGloVe(
         learnable=True,
         oov_mean_initialize=False): # out of vocab
     with tf.variable_scope(scope, reuse=reuse) as scope:
-        glove_vocab = json.load(open(GLOVE_VOCAB_PATH, 'r'))
-        with h5py.File(GLOVE_EMBEDDING_PATH, 'r') as f:
-            glove_param = np.array(f.get('param')).transpose()
-        weights = np.zeros([len(vocab['vocab']), 300], dtype=np.float32)
-        for i, w in enumerate(vocab['vocab']):
-            if w in glove_vocab['dict'] and \
-                    glove_vocab['dict'][w] < glove_param.shape[0]:
-                weights[i, :] = glove_param[glove_vocab['dict'][w], :]
-            elif oov_mean_initialize and w != "":
-                words = w.split()
-                check_all_in_glove = all(w in glove_vocab['dict'] for w in words)
-
-                if check_all_in_glove:
-                    weights[i, :] = np.mean(
-                        [glove_param[glove_vocab['dict'][w], :] for w in words], 0)
-                else:
-                    raise Exception("Unkown words {}".format(words))
-            else:
-                pass  # initialize to zero
+        # words missing in GloVe are initialized to zero
+        weights = embedding_cache.glove_subset(
+            vocab['vocab'], mode='oov_mean' if oov_mean_initialize else 'word')
 
         if learnable:
             embed_map = tf.get_variable(
                 name='embed_map', shape=[len(vocab['vocab']), 300],
-                initializer=tf.constant_initializer(weights))
+                initializer=feed_initializer(weights))
         else:
-            embed_map = tf.constant(weights.T)
+            embed_map = DataVariable(weights.T, name='fixed_map')
 
         return embed_map
 
 
 def GloVe_vocab(vocab, scope='GloVe', reuse=tf.AUTO_REUSE):
     with tf.variable_scope(scope, reuse=reuse) as scope:
-        glove_vocab = json.load(open(GLOVE_VOCAB_PATH, 'r'))
-        used_vocab_idx = [glove_vocab['dict'][v] for v in vocab['vocab'][:-3]]
-
-        with h5py.File(GLOVE_EMBEDDING_PATH, 'r') as f:
-            glove_param = f['param'].value
-        subset_param = np.take(glove_param, used_vocab_idx, axis=1)
+        subset_param = embedding_cache.glove_subset(
+            vocab['vocab'][:-3], mode='strict')
 
         log.warning(scope.name)
-        fixed = tf.constant(subset_param.transpose())
+        fixed = DataVariable(subset_param, name='fixed')
         learn = tf.get_variable(
             name='learn', shape=[3, 300],
             initializer=tf.random_uniform_initializer(
@@ -470,8 +503,8 @@ def GloVe_vocab(vocab, scope='GloVe', reuse=tf.AUTO_REUSE):
 def GloVe(glove_path, scope='GloVe', reuse=tf.AUTO_REUSE):
     with tf.variable_scope(scope, reuse=reuse) as scope:
         log.warning(scope.name)
-        with h5py.File(glove_path, 'r') as f:
-            fixed = tf.constant(f['param'].value.transpose())
+        glove_param = embedding_cache.load_glove_param(glove_path)
+        fixed = DataVariable(glove_param.transpose(), name='fixed')
         learn = tf.get_variable(
             name='learn', shape=[3, 300],
             initializer=tf.random_uniform_initializer(
@@ -575,11 +608,9 @@ def conv2d(input, dim, kernel_size, pad='same', use_bias=False, use_bn=False,
 def AnswerExistMask(answer_dict, word_weight_dir=None):
     mask = np.zeros([len(answer_dict['vocab'])], dtype=np.float32)
     if word_weight_dir is not None:
-        word_answer_dict_path = os.path.join(word_weight_dir, 'answer_dict.pkl')
-        word_answer_dict = cPickle.load(open(word_answer_dict_path, 'rb'))
-        for i, a in enumerate(answer_dict['vocab']):
-            if a in word_answer_dict['dict']:
-                mask[i] = 1.0
+        dst_idx, _ = embedding_cache.vocab_alignment(
+            answer_dict['vocab'], word_weight_dir, 'answer_dict.pkl')
+        mask[dst_idx] = 1.0
     else: mask = mask + 1.0
     mask = np.expand_dims(mask, axis=0)  # make batch dimension
     mask_tensor = tf.convert_to_tensor(mask)
@@ -600,28 +631,25 @@ def WordWeightAnswer(input, answer_dict, word_weight_dir=None,
         weights = np.zeros([input_dim, dim], dtype=np.float32)
         biases = np.zeros([dim], dtype=np.float32) + default_bias
         if word_weight_dir is not None:
-            word_answer_dict_path = os.path.join(word_weight_dir, 'answer_dict.pkl')
-            word_answer_dict = cPickle.load(open(word_answer_dict_path, 'rb'))
-            word_weight_path = os.path.join(word_weight_dir, 'weights.hdf5')
-            with h5py.File(word_weight_path, 'r') as f:
-                answer_weight = np.array(f.get(weight_name))
-                answer_bias = np.array(f.get(bias_name))
-
-            for i, a in enumerate(answer_dict['vocab']):
-                if a in word_answer_dict['dict']:
-                    weights[:, i] = answer_weight[:, word_answer_dict['dict'][a]]
-                    biases[i] = answer_bias[word_answer_dict['dict'][a]]
-                else: pass  # initialize to zero
+            answer_weight = embedding_cache.load_word_weight(
+                word_weight_dir, weight_name)
+            answer_bias = embedding_cache.load_word_weight(
+                word_weight_dir, bias_name)
+            dst_idx, src_idx = embedding_cache.vocab_alignment(
+                answer_dict['vocab'], word_weight_dir, 'answer_dict.pkl')
+            # answers missing in the exported answer_dict keep zero weights
+            weights[:, dst_idx] = answer_weight[:, src_idx]
+            biases[dst_idx] = answer_bias[src_idx]
         if use_bias:
             out = layers.fully_connected(
                 input, dim, activation_fn=None,
-                weights_initializer=tf.constant_initializer(weights),
-                biases_initializer=tf.constant_initializer(biases),
+                weights_initializer=feed_initializer(weights, name='weights_value'),
+                biases_initializer=feed_initializer(biases, name='biases_value'),
                 reuse=reuse, trainable=is_training, scope='fc')
         else:
             out = layers.fully_connected(
                 input, dim, activation_fn=None,
-                weights_initializer=tf.constant_initializer(weights),
+                weights_initializer=feed_initializer(weights, name='weights_value'),
                 biases_initializer=None,
                 reuse=reuse, trainable=is_training, scope='fc')
         return out
@@ -4,6 +4,8 @@ import time
 import tensorflow as tf
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
 from vlmap.datasets import dataset_vlmap, input_ops_vlmap
 
 
@@ -140,15 +142,14 @@ class Trainer(object):
             save_summaries_secs=300,
             save_model_secs=None,
             global_step=self.global_step,
+            init_feed_dict=modules.get_init_feed_dict(),
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
+        modules.initialize_data_variables(self.session)
 
         enc_I_param_path = self.model.get_enc_I_param_path()
         if enc_I_param_path is not None:
@@ -262,6 +263,8 @@ def main():
     parser.add_argument('--dataset_path', type=str,
                         default='data/preprocessed/visualgenome'
                         '/merged_by_image_new_vocab50_min_region20', help=' ')
+    parser.add_argument('--image_cache_dir', type=str, default=None,
+                        help='decoded images of data/tools/build_image_cache.py')
     # log
     parser.add_argument('--log_step', type=int, default=10)
     parser.add_argument('--heavy_summary_step', type=int, default=1000)
@@ -298,12 +301,13 @@ def main():
     parser.add_argument('--num_aug_retrieval', type=int, default=2,
                         help='Augment retrieval with interbatch data')
 
+    add_session_arguments(parser)
     config = parser.parse_args()
     check_config(config)
 
     dataset = dataset_vlmap.create_default_splits(
         config.dataset_path, config.image_dir, config.vocab_path,
-        is_train=True)
+        is_train=True, image_cache_dir=config.image_cache_dir)
     config.dataset_config = dataset['train'].get_config()
 
     trainer = Trainer(config, dataset)
@@ -3,17 +3,74 @@ import json
 import os
 import numpy as np
 
-from PIL import Image
-
 from util import log
+from util.image_cache import ImageCache, crop_key, decode_image
 
 RANDOM_STATE = np.random.RandomState(123)
 
 
+def sample_negative_ids(num_objects, positive_ids, num_neg,
+                        random_state=RANDOM_STATE):
+    """
+    Uniform random ids of range(num_objects) without replacement which are
+    not positive, by rejection: ids are drawn with replacement and the
+    positive and repeated ones are dropped (expected O(num_neg) per row
+    while num_neg is small compared to num_objects).
+
+    Args:
+        - positive_ids: [batch] lists of positive ids
+    Returns:
+        - [batch, num_neg] negative ids (int32)
+    """
+    batch = len(positive_ids)
+    max_pos = max([len(ids) for ids in positive_ids] + [1])
+    if 2 * (num_neg + max_pos) > num_objects:
+        # few objects left to reject from: shuffle them
+        negative_ids = []
+        for ids in positive_ids:
+            candidates = np.setdiff1d(np.arange(num_objects), ids)
+            if len(candidates) < num_neg:
+                raise ValueError(
+                    '{} negatives requested but only {} of {} objects are '
+                    'not positive'.format(num_neg, len(candidates),
+                                          num_objects))
+            negative_ids.append(random_state.permutation(candidates)[:num_neg])
+        return np.array(negative_ids, dtype=np.int32).reshape([batch, num_neg])
+
+    pos = np.full([batch, max_pos], -1, dtype=np.int64)
+    for i, ids in enumerate(positive_ids):
+        pos[i, :len(ids)] = ids
+    # expected number of repeated draws: num_draw ** 2 / (2 * num_objects)
+    num_draw = num_neg + max_pos + \
+        2 * (num_neg + max_pos) ** 2 // num_objects + 8
+    negative_ids = np.zeros([batch, num_neg], dtype=np.int32)
+    rows_left = np.arange(batch)
+    while len(rows_left) > 0:
+        rows = np.arange(len(rows_left))[:, None]
+        draws = random_state.randint(num_objects,
+                                     size=[len(rows_left), num_draw])
+        # repeated draws after the first one (stable sort)
+        order = np.argsort(draws, axis=1, kind='mergesort')
+        sorted_draws = draws[rows, order]
+        repeated = np.zeros(draws.shape, dtype=bool)
+        repeated[rows, order[:, 1:]] = \
+            sorted_draws[:, 1:] == sorted_draws[:, :-1]
+        rejected = repeated | np.any(
+            draws[:, :, None] == pos[rows_left][:, None, :], axis=2)
+
+        done = (~rejected).sum(axis=1) >= num_neg
+        # first num_neg accepted draws of each row
+        first = np.argsort(rejected, axis=1, kind='mergesort')[:, :num_neg]
+        negative_ids[rows_left[done]] = draws[rows, first][done]
+        rows_left = rows_left[~done]
+    return negative_ids
+
+
 class Dataset(object):
 
     def __init__(self, ids, dataset_path, image_dir, vocab_path, num_k,
-                 width=224, height=224, name='default', is_train=True):
+                 width=224, height=224, name='default', is_train=True,
+                 image_cache_dir=None):
         self._ids = list(ids)
         self.image_dir = image_dir
         self.width = width
@@ -21,6 +78,12 @@ class Dataset(object):
         self.name = name
         self.is_train = is_train
 
+        # decoded crops (data/tools/build_image_cache.py)
+        self.image_cache = None
+        if image_cache_dir is not None:
+            self.image_cache = ImageCache(image_cache_dir)
+            self.image_cache.check_size(self.width, self.height)
+
         self.vocab = json.load(open(vocab_path, 'r'))
 
         file_name = os.path.join(dataset_path, 'data.hdf5')
@@ -36,7 +99,6 @@ class Dataset(object):
                 ' '.join([self.vocab['vocab'][i] for i in obj[:obj_len]]))
         self.objects_name = np.array(self.objects_name)
         self.num_objects = int(self.data_info['num_unique_objects'].value)
-        self.objects_ids = list(range(self.num_objects))
         self.max_name_len = int(self.data_info['max_name_length'].value)
 
         if is_train:
@@ -45,6 +107,40 @@ class Dataset(object):
 
         log.info('Reading Done {}'.format(file_name))
 
+    def load_crop(self, image_id, entry):
+        """ uint8 crop of the box of entry (converted to float in input ops) """
+        box = (entry['x'].value, entry['y'].value,
+               entry['w'].value, entry['h'].value)
+        if self.image_cache is not None:
+            return self.image_cache.get(crop_key(image_id, *box))[0]
+        return decode_image(
+            os.path.join(self.image_dir, '{}.jpg'.format(image_id)),
+            self.width, self.height, box)[0]
+
+    def sample_object_ids(self, name_ids):
+        """
+        Candidates of a batch of examples for training.
+
+        Args:
+            - name_ids: [batch] lists of positive object ids
+        Returns:
+            - sampled_ids: [batch, num_k] positive ids followed by random
+              negative ids
+            - ground_truth: [batch, num_k]
+        """
+        name_ids = [list(ids)[:self.num_k] for ids in name_ids]
+        num_pos = np.array([len(ids) for ids in name_ids], dtype=np.int32)
+        negative_ids = sample_negative_ids(
+            self.num_objects, name_ids, max(self.num_k - num_pos.min(), 1))
+        cols = np.arange(self.num_k)[None, :]
+        ground_truth = (cols < num_pos[:, None]).astype(np.float32)
+        sampled_ids = negative_ids[
+            np.arange(len(name_ids))[:, None],
+            np.maximum(cols - num_pos[:, None], 0)]
+        for i, ids in enumerate(name_ids):
+            sampled_ids[i, :len(ids)] = ids
+        return sampled_ids, ground_truth
+
     def get_data(self, id):
         """
         Returns:
@@ -58,21 +154,15 @@ class Dataset(object):
         entry = self.data[image_id][id]
 
         if self.is_train:
-            name_ids = list(entry['name_ids'].value)
-            negative_ids = list(set(self.objects_ids) - set(name_ids))
-            RANDOM_STATE.shuffle(negative_ids)
-
-            sampled_ids = (name_ids + negative_ids)[:self.num_k]
-            sampled_objects = np.take(self.objects_intseq, sampled_ids, axis=0)
+            sampled_ids, ground_truth = self.sample_object_ids(
+                [list(entry['name_ids'].value)])
+            sampled_objects = np.take(
+                self.objects_intseq, sampled_ids[0], axis=0)
             sampled_objects_len = np.take(
-                self.objects_intseq_len, sampled_ids, axis=0)
-            sampled_objects_name = []
-            for obj, obj_len in zip(sampled_objects, sampled_objects_len):
-                sampled_objects_name.append(
-                    ' '.join([self.vocab['vocab'][i] for i in obj[:obj_len]]))
-            sampled_objects_name = np.array(sampled_objects_name)
-            num_pos, num_neg = len(name_ids), self.num_k - len(name_ids)
-            ground_truth = np.array([1] * num_pos + [0] * num_neg, dtype=np.float32)
+                self.objects_intseq_len, sampled_ids[0], axis=0)
+            sampled_objects_name = np.take(
+                self.objects_name, sampled_ids[0], axis=0)
+            ground_truth = ground_truth[0]
         else:
             name_ids = list(entry['name_ids'].value)
             sampled_objects = self.objects_intseq
@@ -82,14 +172,7 @@ class Dataset(object):
             for name_id in name_ids:
                 ground_truth[name_id] = 1.0
 
-        x, y = entry['x'].value, entry['y'].value
-        w, h = entry['w'].value, entry['h'].value
-
-        image_path = os.path.join(self.image_dir, '{}.jpg'.format(image_id))
-        image = np.array(
-            Image.open(image_path).crop([x, y, x + w, y + h])
-            .resize([self.width, self.height]).convert('RGB'), dtype=np.float32
-        )
+        image = self.load_crop(image_id, entry)
 
         return image, sampled_objects, sampled_objects_len, ground_truth,\
             sampled_objects_name
@@ -116,7 +199,7 @@ class Dataset(object):
 
 
 def create_default_splits(dataset_path, image_dir, vocab_path,
-                          num_k, is_train=True):
+                          num_k, is_train=True, image_cache_dir=None):
     """
     Args:
         num_k: number positive + negative object names sampled for training
@@ -125,13 +208,16 @@ def create_default_splits(dataset_path, image_dir, vocab_path,
 
     dataset_train = Dataset(ids_train, dataset_path, image_dir, vocab_path,
                             num_k, width=224, height=224,
-                            name='train', is_train=is_train)
+                            name='train', is_train=is_train,
+                            image_cache_dir=image_cache_dir)
     dataset_test = Dataset(ids_test, dataset_path, image_dir, vocab_path,
                            num_k, width=224, height=224,
-                           name='test', is_train=is_train)
+                           name='test', is_train=is_train,
+                           image_cache_dir=image_cache_dir)
     dataset_val = Dataset(ids_val, dataset_path, image_dir, vocab_path,
                           num_k, width=224, height=224,
-                          name='val', is_train=is_train)
+                          name='val', is_train=is_train,
+                          image_cache_dir=image_cache_dir)
     return {
         'train': dataset_train,
         'test': dataset_test,
@@ -3,9 +3,8 @@ import json
 import os
 import numpy as np
 
-from PIL import Image
-
 from util import log
+from util.image_cache import ImageCache, crop_key, decode_image
 
 RANDOM_STATE = np.random.RandomState(123)
 
@@ -14,7 +13,8 @@ class Dataset(object):
 
     def __init__(self, ids, dataset_path, image_dir, vocab_path,
                  used_wordset_path,
-                 width=224, height=224, name='default', is_train=True):
+                 width=224, height=224, name='default', is_train=True,
+                 image_cache_dir=None):
         self._ids = list(ids)
         self.image_dir = image_dir
         self.width = width
@@ -22,6 +22,12 @@ class Dataset(object):
         self.name = name
         self.is_train = is_train
 
+        # decoded crops (data/tools/build_image_cache.py)
+        self.image_cache = None
+        if image_cache_dir is not None:
+            self.image_cache = ImageCache(image_cache_dir)
+            self.image_cache.check_size(self.width, self.height)
+
         self.vocab = json.load(open(vocab_path, 'r'))
         with h5py.File(used_wordset_path, 'r') as f:
             self.wordset = list(f['used_wordset'].value)
@@ -37,6 +43,16 @@ class Dataset(object):
         self.max_len = int(self.data_info['max_length'].value)
         log.info('Reading Done {}'.format(file_name))
 
+    def load_crop(self, image_id, entry):
+        """ uint8 crop of the box of entry (converted to float in input ops) """
+        box = (entry['x'].value, entry['y'].value,
+               entry['w'].value, entry['h'].value)
+        if self.image_cache is not None:
+            return self.image_cache.get(crop_key(image_id, *box))[0]
+        return decode_image(
+            os.path.join(self.image_dir, '{}.jpg'.format(image_id)),
+            self.width, self.height, box)[0]
+
     def get_data(self, id):
         """
         Returns:
@@ -64,14 +80,7 @@ class Dataset(object):
         blank_desc[drop_word_start: drop_word_end] = \
             self.wordset_dict[self.vocab['dict']['<unk>']]
 
-        x, y = entry['x'].value, entry['y'].value
-        w, h = entry['w'].value, entry['h'].value
-
-        image_path = os.path.join(self.image_dir, '{}.jpg'.format(image_id))
-        image = np.array(
-            Image.open(image_path).crop([x, y, x + w, y + h])
-            .resize([self.width, self.height]).convert('RGB'), dtype=np.float32
-        )
+        image = self.load_crop(image_id, entry)
 
         return image, desc, desc_len, wordset_desc, blank_desc
 
@@ -97,18 +106,22 @@ class Dataset(object):
 
 
 def create_default_splits(dataset_path, image_dir, vocab_path,
-                          used_wordset_path, is_train=True):
+                          used_wordset_path, is_train=True,
+                          image_cache_dir=None):
     ids_train, ids_test, ids_val = all_ids(dataset_path, is_train=is_train)
 
     dataset_train = Dataset(ids_train, dataset_path, image_dir, vocab_path,
                             used_wordset_path, width=224, height=224,
-                            name='train', is_train=is_train)
+                            name='train', is_train=is_train,
+                            image_cache_dir=image_cache_dir)
     dataset_test = Dataset(ids_test, dataset_path, image_dir, vocab_path,
                            used_wordset_path, width=224, height=224,
-                           name='test', is_train=is_train)
+                           name='test', is_train=is_train,
+                           image_cache_dir=image_cache_dir)
     dataset_val = Dataset(ids_val, dataset_path, image_dir, vocab_path,
                           used_wordset_path, width=224, height=224,
-                          name='val', is_train=is_train)
+                          name='val', is_train=is_train,
+                          image_cache_dir=image_cache_dir)
     return {
         'train': dataset_train,
         'test': dataset_test,
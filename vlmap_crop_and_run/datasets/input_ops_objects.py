@@ -26,12 +26,13 @@ def create(dataset,
         def load_py_func(id):
             py_func_out = tf.py_func(
                 load_fn, inp=[id],
-                Tout=[tf.string, tf.float32, tf.int32, tf.int32,
+                Tout=[tf.string, tf.uint8, tf.int32, tf.int32,
                       tf.float32, tf.string],
                 name='input_py_func')
             return {
                 'id': py_func_out[0],
-                'image': py_func_out[1],
+                # uint8 crops (decoded once in the image cache)
+                'image': tf.to_float(py_func_out[1]),
                 'objects': py_func_out[2],
                 'objects_len': py_func_out[3],
                 'ground_truth': py_func_out[4],
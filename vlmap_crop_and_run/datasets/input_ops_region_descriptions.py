@@ -27,12 +27,13 @@ def create(dataset,
         def load_py_func(id):
             py_func_out = tf.py_func(
                 load_fn, inp=[id],
-                Tout=[tf.string, tf.float32, tf.int32, tf.int32,
+                Tout=[tf.string, tf.uint8, tf.int32, tf.int32,
                       tf.int32, tf.int32],
                 name='input_py_func')
             return {
                 'id': py_func_out[0],
-                'image': py_func_out[1],
+                # uint8 crops (decoded once in the image cache)
+                'image': tf.to_float(py_func_out[1]),
                 'region_description': py_func_out[2],
                 'region_description_len': py_func_out[3],
                 'wordset_region_description': py_func_out[4],
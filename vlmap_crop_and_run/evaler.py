@@ -7,6 +7,7 @@ import tensorflow as tf
 from PIL import Image
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
 from vlmap.datasets import dataset_objects, input_ops_objects
 
 
@@ -49,10 +50,7 @@ class Evaler(object):
 
         tf.set_random_seed(123)
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = tf.Session(config=session_config)
 
@@ -161,6 +159,8 @@ def main():
                         default='data/VisualGenome/VG_100K', help='')
     parser.add_argument('--object_dataset_path', type=str,
                         default='data/preprocessed/objects_min_occ20', help='')
+    parser.add_argument('--image_cache_dir', type=str, default=None,
+                        help='decoded crops of data/tools/build_image_cache.py')
     parser.add_argument('--split', type=str, default='test',
                         choices=['train', 'test', 'val'], help=" ")
     # checkpoint
@@ -176,11 +176,13 @@ def main():
     parser.add_argument('--finetune_enc_I', action='store_true', default=False)
     parser.add_argument('--no_finetune_enc_L', action='store_true', default=False)
 
+    add_session_arguments(parser)
     config = parser.parse_args()
 
     object_datasets = dataset_objects.create_default_splits(
         config.object_dataset_path, config.image_dir, config.vocab_path,
-        config.object_num_k, is_train=False)
+        config.object_num_k, is_train=False,
+        image_cache_dir=config.image_cache_dir)
     config.object_data_shapes = \
         object_datasets[config.split].get_data_shapes()
     config.object_max_name_len = \
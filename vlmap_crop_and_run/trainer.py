@@ -4,6 +4,7 @@ import time
 import tensorflow as tf
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
 from vlmap.datasets import dataset_objects, input_ops_objects
 from vlmap.datasets import dataset_region_descriptions, \
     input_ops_region_descriptions
@@ -173,10 +174,7 @@ class Trainer(object):
             global_step=self.global_step,
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
@@ -274,6 +272,10 @@ def main():
                         default='data/preprocessed/region_descriptions_vocab50', help='')
     parser.add_argument('--used_wordset_path', type=str,
                         default='data/preprocessed/vocab50_used_wordset.hdf5', help='')
+    parser.add_argument('--object_image_cache_dir', type=str, default=None,
+                        help='decoded crops of data/tools/build_image_cache.py')
+    parser.add_argument('--region_image_cache_dir', type=str, default=None,
+                        help='decoded crops of data/tools/build_image_cache.py')
     # log
     parser.add_argument('--log_step', type=int, default=10)
     parser.add_argument('--val_sample_step', type=int, default=100)
@@ -298,18 +300,21 @@ def main():
     parser.add_argument('--use_dense_predictor', action='store_true', default=False)
     parser.add_argument('--no_glove', action='store_true', default=False)
 
+    add_session_arguments(parser)
     config = parser.parse_args()
 
     datasets = {}
     datasets['object'] = dataset_objects.create_default_splits(
         config.object_dataset_path, config.image_dir, config.vocab_path,
-        config.object_num_k, is_train=True)
+        config.object_num_k, is_train=True,
+        image_cache_dir=config.object_image_cache_dir)
     config.object_data_shapes = datasets['object']['train'].get_data_shapes()
     config.object_max_name_len = datasets['object']['train'].max_name_len
 
     datasets['region'] = dataset_region_descriptions.create_default_splits(
         config.region_dataset_path, config.image_dir, config.vocab_path,
-        config.used_wordset_path, is_train=True)
+        config.used_wordset_path, is_train=True,
+        image_cache_dir=config.region_image_cache_dir)
     config.region_data_shapes = datasets['region']['train'].get_data_shapes()
     config.region_max_len = datasets['region']['train'].max_len
 
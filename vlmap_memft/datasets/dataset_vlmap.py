@@ -6,7 +6,10 @@ import multiprocessing
 import tensorflow as tf
 from collections import namedtuple, defaultdict
 
-from util import log, get_dummy_data
+from util import input_tuner, log, get_dummy_data
+from util.feature_quantization import (
+    load_image_features, quantized_vfeat_path)
+from util.vfeat_view import open_vfeat
 
 NUM_CONFIG = {
     'attr_blank_fill': 5,
@@ -15,6 +18,12 @@ NUM_CONFIG = {
 
 CPU_COUNT = multiprocessing.cpu_count()
 
+DEFAULT_PIPELINE_CONFIG = {
+    'num_parallel_calls': None,
+    'prefetch': max(CPU_COUNT-5, 0) or None,
+    'shuffle_buffer': 3000,
+}
+
 
 class Dataset(object):
     def __init__(self, config, split, name='vlmap_memft'):
@@ -55,22 +64,35 @@ class Dataset(object):
         enwiki_dict_h5_path = os.path.join(
             data_dir, 'enwiki_context_dict_w3_p{}_n5.hdf5'.format(config.enwiki_preprocessing))
 
+        # written by data/tools/enwiki/4_post_processing.py
+        enwiki_shuffled_path = os.path.join(
+            data_dir, 'enwiki_context_dict_w3_p{}_n5_shuffled.pkl'.format(
+                config.enwiki_preprocessing))
+
         self.enwiki_dict = cPickle.load(open(enwiki_dict_pkl_path, 'rb'))
         with h5py.File(enwiki_dict_h5_path, 'r') as f:
             self.enwiki_dict['np_context'] = f['np_context'].value
             self.enwiki_dict['np_context_len'] = f['np_context_len'].value
+        if os.path.exists(enwiki_shuffled_path):
+            self.enwiki_dict.update(
+                cPickle.load(open(enwiki_shuffled_path, 'rb')))
+        elif 'ans2shuffled_context_idx' not in self.enwiki_dict:
+            raise ValueError('No {}: run data/tools/enwiki/4_post_processing.py'
+                             .format(enwiki_shuffled_path))
 
         if self.config.debug:
             self.image_features, self.spatial_features, self.normal_boxes, self.num_boxes, \
                 self.max_box_num, self.vfeat_dim = get_dummy_data()
         else:
-            with h5py.File(os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
-                        'r') as f:
+            vfeat_path = quantized_vfeat_path(
+                os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
+                getattr(config, 'vfeat_dtype', 'float32'))
+            with open_vfeat(vfeat_path) as f:
 
                 self.vfeat_dim = int(f['data_info']['vfeat_dim'].value)
                 self.max_box_num = int(f['data_info']['max_box_num'].value)
                 log.warn('loading {} image_features ..'.format(split))
-                self.image_features = np.array(f.get('image_features'))
+                self.image_features = load_image_features(f)
                 log.warn('loading {} normal_boxes ..'.format(split))
                 self.normal_boxes = np.array(f.get('normal_boxes'))
                 log.warn('loading {} num_boxes ..'.format(split))
@@ -309,14 +331,18 @@ def create_ops(batch_size,
                dataset,
                is_train=True,
                scope='vlmap_memft',
-               shuffle=True):
+               shuffle=True,
+               pipeline_config=None):
+    pipeline_config = input_tuner.merge_config(
+        DEFAULT_PIPELINE_CONFIG, pipeline_config)
 
     with tf.device('/cpu:0'), tf.name_scope(scope):
         tf_dataset = tf.data.Dataset.from_tensor_slices(
             tf.convert_to_tensor(dataset.ids))
 
         if is_train and shuffle:
-            tf_dataset = tf_dataset.shuffle(buffer_size=3000)
+            tf_dataset = tf_dataset.shuffle(
+                buffer_size=pipeline_config['shuffle_buffer'])
 
         def load_fn(image_id):
             ret = dataset.get_data(image_id)
@@ -335,19 +361,21 @@ def create_ops(batch_size,
                 pyfunc_ret[key].set_shape(shape)
             return pyfunc_ret
 
-        tf_dataset = tf_dataset.map(load_pyfunc)
+        tf_dataset = tf_dataset.map(
+            load_pyfunc,
+            num_parallel_calls=pipeline_config['num_parallel_calls'])
 
     tf_dataset = tf_dataset.padded_batch(
         batch_size=batch_size,
         padded_shapes=dataset.get_shapes()
     )
 
-    tf_dataset = tf_dataset.prefetch(max(CPU_COUNT-5, 0) or None)
+    tf_dataset = tf_dataset.prefetch(pipeline_config['prefetch'])
 
     if is_train:
         tf_dataset = tf_dataset.repeat(1000)  # repeat 1000 epoch
 
-    iterator = tf_dataset.make_one_shot_iterator()
+    iterator = input_tuner.make_iterator(tf_dataset, pipeline_config)
     batch_ops = iterator.get_next()
 
     return batch_ops
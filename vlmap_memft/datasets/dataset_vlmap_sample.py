@@ -1,11 +1,13 @@
 import collections
 import cPickle
-import h5py
 import os
 import numpy as np
 import tensorflow as tf
 
 from util import log, get_dummy_data
+from util.feature_quantization import (
+    load_image_features, quantized_vfeat_path)
+from util.vfeat_view import open_vfeat
 
 NUM_CONFIG = {
     'attr_blank_fill': 5,
@@ -51,13 +53,15 @@ class Dataset(object):
             self.image_features, self.spatial_features, self.normal_boxes, self.num_boxes, \
                 self.max_box_num, self.vfeat_dim = get_dummy_data()
         else:
-            with h5py.File(os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
-                        'r') as f:
+            vfeat_path = quantized_vfeat_path(
+                os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
+                getattr(config, 'vfeat_dtype', 'float32'))
+            with open_vfeat(vfeat_path) as f:
 
                 self.vfeat_dim = int(f['data_info']['vfeat_dim'].value)
                 self.max_box_num = int(f['data_info']['max_box_num'].value)
                 log.warn('loading {} image_features ..'.format(split))
-                self.image_features = np.array(f.get('image_features'))
+                self.image_features = load_image_features(f)
                 log.warn('loading {} normal_boxes ..'.format(split))
                 self.normal_boxes = np.array(f.get('normal_boxes'))
                 log.warn('loading {} num_boxes ..'.format(split))
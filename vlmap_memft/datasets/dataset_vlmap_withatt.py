@@ -6,6 +6,8 @@ import numpy as np
 import tensorflow as tf
 
 from util import log
+from util.feature_quantization import load_image_features, quantized_vfeat_path
+from util.vfeat_view import open_vfeat
 
 NUM_CONFIG = {
     'obj_pred': 5,
@@ -58,13 +60,15 @@ class Dataset(object):
             self.enwiki_dict['np_context'] = f['np_context'].value
             self.enwiki_dict['np_context_len'] = f['np_context_len'].value
 
-        with h5py.File(os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
-                       'r') as f:
+        vfeat_path = quantized_vfeat_path(
+            os.path.join(data_dir, '{}_vfeat.hdf5'.format(split)),
+            getattr(config, 'vfeat_dtype', 'float32'))
+        with open_vfeat(vfeat_path) as f:
 
             self.vfeat_dim = int(f['data_info']['vfeat_dim'].value)
             self.max_box_num = int(f['data_info']['max_box_num'].value)
             log.warn('loading {} image_features ..'.format(split))
-            self.image_features = np.array(f.get('image_features'))
+            self.image_features = load_image_features(f)
             log.warn('loading {} normal_boxes ..'.format(split))
             self.normal_boxes = np.array(f.get('normal_boxes'))
             log.warn('loading {} num_boxes ..'.format(split))
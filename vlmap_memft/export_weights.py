@@ -0,0 +1,226 @@
+"""
+Export the word weights of many checkpoints at once. The variables are read
+from the checkpoint files with a checkpoint reader (no graph, session or
+GloVe loading), and the bundles of the checkpoints are written in parallel.
+
+    python vlmap_memft/export_weights.py --export word_weights \\
+        --checkpoints train_dir/vlmap_*_seed234_*/model-4801 \\
+        train_dir/vlmap_*_seed345_*/model-4801
+
+Exports (<ckpt_dir>/<save_prefix>_<ckpt_name>/):
+    - word_weights: weights.hdf5 (v_word, l_word, l_answer_word,
+      class_weights, class_biases), vocab.pkl, answer_dict.pkl
+    - noc_word_weights: same as word_weights with v_class_* and l_class_*
+      of classifier_v and classifier_l instead of class_*
+    - wordset_embeddings: weights.hdf5 (wordset_ft), vocab.pkl,
+      wordset_dict5_depth{expand_depth}.pkl, answer_dict.pkl
+
+A bundle is written in a temporary directory which is renamed when it is
+complete, so an existing bundle directory is never partial.
+"""
+import argparse
+import cPickle
+import h5py
+import multiprocessing
+import os
+import shutil
+import numpy as np
+import tensorflow as tf
+
+from util import log
+
+WORD_VARIABLES = {
+    'v_word': 'V_GloVe/embed_map',
+    'l_word': 'L_GloVe/embed_map',
+    'l_answer_word': 'LearnAnswerGloVe/embed_map',
+}
+
+
+def wordset_ft(reader):
+    """
+    fc_layer of export_wordset_embeddings.py with layer norm:
+    tanh(layer_norm(tanh(wordset_map) * W + b))
+    """
+    def get(name):
+        return reader.get_tensor('wordset_ft/' + name).astype(np.float32)
+    h = np.tanh(reader.get_tensor('wordset_map/learn').astype(np.float32))
+    h = np.dot(h, get('fc/weights')) + get('fc/biases')
+    mean = h.mean(axis=-1, keepdims=True)
+    var = np.square(h - mean).mean(axis=-1, keepdims=True)
+    h = (h - mean) / np.sqrt(var + 1e-12)  # tf.contrib.layers.layer_norm
+    return np.tanh(h * get('LayerNorm/gamma') + get('LayerNorm/beta'))
+
+
+EXPORTS = {
+    'word_weights': {
+        'save_prefix': 'word_weights',
+        'variables': dict(WORD_VARIABLES, **{
+            'class_weights': 'classifier/fc/weights',
+            'class_biases': 'classifier/fc/biases',
+        }),
+        'dicts': ['vocab.pkl', 'answer_dict.pkl'],
+    },
+    'noc_word_weights': {
+        'save_prefix': 'word_weights',
+        'variables': dict(WORD_VARIABLES, **{
+            'v_class_weights': 'classifier_v/fc/weights',
+            'v_class_biases': 'classifier_v/fc/biases',
+            'l_class_weights': 'classifier_l/fc/weights',
+            'l_class_biases': 'classifier_l/fc/biases',
+        }),
+        'dicts': ['vocab.pkl', 'answer_dict.pkl'],
+    },
+    'wordset_embeddings': {
+        'save_prefix': 'wordset_embeddings',
+        'variables': {},
+        'computed': {'wordset_ft': wordset_ft},
+        'dicts': ['vocab.pkl', 'wordset_dict5_depth{expand_depth}.pkl',
+                  'answer_dict.pkl'],
+    },
+}
+
+
+def str2bool(v):
+    return v.lower() in ('true', '1')
+
+
+def resolve_checkpoint(checkpoint):
+    """ A train_dir is resolved to its latest checkpoint. """
+    if os.path.isdir(checkpoint):
+        latest = tf.train.latest_checkpoint(checkpoint)
+        if latest is None:
+            raise ValueError('No checkpoint in {}'.format(checkpoint))
+        return latest
+    if not tf.train.checkpoint_exists(checkpoint):
+        raise ValueError('No checkpoint: {}'.format(checkpoint))
+    return checkpoint
+
+
+def save_dir_of(checkpoint, save_prefix):
+    ckpt_dir = os.path.dirname(checkpoint)
+    ckpt_name = os.path.basename(checkpoint)
+    return os.path.join(ckpt_dir, '{}_{}'.format(save_prefix, ckpt_name))
+
+
+def expected_rows(dicts):
+    """ Number of rows of the exported weights given by the dictionaries. """
+    num_answer = len(dicts['answer_dict.pkl']['vocab'])
+    rows = {'v_word': len(dicts['vocab.pkl']['vocab']),
+            'l_word': len(dicts['vocab.pkl']['vocab']),
+            'l_answer_word': num_answer}
+    for name in dicts:
+        if name.startswith('wordset_dict'):
+            rows['wordset_ft'] = len(dicts[name]['vocab'])
+    return rows, num_answer
+
+
+def read_weights(checkpoint, spec, dicts):
+    reader = tf.train.NewCheckpointReader(checkpoint)
+    weights = {}
+    for key, name in spec['variables'].items():
+        if not reader.has_tensor(name):
+            raise ValueError('No variable {} in {}'.format(name, checkpoint))
+        weights[key] = reader.get_tensor(name)
+    for key, fn in spec.get('computed', {}).items():
+        weights[key] = fn(reader)
+
+    rows, num_answer = expected_rows(dicts)
+    for key, val in weights.items():
+        if key in rows and val.shape[0] != rows[key]:
+            raise ValueError('{} of {} has {} rows, the dictionaries {}'.format(
+                key, checkpoint, val.shape[0], rows[key]))
+        if 'class_' in key and val.shape[-1] != num_answer:
+            raise ValueError('{} of {} has {} answers, answer_dict {}'.format(
+                key, checkpoint, val.shape[-1], num_answer))
+    return weights
+
+
+_job = None
+
+
+def _export(checkpoint):
+    spec, dicts, dict_paths = _job
+    save_dir = save_dir_of(checkpoint, spec['save_prefix'])
+    weights = read_weights(checkpoint, spec, dicts)
+
+    tmp_dir = save_dir + '.tmp'
+    if os.path.exists(tmp_dir): shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    f = h5py.File(os.path.join(tmp_dir, 'weights.hdf5'), 'w')
+    for key, val in weights.items():
+        f[key] = val
+    f.close()
+    for name, path in dict_paths.items():
+        shutil.copyfile(path, os.path.join(tmp_dir, name))
+    os.rename(tmp_dir, save_dir)
+    return checkpoint, save_dir
+
+
+def export(export_name, checkpoints, data_dir, expand_depth=False,
+           num_workers=1):
+    """
+    Returns:
+        - save directories of the checkpoints
+    """
+    global _job
+    spec = EXPORTS[export_name]
+    checkpoints = [resolve_checkpoint(c) for c in checkpoints]
+    checkpoints = sorted(set(checkpoints), key=checkpoints.index)
+
+    save_dirs = [save_dir_of(c, spec['save_prefix']) for c in checkpoints]
+    for save_dir in save_dirs:
+        if os.path.exists(save_dir):
+            raise ValueError('Do not overwrite: {}'.format(save_dir))
+
+    # the dictionaries are shared by every checkpoint: load them once
+    dict_paths = {}
+    dicts = {}
+    for name in spec['dicts']:
+        name = name.format(expand_depth=int(expand_depth))
+        dict_paths[name] = os.path.join(data_dir, name)
+        dicts[name] = cPickle.load(open(dict_paths[name], 'rb'))
+
+    log.info('Export {} of {} checkpoints'.format(export_name,
+                                                  len(checkpoints)))
+    _job = (spec, dicts, dict_paths)  # read by the forked workers
+    if num_workers > 1 and len(checkpoints) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(checkpoints)))
+        exported = pool.imap_unordered(_export, checkpoints)
+    else:
+        pool = None
+        exported = (_export(c) for c in checkpoints)
+    for checkpoint, save_dir in exported:
+        log.warn('{} is saved in: {}'.format(checkpoint, save_dir))
+    if pool is not None:
+        pool.close()
+        pool.join()
+    _job = None
+    return save_dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--export', type=str, default='word_weights',
+                        choices=sorted(EXPORTS.keys()), help=' ')
+    parser.add_argument('--checkpoints', type=str, nargs='+', required=True,
+                        help='ex) ./model-1 (a train_dir: latest checkpoint)')
+    parser.add_argument('--data_dir', type=str,
+                        default='data/preprocessed/visualgenome'
+                        '/memft_all_new_vocab50_obj3000_attr1000_maxlen10',
+                        help=' ')
+    parser.add_argument('--expand_depth', type=str2bool, default=False,
+                        help='wordset_embeddings: wordset expanded based on '
+                        'deepest depth')
+    parser.add_argument('--num_workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='checkpoints exported in parallel')
+    config = parser.parse_args()
+
+    export(config.export, config.checkpoints, config.data_dir,
+           expand_depth=config.expand_depth, num_workers=config.num_workers)
+    log.warn('done')
+
+
+if __name__ == '__main__':
+    main()
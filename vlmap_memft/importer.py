@@ -0,0 +1,41 @@
+from util.registry import ModelRegistry
+
+MODEL_REGISTRY = ModelRegistry('vlmap_memft', [
+    ('vlmap', 'model_vlmap'),
+    ('vlmap_wordset', 'model_vlmap_wordset'),
+    ('vlmap_wordset_only', 'model_vlmap_wordset_only'),
+    ('vlmap_wordset_only_withatt', 'model_vlmap_wordset_only_withatt'),
+    ('vlmap_wordset_only_withatt_sp', 'model_vlmap_wordset_only_withatt_sp'),
+    ('vlmap_bf_only', 'model_vlmap_bf_only'),
+    ('vlmap_bf_only_withatt', 'model_vlmap_bf_only_withatt'),
+    ('vlmap_bf_only_withatt_sp', 'model_vlmap_bf_only_withatt_sp'),
+    ('vlmap_autoenc', 'model_vlmap_autoenc'),
+    ('vlmap_bf_or_wordset', 'model_vlmap_bf_or_wordset'),
+    ('vlmap_bf_or_wordset_obj', 'model_vlmap_bf_or_wordset_obj'),
+    ('vlmap_bf_or_wordset_withatt', 'model_vlmap_bf_or_wordset_withatt'),
+    ('vlmap_bf_or_wordset_withatt_sp', 'model_vlmap_bf_or_wordset_withatt_sp'),
+    ('vlmap_enwiki_withatt_sp', 'model_vlmap_enwiki_withatt_sp'),
+    ('vlmap_bf_enwiki_withatt_sp', 'model_vlmap_bf_enwiki_withatt_sp'),
+    ('vlmap_bf_or_wordset_enwiki_withatt_sp',
+     'model_vlmap_bf_or_wordset_enwiki_withatt_sp'),
+    ('vlmap_noc_bf_or_wordset_withatt_sp',
+     'model_vlmap_noc_bf_or_wordset_withatt_sp'),
+    ('vlmap_nocarch_bf_or_wordset_withatt_sp',
+     'model_vlmap_nocarch_bf_or_wordset_withatt_sp'),
+    ('vlmap_noc_bf_or_enwiki_withatt_sp',
+     'model_vlmap_noc_bf_or_enwiki_withatt_sp'),
+    # the _obj variant has always been trained with the plain _sp model
+    ('vlmap_bf_or_wordset_withatt_sp_obj', 'model_vlmap_bf_or_wordset_withatt_sp'),
+    ('vlmap_bf_or_wordset_withatt_sp_adapt',
+     'model_vlmap_bf_or_wordset_withatt_sp_adapt'),
+    ('vlmap_autoenc_full', 'model_vlmap_autoenc_full'),
+    ('vlmap_bf_wordset', 'model_vlmap_bf_wordset'),
+])
+
+
+def get_model_types():
+    return MODEL_REGISTRY.types()
+
+
+def get_model_class(model_type='vlmap'):
+    return MODEL_REGISTRY.get(model_type)
@@ -6,7 +6,14 @@ import tensorflow as tf
 
 from tqdm import tqdm
 
-from util import log
+from util import input_tuner, log
+from util.profiler import StepProfiler
+from util.streaming_report import StreamingReport
+from util.checkpoint import AsyncSaver
+from util.feature_quantization import FEATURE_DTYPES
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
+from vlmap_memft import importer
 from vlmap_memft.datasets.dataset_vlmap import Dataset, create_ops
 #from vlmap_memft.datasets.dataset_vlmap_sample import Dataset, create_ops
 
@@ -15,53 +22,7 @@ class Trainer(object):
 
     @staticmethod
     def get_model_class(model_type='vlmap'):
-        if model_type == 'vlmap':
-            from vlmap_memft.model_vlmap import Model
-        elif model_type == 'vlmap_wordset':
-            from vlmap_memft.model_vlmap_wordset import Model
-        elif model_type == 'vlmap_wordset_only':
-            from vlmap_memft.model_vlmap_wordset_only import Model
-        elif model_type == 'vlmap_wordset_only_withatt':
-            from vlmap_memft.model_vlmap_wordset_only_withatt import Model
-        elif model_type == 'vlmap_wordset_only_withatt_sp':
-            from vlmap_memft.model_vlmap_wordset_only_withatt_sp import Model
-        elif model_type == 'vlmap_bf_only':
-            from vlmap_memft.model_vlmap_bf_only import Model
-        elif model_type == 'vlmap_bf_only_withatt':
-            from vlmap_memft.model_vlmap_bf_only_withatt import Model
-        elif model_type == 'vlmap_bf_only_withatt_sp':
-            from vlmap_memft.model_vlmap_bf_only_withatt_sp import Model
-        elif model_type == 'vlmap_bf_wordset':
-            from vlmap_memft.model_vlmap_bf_wordset import Model
-        elif model_type == 'vlmap_bf_or_wordset':
-            from vlmap_memft.model_vlmap_bf_or_wordset import Model
-        elif model_type == 'vlmap_bf_or_wordset_obj':
-            from vlmap_memft.model_vlmap_bf_or_wordset_obj import Model
-        elif model_type == 'vlmap_bf_or_wordset_withatt':
-            from vlmap_memft.model_vlmap_bf_or_wordset_withatt import Model
-        elif model_type == 'vlmap_bf_or_wordset_withatt_sp':
-            from vlmap_memft.model_vlmap_bf_or_wordset_withatt_sp import Model
-        elif model_type == 'vlmap_enwiki_withatt_sp':
-            from vlmap_memft.model_vlmap_enwiki_withatt_sp import Model
-        elif model_type == 'vlmap_bf_enwiki_withatt_sp':
-            from vlmap_memft.model_vlmap_bf_enwiki_withatt_sp import Model
-        elif model_type == 'vlmap_bf_or_wordset_enwiki_withatt_sp':
-            from vlmap_memft.model_vlmap_bf_or_wordset_enwiki_withatt_sp import Model
-        elif model_type == 'vlmap_noc_bf_or_wordset_withatt_sp':
-            from vlmap_memft.model_vlmap_noc_bf_or_wordset_withatt_sp import Model
-        elif model_type == 'vlmap_nocarch_bf_or_wordset_withatt_sp':
-            from vlmap_memft.model_vlmap_nocarch_bf_or_wordset_withatt_sp import Model
-        elif model_type == 'vlmap_noc_bf_or_enwiki_withatt_sp':
-            from vlmap_memft.model_vlmap_noc_bf_or_enwiki_withatt_sp import Model
-        elif model_type == 'vlmap_bf_or_wordset_withatt_sp_obj':
-            from vlmap_memft.model_vlmap_bf_or_wordset_withatt_sp import Model
-        elif model_type == 'vlmap_bf_or_wordset_withatt_sp_adapt':
-            from vlmap_memft.model_vlmap_bf_or_wordset_withatt_sp_adapt import Model
-        elif model_type == 'vlmap_autoenc':
-            from vlmap_memft.model_vlmap_autoenc import Model
-        elif model_type == 'vlmap_autoenc_full':
-            from vlmap_memft.model_vlmap_autoenc_full import Model
-        return Model
+        return importer.get_model_class(model_type)
 
     def __init__(self, config, dataset):
         self.config = config
@@ -70,6 +31,8 @@ class Trainer(object):
         dataset_str = 'd'
         dataset_str += '_' + '_'.join(config.data_dir.replace(
             'data/preprocessed/visualgenome/', '').split('/'))
+        if config.vfeat_dtype != 'float32':
+            dataset_str += '_' + config.vfeat_dtype
 
         hyper_parameter_str = 'bs{}_lr{}_dp{}'.format(
             config.batch_size, config.learning_rate,
@@ -83,6 +46,7 @@ class Trainer(object):
 
         # Input
         self.batch_size = config.batch_size
+        self.pipeline_config = self.get_pipeline_config(config, dataset)
         with tf.name_scope('datasets'):
             self.target_split = tf.placeholder(tf.string)
 
@@ -90,10 +54,12 @@ class Trainer(object):
             vlmap_batch = {
                 'train': create_ops(
                     self.batch_size, dataset['train'], is_train=True,
-                    scope='train_ops', shuffle=True),
+                    scope='train_ops', shuffle=True,
+                    pipeline_config=self.pipeline_config),
                 'val': create_ops(
                     self.batch_size, dataset['val'], is_train=True,
-                    scope='val_ops', shuffle=False)}
+                    scope='val_ops', shuffle=False,
+                    pipeline_config=self.pipeline_config)}
             batch_opt = {
                 tf.equal(self.target_split, 'train'): lambda: vlmap_batch['train'],
                 tf.equal(self.target_split, 'val'): lambda: vlmap_batch['val']
@@ -137,15 +103,9 @@ class Trainer(object):
             name='optimizer')
 
         self.avg_report = {
-            'train': {},
-            'val': {},
-        }
-        for split in ['train', 'val']:
-            for key in self.model.report.keys():
-                self.avg_report[split][key] = tf.placeholder(tf.float32)
-                tf.summary.scalar('average_{}/{}'.format(split, key),
-                                  self.avg_report[split][key],
-                                  collections=['average_{}'.format(split)])
+            split: StreamingReport(self.model.report, split,
+                                   summary_collection='average_{}'.format(split))
+            for split in ['train', 'val']}
 
         self.summary_ops = {
             'train': tf.summary.merge_all(key='train'),
@@ -156,9 +116,13 @@ class Trainer(object):
             'average_val': tf.summary.merge_all(key='average_val'),
             'no_op': tf.no_op(),
         }
+        self.profiler = StepProfiler(self.train_dir, config.profile_steps,
+                                     config.trace_every, config.input_wait_warn)
         all_vars = tf.global_variables()
 
-        self.saver = tf.train.Saver(max_to_keep=100)
+        self.saver = AsyncSaver(
+            max_to_keep=100,
+            meta_graph_path=os.path.join(self.train_dir, 'model.meta'))
         self.checkpoint_loader = tf.train.Saver(max_to_keep=1)
         self.pretrain_loader = tf.train.Saver(var_list=all_vars, max_to_keep=1)
         self.summary_writer = tf.summary.FileWriter(self.train_dir)
@@ -177,15 +141,18 @@ class Trainer(object):
             save_summaries_secs=300,
             save_model_secs=None,
             global_step=self.global_step,
+            init_feed_dict=modules.get_init_feed_dict(),
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
+        modules.initialize_data_variables(self.session)
+        if self.tunable_pipeline is not None:
+            self.tunable_pipeline.initialize(self.session)
+            self.profiler.measure_consumer(input_tuner.CONSUMER_WARMUP_STEPS,
+                                           input_tuner.CONSUMER_STEPS)
 
         self.ckpt_path = config.checkpoint
         if self.ckpt_path is not None:
@@ -199,92 +166,133 @@ class Trainer(object):
             self.pretrain_loader.restore(self.session, self.pretrained_param_path)
             log.info('Loaded the pre-trained parameters')
 
+    def get_pipeline_config(self, config, dataset):
+        self.tunable_pipeline = None
+        measurements = None
+        if config.input_pipeline_config is not None:
+            pipeline_config = input_tuner.load_config(
+                config.input_pipeline_config)
+        elif config.tune_input_pipeline:
+            measurements = input_tuner.measure(
+                lambda cfg: create_ops(
+                    self.batch_size, dataset['train'], is_train=True,
+                    scope='tune_ops', shuffle=True, pipeline_config=cfg))
+            # retuned for the train step time in train()
+            self.tunable_pipeline = input_tuner.TunablePipeline(measurements)
+            pipeline_config = self.tunable_pipeline.config
+        else: return None
+        input_tuner.save_config(self.train_dir, pipeline_config, measurements)
+        if self.tunable_pipeline is not None:
+            return self.tunable_pipeline.pipeline_config()
+        return pipeline_config
+
+    def retune_input_pipeline(self):
+        consumer_secs_per_batch = self.profiler.consumer_secs_per_batch()
+        if consumer_secs_per_batch is None: return
+        pipeline_config = self.tunable_pipeline.retune(
+            self.session, consumer_secs_per_batch)
+        input_tuner.save_config(
+            self.train_dir, pipeline_config,
+            self.tunable_pipeline.measurements, consumer_secs_per_batch)
+
     def train(self):
         log.infov('Training starts')
 
         ckpt_save_steps = self.checkpoint_step
 
-        # initialize average report (put 0 to escape average over empty list)
+        # initialize average step time (put 0 to escape average over empty list)
         avg_step_time = [0]
-        avg_train_report = {key: [0] for key in self.avg_report['train']}
-
-        for s in range(self.max_train_iter):
-            """
-            write average summary and print log
-            """
-            if s % self.train_average_iter == 0:
-                step, avg_train_summary = self.write_average_summary(
-                    avg_train_report, split='train')
-                self.summary_writer.add_summary(
-                    avg_train_summary, global_step=step)
-                self.log_message(step, avg_train_report, avg_step_time,
-                                 split='train', is_train=True)
-                for key in avg_train_report: avg_train_report[key] = []
-                avg_step_time = []
-
-            """
-            Periodic inference on validation set
-            """
-            if s % self.validation_step == 0:
-                # val
-                avg_val_report = {key: [] for key in self.avg_report['val']}
-                avg_val_step_time = []
-                for i in tqdm(range(self.val_average_iter), desc='performing validation'):
-                    step, summary, loss, report, step_time = self.run_val_step(
-                        i == (self.val_average_iter - 1), split='val')
-                    for key in avg_val_report:
-                        avg_val_report[key].append(report[key])
-                    avg_val_step_time.append(step_time)
-                self.summary_writer.add_summary(summary, global_step=step)
-                step, avg_val_summary = self.write_average_summary(
-                    avg_val_report, split='val')
-                self.summary_writer.add_summary(avg_val_summary, global_step=step)
-                self.log_message(step, avg_val_report, avg_val_step_time,
-                                 split='val', is_train=False)
-
-            """
-            Run TRAINING step
-            """
-            step, train_summary, loss, train_report, step_time = \
-                self.run_train_step(s % self.heavy_summary_step == 0)
-            for key in avg_train_report:
-                avg_train_report[key].append(train_report[key])
-            avg_step_time.append(step_time)
-            if s % self.heavy_summary_step == 0:
-                self.summary_writer.add_summary(train_summary, global_step=step)
-
-            """
-            Save Checkpoint
-            """
-            if s % ckpt_save_steps == 0:
-                log.infov('Saved checkpoint at {}'.format(step))
-                self.saver.save(
-                    self.session, os.path.join(self.train_dir, 'model'),
-                    global_step=step)
-
-    def write_average_summary(self, avg_report, split='train'):
-        feed_dict = {
-            self.avg_report[split][key]:
-            np.array(avg_report[key], dtype=np.float32).mean()
-            for key in self.avg_report[split]}
+
+        completed = False
+        try:
+            for s in range(self.max_train_iter):
+                """
+                write average summary and print log
+                """
+                if s % self.train_average_iter == 0:
+                    step, avg_train_summary, avg_train_report = \
+                        self.write_average_summary(split='train')
+                    self.summary_writer.add_summary(
+                        avg_train_summary, global_step=step)
+                    self.log_message(step, avg_train_report, avg_step_time,
+                                     split='train', is_train=True)
+                    self.profiler.write_summary(
+                        self.session, self.summary_writer, step)
+                    avg_step_time = []
+
+                """
+                Periodic inference on validation set
+                """
+                if s % self.validation_step == 0:
+                    # val
+                    avg_val_step_time = []
+                    for i in tqdm(range(self.val_average_iter), desc='performing validation'):
+                        step, summary, step_time = self.run_val_step(
+                            i == (self.val_average_iter - 1), split='val')
+                        avg_val_step_time.append(step_time)
+                    self.summary_writer.add_summary(summary, global_step=step)
+                    step, avg_val_summary, avg_val_report = \
+                        self.write_average_summary(split='val')
+                    self.summary_writer.add_summary(avg_val_summary, global_step=step)
+                    self.log_message(step, avg_val_report, avg_val_step_time,
+                                     split='val', is_train=False)
+
+                """
+                Run TRAINING step
+                """
+                run_kwargs = self.profiler.run_kwargs(s)
+                step, train_summary, step_time = \
+                    self.run_train_step(s % self.heavy_summary_step == 0,
+                                        run_kwargs=run_kwargs)
+                self.profiler.after_run(s, step, run_kwargs, step_time)
+                if self.tunable_pipeline is not None and \
+                        s == max(self.profiler.consumer_steps):
+                    self.retune_input_pipeline()
+                avg_step_time.append(step_time)
+                if s % self.heavy_summary_step == 0:
+                    _start_time = time.time()
+                    self.summary_writer.add_summary(train_summary, global_step=step)
+                    self.profiler.add_time('summary_write', time.time() - _start_time)
+
+                """
+                Save Checkpoint
+                """
+                if s % ckpt_save_steps == 0:
+                    snapshot_time = self.saver.save(
+                        self.session, os.path.join(self.train_dir, 'model'),
+                        global_step=step)
+                    log.infov('Saved checkpoint at {} ({:.3f} sec blocked, '
+                              'written in background)'.format(step, snapshot_time))
+            completed = True
+        finally:
+            # flush the checkpoint being written in the background
+            self.saver.close(raise_error=completed)
+
+    def write_average_summary(self, split='train'):
+        """
+        Read (and reset) the running averages of the split.
+        """
         summary_op = self.summary_ops['average_{}'.format(split)]
-        step, avg_summary = self.session.run([self.global_step, summary_op],
-                                             feed_dict=feed_dict)
-        return step, avg_summary
+        step, avg_summary, avg_report = self.session.run(
+            [self.global_step, summary_op, self.avg_report[split].average])
+        self.session.run(self.avg_report[split].reset_op)
+        return step, avg_summary, avg_report
 
-    def run_train_step(self, use_heavy_summary):
+    def run_train_step(self, use_heavy_summary, run_kwargs=None):
+        if run_kwargs is None: run_kwargs = {}
         if use_heavy_summary:
             summary_op = self.summary_ops['heavy_train']
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
         fetch = [self.global_step, summary_op,
-                 self.model.loss, self.model.report, self.optimizer]
+                 self.avg_report['train'].update_op, self.optimizer]
         fetch_values = self.session.run(fetch,
-                                        feed_dict={self.target_split: 'train'})
-        [step, summary, loss, report] = fetch_values[:4]
+                                        feed_dict={self.target_split: 'train'},
+                                        **run_kwargs)
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def run_val_step(self, use_heavy_summary, split):
         if use_heavy_summary:
@@ -292,12 +300,13 @@ class Trainer(object):
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
-        fetch = [self.global_step, summary_op, self.model.loss, self.model.report]
+        fetch = [self.global_step, summary_op,
+                 self.avg_report[split].update_op]
         fetch_values = self.session.run(
             fetch, feed_dict={self.target_split: split})
-        [step, summary, loss, report] = fetch_values[:4]
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def log_message(self, step, avg_report, avg_step_time, split='train', is_train=True):
         step_time = np.array(avg_step_time, dtype=np.float32).mean()
@@ -307,8 +316,7 @@ class Trainer(object):
         log_str += '({:.3f} sec/batch, {:.3f} instances/sec)]\n'.format(
             step_time, self.batch_size / step_time)
         for key in sorted(avg_report.keys()):
-            report = np.array(avg_report[key], dtype=np.float32).mean()
-            log_str += '  * {}: {:.5f}\n'.format(key, report)
+            log_str += '  * {}: {:.5f}\n'.format(key, avg_report[key])
         log_fn = (log.info if is_train else log.infov)
         log_fn(log_str)
 
@@ -337,6 +345,22 @@ def main():
     parser.add_argument('--heavy_summary_step', type=int, default=200)
     parser.add_argument('--validation_step', type=int, default=200)
     parser.add_argument('--checkpoint_step', type=int, default=800)
+    parser.add_argument('--profile_steps', type=str, default='',
+                        help='steps to export Chrome trace timelines for,'
+                        ' e.g. "100,200-202"')
+    parser.add_argument('--trace_every', type=int, default=100,
+                        help='trace a step every N steps for the'
+                        ' average_train/time/* summaries (0: off)')
+    parser.add_argument('--input_wait_warn', type=float, default=0.2,
+                        help='warn when waiting on input for more than this'
+                        ' fraction of the step time')
+    parser.add_argument('--tune_input_pipeline', action='store_true',
+                        default=False,
+                        help='measure the input pipeline at startup and the'
+                        ' first train steps, and pick parallelism / prefetch'
+                        ' depth for both rates')
+    parser.add_argument('--input_pipeline_config', type=str, default=None,
+                        help='input_pipeline.json saved by a previous run')
     # hyper parameters
     parser.add_argument('--prefix', type=str, default='default', help=' ')
     parser.add_argument('--checkpoint', type=str, default=None)
@@ -345,31 +369,16 @@ def main():
     parser.add_argument('--lr_weight_decay', action='store_true', default=False)
     parser.add_argument('--expand_depth', type=str2bool, default=False, help='whether to expand wordset based on deepest depth')
     parser.add_argument('--enwiki_preprocessing', type=int, default=0, help='0: no, 1: yes')
+    parser.add_argument('--vfeat_dtype', type=str, default='float32',
+                        choices=FEATURE_DTYPES,
+                        help='{split}_vfeat_<dtype>.hdf5 of data/tools/quantize_vfeat.py')
     # model parameters
     parser.add_argument('--debug', type=int, default=0, help='0: normal, 1: debug')
     parser.add_argument('--seed', type=int, default=123, help=' ')
     parser.add_argument('--batch_size', type=int, default=512, help=' ')
     parser.add_argument('--model_type', type=str, default='vlmap', help=' ',
-                        choices=['vlmap', 'vlmap_wordset', 'vlmap_wordset_only',
-                                 'vlmap_wordset_only_withatt',
-                                 'vlmap_wordset_only_withatt_sp',
-                                 'vlmap_bf_only',
-                                 'vlmap_bf_only_withatt',
-                                 'vlmap_bf_only_withatt_sp',
-                                 'vlmap_autoenc',
-                                 'vlmap_bf_or_wordset',
-                                 'vlmap_bf_or_wordset_obj',
-                                 'vlmap_bf_or_wordset_withatt',
-                                 'vlmap_bf_or_wordset_withatt_sp',
-                                 'vlmap_enwiki_withatt_sp',
-                                 'vlmap_bf_enwiki_withatt_sp',
-                                 'vlmap_bf_or_wordset_enwiki_withatt_sp',
-                                 'vlmap_noc_bf_or_wordset_withatt_sp',
-                                 'vlmap_nocarch_bf_or_wordset_withatt_sp',
-                                 'vlmap_noc_bf_or_enwiki_withatt_sp',
-                                 'vlmap_bf_or_wordset_withatt_sp_obj',
-                                 'vlmap_bf_or_wordset_withatt_sp_adapt',
-                                 'vlmap_autoenc_full', 'vlmap_bf_wordset'])
+                        choices=importer.get_model_types())
+    add_session_arguments(parser)
     config = parser.parse_args()
     check_config(config)
 
@@ -0,0 +1,162 @@
+"""
+Compare the frozen inference graph (vqa/export_inference_graph.py) with
+restoring the training checkpoint (vqa/inference_server.VQAPredictor):
+load time, latency per batch and size on disk.
+
+    python vqa/benchmark_inference_graph.py \\
+        --checkpoint train_dir/vqa_.../model-4801 --batch_size 64 --cpu
+
+The image features are loaded once beforehand and shared, so the load
+times only cover the graph and the weights. Random questions are drawn from
+the vocab.
+"""
+import argparse
+import glob
+import os
+import time
+import numpy as np
+import tensorflow as tf
+
+from util import feature_quantization, log
+from util.session_config import add_session_arguments
+from util.vfeat_view import open_vfeat
+from vqa.export_inference_graph import FrozenVQAGraph
+from vqa.inference import parse_checkpoint
+from vqa.inference_server import VQAPredictor
+
+
+def load_image_features(vfeat_path, num_images):
+    """ First num_images of a vfeat file or view, dequantized to float32. """
+    with open_vfeat(vfeat_path) as f:
+        features = feature_quantization.load_image_features(f)
+        num_images = min(num_images, len(features))
+        return {
+            'features': np.array(features[:num_images], dtype=np.float32),
+            'spatials': np.array(f.get('spatial_features')[:num_images]),
+            'normal_boxes': np.array(f.get('normal_boxes')[:num_images]),
+            'num_boxes': np.array(f.get('num_boxes')[:num_images]),
+            'max_box_num': int(f['data_info']['max_box_num'].value),
+            'vfeat_dim': int(f['data_info']['vfeat_dim'].value),
+        }
+
+
+def random_batches(vocab_size, num_images, batch_size, num_batches, seed=123):
+    rng = np.random.RandomState(seed)
+    batches = []
+    for _ in range(num_batches):
+        lengths = rng.randint(4, 13, size=batch_size).astype(np.int32)
+        q_intseq = np.zeros([batch_size, lengths.max()], dtype=np.int32)
+        for i, length in enumerate(lengths):
+            q_intseq[i, :length] = rng.randint(vocab_size, size=length)
+        batches.append({
+            'image_idx': rng.randint(num_images, size=batch_size),
+            'q_intseq': q_intseq,
+            'q_intseq_len': lengths,
+        })
+    return batches
+
+
+def time_batches(run, batches, num_warmup=3):
+    for batch in batches[:num_warmup]: run(batch)
+    latencies = []
+    for batch in batches:
+        start = time.time()
+        run(batch)
+        latencies.append(time.time() - start)
+    return np.array(latencies) * 1000.0
+
+
+def checkpoint_size(checkpoint):
+    return sum(os.path.getsize(p) for p in glob.glob(checkpoint + '.*'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--checkpoint', type=str, required=True)
+    parser.add_argument('--export_dir', type=str, default=None,
+                        help='default: <train_dir>/inference_graph_<ckpt name>')
+    parser.add_argument('--image_dir', type=str, default='data/VQA_v2/images',
+                        help=' ')
+    parser.add_argument('--vocab_name', type=str, default='vocab.pkl', help=' ')
+    parser.add_argument('--batch_size', type=int, default=64, help=' ')
+    parser.add_argument('--num_batches', type=int, default=50, help=' ')
+    parser.add_argument('--num_images', type=int, default=1000,
+                        help='images loaded for the benchmark')
+    parser.add_argument('--max_top_k', type=int, default=10, help=' ')
+    parser.add_argument('--vfeat_dtype', type=str, default='float32',
+                        choices=feature_quantization.FEATURE_DTYPES,
+                        help='features of data/tools/quantize_vfeat.py')
+    parser.add_argument('--cpu', action='store_true', default=False,
+                        help='hide the GPUs')
+    add_session_arguments(parser)
+    config = parser.parse_args()
+    parse_checkpoint(config)
+    config.vfeat_path = feature_quantization.quantized_vfeat_path(
+        config.vfeat_path, config.vfeat_dtype)
+    config.debug = 0
+    if config.export_dir is None:
+        config.export_dir = os.path.join(
+            os.path.dirname(config.checkpoint),
+            'inference_graph_{}'.format(os.path.basename(config.checkpoint)))
+
+    log.infov('loading {} images of {}'.format(config.num_images, config.vfeat_path))
+    image_features = load_image_features(config.vfeat_path, config.num_images)
+    num_images = len(image_features['num_boxes'])
+
+    results = {}
+
+    # frozen graph
+    start = time.time()
+    frozen = FrozenVQAGraph(config.export_dir, config.num_cores,
+                            use_gpu=not config.cpu)
+    load_secs = time.time() - start
+    batches = random_batches(len(frozen.vocab['vocab']), num_images,
+                             config.batch_size, config.num_batches)
+
+    def run_frozen(batch):
+        idx = batch['image_idx']
+        return frozen.predict({
+            'q_intseq': batch['q_intseq'],
+            'q_intseq_len': batch['q_intseq_len'],
+            'V_ft': image_features['features'][idx],
+            'num_V_ft': image_features['num_boxes'][idx],
+            'normal_boxes': image_features['normal_boxes'][idx],
+        })
+    results['frozen graph'] = (
+        load_secs, time_batches(run_frozen, batches),
+        os.path.getsize(os.path.join(config.export_dir, 'frozen_graph.pb')))
+    frozen.session.close()
+
+    # checkpoint
+    with tf.Graph().as_default():
+        start = time.time()
+        predictor = VQAPredictor(config, image_features=image_features)
+        load_secs = time.time() - start
+
+        def run_checkpoint(batch):
+            feed_dict = {
+                predictor.batch['image_idx']: batch['image_idx'],
+                predictor.batch['q_intseq']: batch['q_intseq'],
+                predictor.batch['q_intseq_len']: batch['q_intseq_len'],
+            }
+            feed_dict.update(predictor.bypass_feeds)
+            return predictor.session.run(predictor.top_k, feed_dict=feed_dict)
+        results['checkpoint'] = (
+            load_secs, time_batches(run_checkpoint, batches),
+            checkpoint_size(config.checkpoint))
+        predictor.session.close()
+
+    log.warn('batch size {}, {} batches'.format(
+        config.batch_size, config.num_batches))
+    log.warn('{:<14} {:>10} {:>10} {:>10} {:>10}'.format(
+        '', 'load (s)', 'p50 (ms)', 'p99 (ms)', 'size (MB)'))
+    for key in ['checkpoint', 'frozen graph']:
+        load_secs, latencies_ms, size = results[key]
+        log.infov('{:<14} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.1f}'.format(
+            key, load_secs, np.percentile(latencies_ms, 50),
+            np.percentile(latencies_ms, 99), size / 1e6))
+
+
+if __name__ == '__main__':
+    main()
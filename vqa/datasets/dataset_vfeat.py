@@ -4,9 +4,8 @@ import json
 import os
 import numpy as np
 
-from PIL import Image
-
 from util import log, box_utils
+from util.image_cache import ImageCache, decode_image
 
 RANDOM_STATE = np.random.RandomState(123)
 IMAGE_WIDTH = 540
@@ -20,7 +19,7 @@ DENSECAP_FILENAME = 'results_original_size.hdf5'
 class Dataset(object):
 
     def __init__(self, image_paths, image_dir, densecap_dir,
-                 is_train=True, name='default'):
+                 is_train=True, name='default', image_cache_dir=None):
         self.name = name
 
         self._ids = list(range(len(image_paths)))
@@ -35,6 +34,12 @@ class Dataset(object):
 
         self.max_roi_num = MAX_ROI_NUM
 
+        # decoded images (data/tools/build_image_cache.py)
+        self.image_cache = None
+        if image_cache_dir is not None:
+            self.image_cache = ImageCache(image_cache_dir)
+            self.image_cache.check_size(self.width, self.height)
+
         self.densecap = {}
         for split in ['train2014', 'val2014', 'test2015']:
             densecap_path = os.path.join(
@@ -51,12 +56,13 @@ class Dataset(object):
     def get_data(self, id):
         image_path = self.image_paths[id]
 
-        # Image
-        o_image = Image.open(os.path.join(self.image_dir, image_path))
-        o_w, o_h = o_image.size
-        image = np.array(
-            o_image.resize([self.width, self.height]).convert('RGB'),
-            dtype=np.float32)
+        # Image (uint8, converted to float in input ops)
+        if self.image_cache is not None:
+            image, (o_w, o_h) = self.image_cache.get(image_path)
+        else:
+            image, (o_w, o_h) = decode_image(
+                os.path.join(self.image_dir, image_path),
+                self.width, self.height)
         frac_x = self.width / float(o_w)
         frac_y = self.height / float(o_h)
 
@@ -110,7 +116,7 @@ class Dataset(object):
 
     def get_data_types(self):
         data_types = {
-            'image': np.float32,
+            'image': np.uint8,
             'box': np.float32,
             'normal_box': np.float32,
             'num_box': np.int32,
@@ -131,7 +137,9 @@ class Dataset(object):
         return 'Dataset ({}, {} examples)'.format(self.name, len(self))
 
 
-def create_dataset(image_paths, image_dir, densecap_dir, is_train=True):
+def create_dataset(image_paths, image_dir, densecap_dir, is_train=True,
+                   image_cache_dir=None):
     dataset = Dataset(image_paths, image_dir, densecap_dir,
-                      is_train=is_train, name='dataset')
+                      is_train=is_train, name='dataset',
+                      image_cache_dir=image_cache_dir)
     return dataset
@@ -8,6 +8,7 @@ def np2tf_type(np_type):
     if np_type == np.str: return tf.string
     elif np_type == np.int32: return tf.int32
     elif np_type == np.float32: return tf.float32
+    elif np_type == np.uint8: return tf.uint8
     elif np_type == np.bool: return tf.bool
     else: raise ValueError('Unknown np_type')
 
@@ -64,6 +65,8 @@ def create(dataset,
         def set_shape(entry):
             for key in key_list:
                 entry[key].set_shape(data_shapes[key])
+            # images are uint8 (decoded once in the image cache)
+            entry['image'] = tf.to_float(entry['image'])
             return entry
         tf_dataset = tf_dataset.map(set_shape)
 
@@ -2,13 +2,25 @@ import h5py
 import os
 import tensorflow as tf
 
+from util import input_tuner
+
+DEFAULT_PIPELINE_CONFIG = {
+    'cycle_length': 10,
+    'num_parallel_calls': None,
+    'prefetch': 10,
+    'shuffle_buffer': 3000,
+}
+
 
 def create(batch_size,
            tf_record_dir,
            split,
            is_train=True,
            scope='vqa_tf_record',
-           shuffle=True):
+           shuffle=True,
+           pipeline_config=None):
+    pipeline_config = input_tuner.merge_config(
+        DEFAULT_PIPELINE_CONFIG, pipeline_config)
 
     tf_record_info_path = os.path.join(tf_record_dir, 'data_info.hdf5')
     with h5py.File(tf_record_info_path, 'r') as f:
@@ -20,10 +32,12 @@ def create(batch_size,
 
         dataset = files.apply(
             tf.contrib.data.parallel_interleave(
-                tf.data.TFRecordDataset, cycle_length=10, block_length=1))
+                tf.data.TFRecordDataset,
+                cycle_length=pipeline_config['cycle_length'], block_length=1))
 
         if is_train and shuffle:
-            dataset = dataset.shuffle(buffer_size=3000)
+            dataset = dataset.shuffle(
+                buffer_size=pipeline_config['shuffle_buffer'])
 
         def parse_fn(example):
             example_fmt = {
@@ -58,7 +72,9 @@ def create(batch_size,
             inputs['q_intseq'].set_shape([None])
             return inputs
 
-        dataset = dataset.map(map_func=parse_fn)
+        dataset = dataset.map(
+            map_func=parse_fn,
+            num_parallel_calls=pipeline_config['num_parallel_calls'])
         dataset = dataset.padded_batch(
             batch_size=batch_size,
             padded_shapes={
@@ -72,11 +88,11 @@ def create(batch_size,
         if is_train:
             dataset = dataset.cache()  # cache to memory
 
-        dataset = dataset.prefetch(buffer_size=10)
+        dataset = dataset.prefetch(buffer_size=pipeline_config['prefetch'])
 
         if is_train:
             dataset = dataset.repeat(1000)
-        iterator = dataset.make_one_shot_iterator()
+        iterator = input_tuner.make_iterator(dataset, pipeline_config)
         batch_ops = iterator.get_next()
 
         return batch_ops
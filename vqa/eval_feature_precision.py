@@ -0,0 +1,121 @@
+"""
+Accuracy vs memory of the reduced precision visual features.
+
+Evaluates one checkpoint with the float32 features and with each converted
+file of data/tools/quantize_vfeat.py, then reports the in-memory feature
+size and every averaged eval metric with its difference to float32.
+
+    python vqa/eval_feature_precision.py \\
+        --checkpoint train_dir/vqa_.../model-4801 --dtypes float16 int8
+
+The report is saved in <checkpoint>_feature_precision_<split>.json.
+"""
+import argparse
+import cPickle
+import json
+import os
+import numpy as np
+
+from util import log
+from util.feature_quantization import (
+    FEATURE_DTYPES, get_feature_dtype, load_image_features,
+    quantized_vfeat_path)
+from util.session_config import add_session_arguments
+from util.vfeat_view import open_vfeat
+
+REPORT_KEYS = ['answer_acc', 'test_acc', 'normal_test_acc',
+               'normal_test_object_acc', 'normal_test_attribute_acc',
+               'testonly_score']
+
+
+def load_features(vfeat_path):
+    log.infov('loading image features: {}'.format(vfeat_path))
+    image_features = {}
+    with open_vfeat(vfeat_path) as f:
+        image_features['feature_dtype'] = get_feature_dtype(f)
+        image_features['features'] = load_image_features(f)
+        image_features['spatials'] = np.array(f.get('spatial_features'))
+        image_features['normal_boxes'] = np.array(f.get('normal_boxes'))
+        image_features['num_boxes'] = np.array(f.get('num_boxes'))
+        image_features['max_box_num'] = int(f['data_info']['max_box_num'].value)
+        image_features['vfeat_dim'] = int(f['data_info']['vfeat_dim'].value)
+    log.infov('done')
+    return image_features
+
+
+def evaluate(config, image_features):
+    import tensorflow as tf
+    from vqa.evaler import Evaler
+
+    evaler = Evaler(config, image_features=image_features)
+    evaler.eval()
+    evaler.session.close()
+    tf.reset_default_graph()
+    result = cPickle.load(open(evaler.save_pkl, 'rb'))
+    return result['avg_eval_report']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--checkpoint', type=str, required=True)
+    parser.add_argument('--dtypes', nargs='+', type=str,
+                        default=['float16', 'int8'],
+                        choices=FEATURE_DTYPES[1:], help=' ')
+    parser.add_argument('--image_dir', type=str, default='data/VQA_v2/images',
+                        help=' ')
+    parser.add_argument('--vocab_name', type=str, default='vocab.pkl', help=' ')
+    parser.add_argument('--max_iter', type=int, default=-1, help=' ')
+    parser.add_argument('--split', type=str, default='testval', help=' ',
+                        choices=['train', 'val', 'testval', 'test'])
+    parser.add_argument('--batch_size', type=int, default=512, help=' ')
+    add_session_arguments(parser)
+    config = parser.parse_args()
+    from vqa.evaler import parse_checkpoint
+    parse_checkpoint(config)
+    config.debug = 0
+    config.dump_heavy_output = False
+    config.question_cache_size = 0
+
+    base_vfeat_path = config.vfeat_path
+    report = {}
+    for dtype in ['float32'] + config.dtypes:
+        config.vfeat_path = quantized_vfeat_path(base_vfeat_path, dtype)
+        if not os.path.exists(config.vfeat_path):
+            raise ValueError('Convert the features first '
+                             '(data/tools/quantize_vfeat.py): {}'.format(
+                                 config.vfeat_path))
+        image_features = load_features(config.vfeat_path)
+        if image_features['feature_dtype'] != dtype:
+            raise ValueError('{} stores {} features'.format(
+                config.vfeat_path, image_features['feature_dtype']))
+        report[dtype] = {
+            'feature_mb': image_features['features'].nbytes / 1e6,
+            'file_mb': os.path.getsize(config.vfeat_path) / 1e6,
+            'avg_eval_report': {
+                key: float(value) for key, value in
+                evaluate(config, image_features).items()},
+        }
+        del image_features
+
+    report_path = '{}_feature_precision_{}.json'.format(
+        config.checkpoint, config.split)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    base = report['float32']['avg_eval_report']
+    keys = [key for key in REPORT_KEYS if key in base]
+    log.warn('{:<8} {:>12} {:>10}'.format('dtype', 'memory (MB)', 'file (MB)') +
+             ''.join(' {:>28}'.format(key) for key in keys))
+    for dtype in ['float32'] + config.dtypes:
+        r = report[dtype]
+        scores = r['avg_eval_report']
+        log.infov('{:<8} {:>12.1f} {:>10.1f}'.format(
+            dtype, r['feature_mb'], r['file_mb']) + ''.join(
+                ' {:>18.5f} ({:+.5f})'.format(
+                    scores[key], scores[key] - base[key]) for key in keys))
+    log.warn('report is saved in: {}'.format(report_path))
+
+
+if __name__ == '__main__':
+    main()
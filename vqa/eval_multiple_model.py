@@ -1,13 +1,12 @@
 import argparse
 import glob
-import h5py
 import os
 import numpy as np
 
-import tensorflow as tf
-
 from util import log
-from vqa.evaler import Evaler
+from util.feature_quantization import load_image_features
+from util.session_config import add_session_arguments
+from util.vfeat_view import open_vfeat
 
 
 def check_config(config):
@@ -57,9 +56,16 @@ def main():
     parser.add_argument('--dump_heavy_output', action='store_true', default=False,
                         help=' ')
     parser.add_argument('--debug', type=int, default=0, help='0: normal, 1: debug')
+    parser.add_argument('--question_cache_size', type=int, default=0,
+                        help='LRU cache of question encodings (0: off)')
+    add_session_arguments(parser)
     config = parser.parse_args()
     check_config(config)
 
+    # TensorFlow and the models are only needed past argument parsing
+    import tensorflow as tf
+    from vqa.evaler import Evaler
+
     if config.root_train_dir is None:
         all_train_dirs = config.train_dirs
     else:
@@ -90,8 +96,8 @@ def main():
 
     log.infov('loading image features...')
     image_features = {}
-    with h5py.File(config.vfeat_path, 'r') as f:
-        image_features['features'] = np.array(f.get('image_features'))
+    with open_vfeat(config.vfeat_path) as f:
+        image_features['features'] = load_image_features(f)
         log.infov('feature done')
         image_features['spatials'] = np.array(f.get('spatial_features'))
         log.infov('spatials done')
@@ -9,7 +9,10 @@ import tensorflow as tf
 from tqdm import tqdm
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
 from vqa import importer
+from vqa.question_cache import CachedQuestionEncoder
 from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
 
 
@@ -44,6 +47,15 @@ class Evaler(object):
         self.model = Model(self.batch, config, is_train=False,
                            image_features=image_features)
 
+        self.question_encoder = None
+        question_cache_size = getattr(config, 'question_cache_size', 0)
+        if question_cache_size > 0:
+            if CachedQuestionEncoder.supports(self.model, self.batch):
+                self.question_encoder = CachedQuestionEncoder(
+                    self.model, self.batch, question_cache_size)
+            else: log.warn('{} does not support the question cache'.format(
+                config.model_type))
+
         trainable_vars = tf.trainable_variables()
         train_vars = self.model.filter_train_vars(trainable_vars)
         log.warn('Trainable variables:')
@@ -51,11 +63,9 @@ class Evaler(object):
         log.warn('Filtered train variables:')
         tf.contrib.slim.model_analyzer.analyze_vars(train_vars, print_info=True)
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
         self.session = tf.Session(config=session_config)
+        modules.initialize_data_variables(self.session)
 
         self.checkpoint_loader = tf.train.Saver(max_to_keep=1)
 
@@ -80,8 +90,22 @@ class Evaler(object):
             log.info('Checkpoint path: {}'.format(config.checkpoint))
             self.checkpoint_loader.restore(self.session, config.checkpoint)
             log.info('Loaded the checkpoint')
+            if self.question_encoder is not None:
+                self.question_encoder.reset()
         log.warn('Evaluation initialization is done')
 
+    def get_question_cache_feed(self):
+        """
+        With the question cache, the batch is fetched first and fed back
+        together with the cached question encodings.
+        """
+        if self.question_encoder is None: return None
+        batch = self.session.run(self.batch)
+        feed_dict = {self.batch[key]: batch[key] for key in batch}
+        feed_dict.update(self.question_encoder.feed_dict(
+            self.session, batch['q_intseq'], batch['q_intseq_len']))
+        return feed_dict
+
     def eval(self):
         log.infov('Training starts')
 
@@ -117,7 +141,8 @@ class Evaler(object):
         if self.max_iter < 0: self.max_iter = 50000
         for s in tqdm(range(self.max_iter), desc='eval'):
             try:
-                fetch = self.session.run(fetch_list)
+                fetch = self.session.run(
+                    fetch_list, feed_dict=self.get_question_cache_feed())
             except tf.errors.OutOfRangeError:
                 log.warn('OutOfRangeError happens at {} iter'.format(s + 1))
                 break
@@ -169,6 +194,9 @@ class Evaler(object):
                 for key in reports:
                     avg_eval_report[key].append(reports[key])
 
+        if self.question_encoder is not None:
+            result_dict['question_cache'] = self.question_encoder.stats()
+            log.infov('question cache: {}'.format(result_dict['question_cache']))
         result_dict['avg_eval_report'] = {
             key: np.array(avg_eval_report[key], dtype=np.float32).mean()
             for key in avg_eval_report}
@@ -230,6 +258,9 @@ def main():
     parser.add_argument('--debug', type=int, default=0, help='0: normal, 1: debug')
     parser.add_argument('--dump_heavy_output', action='store_true', default=False,
                         help=' ')
+    parser.add_argument('--question_cache_size', type=int, default=0,
+                        help='LRU cache of question encodings (0: off)')
+    add_session_arguments(parser)
     config = parser.parse_args()
     check_config(config)
     parse_checkpoint(config)
@@ -0,0 +1,245 @@
+"""
+Export a VQA checkpoint as a frozen inference graph.
+
+The model is built with is_train=False on placeholder inputs, the variables
+of the checkpoint are folded into constants and everything the answers do
+not depend on is pruned: Adam slots, the dataset switch, summaries, the
+losses and the image feature DataVariables. The visual features become
+inputs, and the tf.nn.dropout applied unconditionally by some models is
+removed.
+
+    python vqa/export_inference_graph.py --checkpoint train_dir/vqa_.../model-4801
+
+writes <train_dir>/inference_graph_model-4801/ with
+    - frozen_graph.pb
+    - serving_info.json: input / output tensor names and feature shapes
+    - vocab.pkl, answer_dict.pkl
+
+Inputs: q_intseq [bs, len], q_intseq_len [bs], V_ft [bs, max_box_num,
+vfeat_dim], num_V_ft [bs] and normal_boxes [bs, max_box_num, 4] (only for
+the models using the boxes). Only the models taking image_features (the
+features are preloaded DataVariables) can be exported. FrozenVQAGraph loads
+the export.
+vqa/benchmark_inference_graph.py compares it to restoring the checkpoint.
+"""
+import argparse
+import cPickle
+import json
+import os
+import numpy as np
+import tensorflow as tf
+
+from util import log
+from util.session_config import add_session_arguments, get_session_config
+from util.vfeat_view import open_vfeat
+from vqa import importer
+from vqa.inference import parse_checkpoint
+from vqa.inference_server import VQAPredictor, accepts_image_features, \
+    find_dropouts
+
+GRAPH_NAME = 'frozen_graph.pb'
+INFO_NAME = 'serving_info.json'
+
+TRANSFORMS = [
+    'fold_constants(ignore_errors=true)',
+    'fold_batch_norms',
+    'fold_old_batch_norms',
+    'sort_by_execution_order',
+]
+
+
+def tensor_input_name(tensor_name):
+    """ 'op:0' -> 'op' (NodeDef.input format) """
+    return tensor_name[:-2] if tensor_name.endswith(':0') else tensor_name
+
+
+def find_feature_tensors(graph):
+    """
+    Returns:
+        - {input name: tensor name} of the tensors the models derive from
+            image_idx and the in-memory features
+    """
+    features = {}
+    py_funcs = [op for op in graph.get_operations()
+                if op.type in ('PyFunc', 'PyFuncStateless')]
+    if len(py_funcs) != 1:
+        raise ValueError('Expected one feature loading py_func, found {}'.format(
+            [op.name for op in py_funcs]))
+    features['V_ft'] = py_funcs[0].outputs[0].name
+    for op in graph.get_operations():
+        if op.name.endswith('gather_num_V_ft'):
+            features['num_V_ft'] = op.outputs[0].name
+        elif op.name.endswith('gather_normal_boxes'):
+            features['normal_boxes'] = op.outputs[0].name
+    if 'num_V_ft' not in features:
+        raise ValueError('No gather_num_V_ft op in the graph')
+    return features
+
+
+def rewire(graph_def, replace):
+    """ Make every node read replace[tensor] instead of tensor (in place). """
+    replace = {tensor_input_name(k): tensor_input_name(v)
+               for k, v in replace.items()}
+    for node in graph_def.node:
+        for i, name in enumerate(node.input):
+            if name in replace: node.input[i] = replace[name]
+
+
+def dummy_image_features(vfeat_path):
+    """ Shapes of the features without loading them. """
+    with open_vfeat(vfeat_path) as f:
+        max_box_num = int(f['data_info']['max_box_num'].value)
+        vfeat_dim = int(f['data_info']['vfeat_dim'].value)
+    return {
+        'features': np.zeros([1, max_box_num, vfeat_dim], dtype=np.float32),
+        'spatials': np.zeros([1, max_box_num, 6], dtype=np.float32),
+        'normal_boxes': np.zeros([1, max_box_num, 4], dtype=np.float32),
+        'num_boxes': np.ones([1], dtype=np.int32),
+        'max_box_num': max_box_num,
+        'vfeat_dim': vfeat_dim,
+    }
+
+
+def export(config, save_dir):
+    predictor = VQAPredictor(config, image_features=dummy_image_features(
+        config.vfeat_path))
+    graph = predictor.session.graph
+    model = predictor.model
+
+    with tf.name_scope('serving'):
+        feature_inputs = {
+            'V_ft': tf.placeholder(
+                tf.float32, [None, model.max_box_num, model.vfeat_dim],
+                name='V_ft'),
+            'num_V_ft': tf.placeholder(tf.int32, [None], name='num_V_ft'),
+            'normal_boxes': tf.placeholder(
+                tf.float32, [None, model.max_box_num, 4], name='normal_boxes'),
+        }
+    feature_tensors = find_feature_tensors(graph)
+    dropouts = find_dropouts(graph)
+    log.warn('Remove {} dropout op(s): {}'.format(
+        len(dropouts), sorted(dropouts.keys())))
+
+    replace = dict(dropouts)
+    for key, tensor_name in feature_tensors.items():
+        replace[tensor_name] = feature_inputs[key].name
+
+    outputs = {
+        'scores': predictor.scores.name,
+        'top_k_scores': predictor.top_k.values.name,
+        'top_k_answers': predictor.top_k.indices.name,
+    }
+    output_nodes = sorted(set(name.split(':')[0] for name in outputs.values()))
+
+    graph_def = graph.as_graph_def()
+    rewire(graph_def, replace)
+    # unused nodes are pruned here, before folding the variables
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, output_nodes)
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        predictor.session, graph_def, output_nodes)
+
+    input_candidates = dict(feature_inputs, q_intseq=predictor.batch['q_intseq'],
+                            q_intseq_len=predictor.batch['q_intseq_len'])
+    node_names = set(node.name for node in graph_def.node)
+    inputs = {key: tensor.name for key, tensor in input_candidates.items()
+              if tensor.op.name in node_names}
+    if predictor.batch['image_idx'].op.name in node_names:
+        raise ValueError('The frozen graph still depends on image_idx')
+
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+        graph_def = TransformGraph(
+            graph_def, [tensor_input_name(n) for n in inputs.values()],
+            output_nodes, TRANSFORMS)
+    except ImportError:
+        log.warn('graph_transforms is not available, constants are not folded')
+
+    graph_path = os.path.join(save_dir, GRAPH_NAME)
+    with tf.gfile.GFile(graph_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    log.warn('frozen graph ({} nodes, {:.1f}MB) is saved in: {}'.format(
+        len(graph_def.node), os.path.getsize(graph_path) / 1e6, graph_path))
+
+    info = {
+        'checkpoint': config.checkpoint,
+        'model_type': config.model_type,
+        'inputs': inputs,
+        'outputs': outputs,
+        'max_box_num': model.max_box_num,
+        'vfeat_dim': model.vfeat_dim,
+        'vfeat_path': config.vfeat_path,
+        'removed_dropouts': sorted(dropouts.keys()),
+    }
+    with open(os.path.join(save_dir, INFO_NAME), 'w') as f:
+        json.dump(info, f, indent=2, sort_keys=True)
+    cPickle.dump(model.vocab, open(os.path.join(save_dir, 'vocab.pkl'), 'wb'))
+    cPickle.dump(model.answer_dict, open(
+        os.path.join(save_dir, 'answer_dict.pkl'), 'wb'))
+    predictor.session.close()
+    return info
+
+
+class FrozenVQAGraph(object):
+
+    def __init__(self, export_dir, num_cores=None, use_gpu=False):
+        with open(os.path.join(export_dir, INFO_NAME), 'r') as f:
+            self.info = json.load(f)
+        self.vocab = cPickle.load(open(
+            os.path.join(export_dir, 'vocab.pkl'), 'rb'))
+        self.answer_dict = cPickle.load(open(
+            os.path.join(export_dir, 'answer_dict.pkl'), 'rb'))
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(os.path.join(export_dir, GRAPH_NAME), 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.graph.finalize()
+        self.session = tf.Session(graph=self.graph, config=get_session_config(
+            num_cores, use_gpu=use_gpu))
+
+    def predict(self, inputs, fetch=('top_k_scores', 'top_k_answers')):
+        """
+        Args:
+            - inputs: {input name: array}, see serving_info.json
+        """
+        feed_dict = {self.info['inputs'][key]: inputs[key]
+                     for key in self.info['inputs']}
+        return self.session.run(
+            [self.info['outputs'][key] for key in fetch], feed_dict=feed_dict)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--checkpoint', type=str, required=True,
+                        help='ex) train_dir/vqa_.../model-4801')
+    parser.add_argument('--image_dir', type=str, default='data/VQA_v2/images',
+                        help=' ')
+    parser.add_argument('--vocab_name', type=str, default='vocab.pkl', help=' ')
+    parser.add_argument('--max_top_k', type=int, default=10, help=' ')
+    add_session_arguments(parser)
+    config = parser.parse_args()
+    parse_checkpoint(config)
+    config.debug = 0
+    config.cpu = True
+    if not accepts_image_features(importer.get_model_class(config.model_type)):
+        raise ValueError('{} can not be exported: it does not take '
+                         'image_features'.format(config.model_type))
+
+    ckpt_dir = os.path.dirname(config.checkpoint)
+    ckpt_name = os.path.basename(config.checkpoint)
+    save_dir = os.path.join(ckpt_dir, 'inference_graph_{}'.format(ckpt_name))
+    if not os.path.exists(save_dir):
+        log.warn('create directory: {}'.format(save_dir))
+        os.makedirs(save_dir)
+    else:
+        raise ValueError('Do not overwrite: {}'.format(save_dir))
+
+    export(config, save_dir)
+    log.warn('done')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ import os
 import tensorflow as tf
 
 from util import log
+from util.session_config import get_session_config
+from vlmap import modules
 from vqa import importer
 from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
 
@@ -57,12 +59,10 @@ class Inference(object):
 
         self.checkpoint_loader = tf.train.Saver(max_to_keep=1)
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = tf.Session(config=session_config)
+        modules.initialize_data_variables(self.session)
 
         self.ckpt_path = config.checkpoint
         if self.ckpt_path is not None:
@@ -101,6 +101,7 @@ def get_default_config():
     config.vocab_name = 'vocab.pkl'
     config.checkpoint = None
     config.batch_size = 512
+    config.num_cores = 0
     return config
 
 
@@ -0,0 +1,127 @@
+"""
+Local client of vqa/inference_server.py.
+
+Sends questions from concurrent threads and prints the answers, the client
+side latencies and the /metrics of the server:
+
+    python vqa/inference_client.py --question "what color is the car?" --image_idx 0
+    python vqa/inference_client.py --num_requests 2000 --concurrency 32
+
+Does not import TensorFlow.
+"""
+import argparse
+import json
+import threading
+import time
+import urllib2
+import numpy as np
+
+from util import log
+
+DEFAULT_QUESTIONS = [
+    'what color is the car?',
+    'what is the man holding?',
+    'how many people are there?',
+    'what animal is this?',
+    'is the light on?',
+]
+
+
+def post(url, obj, timeout=60):
+    request = urllib2.Request(url, json.dumps(obj),
+                              {'Content-Type': 'application/json'})
+    try:
+        return json.loads(urllib2.urlopen(request, timeout=timeout).read())
+    except urllib2.HTTPError as e:
+        raise ValueError('{}: {}'.format(e.code, e.read()))
+
+
+def get(url, timeout=60):
+    return json.loads(urllib2.urlopen(url, timeout=timeout).read())
+
+
+def run_load(url, requests, concurrency):
+    """
+    Returns:
+        - latencies of the successful requests (seconds)
+        - number of failed requests
+        - wall time (seconds)
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    next_idx = [0]
+
+    def worker():
+        while True:
+            with lock:
+                if next_idx[0] >= len(requests): return
+                request = requests[next_idx[0]]
+                next_idx[0] += 1
+            start = time.time()
+            try:
+                post(url, request)
+            except Exception as e:
+                with lock: errors[0] += 1
+                log.error('{}: {}'.format(request, e))
+                continue
+            with lock: latencies.append(time.time() - start)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return latencies, errors[0], time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--url', type=str, default='http://127.0.0.1:8080')
+    parser.add_argument('--question', type=str, default=None,
+                        help='ask a single question and print the answers')
+    parser.add_argument('--image_idx', type=int, default=0, help=' ')
+    parser.add_argument('--top_k', type=int, default=5, help=' ')
+    parser.add_argument('--num_requests', type=int, default=1000,
+                        help='load test: number of requests')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='load test: number of client threads')
+    parser.add_argument('--num_images', type=int, default=100,
+                        help='load test: image_idx are drawn from [0, num_images)')
+    parser.add_argument('--seed', type=int, default=123, help=' ')
+    config = parser.parse_args()
+    url = config.url.rstrip('/')
+
+    if config.question is not None:
+        result = post(url + '/answer', {
+            'image_idx': config.image_idx, 'question': config.question,
+            'top_k': config.top_k})
+        log.infov('tokens: {} (unknown: {})'.format(
+            result['tokens'], result['unknown_tokens']))
+        for answer in result['answers']:
+            log.info('{:.4f} {}'.format(answer['score'], answer['answer']))
+        return
+
+    rng = np.random.RandomState(config.seed)
+    requests = [{
+        'image_idx': int(rng.randint(config.num_images)),
+        'question': DEFAULT_QUESTIONS[rng.randint(len(DEFAULT_QUESTIONS))],
+        'top_k': config.top_k,
+    } for _ in range(config.num_requests)]
+
+    latencies, num_errors, wall_time = run_load(
+        url + '/answer', requests, config.concurrency)
+    if latencies:
+        latencies_ms = np.array(latencies) * 1000.0
+        log.infov('client: {} requests ({} failed) in {:.2f}s, {:.1f} qps, '
+                  'p50 {:.1f}ms, p99 {:.1f}ms'.format(
+                      len(requests), num_errors, wall_time,
+                      len(latencies) / wall_time,
+                      np.percentile(latencies_ms, 50),
+                      np.percentile(latencies_ms, 99)))
+    else: log.error('all {} requests failed'.format(len(requests)))
+    log.infov('server: {}'.format(json.dumps(get(url + '/metrics'), sort_keys=True)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+"""
+Online VQA inference over HTTP.
+
+The checkpoint is loaded once, questions are tokenized with the vocab of the
+training data and concurrent requests are answered in micro batches: a batch
+is run as soon as it holds max_batch_size requests or its oldest request
+has waited max_latency_ms.
+
+    python vqa/inference_server.py --checkpoint train_dir/vqa_.../model-4801 --cpu
+    curl -d '{"image_idx": 0, "question": "what color is the car?"}' \\
+        localhost:8080/answer
+    curl localhost:8080/metrics
+
+Endpoints:
+    - POST /answer {"image_idx": int, "question": str, "top_k": int (opt)}
+        -> {"answers": [{"answer": str, "score": float}], "tokens": [...],
+            "unknown_tokens": [...]}
+    - GET /metrics: p50 / p99 latency, throughput, batch sizes and the
+        hit rate of the question cache (vqa/question_cache.py)
+    - GET /health
+
+vqa/inference_client.py sends concurrent requests to a running server.
+"""
+import argparse
+import collections
+import h5py
+import inspect
+import json
+import os
+import Queue
+import re
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+from util import log
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
+from vqa import importer
+from vqa.inference import parse_checkpoint
+from vqa.question_cache import CachedQuestionEncoder
+
+
+class QuestionEncoder(object):
+    """ Tokenization of data/tools/vqa_v2/qa_split_*.py """
+
+    TOKEN_PATTERN = re.compile(r"'s+|[\w]+|[.,!?;-]")
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+        self.unk_id = vocab['dict']['<unk>']
+
+    def tokenize(self, question):
+        return self.TOKEN_PATTERN.findall(question.lower())
+
+    def encode(self, question):
+        """
+        Returns:
+            - tokens
+            - intseq: ids of the tokens (<unk> for the unknown ones)
+        """
+        tokens = self.tokenize(question)
+        intseq = [self.vocab['dict'].get(t, self.unk_id) for t in tokens]
+        return tokens, intseq
+
+
+def find_dropouts(graph):
+    """
+    Returns:
+        - {output tensor name: input tensor name} of the tf.nn.dropout ops
+            (ret = x / keep_prob * floor(keep_prob + uniform))
+    """
+    dropouts = {}
+    for op in graph.get_operations():
+        if op.type != 'Mul' or 'dropout' not in op.name: continue
+        div, floor = op.inputs[0].op, op.inputs[1].op
+        if floor.type == 'Floor' and div.type in ('RealDiv', 'Div'):
+            dropouts[op.outputs[0].name] = div.inputs[0].name
+    return dropouts
+
+
+def dropout_bypass_feeds(graph):
+    """
+    Some models apply tf.nn.dropout whatever is_train is. Feeding 1 to the
+    keep_prob of the dropouts of find_dropouts makes them the identity
+    (x / 1 * floor(1 + uniform) = x).
+
+    Returns:
+        - {keep_prob tensor name: 1.0}
+    """
+    feeds = {}
+    for name in find_dropouts(graph):
+        div = graph.get_tensor_by_name(name).op.inputs[0].op
+        feeds[div.inputs[1].name] = 1.0
+    return feeds
+
+
+def accepts_image_features(Model):
+    """ Whether the model can be built on preloaded image_features. """
+    return 'image_features' in inspect.getargspec(Model.__init__).args
+
+
+class VQAPredictor(object):
+    """ Graph fed by placeholders instead of the tf_record input pipeline. """
+
+    def __init__(self, config, image_features=None):
+        """
+        Args:
+            - image_features: see vqa/model_*.py (default: loaded from
+                config.vfeat_path), only for the models of
+                accepts_image_features
+        """
+        self.config = config
+        self.max_top_k = config.max_top_k
+
+        with h5py.File(os.path.join(
+                config.tf_record_dir, 'data_info.hdf5'), 'r') as f:
+            num_answers = int(f['data_info']['num_answers'].value)
+
+        with tf.name_scope('serving'):
+            image_idx = tf.placeholder(tf.int32, [None], name='image_idx')
+            q_intseq = tf.placeholder(tf.int32, [None, None], name='q_intseq')
+            q_intseq_len = tf.placeholder(tf.int32, [None], name='q_intseq_len')
+            batch_size = tf.shape(image_idx)[0]
+            self.batch = {
+                'id': tf.range(tf.cast(batch_size, tf.int64), dtype=tf.int64),
+                'image_id': tf.as_string(image_idx),
+                'image_idx': image_idx,
+                'q_intseq': q_intseq,
+                'q_intseq_len': q_intseq_len,
+                # the losses are built but not fetched
+                'answer_target': tf.zeros([batch_size, num_answers]),
+            }
+
+        Model = importer.get_model_class(config.model_type)
+        log.infov('using model class: {}'.format(Model))
+        model_kwargs = {}
+        if image_features is not None:
+            if not accepts_image_features(Model):
+                raise ValueError('{} can not be built on preloaded image '
+                                 'features'.format(config.model_type))
+            model_kwargs['image_features'] = image_features
+        self.model = Model(self.batch, config, is_train=False, **model_kwargs)
+        self.vocab = self.model.vocab
+        self.answer_vocab = self.model.answer_dict['vocab']
+        self.num_images = len(self.model.num_boxes)
+
+        self.question_encoder = None
+        if getattr(config, 'question_cache_size', 0) > 0:
+            if CachedQuestionEncoder.supports(self.model, self.batch):
+                self.question_encoder = CachedQuestionEncoder(
+                    self.model, self.batch, config.question_cache_size)
+            else: log.warn('{} does not support the question cache'.format(
+                config.model_type))
+
+        with tf.name_scope('serving'):
+            self.scores = tf.nn.sigmoid(self.model.output['logit'], name='scores')
+            self.top_k = tf.nn.top_k(
+                self.scores, k=min(self.max_top_k, len(self.answer_vocab)),
+                name='top_k')
+        self.bypass_feeds = dropout_bypass_feeds(tf.get_default_graph())
+        if self.bypass_feeds:
+            log.warn('Bypass {} dropout op(s)'.format(len(self.bypass_feeds)))
+
+        self.session = tf.Session(config=get_session_config(
+            config.num_cores, use_gpu=not getattr(config, 'cpu', False)))
+        modules.initialize_data_variables(self.session)
+        tf.train.Saver().restore(self.session, config.checkpoint)
+        log.info('Loaded the checkpoint: {}'.format(config.checkpoint))
+
+    def predict(self, image_idx, intseqs):
+        """
+        Args:
+            - image_idx: [bs]
+            - intseqs: [bs] question intseqs of any length
+        Returns:
+            - scores, answer ids: [bs, max_top_k], best first
+        """
+        lengths = [len(intseq) for intseq in intseqs]
+        padded = np.zeros([len(intseqs), max(max(lengths), 1)], dtype=np.int32)
+        for i, intseq in enumerate(intseqs):
+            padded[i, :len(intseq)] = intseq
+        lengths = np.array(lengths, dtype=np.int32)
+        feed_dict = {
+            self.batch['image_idx']: np.array(image_idx, dtype=np.int32),
+            self.batch['q_intseq']: padded,
+            self.batch['q_intseq_len']: lengths,
+        }
+        feed_dict.update(self.bypass_feeds)
+        if self.question_encoder is not None:
+            feed_dict.update(self.question_encoder.feed_dict(
+                self.session, padded, lengths))
+        top_k = self.session.run(self.top_k, feed_dict=feed_dict)
+        return top_k.values, top_k.indices
+
+    def check_deterministic(self, image_idx=0, intseq=(1, 2, 3)):
+        """ Two identical requests must return identical scores. """
+        scores = [self.predict([image_idx], [list(intseq)])[0]
+                  for _ in range(2)]
+        if not np.array_equal(scores[0], scores[1]):
+            raise ValueError('The answers of {} are not deterministic: {} vs '
+                             '{}'.format(self.config.checkpoint, scores[0],
+                                         scores[1]))
+
+
+class LatencyStats(object):
+
+    def __init__(self, window=10000):
+        """
+        Args:
+            - window: number of recent requests / batches the percentiles
+                and the throughput are computed over
+        """
+        self.lock = threading.Lock()
+        self.requests = collections.deque(maxlen=window)  # (end, latency)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.start_time = time.time()
+        self.num_requests = 0
+        self.num_errors = 0
+
+    def add_request(self, latency, error=False):
+        with self.lock:
+            self.requests.append((time.time(), latency))
+            self.num_requests += 1
+            if error: self.num_errors += 1
+
+    def add_batch(self, batch_size):
+        with self.lock:
+            self.batch_sizes.append(batch_size)
+
+    def summary(self):
+        with self.lock:
+            requests = list(self.requests)
+            batch_sizes = list(self.batch_sizes)
+            num_requests, num_errors = self.num_requests, self.num_errors
+        summary = {
+            'num_requests': num_requests,
+            'num_errors': num_errors,
+            'uptime_secs': time.time() - self.start_time,
+        }
+        if requests:
+            latencies_ms = np.array([l for _, l in requests]) * 1000.0
+            summary['latency_p50_ms'] = float(np.percentile(latencies_ms, 50))
+            summary['latency_p99_ms'] = float(np.percentile(latencies_ms, 99))
+            # from the arrival of the oldest request to the latest answer
+            elapsed = requests[-1][0] - (requests[0][0] - requests[0][1])
+            summary['throughput_qps'] = len(requests) / max(elapsed, 1e-6)
+        if batch_sizes:
+            summary['mean_batch_size'] = float(np.mean(batch_sizes))
+        return summary
+
+
+class _Request(object):
+
+    def __init__(self, item):
+        self.item = item
+        self.arrival = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    """
+    Groups the items submitted from concurrent threads and runs
+    run_batch(items) -> results on a single worker thread.
+    """
+
+    def __init__(self, run_batch, max_batch_size=64, max_latency_ms=10.0,
+                 stats=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.stats = stats or LatencyStats()
+        self.queue = Queue.Queue()
+        self.worker = threading.Thread(target=self._loop, name='micro_batcher')
+        self.worker.daemon = True
+        self.worker.start()
+
+    def submit(self, item):
+        """ Blocks until the batch of the item is run. """
+        request = _Request(item)
+        self.queue.put(request)
+        request.done.wait()
+        self.stats.add_request(time.time() - request.arrival,
+                               error=request.error is not None)
+        if request.error is not None: raise request.error
+        return request.result
+
+    def _collect(self):
+        requests = [self.queue.get()]
+        deadline = requests[0].arrival + self.max_latency
+        while len(requests) < self.max_batch_size:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0: requests.append(self.queue.get(timeout=timeout))
+                else: requests.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return requests
+
+    def _loop(self):
+        while True:
+            requests = self._collect()
+            self.stats.add_batch(len(requests))
+            try:
+                results = self.run_batch([r.item for r in requests])
+            except Exception as e:
+                log.error('Batch of {} failed: {}'.format(len(requests), e))
+                for request in requests:
+                    request.error = e
+                    request.done.set()
+                continue
+            for request, result in zip(requests, results):
+                request.result = result
+                request.done.set()
+
+
+class InferenceService(object):
+
+    def __init__(self, predictor, max_batch_size=64, max_latency_ms=10.0):
+        self.predictor = predictor
+        self.encoder = QuestionEncoder(predictor.vocab)
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(self._run_batch, max_batch_size,
+                                    max_latency_ms, self.stats)
+
+    def _run_batch(self, items):
+        scores, answer_ids = self.predictor.predict(
+            [image_idx for image_idx, _ in items],
+            [intseq for _, intseq in items])
+        return zip(scores, answer_ids)
+
+    def answer(self, image_idx, question, top_k=5):
+        if not 0 <= image_idx < self.predictor.num_images:
+            raise ValueError('image_idx should be in [0, {})'.format(
+                self.predictor.num_images))
+        tokens, intseq = self.encoder.encode(question)
+        if len(intseq) == 0:
+            raise ValueError('Empty question')
+        scores, answer_ids = self.batcher.submit((image_idx, intseq))
+        top_k = min(top_k, len(scores))
+        return {
+            'answers': [{'answer': self.predictor.answer_vocab[i],
+                         'score': float(s)}
+                        for s, i in zip(scores[:top_k], answer_ids[:top_k])],
+            'tokens': tokens,
+            'unknown_tokens': [t for t, i in zip(tokens, intseq)
+                               if i == self.encoder.unk_id],
+        }
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def _reply(self, code, obj):
+            body = json.dumps(obj)
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                metrics = service.stats.summary()
+                if service.predictor.question_encoder is not None:
+                    metrics['question_cache'] = \
+                        service.predictor.question_encoder.stats()
+                self._reply(200, metrics)
+            elif self.path == '/health':
+                self._reply(200, {'status': 'ok'})
+            else: self._reply(404, {'error': 'not found: {}'.format(self.path)})
+
+        def do_POST(self):
+            if self.path != '/answer':
+                return self._reply(404, {'error': 'not found: {}'.format(self.path)})
+            try:
+                length = int(self.headers.getheader('content-length', 0))
+                request = json.loads(self.rfile.read(length))
+                result = service.answer(
+                    int(request['image_idx']), request['question'],
+                    int(request.get('top_k', 5)))
+            except (KeyError, ValueError, TypeError) as e:
+                return self._reply(400, {'error': str(e)})
+            except Exception as e:
+                return self._reply(500, {'error': str(e)})
+            self._reply(200, result)
+
+        def log_message(self, format, *args):
+            pass  # one line per request is too much, see /metrics
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--checkpoint', type=str, required=True)
+    parser.add_argument('--image_dir', type=str, default='data/VQA_v2/images',
+                        help=' ')
+    parser.add_argument('--vocab_name', type=str, default='vocab.pkl', help=' ')
+    parser.add_argument('--debug', type=int, default=0,
+                        help='1: dummy image features')
+    # serving
+    parser.add_argument('--host', type=str, default='127.0.0.1', help=' ')
+    parser.add_argument('--port', type=int, default=8080, help=' ')
+    parser.add_argument('--max_batch_size', type=int, default=64, help=' ')
+    parser.add_argument('--max_latency_ms', type=float, default=10.0,
+                        help='longest wait of a request for its batch to fill')
+    parser.add_argument('--max_top_k', type=int, default=10, help=' ')
+    parser.add_argument('--question_cache_size', type=int, default=10000,
+                        help='LRU cache of question encodings (0: off)')
+    parser.add_argument('--cpu', action='store_true', default=False,
+                        help='hide the GPUs')
+    add_session_arguments(parser)
+    config = parser.parse_args()
+    parse_checkpoint(config)
+
+    predictor = VQAPredictor(config)
+    predictor.check_deterministic()
+    service = InferenceService(predictor, config.max_batch_size,
+                               config.max_latency_ms)
+    server = _ThreadingHTTPServer((config.host, config.port),
+                                  make_handler(service))
+    log.warn('Serving {} on http://{}:{}'.format(
+        config.checkpoint, config.host, config.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.warn('Stopped: {}'.format(json.dumps(service.stats.summary())))
+
+
+if __name__ == '__main__':
+    main()
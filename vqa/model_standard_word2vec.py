@@ -1,10 +1,11 @@
 import cPickle
-import h5py
 import os
 import numpy as np
 import tensorflow as tf
 
 from util import box_utils, log, get_dummy_data
+from util.feature_quantization import load_image_features
+from util.vfeat_view import open_vfeat
 from vlmap import modules
 
 W_DIM = 300  # Word dimension
@@ -58,8 +59,8 @@ class Model(object):
                 self.max_box_num, self.vfeat_dim = get_dummy_data()
         elif image_features is None:
             log.infov('loading image features...')
-            with h5py.File(config.vfeat_path, 'r') as f:
-                self.features = np.array(f.get('image_features'))
+            with open_vfeat(config.vfeat_path) as f:
+                self.features = load_image_features(f)
                 log.infov('feature done')
                 self.spatials = np.array(f.get('spatial_features'))
                 log.infov('spatials done')
@@ -114,10 +115,13 @@ class Model(object):
                 load_feature, inp=[self.batch['image_idx']], Tout=tf.float32,
                 name='sample_features')
             V_ft.set_shape([None, self.max_box_num, self.vfeat_dim])
-            num_V_ft = tf.gather(self.num_boxes, self.batch['image_idx'],
+            num_boxes = modules.DataVariable(self.num_boxes, name='num_boxes')
+            num_V_ft = tf.gather(num_boxes, self.batch['image_idx'],
                                  name='gather_num_V_ft', axis=0)
             self.mid_result['num_V_ft'] = num_V_ft
-            normal_boxes = tf.gather(self.normal_boxes, self.batch['image_idx'],
+            normal_boxes = modules.DataVariable(self.normal_boxes,
+                                                name='normal_boxes')
+            normal_boxes = tf.gather(normal_boxes, self.batch['image_idx'],
                                      name='gather_normal_boxes', axis=0)
             self.mid_result['normal_boxes'] = normal_boxes
 
@@ -0,0 +1,145 @@
+"""
+LRU cache of question encodings.
+
+Question strings repeat a lot in VQA v2 ("what color is the ...", "how many
+..."), and the question encoder (GloVe lookup and the modules.encode_L GRU)
+only depends on the token sequence. The models expose its output as
+mid_result['q_L_ft'] or, where it is the encode_L output itself,
+heavy_output['condition']. TensorFlow accepts a feed for any tensor, so
+feeding the cached encodings to it skips the encoder for the whole batch.
+Rows missing from the cache are encoded first by a run of the encoding
+tensor alone, on those rows only.
+
+A model is supported only if the question reaches the logits through the
+encoding tensor alone (see supports()): otherwise the feed would not skip
+the encoder and every miss would cost an extra run.
+"""
+import collections
+import numpy as np
+
+
+def encoding_tensor(model):
+    """ Output of the question encoder of the model, or None. """
+    mid_result = getattr(model, 'mid_result', {})
+    if 'q_L_ft' in mid_result: return mid_result['q_L_ft']
+    return model.heavy_output.get('condition', None)
+
+
+def depends_on(tensor, sources, stop):
+    """ Whether tensor depends on sources other than through stop. """
+    sources = set(sources)
+    visited = set()
+    stack = [tensor]
+    while stack:
+        t = stack.pop()
+        if t is stop or t in visited: continue
+        if t in sources: return True
+        visited.add(t)
+        stack.extend(t.op.inputs)
+    return False
+
+
+class QuestionEncodingCache(object):
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries[key] = value  # most recently used last
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class CachedQuestionEncoder(object):
+    """ Not thread safe: use it from the thread running the session. """
+
+    def __init__(self, model, batch, max_size=10000):
+        """
+        Args:
+            - model: a vqa model of supports()
+            - batch: the batch dict the model is built on
+        """
+        if not self.supports(model, batch):
+            raise ValueError('The question encoding of {} can not be '
+                             'cached'.format(type(model)))
+        self.encoding = encoding_tensor(model)
+        self.q_intseq = batch['q_intseq']
+        self.q_intseq_len = batch['q_intseq_len']
+        self.cache = QuestionEncodingCache(max_size)
+
+    @staticmethod
+    def supports(model, batch):
+        encoding = encoding_tensor(model)
+        if encoding is None: return False
+        return not depends_on(model.output['logit'],
+                              [batch['q_intseq'], batch['q_intseq_len']],
+                              encoding)
+
+    def encode(self, session, q_intseq, q_intseq_len):
+        """
+        Args:
+            - q_intseq: [bs, len] padded intseqs
+            - q_intseq_len: [bs]
+        Returns:
+            - encodings: [bs, dim]
+        """
+        q_intseq = np.asarray(q_intseq)
+        q_intseq_len = np.asarray(q_intseq_len)
+        keys = [tuple(intseq[:length])
+                for intseq, length in zip(q_intseq, q_intseq_len)]
+        encodings = [self.cache.get(key) for key in keys]
+
+        # encode every missing question once, even if repeated in the batch
+        missing = collections.OrderedDict()
+        for i, encoding in enumerate(encodings):
+            if encoding is None: missing.setdefault(keys[i], i)
+        if missing:
+            rows = list(missing.values())
+            encoded = session.run(self.encoding, feed_dict={
+                self.q_intseq: q_intseq[rows],
+                self.q_intseq_len: q_intseq_len[rows]})
+            encoded = dict(zip(missing.keys(), encoded))
+            for key, encoding in encoded.items():
+                self.cache.put(key, encoding)
+            encodings = [encoded[key] if encoding is None else encoding
+                         for key, encoding in zip(keys, encodings)]
+        return np.stack(encodings, axis=0)
+
+    def feed_dict(self, session, q_intseq, q_intseq_len):
+        return {self.encoding: self.encode(session, q_intseq, q_intseq_len)}
+
+    def reset(self):
+        """ The encodings are stale once other weights are loaded. """
+        self.cache = QuestionEncodingCache(self.cache.max_size)
+
+    def stats(self):
+        return self.cache.stats()
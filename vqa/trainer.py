@@ -1,5 +1,7 @@
 import argparse
 import os
+import subprocess
+import sys
 import time
 import shutil
 import numpy as np
@@ -7,8 +9,13 @@ import tensorflow as tf
 
 from tqdm import tqdm
 
-from util import log
-from vqa import importer
+from util import input_tuner, log
+from util.profiler import StepProfiler
+from util.streaming_report import StreamingReport
+from util.checkpoint import AsyncSaver
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
+from vqa import importer, validator
 from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
 
 
@@ -49,8 +56,13 @@ class Trainer(object):
             config.vlmap_word_weight_dir = self.vlmap_word_weight_dir
         else: self.vlmap_word_weight_dir = config.vlmap_word_weight_dir
 
+        self.validation_mode = config.validation_mode
+        if self.validation_mode == 'sidecar':
+            validator.save_config(config, self.train_dir)
+
         # Input
         self.batch_size = config.batch_size
+        self.pipeline_config = self.get_pipeline_config(config)
         with tf.name_scope('datasets'):
             self.target_split = tf.placeholder(tf.string)
 
@@ -58,16 +70,20 @@ class Trainer(object):
             vqa_batch = {
                 'train': input_ops_vqa.create(
                     self.batch_size, self.tf_record_dir, 'train',
-                    is_train=True, scope='train_ops', shuffle=True),
+                    is_train=True, scope='train_ops', shuffle=True,
+                    pipeline_config=self.pipeline_config),
                 'val': input_ops_vqa.create(
                     self.batch_size, self.tf_record_dir, 'val',
-                    is_train=True, scope='val_ops', shuffle=False),
+                    is_train=True, scope='val_ops', shuffle=False,
+                    pipeline_config=self.pipeline_config),
                 'testval': input_ops_vqa.create(
                     self.batch_size, self.tf_record_dir, 'testval',
-                    is_train=True, scope='testval_ops', shuffle=False),
+                    is_train=True, scope='testval_ops', shuffle=False,
+                    pipeline_config=self.pipeline_config),
                 'test': input_ops_vqa.create(
                     self.batch_size, self.tf_record_dir, 'test',
-                    is_train=True, scope='test_ops', shuffle=False)
+                    is_train=True, scope='test_ops', shuffle=False,
+                    pipeline_config=self.pipeline_config)
             }
             batch_opt = {
                 tf.equal(self.target_split, 'train'): lambda: vqa_batch['train'],
@@ -114,16 +130,9 @@ class Trainer(object):
             name='optimizer')
 
         self.avg_report = {
-            'train': {},
-            'val': {},
-            'testval': {},
-        }
-        for split in ['train', 'val', 'testval']:
-            for key in self.model.report.keys():
-                self.avg_report[split][key] = tf.placeholder(tf.float32)
-                tf.summary.scalar('average_{}/{}'.format(split, key),
-                                  self.avg_report[split][key],
-                                  collections=['average_{}'.format(split)])
+            split: StreamingReport(self.model.report, split,
+                                   summary_collection='average_{}'.format(split))
+            for split in ['train', 'val', 'testval']}
 
         self.summary_ops = {
             'train': tf.summary.merge_all(key='train'),
@@ -137,11 +146,15 @@ class Trainer(object):
             'average_testval': tf.summary.merge_all(key='average_testval'),
             'no_op': tf.no_op(),
         }
+        self.profiler = StepProfiler(self.train_dir, config.profile_steps,
+                                     config.trace_every, config.input_wait_warn)
 
         all_vars = tf.global_variables()
         transfer_vars = self.model.filter_transfer_vars(all_vars)
 
-        self.saver = tf.train.Saver(max_to_keep=100)
+        self.saver = AsyncSaver(
+            max_to_keep=100,
+            meta_graph_path=os.path.join(self.train_dir, 'model.meta'))
         self.checkpoint_loader = tf.train.Saver(max_to_keep=1)
         self.pretrain_loader = tf.train.Saver(var_list=transfer_vars, max_to_keep=1)
         self.summary_writer = tf.summary.FileWriter(self.train_dir)
@@ -160,15 +173,18 @@ class Trainer(object):
             save_summaries_secs=300,
             save_model_secs=None,
             global_step=self.global_step,
+            init_feed_dict=modules.get_init_feed_dict(),
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
+        modules.initialize_data_variables(self.session)
+        if self.tunable_pipeline is not None:
+            self.tunable_pipeline.initialize(self.session)
+            self.profiler.measure_consumer(input_tuner.CONSUMER_WARMUP_STEPS,
+                                           input_tuner.CONSUMER_STEPS)
 
         self.ckpt_path = config.checkpoint
         if self.ckpt_path is not None:
@@ -185,106 +201,171 @@ class Trainer(object):
             self.pretrain_loader.restore(self.session, self.pretrained_param_path)
             log.info('Loaded the pre-trained parameters')
 
+    def get_pipeline_config(self, config):
+        self.tunable_pipeline = None
+        measurements = None
+        if config.input_pipeline_config is not None:
+            pipeline_config = input_tuner.load_config(
+                config.input_pipeline_config)
+        elif config.tune_input_pipeline:
+            num_files = len(tf.gfile.Glob(os.path.join(
+                self.tf_record_dir, 'train', 'train-*')))
+            measurements = input_tuner.measure(
+                lambda cfg: input_ops_vqa.create(
+                    self.batch_size, self.tf_record_dir, 'train',
+                    is_train=True, scope='tune_ops', shuffle=True,
+                    pipeline_config=cfg),
+                max_cycle_length=max(num_files, 1))
+            # retuned for the train step time in train()
+            self.tunable_pipeline = input_tuner.TunablePipeline(
+                measurements, max_cycle_length=max(num_files, 1))
+            pipeline_config = self.tunable_pipeline.config
+        else: return None
+        input_tuner.save_config(self.train_dir, pipeline_config, measurements)
+        if self.tunable_pipeline is not None:
+            return self.tunable_pipeline.pipeline_config()
+        return pipeline_config
+
+    def retune_input_pipeline(self):
+        consumer_secs_per_batch = self.profiler.consumer_secs_per_batch()
+        if consumer_secs_per_batch is None: return
+        pipeline_config = self.tunable_pipeline.retune(
+            self.session, consumer_secs_per_batch)
+        input_tuner.save_config(
+            self.train_dir, pipeline_config,
+            self.tunable_pipeline.measurements, consumer_secs_per_batch)
+
+    def launch_validator(self):
+        log.infov('Launching sidecar validation process')
+        env = dict(os.environ)
+        if self.config.validation_devices is not None:
+            env['CUDA_VISIBLE_DEVICES'] = self.config.validation_devices
+        cmd = [sys.executable,
+               os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'validator.py'),
+               '--train_dir', self.train_dir,
+               '--parent_pid', str(os.getpid())]
+        return subprocess.Popen(cmd, env=env)
+
     def train(self):
         log.infov('Training starts')
 
-        # initialize average report (put 0 to escape average over empty list)
+        validation_process = None
+        if self.validation_mode == 'sidecar':
+            validation_process = self.launch_validator()
+
+        # initialize average step time (put 0 to escape average over empty list)
         avg_step_time = [0]
-        avg_train_report = {key: [0] for key in self.avg_report['train']}
-
-        for s in range(self.max_train_iter):
-            """
-            write average summary and print log
-            """
-            if s % self.train_average_iter == 0:
-                step, avg_train_summary = self.write_average_summary(
-                    avg_train_report, split='train')
-                self.summary_writer.add_summary(
-                    avg_train_summary, global_step=step)
-                self.log_message(step, avg_train_report, avg_step_time,
-                                 split='train', is_train=True)
-                for key in avg_train_report: avg_train_report[key] = []
-                avg_step_time = []
-
-            """
-            Periodic inference on validation set
-            """
-            if s % self.validation_step == 0:
-                # val
-                avg_val_report = {key: [] for key in self.avg_report['val']}
-                avg_val_step_time = []
-                for i in tqdm(range(self.val_average_iter), desc='eval val'):
-                    step, summary, loss, report, step_time = self.run_val_step(
-                        i == (self.val_average_iter - 1), split='val')
-                    for key in avg_val_report:
-                        avg_val_report[key].append(report[key])
-                    avg_val_step_time.append(step_time)
-                self.summary_writer.add_summary(summary, global_step=step)
-                step, avg_val_summary = self.write_average_summary(
-                    avg_val_report, split='val')
-                self.summary_writer.add_summary(avg_val_summary, global_step=step)
-                self.log_message(step, avg_val_report, avg_val_step_time,
-                                 split='val', is_train=False)
-
-                # testval
-                avg_val_report = {key: [] for key in self.avg_report['testval']}
-                avg_val_step_time = []
-                for i in tqdm(range(self.val_average_iter), desc='eval testval'):
-                    step, summary, loss, report, step_time = self.run_val_step(
-                        i == (self.val_average_iter - 1), split='testval')
-                    for key in avg_val_report:
-                        avg_val_report[key].append(report[key])
-                    avg_val_step_time.append(step_time)
-                self.summary_writer.add_summary(summary, global_step=step)
-                step, avg_val_summary = self.write_average_summary(
-                    avg_val_report, split='testval')
-                self.summary_writer.add_summary(avg_val_summary, global_step=step)
-                self.log_message(step, avg_val_report, avg_val_step_time,
-                                 split='testval', is_train=False)
-
-            """
-            Run TRAINING step
-            """
-            step, train_summary, loss, train_report, step_time = \
-                self.run_train_step(s % self.heavy_summary_step == 0)
-            for key in avg_train_report:
-                avg_train_report[key].append(train_report[key])
-            avg_step_time.append(step_time)
-            if s % self.heavy_summary_step == 0:
-                self.summary_writer.add_summary(train_summary, global_step=step)
-
-            """
-            Save Checkpoint
-            """
-            if s % self.checkpoint_step == 0:
-                log.infov('Saved checkpoint at {}'.format(step))
-                self.saver.save(
-                    self.session, os.path.join(self.train_dir, 'model'),
-                    global_step=step)
-
-    def write_average_summary(self, avg_report, split='train'):
-        feed_dict = {
-            self.avg_report[split][key]:
-            np.array(avg_report[key], dtype=np.float32).mean()
-            for key in self.avg_report[split]}
+
+        completed = False
+        try:
+            for s in range(self.max_train_iter):
+                """
+                write average summary and print log
+                """
+                if s % self.train_average_iter == 0:
+                    step, avg_train_summary, avg_train_report = \
+                        self.write_average_summary(split='train')
+                    self.summary_writer.add_summary(
+                        avg_train_summary, global_step=step)
+                    self.log_message(step, avg_train_report, avg_step_time,
+                                     split='train', is_train=True)
+                    self.profiler.write_summary(
+                        self.session, self.summary_writer, step)
+                    avg_step_time = []
+
+                """
+                Periodic inference on validation set
+                (sidecar mode: done by the validation process on checkpoints)
+                """
+                if self.validation_mode == 'inline' and s % self.validation_step == 0:
+                    # val
+                    avg_val_step_time = []
+                    for i in tqdm(range(self.val_average_iter), desc='eval val'):
+                        step, summary, step_time = self.run_val_step(
+                            i == (self.val_average_iter - 1), split='val')
+                        avg_val_step_time.append(step_time)
+                    self.summary_writer.add_summary(summary, global_step=step)
+                    step, avg_val_summary, avg_val_report = \
+                        self.write_average_summary(split='val')
+                    self.summary_writer.add_summary(avg_val_summary, global_step=step)
+                    self.log_message(step, avg_val_report, avg_val_step_time,
+                                     split='val', is_train=False)
+
+                    # testval
+                    avg_val_step_time = []
+                    for i in tqdm(range(self.val_average_iter), desc='eval testval'):
+                        step, summary, step_time = self.run_val_step(
+                            i == (self.val_average_iter - 1), split='testval')
+                        avg_val_step_time.append(step_time)
+                    self.summary_writer.add_summary(summary, global_step=step)
+                    step, avg_val_summary, avg_val_report = \
+                        self.write_average_summary(split='testval')
+                    self.summary_writer.add_summary(avg_val_summary, global_step=step)
+                    self.log_message(step, avg_val_report, avg_val_step_time,
+                                     split='testval', is_train=False)
+
+                """
+                Run TRAINING step
+                """
+                run_kwargs = self.profiler.run_kwargs(s)
+                step, train_summary, step_time = \
+                    self.run_train_step(s % self.heavy_summary_step == 0,
+                                        run_kwargs=run_kwargs)
+                self.profiler.after_run(s, step, run_kwargs, step_time)
+                if self.tunable_pipeline is not None and \
+                        s == max(self.profiler.consumer_steps):
+                    self.retune_input_pipeline()
+                avg_step_time.append(step_time)
+                if s % self.heavy_summary_step == 0:
+                    _start_time = time.time()
+                    self.summary_writer.add_summary(train_summary, global_step=step)
+                    self.profiler.add_time('summary_write', time.time() - _start_time)
+
+                """
+                Save Checkpoint
+                """
+                if s % self.checkpoint_step == 0:
+                    snapshot_time = self.saver.save(
+                        self.session, os.path.join(self.train_dir, 'model'),
+                        global_step=step)
+                    log.infov('Saved checkpoint at {} ({:.3f} sec blocked, '
+                              'written in background)'.format(step, snapshot_time))
+            completed = True
+        finally:
+            # flush the checkpoint being written in the background
+            self.saver.close(raise_error=completed)
+
+        if validation_process is not None:
+            validator.mark_training_done(self.train_dir)
+            log.infov('Waiting for the validation process')
+            validation_process.wait()
+
+    def write_average_summary(self, split='train'):
+        """
+        Read (and reset) the running averages of the split.
+        """
         summary_op = self.summary_ops['average_{}'.format(split)]
-        step, avg_summary = self.session.run([self.global_step, summary_op],
-                                             feed_dict=feed_dict)
-        return step, avg_summary
+        step, avg_summary, avg_report = self.session.run(
+            [self.global_step, summary_op, self.avg_report[split].average])
+        self.session.run(self.avg_report[split].reset_op)
+        return step, avg_summary, avg_report
 
-    def run_train_step(self, use_heavy_summary):
+    def run_train_step(self, use_heavy_summary, run_kwargs=None):
+        if run_kwargs is None: run_kwargs = {}
         if use_heavy_summary:
             summary_op = self.summary_ops['heavy_train']
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
         fetch = [self.global_step, summary_op,
-                 self.model.loss, self.model.report, self.optimizer]
+                 self.avg_report['train'].update_op, self.optimizer]
         fetch_values = self.session.run(fetch,
-                                        feed_dict={self.target_split: 'train'})
-        [step, summary, loss, report] = fetch_values[:4]
+                                        feed_dict={self.target_split: 'train'},
+                                        **run_kwargs)
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def run_val_step(self, use_heavy_summary, split):
         if use_heavy_summary:
@@ -292,12 +373,13 @@ class Trainer(object):
         else: summary_op = self.summary_ops['no_op']
 
         _start_time = time.time()
-        fetch = [self.global_step, summary_op, self.model.loss, self.model.report]
+        fetch = [self.global_step, summary_op,
+                 self.avg_report[split].update_op]
         fetch_values = self.session.run(
             fetch, feed_dict={self.target_split: split})
-        [step, summary, loss, report] = fetch_values[:4]
+        [step, summary] = fetch_values[:2]
         _end_time = time.time()
-        return step, summary, loss, report, (_end_time - _start_time)
+        return step, summary, (_end_time - _start_time)
 
     def log_message(self, step, avg_report, avg_step_time, split='train', is_train=True):
         step_time = np.array(avg_step_time, dtype=np.float32).mean()
@@ -307,8 +389,7 @@ class Trainer(object):
         log_str += '({:.3f} sec/batch, {:.3f} instances/sec)]\n'.format(
             step_time, self.batch_size / step_time)
         for key in sorted(avg_report.keys()):
-            report = np.array(avg_report[key], dtype=np.float32).mean()
-            log_str += '  * {}: {:.5f}\n'.format(key, report)
+            log_str += '  * {}: {:.5f}\n'.format(key, avg_report[key])
         log_fn = (log.info if is_train else log.infov)
         log_fn(log_str)
 
@@ -338,6 +419,30 @@ def main():
     parser.add_argument('--heavy_summary_step', type=int, default=800)  # 867 for 1 epoch
     parser.add_argument('--validation_step', type=int, default=800)
     parser.add_argument('--checkpoint_step', type=int, default=800)
+    parser.add_argument('--profile_steps', type=str, default='',
+                        help='steps to export Chrome trace timelines for,'
+                        ' e.g. "100,200-202"')
+    parser.add_argument('--trace_every', type=int, default=100,
+                        help='trace a step every N steps for the'
+                        ' average_train/time/* summaries (0: off)')
+    parser.add_argument('--input_wait_warn', type=float, default=0.2,
+                        help='warn when waiting on input for more than this'
+                        ' fraction of the step time')
+    parser.add_argument('--tune_input_pipeline', action='store_true',
+                        default=False,
+                        help='measure the input pipeline at startup and the'
+                        ' first train steps, and pick parallelism / prefetch'
+                        ' depth for both rates')
+    parser.add_argument('--input_pipeline_config', type=str, default=None,
+                        help='input_pipeline.json saved by a previous run')
+    parser.add_argument('--validation_mode', type=str, default='inline',
+                        choices=['inline', 'sidecar'],
+                        help='sidecar: validate every checkpoint in a separate'
+                        ' process instead of pausing training every'
+                        ' validation_step')
+    parser.add_argument('--validation_devices', type=str, default=None,
+                        help='CUDA_VISIBLE_DEVICES of the sidecar validation'
+                        ' process (default: inherited)')
     # hyper parameters
     parser.add_argument('--prefix', type=str, default='default', help=' ')
     parser.add_argument('--checkpoint', type=str, default=None)
@@ -355,6 +460,7 @@ def main():
     parser.add_argument('--seed', type=int, default=123, help=' ')
     parser.add_argument('--debug', type=int, default=0, help='0: normal, 1: debug')
 
+    add_session_arguments(parser)
     config = parser.parse_args()
     config.vocab_path = os.path.join(config.tf_record_dir, config.vocab_name)
     config.vfeat_path = os.path.join(config.tf_record_dir, config.vfeat_name)
@@ -8,6 +8,8 @@ import numpy as np
 import tensorflow as tf
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
+from vlmap import modules
 from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
 
 
@@ -136,15 +138,14 @@ class Trainer(object):
             save_summaries_secs=300,
             save_model_secs=None,
             global_step=self.global_step,
+            init_feed_dict=modules.get_init_feed_dict(),
         )
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = self.supervisor.prepare_or_wait_for_session(
             config=session_config)
+        modules.initialize_data_variables(self.session)
 
         self.ckpt_path = config.checkpoint
         if self.ckpt_path is not None:
@@ -298,6 +299,7 @@ def main():
     parser.add_argument('--batch_size', type=int, default=512, help=' ')
     parser.add_argument('--model_type', type=str, default='standard', help=' ',
                         choices=['standard'])
+    add_session_arguments(parser)
     config = parser.parse_args()
     config.vocab_path = os.path.join(config.tf_record_dir, config.vocab_name)
     config.vfeat_path = os.path.join(config.tf_record_dir, config.vfeat_name)
@@ -0,0 +1,183 @@
+"""
+Sidecar validation process for vqa/trainer.py (--validation_mode sidecar).
+
+The trainer dumps its config to train_dir/config.pkl and launches this
+script. Every new checkpoint found in train_dir is restored and evaluated on
+val and testval, and the average_val / average_testval (and heavy) summaries
+are written to train_dir, so the training process never pauses for
+validation.
+"""
+import argparse
+import cPickle
+import os
+import time
+import numpy as np
+import tensorflow as tf
+
+from tqdm import tqdm
+
+from util import log
+from util.streaming_report import StreamingReport
+from util.session_config import get_session_config
+from vlmap import modules
+from vqa import importer
+from vqa.datasets import input_ops_vqa_tf_record_memft as input_ops_vqa
+
+CONFIG_NAME = 'config.pkl'
+DONE_NAME = 'TRAINING_DONE'
+SPLITS = ['val', 'testval']
+
+
+def save_config(config, train_dir):
+    cPickle.dump(config, open(os.path.join(train_dir, CONFIG_NAME), 'wb'))
+
+
+def mark_training_done(train_dir):
+    open(os.path.join(train_dir, DONE_NAME), 'w').close()
+
+
+class Validator(object):
+
+    def __init__(self, config, train_dir):
+        self.config = config
+        self.train_dir = train_dir
+        self.tf_record_dir = config.tf_record_dir
+        self.val_average_iter = config.val_average_iter
+        self.last_checkpoint = None
+
+        # Input
+        self.batch_size = config.batch_size
+        with tf.name_scope('datasets'):
+            self.target_split = tf.placeholder(tf.string)
+
+        with tf.name_scope('datasets/batch'):
+            vqa_batch = {
+                split: input_ops_vqa.create(
+                    self.batch_size, self.tf_record_dir, split,
+                    is_train=True, scope='{}_ops'.format(split), shuffle=False)
+                for split in SPLITS}
+            batch_opt = {
+                tf.equal(self.target_split, 'val'): lambda: vqa_batch['val'],
+                tf.equal(self.target_split, 'testval'): lambda: vqa_batch['testval'],
+            }
+            self.batch = tf.case(
+                batch_opt, default=lambda: vqa_batch['val'], exclusive=True)
+
+        # Model (built as in the trainer, so the validation numbers match)
+        Model = importer.get_model_class(config.model_type)
+        log.infov('using model class: {}'.format(Model))
+        self.model = Model(self.batch, config, is_train=True)
+        self.global_step = tf.train.get_or_create_global_step(graph=None)
+
+        self.avg_report = {
+            split: StreamingReport(self.model.report, split,
+                                   summary_collection='average_{}'.format(split))
+            for split in SPLITS}
+        self.summary_ops = {
+            'heavy_val': tf.summary.merge_all(key='heavy_val'),
+            'heavy_testval': tf.summary.merge_all(key='heavy_testval'),
+            'average_val': tf.summary.merge_all(key='average_val'),
+            'average_testval': tf.summary.merge_all(key='average_testval'),
+            'no_op': tf.no_op(),
+        }
+
+        self.checkpoint_loader = tf.train.Saver(max_to_keep=1)
+        self.summary_writer = tf.summary.FileWriter(self.train_dir)
+
+        session_config = get_session_config(config.num_cores)
+        self.session = tf.Session(config=session_config)
+        self.session.run(tf.local_variables_initializer())
+        modules.initialize_data_variables(self.session)
+
+    def eval_checkpoint(self, ckpt_path):
+        log.info('Checkpoint path: {}'.format(ckpt_path))
+        self.checkpoint_loader.restore(self.session, ckpt_path)
+        self.last_checkpoint = ckpt_path
+        step = self.session.run(self.global_step)
+
+        for split in SPLITS:
+            self.session.run(self.avg_report[split].reset_op)
+            avg_val_step_time = []
+            for i in tqdm(range(self.val_average_iter),
+                          desc='eval {}'.format(split)):
+                summary, step_time = self.run_val_step(
+                    i == (self.val_average_iter - 1), split=split)
+                avg_val_step_time.append(step_time)
+            self.summary_writer.add_summary(summary, global_step=step)
+            avg_val_summary, avg_val_report = self.session.run(
+                [self.summary_ops['average_{}'.format(split)],
+                 self.avg_report[split].average])
+            self.summary_writer.add_summary(avg_val_summary, global_step=step)
+            self.log_message(step, avg_val_report, avg_val_step_time, split)
+        self.summary_writer.flush()
+
+    def run_val_step(self, use_heavy_summary, split):
+        if use_heavy_summary:
+            summary_op = self.summary_ops['heavy_{}'.format(split)]
+        else: summary_op = self.summary_ops['no_op']
+
+        _start_time = time.time()
+        summary, _ = self.session.run(
+            [summary_op, self.avg_report[split].update_op],
+            feed_dict={self.target_split: split})
+        _end_time = time.time()
+        return summary, (_end_time - _start_time)
+
+    def log_message(self, step, avg_report, avg_step_time, split):
+        step_time = np.array(avg_step_time, dtype=np.float32).mean()
+        if step_time == 0: step_time = 0.001
+        log_str = ''
+        log_str += '[{:5s} step {:4d} '.format(split, step)
+        log_str += '({:.3f} sec/batch, {:.3f} instances/sec)]\n'.format(
+            step_time, self.batch_size / step_time)
+        for key in sorted(avg_report.keys()):
+            log_str += '  * {}: {:.5f}\n'.format(key, avg_report[key])
+        log.infov(log_str)
+
+    def run(self, parent_pid=None, poll_secs=10):
+        def should_stop():
+            if os.path.exists(os.path.join(self.train_dir, DONE_NAME)):
+                return True
+            if parent_pid is not None and not _pid_alive(parent_pid):
+                log.warn('Trainer process {} is gone'.format(parent_pid))
+                return True
+            return False
+
+        # only the latest checkpoint is evaluated when validation falls
+        # behind checkpointing
+        for ckpt_path in tf.train.checkpoints_iterator(
+                self.train_dir, min_interval_secs=1,
+                timeout=poll_secs, timeout_fn=should_stop):
+            self.eval_checkpoint(ckpt_path)
+        # pick up the final checkpoint written right before the trainer ended
+        ckpt_path = tf.train.latest_checkpoint(self.train_dir)
+        if ckpt_path is not None and ckpt_path != self.last_checkpoint:
+            self.eval_checkpoint(ckpt_path)
+        log.warn('Validation is done')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--train_dir', type=str, required=True)
+    parser.add_argument('--parent_pid', type=int, default=None)
+    parser.add_argument('--poll_secs', type=int, default=10)
+    args = parser.parse_args()
+
+    config = cPickle.load(open(os.path.join(args.train_dir, CONFIG_NAME), 'rb'))
+    tf.set_random_seed(config.seed)
+    np.random.seed(config.seed)
+
+    validator = Validator(config, args.train_dir)
+    validator.run(parent_pid=args.parent_pid, poll_secs=args.poll_secs)
+
+if __name__ == '__main__':
+    main()
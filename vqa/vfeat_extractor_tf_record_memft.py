@@ -8,6 +8,7 @@ import tensorflow as tf
 from tqdm import tqdm
 
 from util import log
+from util.session_config import add_session_arguments, get_session_config
 from vqa.datasets import dataset_vfeat, input_ops_vfeat
 
 
@@ -60,10 +61,7 @@ class Extractor(object):
 
         self.pretrain_loader = tf.train.Saver(var_list=all_vars, max_to_keep=1)
 
-        session_config = tf.ConfigProto(
-            allow_soft_placement=True,
-            gpu_options=tf.GPUOptions(allow_growth=True),
-            device_count={'GPU': 1})
+        session_config = get_session_config(config.num_cores)
 
         self.session = tf.Session(config=session_config)
 
@@ -168,6 +166,8 @@ def main():
                         default='data/VQA_v2/images', help=' ')
     parser.add_argument('--densecap_dir', type=str,
                         default='data/VQA_v2/densecap', help=' ')
+    parser.add_argument('--image_cache_dir', type=str, default=None,
+                        help='decoded images of data/tools/build_image_cache.py')
     # hyper parameters
     parser.add_argument('--pretrained_param_path', type=str, default=None,
                         required=True)
@@ -176,6 +176,7 @@ def main():
     parser.add_argument('--model_type', type=str, default='vfeat', help=' ',
                         choices=['vfeat', 'resnet'])
 
+    add_session_arguments(parser)
     config = parser.parse_args()
 
     config.image_info_path = os.path.join(config.tf_record_memft_dir,
@@ -195,7 +196,7 @@ def main():
 
     dataset = dataset_vfeat.create_dataset(
         config.image_path2idx.keys(), config.image_dir, config.densecap_dir,
-        is_train=False)
+        is_train=False, image_cache_dir=config.image_cache_dir)
     config.dataset_config = dataset.get_config()
 
     extractor = Extractor(config, dataset)